@@ -0,0 +1,25 @@
+"""
+ASGI config for ChronosAtlas project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server, e.g. ``gunicorn -k uvicorn.workers.UvicornWorker
+ChronosAtlas.asgi:application`` (SERVER_MODE=asgi in entrypoint.sh).
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ChronosAtlas.settings_default')
+# Read routes become async views on a bounded thread pool (see urls_asgi.py).
+os.environ.setdefault('ROOT_URLCONF', 'ChronosAtlas.urls_asgi')
+
+application = get_asgi_application()
+
+# Build the in-memory autocomplete index in the background as each worker starts.
+from figures.autocomplete import warm  # noqa: E402
+
+warm()
@@ -0,0 +1,102 @@
+"""
+PostgreSQL backend that takes its connections from a per-process pool.
+
+Set ENGINE to 'ChronosAtlas.backends.pooled_postgresql' and CONN_MAX_AGE to 0:
+Django then "closes" the connection at the end of every request, which hands it
+back to the pool instead of tearing down the socket, so each worker thread
+holds a connection only while it serves a request. Size the pool with
+OPTIONS['POOL']:
+
+    'MIN_SIZE'  connections kept open while idle (default 1)
+    'MAX_SIZE'  connections open at once (default 10)
+    'TIMEOUT'   seconds a request waits for a free connection (default 10)
+
+Every alias gets its own pool, so a primary and its replicas are sized
+separately. A connection whose server went away is discarded on its way back.
+"""
+import os
+import threading
+
+from django.db.backends.postgresql import base
+from psycopg2 import pool as psycopg2_pool
+
+POOL_DEFAULTS = {'MIN_SIZE': 1, 'MAX_SIZE': 10, 'TIMEOUT': 10}
+
+
+class ConnectionPool:
+    """psycopg2's ThreadedConnectionPool, with callers waiting for a free connection rather than failing."""
+
+    def __init__(self, options, conn_params):
+        self.timeout = options['TIMEOUT']
+        self.slots = threading.BoundedSemaphore(options['MAX_SIZE'])
+        self.pool = psycopg2_pool.ThreadedConnectionPool(options['MIN_SIZE'], options['MAX_SIZE'], **conn_params)
+
+    def get(self, database):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise database.OperationalError(
+                f'No pooled connection became free within {self.timeout:g}s.'
+            )
+        try:
+            return self.pool.getconn()
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def put(self, connection):
+        try:
+            self.pool.putconn(connection, close=bool(connection.closed))
+        finally:
+            self.slots.release()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, options, conn_params):
+    # Keyed by process too, as a forked worker must not reuse its parent's sockets,
+    # and by parameters, since Django also connects to the 'postgres' database.
+    key = (alias, os.getpid(), repr(sorted(conn_params.items())))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(options, conn_params)
+        return _pools[key]
+
+
+class _PooledDatabase:
+    """The psycopg2 module, except that connect() checks a connection out of the pool."""
+
+    def __init__(self, pool):
+        self._pool = pool
+
+    def connect(self, **conn_params):
+        return self._pool.get(base.Database)
+
+    def __getattr__(self, name):
+        return getattr(base.Database, name)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def pool_options(self):
+        return {**POOL_DEFAULTS, **self.settings_dict['OPTIONS'].get('POOL', {})}
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('POOL', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        pool = self.connection_pool = get_pool(self.alias, self.pool_options(), conn_params)
+        # The parent sets up isolation level and JSON decoding on what connect() returns.
+        self.Database = _PooledDatabase(pool)
+        try:
+            return super().get_new_connection(conn_params)
+        finally:
+            del self.Database
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            self.connection_pool.put(self.connection)
@@ -0,0 +1,130 @@
+"""
+Shared plumbing for batch writes (GraphQL `createFigures`/`upsertFigures`/
+`createTimelineEvents` and the REST `bulk`/`upsert` actions).
+
+A batch is validated item by item before anything touches the database; only
+the valid items are then written together inside one transaction. If that
+write hits a constraint anyway (e.g. a concurrent insert), it is retried item
+by item in savepoints so one bad row never fails the whole batch. Every
+problem is reported against the index of the input item it came from.
+"""
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db import IntegrityError, transaction
+from rest_framework import exceptions, status
+from rest_framework.response import Response
+
+# Largest number of items accepted by one batch request.
+MAX_BATCH_SIZE = 1000
+
+
+class BatchTooLarge(ValueError):
+    """Raised when a request carries more than MAX_BATCH_SIZE items."""
+
+
+def check_batch_size(items):
+    if len(items) > MAX_BATCH_SIZE:
+        raise BatchTooLarge(f"A batch may contain at most {MAX_BATCH_SIZE} items (got {len(items)}).")
+
+
+class BatchResult:
+    """
+    Outcome of a batch write: `objects[i]` is the saved object for input item i
+    (None if it was rejected), `errors` lists {'index', 'field', 'message'} dicts.
+    """
+
+    def __init__(self, size):
+        self.objects = [None] * size
+        self.errors = []
+
+    def reject(self, index, message, field=None):
+        self.errors.append({'index': index, 'field': field, 'message': str(message)})
+
+    def reject_invalid(self, index, error):
+        """Records every message of a Django ValidationError against one item."""
+        if not hasattr(error, 'error_dict'):
+            for message in error.messages:
+                self.reject(index, message)
+            return
+        for field, errors in error.message_dict.items():
+            for message in errors:
+                self.reject(index, message, None if field == NON_FIELD_ERRORS else field)
+
+    @property
+    def saved(self):
+        return sum(obj is not None for obj in self.objects)
+
+    def finish(self):
+        """Orders errors by item index once the batch is written; returns self."""
+        self.errors.sort(key=lambda error: error['index'])
+        return self
+
+
+def clean(result, index, instance, exclude=None):
+    """Runs model validation (minus uniqueness, checked in bulk by the caller); returns True if valid."""
+    try:
+        instance.full_clean(exclude=exclude, validate_unique=False)
+    except ValidationError as e:
+        result.reject_invalid(index, e)
+        return False
+    return True
+
+
+def write_or_isolate(items, write):
+    """
+    Calls write([obj, ...]) on every (index, obj) in `items` inside one savepoint;
+    on IntegrityError retries them one at a time. Returns [(index, message), ...]
+    for the items the database refused.
+    """
+    try:
+        with transaction.atomic():
+            write([obj for _, obj in items])
+        return []
+    except IntegrityError:
+        pass
+
+    refused = []
+    for index, obj in items:
+        try:
+            with transaction.atomic():
+                write([obj])
+        except IntegrityError as e:
+            refused.append((index, str(e).strip()))
+    return refused
+
+
+def build(model, fields, data):
+    """
+    Builds an unsaved `model` instance from one payload item (a dict keyed by
+    model field name). Raises ValidationError for non-objects and unknown keys;
+    null values fall back to the model defaults.
+    """
+    if not isinstance(data, dict):
+        raise ValidationError("Expected an object.")
+    unknown = sorted(set(data) - set(fields))
+    if unknown:
+        raise ValidationError({name: "Unknown field." for name in unknown})
+    return model(**{name: data[name] for name in fields if data.get(name) is not None})
+
+
+def batch_response(data, write, serializer_class):
+    """
+    Runs a REST batch action: `data` must be a JSON list, `write(items)` returns a
+    BatchResult. Responds {"results": [object or null per item], "errors": [...]}
+    with 201 if every item was saved, 200 if some were and 400 if none were.
+    """
+    if not isinstance(data, list):
+        raise exceptions.ValidationError({'detail': 'Expected a JSON list of objects.'})
+    try:
+        result = write(data)
+    except BatchTooLarge as e:
+        raise exceptions.ValidationError({'detail': str(e)})
+
+    saved = iter(serializer_class([obj for obj in result.objects if obj is not None], many=True).data)
+    results = [None if obj is None else next(saved) for obj in result.objects]
+    if not result.errors:
+        code = status.HTTP_201_CREATED
+    elif result.saved:
+        code = status.HTTP_200_OK
+    else:
+        code = status.HTTP_400_BAD_REQUEST
+    return Response({'results': results, 'errors': result.errors}, status=code)
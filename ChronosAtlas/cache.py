@@ -0,0 +1,369 @@
+"""
+Response cache and conditional GET support for /graphql/ and the REST viewsets.
+
+Entries are keyed on everything that can change a response: the normalized
+GraphQL document (or the REST path and sorted query string), variables,
+operation name, Accept / Accept-Encoding, and the current version of every
+model the response reads. Versions are counters kept in Django's cache and
+bumped by signals (timeline/signals.py) once a write commits, so a write makes
+the affected entries unreachable instead of deleting them, and entries that
+only read other models survive it.
+
+There are two tiers: an in-process LRU with a TTL, and an optional shared tier
+(any Django cache alias, e.g. Redis) so that workers share entries. Configure
+both with settings.RESPONSE_CACHE. The version counters must live in a CACHES
+backend that every worker and management command shares (Redis in production,
+see REDIS_URL), or a write would only invalidate the entries of the process that
+made it; a system check refuses a per-process LocMemCache when the server runs
+several processes (settings.SERVER_PROCESSES).
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, register
+from django.core.signals import setting_changed
+from django.db import connection, transaction
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+from . import db_routing, metrics
+
+DEFAULTS = {
+    'ENABLED': True,
+    'TTL': 300,                 # seconds an entry may be served
+    'MAX_ENTRIES': 1000,        # size of the in-process LRU tier
+    'SHARED_CACHE': None,       # CACHES alias of the shared tier, or None
+    'VERSION_CACHE': 'default', # CACHES alias holding the model version counters
+}
+
+# Model labels a response is assumed to read when nothing narrower is known.
+ALL_MODELS = (
+    'figures.figure', 'figures.field', 'timeline.influence', 'timeline.influencemetrics', 'timeline.timelineevent',
+)
+
+CACHE_HEADER = 'X-Cache'
+
+
+def setting(name):
+    return getattr(settings, 'RESPONSE_CACHE', {}).get(name, DEFAULTS[name])
+
+
+# --- 1. Model versions ---
+
+def version_store():
+    """The cache holding the version counters, shared by every process."""
+    return caches[setting('VERSION_CACHE')]
+
+
+def model_label(model):
+    return model if isinstance(model, str) else model._meta.label_lower
+
+
+def _version_key(label):
+    return f'response_cache:version:{label}'
+
+
+# Wall-clock time of the last version bump, shared like the counters.
+LAST_WRITE_KEY = 'response_cache:last_write'
+
+
+def get_versions(models):
+    """Current version of each model, in the given order (one cache round trip)."""
+    store = version_store()
+    keys = [_version_key(model_label(model)) for model in models]
+    found = store.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # Seed from the clock rather than 0, so a counter lost to eviction can
+            # never come back at a value that older entries were stored under.
+            store.add(key, time.time_ns(), timeout=None)
+            found[key] = store.get(key)
+    return tuple(found[key] for key in keys)
+
+
+def bump_versions(*models):
+    store = version_store()
+    store.set(LAST_WRITE_KEY, time.time(), timeout=None)
+    for model in models:
+        key = _version_key(model_label(model))
+        try:
+            store.incr(key)
+        except ValueError:
+            store.add(key, time.time_ns(), timeout=None)
+            store.incr(key)
+
+
+def bump_on_commit(*models):
+    """Bumps the versions once the current transaction commits (immediately in autocommit)."""
+    transaction.on_commit(lambda: bump_versions(*models))
+
+
+def replica_may_lag():
+    """
+    True when the current request read from a replica and a write committed
+    recently enough (within DATABASE_ROUTING['MAX_LAG']) that the replica may
+    not have it yet. Such a response is not stored under the new versions.
+    """
+    if db_routing.read_from_replica() is None:
+        return False
+    last_write = version_store().get(LAST_WRITE_KEY)
+    return last_write is not None and time.time() - last_write < db_routing.setting('MAX_LAG')
+
+
+@register(Tags.caches)
+def check_version_store(app_configs, **kwargs):
+    if not setting('ENABLED') or getattr(settings, 'SERVER_PROCESSES', 1) <= 1:
+        return []
+    if not isinstance(version_store(), LocMemCache):
+        return []
+    return [Error(
+        f"RESPONSE_CACHE['VERSION_CACHE'] ({setting('VERSION_CACHE')!r}) is a per-process LocMemCache, "
+        f"but SERVER_PROCESSES is {settings.SERVER_PROCESSES}: a write would leave the other processes "
+        f"serving stale responses.",
+        hint="Set REDIS_URL (or point VERSION_CACHE at another shared CACHES alias), "
+             "or set RESPONSE_CACHE_ENABLED=False.",
+        id='ChronosAtlas.E001',
+    )]
+
+
+# --- 2. Storage tiers ---
+
+class LocalCache:
+    """Thread-safe in-process LRU whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()   # key -> (expires_at, value)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class ResponseCache:
+    """The local LRU tier in front of an optional shared Django cache."""
+
+    def __init__(self, max_entries, ttl, shared=None):
+        self.local = LocalCache(max_entries, ttl)
+        self.shared = shared
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value, self.ttl)
+
+    def clear(self):
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+
+_response_cache = None
+
+
+def get_response_cache():
+    global _response_cache
+    if _response_cache is None:
+        alias = setting('SHARED_CACHE')
+        _response_cache = ResponseCache(
+            setting('MAX_ENTRIES'), setting('TTL'), caches[alias] if alias else None
+        )
+    return _response_cache
+
+
+@receiver(setting_changed)
+def _reset_on_setting_changed(setting, **kwargs):
+    global _response_cache
+    if setting in ('RESPONSE_CACHE', 'CACHES'):
+        _response_cache = None
+
+
+# --- 3. Serving responses ---
+
+def accept_encoding(request):
+    """The Accept-Encoding header in a canonical form (lower case, sorted, no spaces)."""
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    return ','.join(sorted(token.strip().lower().replace(' ', '') for token in header.split(',') if token.strip()))
+
+
+def is_enabled():
+    # Inside a transaction (ATOMIC_REQUESTS, a test case) a response may show rows
+    # that are later rolled back, so it is neither cached nor served from cache.
+    return setting('ENABLED') and not connection.in_atomic_block
+
+
+# [storable] while cached_response renders a response it may store.
+_rendering = ContextVar('response_cache_rendering', default=None)
+
+
+def rendering_for_cache():
+    """True while cached_response renders a response it may store."""
+    return _rendering.get() is not None
+
+
+def do_not_store():
+    """
+    Keeps the response being rendered out of the cache. Called by code answering
+    from in-process state (the influence graph, the autocomplete index) that lags
+    the shared versions the response would be stored under.
+    """
+    state = _rendering.get()
+    if state is not None:
+        state[0] = False
+
+
+def cached_response(request, parts, models, render, store=None):
+    """
+    Returns the cached response for `parts` (anything JSON-serializable that
+    identifies the request) under the current versions of `models`; on a miss,
+    calls render() and caches its result if it is a 200 and store(response)
+    (when given) agrees.
+    """
+    if not is_enabled():
+        return render()
+
+    models = sorted(model_label(model) for model in models)
+    key_source = json.dumps(
+        [parts, accept_encoding(request), models, get_versions(models)], sort_keys=True, default=str
+    )
+    key = 'response_cache:' + hashlib.sha256(key_source.encode()).hexdigest()
+    cache = get_response_cache()
+
+    entry = cache.get(key)
+    if entry is not None:
+        status, headers, content = entry
+        response = HttpResponse(content, status=status)
+        for name, value in headers:
+            response[name] = value
+        response[CACHE_HEADER] = 'HIT'
+        metrics.inc('chronos_response_cache_requests_total', result='hit')
+        return response
+
+    metrics.inc('chronos_response_cache_requests_total', result='miss')
+    storable = [True]
+    token = _rendering.set(storable)
+    try:
+        response = render()
+        if getattr(response, 'streaming', False) or response.status_code != 200:
+            return response
+        if callable(getattr(response, 'render', None)):
+            response = response.render()
+    finally:
+        _rendering.reset(token)
+    if storable[0] and (store is None or store(response)) and not replica_may_lag():
+        cache.set(key, (response.status_code, list(response.items()), response.content))
+    response[CACHE_HEADER] = 'MISS'
+    return response
+
+
+class CachedResponseMixin:
+    """
+    Serves a viewset's GET requests from the response cache. `cache_models` lists
+    the model labels its responses read; an @action can narrow or widen it with
+    @action(..., cache_models=(...)).
+    """
+    cache_models = ALL_MODELS
+
+    def dispatch(self, request, *args, **kwargs):
+        dispatch = super().dispatch
+        if request.method != 'GET':
+            return dispatch(request, *args, **kwargs)
+        # Bodies hold absolute next/previous URLs, so the host and scheme are part of the key.
+        parts = [
+            'rest', request.scheme, request.get_host(), request.path, sorted(request.GET.lists()),
+            request.META.get('HTTP_ACCEPT', ''),
+        ]
+        return cached_response(request, parts, self.cache_models, lambda: dispatch(request, *args, **kwargs))
+
+
+# --- 4. Conditional GET (ETag / Last-Modified) ---
+
+class ConditionalGetMixin:
+    """
+    Answers If-None-Match / If-Modified-Since on a viewset's GET routes before any
+    query runs. List (and other non-detail) routes get a strong ETag computed from
+    the request and the version stamps of `cache_models`; detail routes add the
+    row's `updated_at`, read with one primary-key lookup. Put it before
+    CachedResponseMixin so a 304 skips the response cache too.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        dispatch = super().dispatch
+        # Version stamps only move when writes commit (see is_enabled()).
+        if request.method not in ('GET', 'HEAD') or connection.in_atomic_block:
+            return dispatch(request, *args, **kwargs)
+
+        model = self.queryset.model
+        own_label = model_label(model)
+        lookup = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        last_modified = None
+        models = set(self.cache_models)
+        parts = [
+            request.scheme, request.get_host(), request.path, sorted(request.GET.lists()),
+            request.META.get('HTTP_ACCEPT', ''),
+        ]
+
+        if lookup is not None and self.action_map.get('get') == 'retrieve':
+            try:
+                updated_at = model.objects.filter(pk=lookup).values_list('updated_at', flat=True).first()
+            except (TypeError, ValueError):
+                updated_at = None
+            if updated_at is None:
+                return dispatch(request, *args, **kwargs)   # let the view answer 404
+            models.discard(own_label)
+            parts.append(updated_at.isoformat())
+            # Only the row itself can change this representation, so its timestamp is exact.
+            if not models:
+                last_modified = int(updated_at.timestamp())
+
+        models = sorted(models)
+        key_source = json.dumps([parts, accept_encoding(request), models, get_versions(models)], default=str)
+        etag = quote_etag(hashlib.sha256(key_source.encode()).hexdigest()[:32])
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = dispatch(request, *args, **kwargs)
+            if response.status_code != 200 or replica_may_lag():
+                return response
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
@@ -0,0 +1,84 @@
+"""
+Per-request DataLoaders for the GraphQL API.
+
+graphql-core resolves list items one after another in sync execution, so there is
+no natural tick at which to flush a batch. Instead, resolvers that return objects
+announce the keys they produced (`expect`), and the first loader miss for a key
+space fetches every announced key in a single query. The result is one SQL query
+per relation per nesting level, however many figures a query returns.
+"""
+from collections import defaultdict
+
+
+class BatchLoader:
+    """
+    Base class for a synchronous, per-request batching loader.
+
+    Subclasses set `key_space` (which announced keys to batch together) and
+    implement `batch_load(keys)`, returning one value per key in the same order.
+    """
+    key_space = None
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.cache = {}
+
+    def batch_load(self, keys):
+        raise NotImplementedError
+
+    def load(self, key):
+        """Returns the value for `key`, batching all announced-but-unloaded keys."""
+        if key not in self.cache:
+            pending = self.registry.expected[self.key_space]
+            keys = [k for k in pending if k not in self.cache]
+            if key not in pending:
+                keys.append(key)
+            self.cache.update(zip(keys, self.batch_load(keys)))
+        return self.cache[key]
+
+    def prime(self, key, value):
+        """Seeds the cache with an already-fetched value."""
+        self.cache.setdefault(key, value)
+
+    def load_many(self, keys):
+        return [self.load(key) for key in keys]
+
+
+class LoaderRegistry:
+    """
+    Holds the loaders and announced keys for a single request. `info` is the
+    resolve info of the first resolver that asked, for operation-wide data such
+    as the selected columns (ChronosAtlas/projection.py).
+    """
+
+    def __init__(self, info=None):
+        self.info = info
+        self.loaders = {}
+        self.expected = defaultdict(dict)  # key_space -> ordered set of keys
+
+    def get(self, loader_class):
+        if loader_class not in self.loaders:
+            self.loaders[loader_class] = loader_class(self)
+        return self.loaders[loader_class]
+
+    def expect(self, key_space, keys):
+        self.expected[key_space].update(dict.fromkeys(keys))
+
+
+def get_registry(info):
+    """Returns the loader registry attached to the current request (info.context)."""
+    context = info.context
+    registry = getattr(context, 'dataloaders', None)
+    if registry is None:
+        registry = LoaderRegistry(info)
+        context.dataloaders = registry
+    return registry
+
+
+def get_loader(info, loader_class):
+    return get_registry(info).get(loader_class)
+
+
+def expect(info, key_space, keys):
+    """Announces keys a resolver is about to return, so later loads batch over them."""
+    get_registry(info).expect(key_space, keys)
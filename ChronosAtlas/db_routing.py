@@ -0,0 +1,261 @@
+"""
+Read-replica routing for the request/response cycle.
+
+settings.DATABASE_ROUTING['REPLICAS'] lists the DATABASES aliases that
+replicate 'default'. ReplicaRoutingMiddleware marks a request as a read when
+it uses a safe method (GET/HEAD/OPTIONS) or is a POST to /graphql/, and
+ReplicaRouter then sends that request's reads to one healthy replica. Writes
+always go to the primary, and so does every read that follows a write in the
+same request. CachedGraphQLView pins mutations to the primary before they
+run (use_primary()).
+
+Read-your-writes: a request that wrote gets a short-lived cookie, and requests
+carrying it read from the primary until the replicas have caught up
+(STICKY_SECONDS, which should exceed MAX_LAG).
+
+Failover: a replica is pinged (and, on PostgreSQL, its replay lag measured)
+at most every HEALTH_CHECK_INTERVAL seconds per process. A replica that cannot
+be reached or lags by more than MAX_LAG seconds is skipped until its next
+check, and with no healthy replica the primary serves the reads. A replica
+that fails during a read request gets that request retried once on the
+primary.
+"""
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, OperationalError, connections
+
+DEFAULTS = {
+    'REPLICAS': [],                 # DATABASES aliases of the read replicas
+    'STICKY_SECONDS': 15,           # reads stay on the primary this long after a write
+    'HEALTH_CHECK_INTERVAL': 5,     # seconds between health checks of a replica
+    'MAX_LAG': 10,                  # seconds of replay lag before a replica is skipped
+    'GRAPHQL_PATHS': ('/graphql/',),
+    'COOKIE_NAME': 'db_primary',
+}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Replay lag in seconds; 0 when the replica has replayed everything it received,
+# and NULL (read as 0) on a server that is not in recovery.
+PG_LAG_SQL = (
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+def setting(name):
+    return getattr(settings, 'DATABASE_ROUTING', {}).get(name, DEFAULTS[name])
+
+
+def replicas():
+    return setting('REPLICAS')
+
+
+# --- 1. Per-request state ---
+
+class RoutingState:
+    """Where the current request reads from; shared by the threads that serve it."""
+
+    def __init__(self, read_replica):
+        self.read_replica = read_replica
+        self.alias = None           # the replica chosen on the first read
+        self.wrote = False
+        self.replica_failed = False
+
+
+_state = ContextVar('db_routing_state', default=None)
+
+
+def use_primary():
+    """Sends the rest of the current request's reads to the primary."""
+    state = _state.get()
+    if state is not None:
+        state.read_replica = False
+
+
+def read_from_replica():
+    """The replica alias the current request has read from, or None."""
+    state = _state.get()
+    return state.alias if state is not None and state.alias != DEFAULT_DB_ALIAS else None
+
+
+# --- 2. Replica health ---
+
+def check_replica(alias):
+    """True when `alias` answers and is no more than MAX_LAG seconds behind."""
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(PG_LAG_SQL)
+                lag = cursor.fetchone()[0] or 0
+            else:
+                cursor.execute('SELECT 1')
+                lag = 0
+    except DatabaseError:
+        try:
+            connection.close()
+        except DatabaseError:
+            pass
+        return False
+    return lag <= setting('MAX_LAG')
+
+
+class ReplicaHealth:
+    """Health of each replica as last checked by this process."""
+
+    def __init__(self):
+        self.status = {}                # alias -> (checked at, healthy)
+        self.lock = threading.Lock()
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        with self.lock:
+            checked = self.status.get(alias)
+        if checked is not None and now - checked[0] < setting('HEALTH_CHECK_INTERVAL'):
+            return checked[1]
+        healthy = check_replica(alias)
+        with self.lock:
+            self.status[alias] = (now, healthy)
+        return healthy
+
+    def mark_unhealthy(self, alias):
+        with self.lock:
+            self.status[alias] = (time.monotonic(), False)
+
+    def clear(self):
+        with self.lock:
+            self.status.clear()
+
+
+health = ReplicaHealth()
+
+
+def _watch_errors(alias):
+    """Execute wrapper that takes `alias` out of rotation when a query on it fails to reach it."""
+    def wrapper(execute, sql, params, many, context):
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError:
+            health.mark_unhealthy(alias)
+            state = _state.get()
+            if state is not None and state.alias == alias:
+                state.replica_failed = True
+            raise
+    wrapper.replica_alias = alias
+    return wrapper
+
+
+def choose_replica():
+    """A healthy, connected replica picked at random, or None."""
+    candidates = list(replicas())
+    random.shuffle(candidates)
+    for alias in candidates:
+        if not health.is_healthy(alias):
+            continue
+        connection = connections[alias]
+        try:
+            connection.ensure_connection()
+        except DatabaseError:
+            health.mark_unhealthy(alias)
+            continue
+        if not any(getattr(w, 'replica_alias', None) == alias for w in connection.execute_wrappers):
+            connection.execute_wrappers.append(_watch_errors(alias))
+        return alias
+    return None
+
+
+# --- 3. Router and middleware ---
+
+class ReplicaRouter:
+    """Reads of a read request go to its replica; everything else uses the primary."""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.read_replica:
+            return DEFAULT_DB_ALIAS if state is not None else None
+        if state.alias is None:
+            state.alias = choose_replica() or DEFAULT_DB_ALIAS
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.read_replica = False
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        pool = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas receive the schema through replication.
+        return False if db in replicas() else None
+
+
+class ReplicaRoutingMiddleware:
+    """Opens the routing state of each request and sets the read-your-writes cookie."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def is_read(self, request):
+        if not replicas() or setting('COOKIE_NAME') in request.COOKIES:
+            return False
+        return request.method in SAFE_METHODS or (
+            request.method == 'POST' and request.path in setting('GRAPHQL_PATHS')
+        )
+
+    def respond(self, request, read_replica):
+        state = RoutingState(read_replica)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return state, response
+
+    async def arespond(self, request, read_replica):
+        state = RoutingState(read_replica)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return state, response
+
+    def finish(self, state, response):
+        if state.wrote:
+            response.set_cookie(
+                setting('COOKIE_NAME'), '1', max_age=setting('STICKY_SECONDS'), httponly=True, samesite='Lax'
+            )
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        read = self.is_read(request)
+        state, response = self.respond(request, read)
+        if read and state.replica_failed and not state.wrote:
+            state, response = self.respond(request, False)
+        return self.finish(state, response)
+
+    async def __acall__(self, request):
+        read = self.is_read(request)
+        state, response = await self.arespond(request, read)
+        if read and state.replica_failed and not state.wrote:
+            state, response = await self.arespond(request, False)
+        return self.finish(state, response)
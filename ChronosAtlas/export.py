@@ -0,0 +1,141 @@
+"""
+Streaming full and incremental exports of the dataset (the /api/export/
+endpoint and the export_data command).
+
+A dataset is read through a server-side cursor (QuerySet.iterator(), a named
+cursor on PostgreSQL) as plain value tuples, encoded BLOCK_ROWS rows at a time
+and optionally gzip-compressed on the fly, so memory use does not depend on
+the size of the table. Two encodings are offered, both one JSON document per
+line:
+
+    ndjson   one object per row: {"id": 1, "name": "Plato", ...}
+    columns  a header line {"dataset", "columns"}, then one line per block of
+             rows holding a list per column: [[1, 2], ["Plato", "Aristotle"], ...]
+
+`since` limits a dataset to rows changed at or after a time (`updated_at`).
+Every export reports a watermark to pass as `since` next time; it trails the
+start of the export by SINCE_OVERLAP so that rows written by transactions still
+open then are not missed, which means consecutive incremental exports may
+repeat rows (consumers upsert on `id`). Deleted rows are not reported: take a
+full export periodically. Fields have no timestamp and are always exported in
+full; `figure_fields` follows the `updated_at` of the figure, so an incremental
+export carries every link of each changed figure.
+"""
+import zlib
+from collections import namedtuple
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+FORMATS = ('ndjson', 'columns')
+COMPRESSIONS = ('gzip',)
+# Rows fetched from the cursor, and encoded, at a time.
+BLOCK_ROWS = 2000
+SINCE_OVERLAP = timedelta(minutes=5)
+
+Dataset = namedtuple('Dataset', 'model columns changed_at')
+
+DATASETS = {
+    'figures': Dataset('figures.Figure', [
+        'id', 'name', 'slug', 'wikidata_id', 'summary', 'birth_date', 'death_date',
+        'normalized_birth_year', 'normalized_death_year', 'instance_of_QIDs', 'updated_at',
+    ], 'updated_at'),
+    'fields': Dataset('figures.Field', ['id', 'name', 'wikidata_id'], None),
+    'figure_fields': Dataset('figures.Figure_fields', ['figure_id', 'field_id'], 'figure__updated_at'),
+    'events': Dataset('timeline.TimelineEvent', [
+        'id', 'title', 'year', 'category', 'description', 'importance', 'updated_at',
+    ], 'updated_at'),
+    'influences': Dataset('timeline.Influence', ['id', 'influencer_id', 'influenced_id', 'updated_at'], 'updated_at'),
+}
+
+CONTENT_TYPES = {None: 'application/x-ndjson', 'gzip': 'application/gzip'}
+
+
+class ExportError(ValueError):
+    """Raised for an unknown dataset, format or compression, or an invalid `since`."""
+
+
+def parse_since(value):
+    """A timezone-aware datetime from an ISO 8601 string (naive ones are taken in the current time zone)."""
+    try:
+        since = parse_datetime(value)
+    except ValueError:
+        since = None
+    if since is None:
+        raise ExportError(f"since is not an ISO 8601 date and time: {value!r}")
+    return timezone.make_aware(since) if timezone.is_naive(since) else since
+
+
+def watermark():
+    """The `since` of the next incremental export, to be taken before this one starts reading."""
+    return timezone.now() - SINCE_OVERLAP
+
+
+def filename(dataset, format='ndjson', compression=None):
+    name = f"{dataset}.ndjson" if format == 'ndjson' else f"{dataset}.{format}.ndjson"
+    return f"{name}.gz" if compression == 'gzip' else name
+
+
+def rows(dataset, since=None, using=None):
+    """Value tuples of `dataset` in primary key order, read through a server-side cursor."""
+    model, columns, changed_at = DATASETS[dataset]
+    queryset = apps.get_model(model)._base_manager.using(using)
+    if since is not None and changed_at is not None:
+        queryset = queryset.filter(**{f'{changed_at}__gte': since})
+    return queryset.order_by('pk').values_list(*columns).iterator(chunk_size=BLOCK_ROWS)
+
+
+def _blocks(iterator):
+    block = []
+    for row in iterator:
+        block.append(row)
+        if len(block) == BLOCK_ROWS:
+            yield block
+            block = []
+    if block:
+        yield block
+
+
+def encode(dataset, rows, format='ndjson'):
+    """Yields the encoded lines of `rows` as str, a block at a time."""
+    columns = DATASETS[dataset].columns
+    dumps = DjangoJSONEncoder(separators=(',', ':'), ensure_ascii=False).encode
+    if format == 'columns':
+        yield dumps({'dataset': dataset, 'columns': columns}) + '\n'
+        for block in _blocks(rows):
+            yield dumps([list(values) for values in zip(*block)]) + '\n'
+    else:
+        for block in _blocks(rows):
+            yield ''.join(dumps(dict(zip(columns, row))) + '\n' for row in block)
+
+
+def compress(chunks, compression=None):
+    """Yields `chunks` (str) as UTF-8 bytes, gzip-compressed on the fly with compression='gzip'."""
+    if compression is None:
+        for chunk in chunks:
+            yield chunk.encode()
+        return
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def check(dataset, format, compression):
+    if dataset not in DATASETS:
+        raise ExportError(f"Unknown dataset {dataset!r}; expected one of {', '.join(DATASETS)}.")
+    if format not in FORMATS:
+        raise ExportError(f"Unknown format {format!r}; expected one of {', '.join(FORMATS)}.")
+    if compression is not None and compression not in COMPRESSIONS:
+        raise ExportError(f"Unknown compression {compression!r}; expected one of {', '.join(COMPRESSIONS)}.")
+
+
+def stream(dataset, format='ndjson', compression=None, since=None, using=None):
+    """The bytes of one dataset's export. Raises ExportError on bad arguments (before reading anything)."""
+    check(dataset, format, compression)
+    return compress(encode(dataset, rows(dataset, since, using), format), compression)
@@ -0,0 +1,130 @@
+"""
+Graphene middleware for /graphql/: an execution time limit and per-resolver timing.
+
+CachedGraphQLView opens an ExecutionBudget on the request (info.context)
+around every execution. TimeoutMiddleware makes every resolver that starts after
+the deadline fail fast, and the view then replaces the result with a single
+timeout error. A resolver that is already running is not interrupted; on
+PostgreSQL, also set statement_timeout to cap single queries.
+
+ResolverTimingMiddleware records wall time, calls and SQL statements per
+"Type.field" while the /metrics registry is enabled (ChronosAtlas/metrics.py)
+or timing is on for the request: the client sent the X-GraphQL-Timing header,
+or GRAPHQL_LIMITS['TIMING_ALWAYS'] is set. In the latter case, the view also
+returns the numbers under `extensions.timing` and logs them.
+"""
+import logging
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+from graphql import GraphQLError
+
+from . import metrics
+from .query_cost import setting
+
+logger = logging.getLogger(__name__)
+
+TIMING_HEADER = 'HTTP_X_GRAPHQL_TIMING'
+# Resolvers listed in the log line, slowest first.
+LOGGED_RESOLVERS = 10
+
+
+class QueryTimeout(GraphQLError):
+    pass
+
+
+class ResolverTimings:
+    """Per-field totals for one request, plus a running SQL statement count."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.fields = defaultdict(lambda: [0, 0.0, 0])   # "Type.field" -> [calls, seconds, queries]
+
+    def count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def seconds_per_field(self):
+        return {field: seconds for field, (_, seconds, _) in self.fields.items()}
+
+    def as_dict(self):
+        ranked = sorted(self.fields.items(), key=lambda item: -item[1][1])
+        return {
+            'totalMs': round(self.elapsed() * 1000, 3),
+            'sqlQueries': self.queries,
+            'resolvers': [
+                {'field': field, 'calls': calls, 'totalMs': round(seconds * 1000, 3), 'sqlQueries': queries}
+                for field, (calls, seconds, queries) in ranked
+            ],
+        }
+
+
+class ExecutionBudget:
+    """Deadline (and optional timings) of one GraphQL execution, kept on the request."""
+
+    def __init__(self, timeout, timings=None):
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.timed_out = False
+        self.timings = timings
+
+
+def timing_requested(request):
+    return setting('TIMING_ALWAYS') or request.META.get(TIMING_HEADER, '').lower() in ('1', 'true')
+
+
+@contextmanager
+def execution_budget(request):
+    """Attaches an ExecutionBudget to the request for the duration of one execution."""
+    timings = ResolverTimings() if timing_requested(request) or metrics.enabled() else None
+    budget = request.graphql_budget = ExecutionBudget(setting('TIMEOUT'), timings)
+    try:
+        with ExitStack() as stack:
+            if timings is not None:
+                # Every alias: resolvers may read from a replica (ChronosAtlas/db_routing.py).
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings.count_query))
+            yield budget
+    finally:
+        del request.graphql_budget
+
+
+def log_timings(operation_name, timings):
+    data = timings.as_dict()
+    slowest = ', '.join(
+        f"{r['field']}={r['totalMs']}ms/{r['calls']}x/{r['sqlQueries']}q"
+        for r in data['resolvers'][:LOGGED_RESOLVERS]
+    )
+    logger.info("GraphQL %s: %sms, %s SQL queries; %s",
+                operation_name or 'anonymous', data['totalMs'], data['sqlQueries'], slowest)
+
+
+class TimeoutMiddleware:
+    def resolve(self, next, root, info, **args):
+        budget = getattr(info.context, 'graphql_budget', None)
+        if budget is not None and budget.deadline is not None and time.monotonic() > budget.deadline:
+            budget.timed_out = True
+            raise QueryTimeout(f"Query exceeded the {budget.timeout:g}s time limit.")
+        return next(root, info, **args)
+
+
+class ResolverTimingMiddleware:
+    def resolve(self, next, root, info, **args):
+        budget = getattr(info.context, 'graphql_budget', None)
+        timings = budget and budget.timings
+        if not timings:
+            return next(root, info, **args)
+        queries, start = timings.queries, time.perf_counter()
+        try:
+            return next(root, info, **args)
+        finally:
+            totals = timings.fields[f'{info.parent_type.name}.{info.field_name}']
+            totals[0] += 1
+            totals[1] += time.perf_counter() - start
+            totals[2] += timings.queries - queries
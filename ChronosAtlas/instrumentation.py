@@ -0,0 +1,285 @@
+"""
+Per-request instrumentation: SQL count and time, repeated (N+1) statements,
+serialization time and the GraphQL operation name of every request.
+
+InstrumentationMiddleware opens a RequestMetrics for each request. Every
+database connection runs its statements through record_query(), which adds
+them to the metrics of the request in progress (a context variable, so the
+read pool threads of the ASGI URLconf report to the request they serve).
+Statements are grouped by their SQL text before parameters are bound, so a
+statement run once per row of a list shows up as one entry with a high count.
+
+The numbers go out three ways, configured with settings.INSTRUMENTATION:
+
+    Server-Timing   total, sql, serialize, graphql and nplus1 entries on every
+                    response (browser dev tools show them)
+    slow log        requests slower than SLOW_REQUEST_MS are logged, sampled at
+                    SLOW_LOG_SAMPLE_RATE, with their slowest statements
+    cProfile        a request carrying X-Profile is profiled into PROFILE_DIR
+                    when the header holds PROFILE_TOKEN or the user is staff
+
+Under ASGI, profiles cover the views of the read pool routes (/api/, /graphql/).
+Finished requests are also counted into the /metrics registry (ChronosAtlas/metrics.py).
+"""
+import cProfile
+import hmac
+import logging
+import os
+import random
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils.text import slugify
+from rest_framework.renderers import JSONRenderer
+
+from . import metrics as registry
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'SERVER_TIMING': True,          # send the Server-Timing header
+    'SLOW_REQUEST_MS': 1000,        # requests at least this slow are logged
+    'SLOW_LOG_SAMPLE_RATE': 1.0,    # fraction of the slow requests logged
+    'LOGGED_STATEMENTS': 20,        # statements listed per slow request, slowest first
+    'DUPLICATE_QUERY_THRESHOLD': 3, # runs of one statement in a request reported as N+1
+    'PROFILE_DIR': None,            # where cProfile dumps go; None disables profiling
+    'PROFILE_TOKEN': None,          # X-Profile value that authorizes callers who are not staff
+}
+
+PROFILE_HEADER = 'X-Profile'
+
+
+def setting(name):
+    return getattr(settings, 'INSTRUMENTATION', {}).get(name, DEFAULTS[name])
+
+
+class RequestMetrics:
+    """What one request spent, filled in while it runs."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.statements = defaultdict(lambda: [0, 0.0])     # SQL -> [runs, seconds]
+        self.by_alias = defaultdict(lambda: [0, 0.0])       # database alias -> [queries, seconds]
+        self.timers = defaultdict(float)                    # e.g. 'serialize' -> seconds
+        self.graphql_operation = None
+        self.profile_requested = False
+        self.profile = None
+
+    def add_query(self, sql, seconds, alias):
+        self.queries += 1
+        self.sql_seconds += seconds
+        for totals in (self.statements[sql], self.by_alias[alias]):
+            totals[0] += 1
+            totals[1] += seconds
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.started
+
+    def duplicates(self):
+        """(runs, SQL) of the statements run at least DUPLICATE_QUERY_THRESHOLD times, most runs first."""
+        threshold = setting('DUPLICATE_QUERY_THRESHOLD')
+        repeated = [(runs, sql) for sql, (runs, _) in self.statements.items() if runs >= threshold]
+        return sorted(repeated, key=lambda item: -item[0])
+
+    def slowest(self, limit):
+        """(seconds, runs, SQL) of the statements that took longest in total."""
+        ranked = sorted(self.statements.items(), key=lambda item: -item[1][1])
+        return [(seconds, runs, sql) for sql, (runs, seconds) in ranked[:limit]]
+
+
+_current = ContextVar('instrumentation_metrics', default=None)
+
+
+def current():
+    """The RequestMetrics of the request in progress, or None."""
+    return _current.get()
+
+
+@contextmanager
+def recording():
+    """Collects the metrics of the code inside the block."""
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        metrics.finish()
+        _current.reset(token)
+
+
+@contextmanager
+def timed(name):
+    """Adds the time spent in the block to the current request's `name` timer."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.timers[name] += time.perf_counter() - start
+
+
+def annotate_graphql(operation_name):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.graphql_operation = operation_name or 'anonymous'
+
+
+# --- 1. SQL ---
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper installed on every connection; a no-op outside a request."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(sql, time.perf_counter() - start, context['connection'].alias)
+
+
+def install(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+@receiver(connection_created)
+def _install_on_new_connection(sender, connection, **kwargs):
+    install(connection)
+
+
+# --- 2. Serialization and profiling hooks ---
+
+class TimedJSONRenderer(JSONRenderer):
+    """DRF's JSONRenderer, counting its time as serialization."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed('serialize'):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+def profile_call(func, *args, **kwargs):
+    """Calls func, under cProfile when the current request asked for a profile and none is running."""
+    metrics = _current.get()
+    if metrics is None or not metrics.profile_requested or metrics.profile is not None:
+        return func(*args, **kwargs)
+    metrics.profile = cProfile.Profile()
+    return metrics.profile.runcall(func, *args, **kwargs)
+
+
+def _profile_authorized(request, user):
+    value = request.headers.get(PROFILE_HEADER)
+    if not value or not setting('PROFILE_DIR'):
+        return False
+    token = setting('PROFILE_TOKEN')
+    if token and hmac.compare_digest(value.encode(), token.encode()):
+        return True
+    return bool(user is not None and user.is_staff)
+
+
+def _dump_profile(request, metrics):
+    name = f"{time.strftime('%Y%m%dT%H%M%S')}-{request.method}-{slugify(request.path)[:60]}-{uuid.uuid4().hex[:8]}.prof"
+    metrics.profile.dump_stats(os.path.join(setting('PROFILE_DIR'), name))
+    return name
+
+
+# --- 3. Reporting ---
+
+def _ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+def _quoted(text):
+    return '"' + str(text).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def server_timing(metrics, profile_name=None):
+    """The Server-Timing header value for a finished request."""
+    entries = [
+        f'total;dur={_ms(metrics.seconds)}',
+        f'sql;dur={_ms(metrics.sql_seconds)};desc={_quoted(f"{metrics.queries} queries")}',
+    ]
+    if 'serialize' in metrics.timers:
+        entries.append(f"serialize;dur={_ms(metrics.timers['serialize'])}")
+    duplicates = metrics.duplicates()
+    if duplicates:
+        runs = ', '.join(str(count) for count, _ in duplicates)
+        entries.append(f'nplus1;desc={_quoted(f"{len(duplicates)} statements repeated ({runs} runs)")}')
+    if metrics.graphql_operation:
+        entries.append(f'graphql;desc={_quoted(metrics.graphql_operation)}')
+    if profile_name:
+        entries.append(f'profile;desc={_quoted(profile_name)}')
+    return ', '.join(entries)
+
+
+def log_if_slow(request, response, metrics):
+    if _ms(metrics.seconds) < setting('SLOW_REQUEST_MS') or random.random() >= setting('SLOW_LOG_SAMPLE_RATE'):
+        return
+    lines = [
+        f"Slow request {request.method} {request.get_full_path()} -> {response.status_code}: "
+        f"{_ms(metrics.seconds)}ms, {metrics.queries} SQL queries in {_ms(metrics.sql_seconds)}ms"
+        + (f", serialization {_ms(metrics.timers['serialize'])}ms" if 'serialize' in metrics.timers else '')
+        + (f", GraphQL operation {metrics.graphql_operation}" if metrics.graphql_operation else '')
+    ]
+    for runs, sql in metrics.duplicates():
+        lines.append(f"  N+1: {runs}x {sql}")
+    for seconds, runs, sql in metrics.slowest(setting('LOGGED_STATEMENTS')):
+        lines.append(f"  {_ms(seconds)}ms {runs}x {sql}")
+    logger.warning('\n'.join(lines))
+
+
+class InstrumentationMiddleware:
+    """Records each request's metrics and reports them (see the module docstring)."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Connections opened before the middleware was loaded (in this thread).
+        for connection in connections.all(initialized_only=True):
+            install(connection)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not setting('ENABLED'):
+            return self.get_response(request)
+        with recording() as metrics:
+            metrics.profile_requested = _profile_authorized(request, getattr(request, 'user', None))
+            response = profile_call(self.get_response, request)
+        return self.report(request, response, metrics)
+
+    async def __acall__(self, request):
+        if not setting('ENABLED'):
+            return await self.get_response(request)
+        with recording() as metrics:
+            user = await request.auser() if hasattr(request, 'auser') else None
+            metrics.profile_requested = _profile_authorized(request, user)
+            # The view itself calls profile_call() on its read pool thread.
+            response = await self.get_response(request)
+        return self.report(request, response, metrics)
+
+    def report(self, request, response, metrics):
+        profile_name = _dump_profile(request, metrics) if metrics.profile is not None else None
+        if setting('SERVER_TIMING'):
+            response['Server-Timing'] = server_timing(metrics, profile_name)
+        log_if_slow(request, response, metrics)
+        registry.observe_request(request, response, metrics)
+        return response
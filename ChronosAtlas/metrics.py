@@ -0,0 +1,349 @@
+"""
+In-process metrics registry exposed in the Prometheus text format on /metrics.
+
+Every sample is a monotonic counter (histograms are stored as their cumulative
+buckets, sum and count), so the values of several processes add up. Each
+process writes its own samples into a memory-mapped file in
+settings.METRICS['DIRECTORY'], one (key, float64) record per sample, updated in
+place; a scrape of any worker sums the files of every process that ever
+served, so gunicorn's prefork workers report as one server. Files of exited
+workers are kept (their counts still count) until the directory is emptied
+when the server restarts, which entrypoint.sh does. Without a DIRECTORY the
+samples stay in anonymous memory and /metrics reports the scraped process only.
+
+Recorded:
+
+    chronos_http_requests_total                   method, route, status
+    chronos_http_request_duration_seconds         method, route (histogram)
+    chronos_graphql_operation_duration_seconds    operation (histogram)
+    chronos_graphql_resolver_duration_seconds     field: time per operation spent in
+                                                  one "Type.field" (histogram)
+    chronos_db_queries_total                      alias
+    chronos_db_query_duration_seconds_total       alias
+    chronos_db_connections_opened_total           alias
+    chronos_response_cache_requests_total         result (hit or miss)
+
+Requests are recorded by InstrumentationMiddleware (ChronosAtlas/instrumentation.py)
+and GraphQL executions by CachedGraphQLView. The cache hit ratio is
+rate(...{result="hit"}) / rate(chronos_response_cache_requests_total).
+"""
+import ipaddress
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+DEFAULTS = {
+    'ENABLED': True,
+    'DIRECTORY': None,      # shared by every worker of the server; None keeps samples per process
+    'ALLOWED_NETWORKS': ['127.0.0.0/8', '::1/128'],   # clients that may scrape /metrics
+    'MAX_OPERATION_NAMES': 200,     # distinct GraphQL operation labels per process, then "other"
+}
+
+# Seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+
+COUNTER, HISTOGRAM = 'counter', 'histogram'
+FAMILIES = {
+    'chronos_http_requests_total': (COUNTER, 'HTTP requests served.'),
+    'chronos_http_request_duration_seconds': (HISTOGRAM, 'Time to produce an HTTP response.'),
+    'chronos_graphql_operation_duration_seconds': (HISTOGRAM, 'Execution time of GraphQL operations.'),
+    'chronos_graphql_resolver_duration_seconds': (
+        HISTOGRAM, 'Time one GraphQL operation spent in a field, over all its calls.'
+    ),
+    'chronos_db_queries_total': (COUNTER, 'SQL statements run while serving requests.'),
+    'chronos_db_query_duration_seconds_total': (COUNTER, 'Time spent in SQL statements while serving requests.'),
+    'chronos_db_connections_opened_total': (COUNTER, 'Database connections opened.'),
+    'chronos_response_cache_requests_total': (COUNTER, 'Response cache lookups, by result.'),
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def setting(name):
+    return getattr(settings, 'METRICS', {}).get(name, DEFAULTS[name])
+
+
+def enabled():
+    return setting('ENABLED')
+
+
+# --- 1. Storage ---
+
+_HEADER = struct.Struct('<Q')       # bytes in use, header included
+_KEY_LENGTH = struct.Struct('<I')
+_VALUE = struct.Struct('<d')
+INITIAL_SIZE = 64 * 1024
+
+
+def _padded(length):
+    return (length + 7) // 8 * 8
+
+
+def read_samples(data):
+    """Yields (key, value) from the bytes of a samples file."""
+    if len(data) < _HEADER.size:
+        return
+    used = min(_HEADER.unpack_from(data, 0)[0], len(data))
+    offset = _HEADER.size
+    while offset + _KEY_LENGTH.size <= used:
+        length = _KEY_LENGTH.unpack_from(data, offset)[0]
+        key_start = offset + _KEY_LENGTH.size
+        value_offset = _padded(key_start + length)
+        if value_offset + _VALUE.size > used:
+            return
+        yield data[key_start:key_start + length].decode(), _VALUE.unpack_from(data, value_offset)[0]
+        offset = value_offset + _VALUE.size
+
+
+class Samples:
+    """
+    float64 samples of one process in a growable memory map. New records are
+    written before the header that makes them visible, and values are updated in
+    place, so other processes can read the file at any time without locking.
+    """
+
+    def __init__(self, directory):
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.positions = {}
+        self.file = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self.path = os.path.join(directory, f'samples_{self.pid}.db')
+            self.file = open(self.path, 'w+b')
+            self.file.truncate(INITIAL_SIZE)
+            self.map = mmap.mmap(self.file.fileno(), INITIAL_SIZE)
+        else:
+            self.path = None
+            self.map = mmap.mmap(-1, INITIAL_SIZE)
+        self.used = _HEADER.size
+        _HEADER.pack_into(self.map, 0, self.used)
+
+    def _grow(self, needed):
+        size = len(self.map)
+        while size < needed:
+            size *= 2
+        if self.file is not None:
+            self.map.close()
+            self.file.truncate(size)
+            self.map = mmap.mmap(self.file.fileno(), size)
+        else:
+            grown = mmap.mmap(-1, size)
+            grown[:self.used] = self.map[:self.used]
+            self.map.close()
+            self.map = grown
+
+    def _position(self, key):
+        position = self.positions.get(key)
+        if position is None:
+            encoded = key.encode()
+            position = _padded(self.used + _KEY_LENGTH.size + len(encoded))
+            end = position + _VALUE.size
+            if end > len(self.map):
+                self._grow(end)
+            _KEY_LENGTH.pack_into(self.map, self.used, len(encoded))
+            self.map[self.used + _KEY_LENGTH.size:self.used + _KEY_LENGTH.size + len(encoded)] = encoded
+            _VALUE.pack_into(self.map, position, 0.0)
+            self.used = end
+            _HEADER.pack_into(self.map, 0, self.used)
+            self.positions[key] = position
+        return position
+
+    def add(self, increments):
+        """Adds each (key, amount)."""
+        with self.lock:
+            for key, amount in increments:
+                position = self._position(key)
+                _VALUE.pack_into(self.map, position, _VALUE.unpack_from(self.map, position)[0] + amount)
+
+    def items(self):
+        with self.lock:
+            return list(read_samples(self.map[:self.used]))
+
+
+_samples = None
+_samples_lock = threading.Lock()
+_operation_names = set()
+
+
+def samples():
+    """This process's Samples; reopened after a fork, since a child must not write into its parent's file."""
+    global _samples
+    with _samples_lock:
+        if _samples is None or _samples.pid != os.getpid():
+            _samples = Samples(setting('DIRECTORY'))
+        return _samples
+
+
+@receiver(setting_changed)
+def reset(**kwargs):
+    """Starts over with new samples when METRICS changes (in tests)."""
+    global _samples
+    if kwargs['setting'] != 'METRICS':
+        return
+    with _samples_lock:
+        if _samples is not None and _samples.file is not None:
+            _samples.map.close()
+            _samples.file.close()
+        _samples = None
+        _operation_names.clear()
+
+
+# --- 2. Recording ---
+
+def _key(name, labels):
+    return json.dumps([name, labels], separators=(',', ':'))
+
+
+def _counter(name, amount=1, **labels):
+    return _key(name, sorted(labels.items())), amount
+
+
+def _observation(name, value, **labels):
+    """The increments of one histogram observation."""
+    labels = sorted(labels.items())
+    increments = [
+        (_key(f'{name}_bucket', labels + [('le', bound)]), 1) for bound in BUCKETS if value <= bound
+    ]
+    increments.append((_key(f'{name}_sum', labels), value))
+    increments.append((_key(f'{name}_count', labels), 1))
+    return increments
+
+
+def inc(name, amount=1, **labels):
+    if enabled():
+        samples().add([_counter(name, amount, **labels)])
+
+
+def route(request):
+    """Bounded route label: the URL pattern's name (or pattern) rather than the path."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name if match.url_name else (match.route or 'root')
+
+
+def observe_request(request, response, request_metrics):
+    """Records one finished request from its RequestMetrics (ChronosAtlas/instrumentation.py)."""
+    if not enabled():
+        return
+    labels = {'method': request.method, 'route': route(request)}
+    increments = [_counter('chronos_http_requests_total', status=str(response.status_code), **labels)]
+    increments += _observation('chronos_http_request_duration_seconds', request_metrics.seconds, **labels)
+    for alias, (queries, seconds) in request_metrics.by_alias.items():
+        increments.append(_counter('chronos_db_queries_total', queries, alias=alias))
+        increments.append(_counter('chronos_db_query_duration_seconds_total', seconds, alias=alias))
+    samples().add(increments)
+
+
+def _operation_label(name):
+    if name in _operation_names:
+        return name
+    if len(_operation_names) >= setting('MAX_OPERATION_NAMES'):
+        return 'other'
+    _operation_names.add(name)
+    return name
+
+
+def observe_graphql(operation_name, seconds, fields):
+    """Records one GraphQL execution; `fields` maps "Type.field" to seconds spent in it."""
+    if not enabled():
+        return
+    increments = _observation('chronos_graphql_operation_duration_seconds', seconds,
+                              operation=_operation_label(operation_name or 'anonymous'))
+    for field, field_seconds in fields.items():
+        increments += _observation('chronos_graphql_resolver_duration_seconds', field_seconds, field=field)
+    samples().add(increments)
+
+
+@receiver(connection_created)
+def _count_connection(sender, connection, **kwargs):
+    inc('chronos_db_connections_opened_total', alias=connection.alias)
+
+
+# --- 3. Exposition ---
+
+def collect():
+    """{key: value} summed over every process's samples."""
+    totals = defaultdict(float)
+    own = samples()
+    for key, value in own.items():
+        totals[key] += value
+    directory = setting('DIRECTORY')
+    if directory and os.path.isdir(directory):
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if not name.endswith('.db') or path == own.path:
+                continue
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            for key, value in read_samples(data):
+                totals[key] += value
+    return totals
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _family(name):
+    for suffix in ('_bucket', '_sum', '_count'):
+        base = name[:-len(suffix)]
+        if name.endswith(suffix) and FAMILIES.get(base, (None,))[0] == HISTOGRAM:
+            return base
+    return name
+
+
+def _sort_key(sample):
+    name, labels, _ = sample
+    family = _family(name)
+    plain = [pair for pair in labels if pair[0] != 'le']
+    le = next((bound for label, bound in labels if label == 'le'), 0)
+    return family, plain, {'_bucket': 0, '_sum': 1, '_count': 2}.get(name[len(family):], 0), le
+
+
+def render(totals):
+    """Prometheus text exposition (format 0.0.4) of collect()'s totals."""
+    decoded = []
+    for key, value in totals.items():
+        name, labels = json.loads(key)
+        decoded.append((name, [tuple(pair) for pair in labels], value))
+    lines, current_family = [], None
+    for name, labels, value in sorted(decoded, key=_sort_key):
+        family = _family(name)
+        if family != current_family:
+            kind, help_text = FAMILIES.get(family, ('untyped', ''))
+            lines += [f'# HELP {family} {help_text}', f'# TYPE {family} {kind}']
+            current_family = family
+        label_text = ','.join(
+            f'{label}="{_format_value(bound) if label == "le" else _escape(bound)}"' for label, bound in labels
+        )
+        lines.append(f'{name}{{{label_text}}} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def allowed(request):
+    """True if the client may scrape /metrics (its address is in ALLOWED_NETWORKS)."""
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network) for network in setting('ALLOWED_NETWORKS'))
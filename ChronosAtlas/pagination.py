@@ -0,0 +1,293 @@
+"""
+Keyset (cursor) pagination shared by the REST viewsets and GraphQL connections.
+
+Pages are selected with a WHERE clause on the ordering columns
+(e.g. "after (birth_year, name, id)") instead of OFFSET, so the database can seek
+straight to the page through the ordering index and page 10,000 costs the same
+as page 1. Orderings always end with the primary key so positions are unique.
+
+The clause is written so that a B-tree index on the ordering columns can seek to
+it: columns sorted the same way are compared as one row value,
+"(name, id) > (%s, %s)", and a column before them gets a redundant range bound,
+"birth_year >= %s AND (birth_year > %s OR (birth_year = %s AND ...))", with its
+NULL rows as a separate branch.
+"""
+import base64
+import json
+
+import graphene
+from django.db.models import BooleanField, Expression, F, Q, Value
+from graphql import GraphQLError
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(data):
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}")
+
+
+class RowComparison(Expression):
+    """A row-value comparison, "(a, b) > (%s, %s)", usable as a filter condition."""
+    conditional = True
+    output_field = BooleanField()
+
+    def __init__(self, keys, values, operator):
+        super().__init__()
+        self.columns = [F(key) for key in keys]
+        self.values = [Value(value) for value in values]
+        self.operator = operator
+
+    def get_source_expressions(self):
+        return self.columns + self.values
+
+    def set_source_expressions(self, exprs):
+        self.columns, self.values = exprs[:len(self.columns)], exprs[len(self.columns):]
+
+    def resolve_expression(self, *args, **kwargs):
+        resolved = super().resolve_expression(*args, **kwargs)
+        # Bind each value to its column's type so it is adapted like in a plain lookup.
+        resolved.values = [
+            Value(value.value, output_field=column.output_field)
+            for column, value in zip(resolved.columns, resolved.values)
+        ]
+        return resolved
+
+    def as_sql(self, compiler, connection):
+        sides, params = [], []
+        for exprs in (self.columns, self.values):
+            parts = [compiler.compile(expr) for expr in exprs]
+            sides.append(', '.join(sql for sql, _ in parts))
+            params.extend(param for _, part_params in parts for param in part_params)
+        return f"({sides[0]}) {self.operator} ({sides[1]})", params
+
+
+class Keyset:
+    """
+    An ordering that can be paginated by position.
+    A "-" prefix sorts a column descending. NULLs sort last going forwards on
+    every backend, matching PostgreSQL's default B-tree order so the composite
+    ordering index can be used directly.
+
+    Columns may live on a related row ("influence_metrics__pagerank"); they are
+    read through an annotation, and rows without the related row are left out
+    when its column is NOT NULL, so the ordering can follow that table's index.
+    """
+
+    def __init__(self, model, *fields):
+        if fields[-1] not in ('id', 'pk'):
+            fields = fields + ('id',)
+        self.fields = tuple(name.lstrip('-') for name in fields)
+        self.descending = [name.startswith('-') for name in fields]
+        self.nullable = [self._field(model, name).null for name in self.fields]
+        self.keys = [f'keyset_{i}' if '__' in name else name for i, name in enumerate(self.fields)]
+        # The model's own columns, e.g. for QuerySet.only().
+        self.columns = tuple(name for name in self.fields if '__' not in name)
+
+    @staticmethod
+    def _field(model, path):
+        *relations, name = path.split('__')
+        for relation in relations:
+            model = model._meta.get_field(relation).related_model
+        return model._meta.get_field(name)
+
+    def prepare(self, queryset):
+        """Annotates the related columns and drops rows that lack a NOT NULL one."""
+        related = {key: F(name) for name, key in zip(self.fields, self.keys) if key != name}
+        if not related:
+            return queryset
+        required = {
+            f"{name}__isnull": False
+            for name, key, nullable in zip(self.fields, self.keys, self.nullable) if key != name and not nullable
+        }
+        return queryset.filter(**required).annotate(**related)
+
+    def order_by(self, reverse=False):
+        ordering = []
+        for key, descending, nullable in zip(self.keys, self.descending, self.nullable):
+            nulls = ({'nulls_first': True} if reverse else {'nulls_last': True}) if nullable else {}
+            ordering.append(F(key).desc(**nulls) if reverse != descending else F(key).asc(**nulls))
+        return ordering
+
+    def position(self, obj):
+        return [getattr(obj, key) for key in self.keys]
+
+    def _after(self, i, position, reverse):
+        """
+        Rows past `position` on columns i onwards, among rows equal to it on the
+        columns before i; None when there are none.
+        """
+        key, nullable, descending, value = self.keys[i], self.nullable[i], self.descending[i], position[i]
+        rest = range(i, len(self.keys))
+        if (i < len(self.keys) - 1 and None not in position[i:]
+                and not any(self.nullable[j] for j in rest)
+                and all(self.descending[j] == descending for j in rest)):
+            return Q(RowComparison(self.keys[i:], position[i:], '<' if reverse != descending else '>'))
+        after = self._after(i + 1, position, reverse) if i < len(self.keys) - 1 else None
+
+        if value is None:
+            # NULLs are last: only the NULL group can follow, and all non-NULL rows precede it.
+            condition = Q(**{f"{key}__isnull": True}) & after if after is not None else None
+            if reverse:
+                tail = Q(**{f"{key}__isnull": False})
+                condition = tail if condition is None else tail | condition
+            return condition
+
+        backwards = reverse != descending
+        condition = Q(**{f"{key}__{'lt' if backwards else 'gt'}": value})
+        if after is not None:
+            # The redundant bound lets the index range-scan from `value` on.
+            bound = Q(**{f"{key}__{'lte' if backwards else 'gte'}": value})
+            condition = bound & (condition | (Q(**{key: value}) & after))
+        if nullable and not reverse:
+            condition |= Q(**{f"{key}__isnull": True})
+        return condition
+
+    def filter_after(self, queryset, position, reverse=False):
+        """Restricts the (prepared) queryset to rows after `position` (before it when reverse)."""
+        if not isinstance(position, list) or len(position) != len(self.fields):
+            raise InvalidCursor("Cursor does not match this ordering.")
+        condition = self._after(0, position, reverse)
+        if condition is None:
+            return queryset.none()
+        return queryset.filter(condition)
+
+    def page(self, queryset, limit, position=None, reverse=False):
+        """
+        Returns (rows, has_more) for one page in display order.
+        Fetches limit + 1 rows to learn whether another page exists.
+        """
+        queryset = self.prepare(queryset)
+        if position is not None:
+            queryset = self.filter_after(queryset, position, reverse)
+        rows = list(queryset.order_by(*self.order_by(reverse))[:limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if reverse:
+            rows.reverse()
+        return rows, has_more
+
+
+def clamp_page_size(size):
+    if size is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(int(size), MAX_PAGE_SIZE))
+
+
+class KeysetPagination(BasePagination):
+    """
+    DRF pagination class using Keyset; subclasses set `ordering`.
+    Responds with {"next", "previous", "results"} like DRF's CursorPagination,
+    but compares every ordering column so it never falls back to OFFSET.
+    """
+    ordering = ('id',)
+    # Other orderings a client may pick with ?ordering=<name>: {name: fields}.
+    orderings = {}
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering_query_param = 'ordering'
+
+    def get_ordering(self, request):
+        name = request.query_params.get(self.ordering_query_param)
+        if not name:
+            return self.ordering
+        if name not in self.orderings:
+            raise ValidationError({self.ordering_query_param: (
+                f"Unknown ordering {name!r}. Available: {', '.join(self.orderings) or 'none'}."
+            )})
+        return self.orderings[name]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        keyset = Keyset(queryset.model, *self.get_ordering(request))
+
+        try:
+            limit = clamp_page_size(request.query_params.get(self.page_size_query_param))
+        except ValueError:
+            limit = DEFAULT_PAGE_SIZE
+
+        position, reverse = None, False
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            try:
+                data = decode_cursor(cursor)
+                position, reverse = data['p'], bool(data.get('r'))
+                rows, has_more = keyset.page(queryset, limit, position, reverse)
+            except (ValueError, KeyError, TypeError, AttributeError):
+                raise NotFound("Invalid cursor.")
+        else:
+            rows, has_more = keyset.page(queryset, limit)
+
+        self.next_position = self.previous_position = None
+        if rows:
+            first, last = keyset.position(rows[0]), keyset.position(rows[-1])
+            if has_more or reverse:
+                self.next_position = last
+            if position is not None and (has_more or not reverse):
+                self.previous_position = first
+        return rows
+
+    def _link(self, position, reverse):
+        if position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encode_cursor({'p': position, 'r': int(reverse)}))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self._link(self.next_position, False),
+            'previous': self._link(self.previous_position, True),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+def resolve_keyset_connection(connection_type, keyset, queryset, first=None, after=None,
+                              last=None, before=None):
+    """
+    Builds a Relay connection for `queryset` using keyset pagination.
+    Forward paging uses first/after; backward paging uses last/before.
+    """
+    reverse = last is not None or before is not None
+    limit = clamp_page_size(last if reverse else first)
+    cursor = before if reverse else after
+    try:
+        position = decode_cursor(cursor) if cursor else None
+        rows, has_more = keyset.page(queryset, limit, position, reverse)
+    except (ValueError, TypeError):
+        raise GraphQLError(f"Invalid cursor: {cursor!r}")
+    edges = [
+        connection_type.Edge(node=row, cursor=encode_cursor(keyset.position(row)))
+        for row in rows
+    ]
+    page_info = graphene.relay.PageInfo(
+        start_cursor=edges[0].cursor if edges else None,
+        end_cursor=edges[-1].cursor if edges else None,
+        has_next_page=has_more if not reverse else cursor is not None,
+        has_previous_page=has_more if reverse else cursor is not None,
+    )
+    return connection_type(edges=edges, page_info=page_info)
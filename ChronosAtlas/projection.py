@@ -0,0 +1,183 @@
+"""
+Column projection: read only the columns and relations a response uses.
+
+REST: SparseFieldsetMixin gives a viewset's list and retrieve routes
+`?fields=a,b` (keep only these) and `?omit=c,d` (drop these). The serializer
+loses the other fields, and the queryset is narrowed with .only() to the
+columns behind the remaining ones, plus the primary key and the pagination
+ordering. Forward and reverse one-to-one relations are select_related and
+many-valued ones prefetch_related only when a kept field renders them. Without
+either parameter every field is kept, which still prefetches the relations the
+serializer needs.
+
+GraphQL: project(queryset, info, object_type) applies .only() with the columns
+of every field selected on `object_type` anywhere in the operation (through
+fragments too). Using the whole operation rather than one field's subtree keeps
+objects shared through DataLoaders complete for every place they appear.
+Relations are left to the DataLoaders (ChronosAtlas/dataloaders.py), which
+already batch them.
+
+Fields that are not model fields (custom resolvers, SerializerMethodFields)
+are assumed to need nothing beyond the primary key on GraphQL types; on
+serializers they disable .only() entirely. Reading a deferred column still
+works, at the cost of one query per object.
+"""
+from collections import defaultdict
+
+from django.core.exceptions import FieldDoesNotExist
+from graphene.utils.str_converters import to_camel_case
+from graphql import TypeInfo, TypeInfoVisitor, Visitor, visit
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+
+# --- 1. REST sparse fieldsets ---
+
+def _names(params, name):
+    value = params.get(name)
+    if value is None:
+        return None
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+
+def serializer_projection(serializer, model):
+    """
+    Returns (only, select_related, prefetch_related) for the fields of `serializer`;
+    `only` is None when a field's source cannot be mapped to model columns.
+    """
+    only, select, prefetch = {model._meta.pk.name}, set(), set()
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        source = field.source
+        try:
+            model_field = model._meta.get_field(source)
+        except FieldDoesNotExist:
+            model_field = None
+        if model_field is None or source == '*' or '.' in source:
+            only = None
+            continue
+        if model_field.many_to_many or model_field.one_to_many:
+            prefetch.add(source)
+        elif model_field.one_to_one and not model_field.concrete:
+            # A reverse one-to-one row joins in without loading any local column.
+            select.add(source)
+        elif model_field.concrete:
+            if only is not None:
+                only.add(source)
+            # A bare primary key only needs the local column.
+            if model_field.is_relation and not isinstance(field, serializers.PrimaryKeyRelatedField):
+                select.add(source)
+    return only, select, prefetch
+
+
+class SparseFieldsetMixin:
+    """
+    ?fields= / ?omit= on a viewset's read routes, with the matching .only(),
+    select_related() and prefetch_related() (see the module docstring).
+    """
+    fields_query_param = 'fields'
+    omit_query_param = 'omit'
+    sparse_fieldset_actions = ('list', 'retrieve')
+
+    def sparse_fieldset(self):
+        """Serializer field names to keep (None for all), validated against the serializer."""
+        if not hasattr(self, '_sparse_fieldset'):
+            params = self.request.query_params
+            fields = _names(params, self.fields_query_param)
+            omit = _names(params, self.omit_query_param)
+            available = list(self.get_serializer_class()(context=self.get_serializer_context()).fields)
+            for param, names in ((self.fields_query_param, fields), (self.omit_query_param, omit)):
+                unknown = [name for name in names or () if name not in available]
+                if unknown:
+                    raise ValidationError({param: (
+                        f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(available)}."
+                    )})
+            if fields is None and omit is None:
+                self._sparse_fieldset = None
+            else:
+                self._sparse_fieldset = [
+                    name for name in available
+                    if (fields is None or name in fields) and name not in (omit or ())
+                ]
+        return self._sparse_fieldset
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        keep = self.sparse_fieldset() if self.action in self.sparse_fieldset_actions else None
+        if keep is not None:
+            target = getattr(serializer, 'child', serializer)
+            for name in list(target.fields):
+                if name not in keep:
+                    target.fields.pop(name)
+        return serializer
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in self.sparse_fieldset_actions:
+            return queryset
+        serializer = self.get_serializer()
+        only, select, prefetch = serializer_projection(serializer, queryset.model)
+        queryset = queryset.select_related(None)
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        if only is not None:
+            # Keyset pagination reads its ordering columns from the last row.
+            only.update(getattr(self.pagination_class, 'ordering', ()))
+            queryset = queryset.only(*(name.lstrip('-') for name in only))
+        return queryset
+
+
+# --- 2. GraphQL selection-driven projection ---
+
+class _SelectionCollector(Visitor):
+    def __init__(self, type_info):
+        super().__init__()
+        self.type_info = type_info
+        self.fields = defaultdict(set)     # GraphQL type name -> selected field names
+
+    def enter_field(self, node, *args):
+        parent = self.type_info.get_parent_type()
+        if parent is not None:
+            self.fields[parent.name].add(node.name.value)
+
+
+def selected_fields(info):
+    """{GraphQL type name: field names selected on it} for the current operation, cached per request."""
+    cache = getattr(info.context, 'graphql_selections', None)
+    if cache is None:
+        cache = {}
+        if info.context is not None:
+            info.context.graphql_selections = cache
+    key = id(info.operation)
+    if key not in cache:
+        type_info = TypeInfo(info.schema)
+        collector = _SelectionCollector(type_info)
+        for node in [info.operation, *info.fragments.values()]:
+            visit(node, TypeInfoVisitor(type_info, collector))
+        cache[key] = collector.fields
+    return cache[key]
+
+
+def selected_columns(info, object_type):
+    """Model field names backing the fields selected on a DjangoObjectType in this operation."""
+    model = object_type._meta.model
+    selected = selected_fields(info).get(object_type._meta.name, ())
+    columns = {model._meta.pk.name}
+    for name in object_type._meta.fields:
+        if to_camel_case(name) not in selected:
+            continue
+        try:
+            model_field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        if model_field.concrete and not model_field.many_to_many:
+            columns.add(name)
+    return columns
+
+
+def project(queryset, info, object_type, extra=()):
+    """Defers every column that no selection of `object_type` in the operation reads."""
+    return queryset.only(*selected_columns(info, object_type), *extra)
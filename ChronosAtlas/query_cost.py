@@ -0,0 +1,180 @@
+"""
+Static cost and depth limits for GraphQL operations, checked before execution.
+
+The cost of an operation is the estimated number of objects it resolves. Every
+field returning an object (or a list of them) costs FIELD_COSTS.get("Type.field", 1)
+per resolution and scalars cost nothing, unless FIELD_COSTS says otherwise. Each
+field is multiplied by the sizes of the lists around it: a list field's size is
+its first/last/limit argument (or that argument's schema default), the size
+argument of the connection it sits under, LIST_SIZES["Type.field"], or
+DEFAULT_LIST_SIZE, in that order. Depth counts nested fields. Introspection
+fields are free, so GraphiQL keeps working.
+
+A named fragment is analysed once per (type, inherited list size) at a
+multiplier of 1 and scaled wherever it is spread, so the analysis stays linear
+in the size of the document even when fragments spread each other repeatedly.
+
+Configure with settings.GRAPHQL_LIMITS (see DEFAULTS); CachedGraphQLView runs
+check_limits() on every operation before graphene executes it.
+"""
+from django.conf import settings
+from graphql import (
+    FieldNode, FragmentSpreadNode, GraphQLError, GraphQLList, GraphQLNonNull,
+    IntValueNode, OperationDefinitionNode, VariableNode, get_named_type, is_composite_type,
+    is_object_type, is_interface_type,
+)
+
+DEFAULTS = {
+    'MAX_DEPTH': 10,
+    'MAX_COST': 20000,
+    'DEFAULT_LIST_SIZE': 10,    # assumed length of lists without a size argument
+    'LIST_SIZES': {},           # "Type.field" -> assumed length, e.g. {"Query.figures": 100}
+    'FIELD_COSTS': {},          # "Type.field" -> cost per resolution
+    'TIMEOUT': 10.0,            # seconds of execution (ChronosAtlas/graphql_middleware.py)
+    'TIMING_ALWAYS': False,     # record resolver timings for every request, not only on demand
+}
+
+SIZE_ARGUMENTS = ('first', 'last', 'limit')
+
+
+def setting(name):
+    return getattr(settings, 'GRAPHQL_LIMITS', {}).get(name, DEFAULTS[name])
+
+
+def _is_list(graphql_type):
+    if isinstance(graphql_type, GraphQLNonNull):
+        graphql_type = graphql_type.of_type
+    return isinstance(graphql_type, GraphQLList)
+
+
+class CostAnalysis:
+    """Computes (cost, depth) of one operation against a schema."""
+
+    def __init__(self, schema, fragments, variables=None):
+        self.schema = schema
+        self.fragments = fragments
+        self.variables = variables or {}
+        self.default_list_size = setting('DEFAULT_LIST_SIZE')
+        self.list_sizes = setting('LIST_SIZES')
+        self.field_costs = setting('FIELD_COSTS')
+        # (fragment name, type name, inherited_size) -> (cost at multiplier 1, depth below the spread)
+        self.fragment_costs = {}
+
+    def operation(self, operation):
+        root = self.schema.get_root_type(operation.operation)
+        return self.selections(root, operation.selection_set, multiplier=1, inherited_size=None,
+                               depth=0, fragments_seen=frozenset())
+
+    def size_argument(self, node, field_def):
+        for argument in node.arguments:
+            if argument.name.value not in SIZE_ARGUMENTS:
+                continue
+            value = argument.value
+            if isinstance(value, IntValueNode):
+                return max(0, int(value.value))
+            if isinstance(value, VariableNode):
+                size = self.variables.get(value.name.value)
+                if isinstance(size, int):
+                    return max(0, size)
+        if field_def is not None:
+            for name in SIZE_ARGUMENTS:
+                argument = field_def.args.get(name)
+                if argument is not None and isinstance(argument.default_value, int):
+                    return argument.default_value
+        return None
+
+    def selections(self, parent_type, selection_set, multiplier, inherited_size, depth, fragments_seen):
+        cost, max_depth = 0, depth
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                field_cost, field_depth = self.field(parent_type, selection, multiplier, inherited_size,
+                                                     depth, fragments_seen)
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                fragment = self.fragments.get(name)
+                if fragment is None or name in fragments_seen:
+                    continue    # reported by the standard validation rules
+                unit_cost, fragment_depth = self.fragment(name, fragment, parent_type, inherited_size,
+                                                          fragments_seen)
+                field_cost, field_depth = multiplier * unit_cost, depth + fragment_depth
+            else:
+                field_cost, field_depth = self.selections(
+                    self.fragment_type(selection, parent_type), selection.selection_set, multiplier,
+                    inherited_size, depth, fragments_seen,
+                )
+            cost += field_cost
+            max_depth = max(max_depth, field_depth)
+        return cost, max_depth
+
+    def fragment_type(self, fragment, parent_type):
+        type_condition = fragment.type_condition
+        fragment_type = self.schema.get_type(type_condition.name.value) if type_condition else None
+        return fragment_type or parent_type
+
+    def fragment(self, name, fragment, parent_type, inherited_size, fragments_seen):
+        """(cost at multiplier 1, depth) of a named fragment, computed once per type and inherited size."""
+        fragment_type = self.fragment_type(fragment, parent_type)
+        key = (name, fragment_type.name if fragment_type is not None else None, inherited_size)
+        if key not in self.fragment_costs:
+            self.fragment_costs[key] = self.selections(fragment_type, fragment.selection_set, 1, inherited_size,
+                                                       0, fragments_seen | {name})
+        return self.fragment_costs[key]
+
+    def field(self, parent_type, node, multiplier, inherited_size, depth, fragments_seen):
+        name = node.name.value
+        if name.startswith('__'):
+            return 0, depth
+        field_def = None
+        if is_object_type(parent_type) or is_interface_type(parent_type):
+            field_def = parent_type.fields.get(name)
+        field_type = field_def.type if field_def is not None else None
+        named_type = get_named_type(field_type) if field_type is not None else None
+        key = f'{parent_type.name}.{name}' if parent_type is not None else name
+
+        default_cost = 1 if named_type is not None and is_composite_type(named_type) else 0
+        cost = multiplier * self.field_costs.get(key, default_cost)
+        size = self.size_argument(node, field_def)
+        if field_type is not None and _is_list(field_type):
+            multiplier *= size if size is not None else (
+                inherited_size if inherited_size is not None else self.list_sizes.get(key, self.default_list_size)
+            )
+            size = None     # consumed by this list
+
+        if node.selection_set is None:
+            return cost, depth + 1
+        child_cost, child_depth = self.selections(named_type, node.selection_set, multiplier, size,
+                                                  depth + 1, fragments_seen)
+        return cost + child_cost, child_depth
+
+
+def check_limits(schema, document, variables=None, operation_name=None):
+    """
+    Returns a list of GraphQLErrors for the operations of `document` that exceed
+    MAX_DEPTH or MAX_COST (only the selected one if `operation_name` is given).
+    """
+    fragments = {}
+    operations = []
+    for definition in document.definitions:
+        if isinstance(definition, OperationDefinitionNode):
+            if operation_name is None or (definition.name and definition.name.value == operation_name):
+                operations.append(definition)
+        elif hasattr(definition, 'type_condition'):
+            fragments[definition.name.value] = definition
+
+    analysis = CostAnalysis(schema, fragments, variables)
+    max_depth, max_cost = setting('MAX_DEPTH'), setting('MAX_COST')
+    errors = []
+    for operation in operations:
+        cost, depth = analysis.operation(operation)
+        if depth > max_depth:
+            errors.append(GraphQLError(
+                f"Query depth {depth} exceeds the maximum of {max_depth}.", operation,
+                extensions={'code': 'QUERY_TOO_DEEP', 'depth': depth, 'maxDepth': max_depth},
+            ))
+        if cost > max_cost:
+            errors.append(GraphQLError(
+                f"Query cost {cost} exceeds the maximum of {max_cost}; "
+                "request fewer nested lists or pass smaller first/last/limit arguments.", operation,
+                extensions={'code': 'QUERY_TOO_COSTLY', 'cost': cost, 'maxCost': max_cost},
+            ))
+    return errors
@@ -1,7 +1,7 @@
 import graphene
 # Import schemas from the individual apps
-from timeline.schema import TimelineQuery, TimelineMutation
-from figures.schema import FigureQuery, FigureMutation
+from timeline.schema import TimelineQuery, TimelineMutation, CACHE_MODELS as TIMELINE_CACHE_MODELS
+from figures.schema import FigureQuery, FigureMutation, CACHE_MODELS as FIGURE_CACHE_MODELS
 
 # Combine all application queries into a single root Query
 class Query(TimelineQuery, FigureQuery, graphene.ObjectType):
@@ -17,4 +17,7 @@ class Mutation(TimelineMutation, FigureMutation, graphene.ObjectType):
     pass
 
 # Create the final schema object, referenced in settings.py
-schema = graphene.Schema(query=Query, mutation=Mutation)
\ No newline at end of file
+schema = graphene.Schema(query=Query, mutation=Mutation)
+
+# Models read by each root query field, used to key the response cache (see ChronosAtlas/views.py)
+cache_models = {**TIMELINE_CACHE_MODELS, **FIGURE_CACHE_MODELS}
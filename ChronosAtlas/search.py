@@ -0,0 +1,181 @@
+"""
+Full-text search indexes shared by the figures and timeline apps.
+
+PostgreSQL: a stored generated tsvector column (`search_vector`), weighted per
+column and covered by a GIN index; the database keeps it in sync on write.
+SQLite (dev): an external-content FTS5 shadow table (`<table>_fts`) kept in
+sync by triggers. Django's SQLite schema editor drops those triggers whenever
+it rebuilds the table, so migrations that alter the table must call
+install_sqlite_triggers() again (see figures/indexes.py).
+
+Other backends fall back to unranked icontains scans.
+"""
+import html
+import re
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'english'
+# Maximum hits per index returned by FullTextIndex.ranked().
+MAX_SEARCH_RESULTS = 100
+
+# Highlight delimiters used inside SQL; swapped for <mark> after HTML-escaping.
+_START, _STOP = '\x02', '\x03'
+
+WEIGHTS = ('A', 'B', 'C', 'D')
+
+
+def highlight(snippet):
+    """HTML-escapes a raw snippet and turns the match delimiters into <mark> tags."""
+    return html.escape(snippet or '').replace(_START, '<mark>').replace(_STOP, '</mark>')
+
+
+def fts5_query(text):
+    """
+    Turns free text into an FTS5 MATCH expression: every word must match, and
+    quoting each word keeps FTS5 operators in user input from being interpreted.
+    Returns None if the text has no searchable words.
+    """
+    words = re.findall(r'\w+', text)
+    return ' '.join(f'"{word}"' for word in words) or None
+
+
+class FullTextIndex:
+    """A weighted full-text index over some text columns of one table."""
+
+    def __init__(self, table, columns):
+        self.table = table
+        self.columns = list(columns)    # most important first
+        self.fts_table = f'{table}_fts'
+        self.index_name = f'{table}_search_gin'
+
+    # --- DDL ---
+
+    def _tsvector_sql(self):
+        return ' || '.join(
+            f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce({column}, '')), '{weight}')"
+            for column, weight in zip(self.columns, WEIGHTS)
+        )
+
+    def _sqlite_triggers(self):
+        columns = ', '.join(self.columns)
+        new = ', '.join(f'NEW.{c}' for c in self.columns)
+        old = ', '.join(f'OLD.{c}' for c in self.columns)
+        delete = f"INSERT INTO {self.fts_table}({self.fts_table}, rowid, {columns}) VALUES ('delete', OLD.id, {old});"
+        insert = f"INSERT INTO {self.fts_table}(rowid, {columns}) VALUES (NEW.id, {new});"
+        return [
+            f"CREATE TRIGGER IF NOT EXISTS {self.fts_table}_ai AFTER INSERT ON {self.table} BEGIN {insert} END",
+            f"CREATE TRIGGER IF NOT EXISTS {self.fts_table}_ad AFTER DELETE ON {self.table} BEGIN {delete} END",
+            f"CREATE TRIGGER IF NOT EXISTS {self.fts_table}_au AFTER UPDATE OF id, {columns} ON {self.table} "
+            f"BEGIN {delete} {insert} END",
+        ]
+
+    def create(self, schema_editor):
+        vendor = schema_editor.connection.vendor
+        if vendor == 'postgresql':
+            schema_editor.execute(
+                f"ALTER TABLE {self.table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                f"GENERATED ALWAYS AS ({self._tsvector_sql()}) STORED"
+            )
+            schema_editor.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.index_name} ON {self.table} USING gin (search_vector)"
+            )
+        elif vendor == 'sqlite':
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.fts_table} USING fts5("
+                f"{', '.join(self.columns)}, content='{self.table}', content_rowid='id', "
+                f"tokenize='porter unicode61 remove_diacritics 2')"
+            )
+            schema_editor.execute(f"INSERT INTO {self.fts_table}({self.fts_table}) VALUES ('rebuild')")
+            self.install_sqlite_triggers(schema_editor)
+
+    def drop(self, schema_editor):
+        vendor = schema_editor.connection.vendor
+        if vendor == 'postgresql':
+            schema_editor.execute(f"DROP INDEX IF EXISTS {self.index_name}")
+            schema_editor.execute(f"ALTER TABLE {self.table} DROP COLUMN IF EXISTS search_vector")
+        elif vendor == 'sqlite':
+            for suffix in ('ai', 'ad', 'au'):
+                schema_editor.execute(f"DROP TRIGGER IF EXISTS {self.fts_table}_{suffix}")
+            schema_editor.execute(f"DROP TABLE IF EXISTS {self.fts_table}")
+
+    def install_sqlite_triggers(self, schema_editor):
+        """Re-creates the sync triggers, if the FTS5 table exists yet."""
+        connection = schema_editor.connection
+        if connection.vendor == 'sqlite' and self.fts_table in connection.introspection.table_names():
+            for statement in self._sqlite_triggers():
+                schema_editor.execute(statement)
+
+    # --- Queries ---
+
+    def filter(self, queryset, text):
+        """Restricts a queryset over this table to rows matching `text` (unranked)."""
+        vendor = connections[queryset.db].vendor
+        if vendor == 'postgresql':
+            return queryset.filter(pk__in=RawSQL(
+                f"SELECT id FROM {self.table} WHERE search_vector @@ websearch_to_tsquery('{SEARCH_CONFIG}', %s)",
+                (text,),
+            ))
+        if vendor == 'sqlite':
+            match = fts5_query(text)
+            if match is None:
+                return queryset.none()
+            return queryset.filter(pk__in=RawSQL(
+                f"SELECT rowid FROM {self.fts_table} WHERE {self.fts_table} MATCH %s", (match,)
+            ))
+        condition = Q()
+        for column in self.columns:
+            condition |= Q(**{f'{column}__icontains': text})
+        return queryset.filter(condition)
+
+    def ranked(self, queryset, text, limit=20):
+        """
+        Returns [(id, score, snippet_html), ...] for the best matches, highest score first.
+        Snippets are HTML-escaped with matches wrapped in <mark>. `queryset` picks the
+        database; its filters only apply on backends without a full-text index.
+        """
+        limit = max(1, min(limit, MAX_SEARCH_RESULTS))
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            rows = self._ranked_postgresql(connection, text, limit)
+        elif connection.vendor == 'sqlite':
+            rows = self._ranked_sqlite(connection, text, limit)
+        else:
+            return [
+                (pk, 1.0, highlight(first)) for pk, first in
+                self.filter(queryset, text).values_list('id', self.columns[0])[:limit]
+            ]
+        return [(pk, float(score), highlight(snippet)) for pk, score, snippet in rows]
+
+    def _ranked_postgresql(self, connection, text, limit):
+        document = ", ".join(self.columns)
+        options = f"StartSel={_START}, StopSel={_STOP}, MaxWords=30, MinWords=10, MaxFragments=2"
+        with connection.cursor() as cursor:
+            # Rank on the index first; only the final `limit` rows pay for ts_headline.
+            cursor.execute(
+                f"SELECT hit.id, hit.score, ts_headline('{SEARCH_CONFIG}', concat_ws(' — ', {document}), "
+                f"hit.query, %s) FROM ("
+                f"  SELECT t.id, ts_rank_cd(t.search_vector, q) AS score, q AS query, {document}"
+                f"  FROM {self.table} t, websearch_to_tsquery('{SEARCH_CONFIG}', %s) q"
+                f"  WHERE t.search_vector @@ q ORDER BY score DESC, t.id LIMIT %s"
+                f") hit ORDER BY hit.score DESC, hit.id",
+                (options, text, limit),
+            )
+            return cursor.fetchall()
+
+    def _ranked_sqlite(self, connection, text, limit):
+        match = fts5_query(text)
+        if match is None:
+            return []
+        # Earlier columns weigh more, like the tsvector weights on PostgreSQL.
+        weights = ', '.join(str(10.0 / (i + 1)) for i in range(len(self.columns)))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, -bm25({self.fts_table}, {weights}) AS score, "
+                f"snippet({self.fts_table}, -1, %s, %s, '…', 16) FROM {self.fts_table} "
+                f"WHERE {self.fts_table} MATCH %s ORDER BY score DESC, rowid LIMIT %s",
+                (_START, _STOP, match, limit),
+            )
+            return cursor.fetchall()
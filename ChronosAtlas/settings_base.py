@@ -12,7 +12,7 @@ STATICFILES_DIRS = []
 # REST Framework settings for API endpoints
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'ChronosAtlas.instrumentation.TimedJSONRenderer',
     ]
 }
 """
@@ -45,16 +45,20 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'ChronosAtlas.db_routing.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # After authentication, which decides who may request a profile.
+    'ChronosAtlas.instrumentation.InstrumentationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'ChronosAtlas.urls'
+# asgi.py switches to ChronosAtlas.urls_asgi, which serves the read routes asynchronously.
+ROOT_URLCONF = os.environ.get('ROOT_URLCONF', 'ChronosAtlas.urls')
 
 TEMPLATES = [
     {
@@ -73,6 +77,19 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'ChronosAtlas.wsgi.application'
+ASGI_APPLICATION = 'ChronosAtlas.asgi.application'
+# Threads per ASGI worker that run the read routes (and hold at most as many DB connections).
+ASYNC_READ_THREADS = int(os.environ.get('ASYNC_READ_THREADS', '16'))
+
+# Read replicas (see ChronosAtlas/db_routing.py). REPLICAS names DATABASES aliases;
+# with none configured every query goes to 'default'.
+DATABASE_ROUTERS = ['ChronosAtlas.db_routing.ReplicaRouter']
+DATABASE_ROUTING = {
+    'REPLICAS': [],
+    'STICKY_SECONDS': int(os.environ.get('DB_STICKY_SECONDS', '15')),
+    'HEALTH_CHECK_INTERVAL': float(os.environ.get('DB_HEALTH_CHECK_INTERVAL', '5')),
+    'MAX_LAG': float(os.environ.get('DB_REPLICA_MAX_LAG', '10')),
+}
 
 AUTH_PASSWORD_VALIDATORS = []
 LANGUAGE_CODE = 'en-us'
@@ -83,7 +100,71 @@ STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 GRAPHENE = {
-    'SCHEMA': 'ChronosAtlas.schema.schema'
+    'SCHEMA': 'ChronosAtlas.schema.schema',
+    'MIDDLEWARE': [
+        'ChronosAtlas.graphql_middleware.TimeoutMiddleware',
+        'ChronosAtlas.graphql_middleware.ResolverTimingMiddleware',
+    ],
+}
+# Cost/depth limits, execution timeout and resolver timing for /graphql/
+# (see ChronosAtlas/query_cost.py for the cost model and the remaining keys).
+GRAPHQL_LIMITS = {
+    'MAX_DEPTH': int(os.environ.get('GRAPHQL_MAX_DEPTH', '10')),
+    'MAX_COST': int(os.environ.get('GRAPHQL_MAX_COST', '20000')),
+    'TIMEOUT': float(os.environ.get('GRAPHQL_TIMEOUT', '10')),
+    'FIELD_COSTS': {
+        # Searches hit the full-text index and rank every match.
+        'Query.search': 10,
+        'Query.influencePaths': 25,
+    },
+    'LIST_SIZES': {
+        # At most MAX_WIDTH / MIN_BUCKET_PIXELS buckets (timeline/viewport.py).
+        'TimelineViewportType.buckets': 250,
+    },
+}
+# Server processes (gunicorn workers, WEB_CONCURRENCY in entrypoint.sh). With more
+# than one, the default cache must be shared: it holds the response cache versions
+# and the influence graph version, which management commands bump as well.
+SERVER_PROCESSES = int(os.environ.get('WEB_CONCURRENCY', '1'))
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+# Response cache for GraphQL queries and REST GETs (see ChronosAtlas/cache.py).
+# SHARED_CACHE names a CACHES alias (e.g. Redis) shared by all workers; None keeps
+# entries per process. Model version counters live in VERSION_CACHE, which must
+# be shared by every process (checked against SERVER_PROCESSES).
+RESPONSE_CACHE = {
+    'ENABLED': os.environ.get('RESPONSE_CACHE_ENABLED', 'True') == 'True',
+    'TTL': int(os.environ.get('RESPONSE_CACHE_TTL', '300')),
+    'MAX_ENTRIES': 1000,
+    'SHARED_CACHE': None,
+    'VERSION_CACHE': 'default',
+}
+# Per-request SQL and timing instrumentation (see ChronosAtlas/instrumentation.py):
+# Server-Timing headers, a sampled slow-request log, and cProfile dumps into
+# PROFILE_DIR for requests sending `X-Profile: <PROFILE_TOKEN>` (or from staff users).
+INSTRUMENTATION = {
+    'ENABLED': os.environ.get('INSTRUMENTATION_ENABLED', 'True') == 'True',
+    'SERVER_TIMING': os.environ.get('SERVER_TIMING', 'True') == 'True',
+    'SLOW_REQUEST_MS': float(os.environ.get('SLOW_REQUEST_MS', '1000')),
+    'SLOW_LOG_SAMPLE_RATE': float(os.environ.get('SLOW_LOG_SAMPLE_RATE', '1.0')),
+    'DUPLICATE_QUERY_THRESHOLD': 3,
+    'PROFILE_DIR': os.environ.get('PROFILE_DIR') or None,
+    'PROFILE_TOKEN': os.environ.get('PROFILE_TOKEN') or None,
+}
+# Prometheus metrics on /metrics (see ChronosAtlas/metrics.py). METRICS_DIR must be
+# shared by every worker of one server and emptied when it starts (entrypoint.sh);
+# unset, each worker reports only its own numbers. METRICS_ALLOWED_NETWORKS lists
+# the client networks that may scrape, comma-separated.
+METRICS = {
+    'ENABLED': os.environ.get('METRICS_ENABLED', 'True') == 'True',
+    'DIRECTORY': os.environ.get('METRICS_DIR') or None,
+    'ALLOWED_NETWORKS': os.environ.get('METRICS_ALLOWED_NETWORKS', '127.0.0.0/8,::1/128').split(','),
+    'MAX_OPERATION_NAMES': 200,
 }
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -26,6 +26,37 @@ DATABASES = {
         conn_max_age=600
     )
 }
+
+# Read replicas: DATABASE_REPLICA_URLS is a comma-separated list of URLs, served as
+# aliases replica_1, replica_2, ... (see ChronosAtlas/db_routing.py). Tests run the
+# replicas as mirrors of the test database.
+for index, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')), 1):
+    DATABASES[f'replica_{index}'] = dj_database_url.parse(
+        url.strip(), conn_max_age=600, conn_health_checks=True, test_options={'MIRROR': 'default'}
+    )
+DATABASE_ROUTING['REPLICAS'] = [alias for alias in DATABASES if alias != 'default']
+
+# Redis holds the response cache versions and the influence graph version, so a
+# write made by one worker (or a management command) reaches every worker.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL', 'redis://redis:6379/0'),
+    }
+}
+
+# DATABASE_POOL=True hands every request a connection from a per-process pool
+# (ChronosAtlas/backends/pooled_postgresql) instead of one persistent connection
+# per thread; DATABASE_POOL_SIZE caps the connections per alias and process.
+if os.environ.get('DATABASE_POOL', 'False') == 'True':
+    for database in DATABASES.values():
+        database['ENGINE'] = 'ChronosAtlas.backends.pooled_postgresql'
+        database['CONN_MAX_AGE'] = 0
+        database.setdefault('OPTIONS', {})['POOL'] = {
+            'MIN_SIZE': int(os.environ.get('DATABASE_POOL_MIN_SIZE', '1')),
+            'MAX_SIZE': int(os.environ.get('DATABASE_POOL_SIZE', '10')),
+            'TIMEOUT': float(os.environ.get('DATABASE_POOL_TIMEOUT', '10')),
+        }
 # -----------------------------------------------------------------------
 
 
@@ -54,6 +85,12 @@ LOGGING = {
             'level': 'DEBUG', # Set to DEBUG to catch the most detailed info, including tracebacks
             'propagate': True,
         },
+        # Slow requests with their SQL (ChronosAtlas/instrumentation.py)
+        'ChronosAtlas.instrumentation': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
         # Specific logger for GraphQL errors (highly recommended for Graphene apps)
         'graphene.execution.errors': {
             'handlers': ['console'],
@@ -1,8 +1,8 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.views.decorators.csrf import csrf_exempt
-from graphene_django.views import GraphQLView
-from .views import home
+from .schema import cache_models
+from .views import CachedGraphQLView, export, home, prometheus_metrics
 from rest_framework import routers
 from figures.api import FigureViewSet
 from timeline.api import TimelineEventViewSet, InfluenceViewSet
@@ -15,6 +15,8 @@ router.register(r'influences', InfluenceViewSet)
 urlpatterns = [
     path('', home, name='home'),
     path('admin/', admin.site.urls),
+    path('metrics', prometheus_metrics, name='metrics'),
+    path('api/export/<str:dataset>/', export, name='export'),
     path('api/', include(router.urls)),
-    path("graphql/", csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path("graphql/", csrf_exempt(CachedGraphQLView.as_view(graphiql=True, cache_models=cache_models)), name='graphql'),
 ]
\ No newline at end of file
@@ -0,0 +1,32 @@
+"""
+URLconf used when serving through asgi.py: the same routes as ChronosAtlas/urls.py,
+but /graphql/ and the REST API run as async views on the read thread pool
+(ChronosAtlas.views.run_in_read_pool), so slow queries wait there instead of
+tying up a whole worker process.
+"""
+from django.urls import URLPattern
+
+from . import urls
+from .views import run_in_read_pool
+
+
+def offload(patterns):
+    """Copies url patterns (recursing into includes) with their views wrapped by run_in_read_pool."""
+    wrapped = []
+    for pattern in patterns:
+        if isinstance(pattern, URLPattern):
+            pattern = URLPattern(pattern.pattern, run_in_read_pool(pattern.callback),
+                                 pattern.default_args, pattern.name)
+        else:
+            pattern = type(pattern)(pattern.pattern, offload(pattern.url_patterns), pattern.default_kwargs,
+                                    pattern.app_name, pattern.namespace)
+        wrapped.append(pattern)
+    return wrapped
+
+
+READ_PREFIXES = ('api/', 'graphql/')
+
+urlpatterns = [
+    offload([pattern])[0] if str(pattern.pattern).startswith(READ_PREFIXES) else pattern
+    for pattern in urls.urlpatterns
+]
@@ -1,4 +1,225 @@
-from django.http import HttpResponse
+import asyncio
+import functools
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, connections, router
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_safe
+from graphene_django.views import GraphQLView, HttpError
+from graphql import ExecutionResult, FieldNode, GraphQLError, OperationType, get_operation_ast, parse, print_ast
+from . import export as data_export
+from . import instrumentation, metrics
+from .cache import ALL_MODELS, cached_response, is_enabled
+from .db_routing import use_primary
+from .graphql_middleware import QueryTimeout, execution_budget, log_timings, timing_requested
+from .query_cost import check_limits
 
 def home(request):
     return HttpResponse("Welcome to Chronos Atlas!")
+
+@require_safe
+def prometheus_metrics(request):
+    """Every worker's metrics in the Prometheus text format (ChronosAtlas/metrics.py), for local scrapers."""
+    if not metrics.enabled():
+        raise Http404
+    if not metrics.allowed(request):
+        return HttpResponseForbidden("Metrics are only served to local clients.")
+    return HttpResponse(metrics.render(metrics.collect()), content_type=metrics.CONTENT_TYPE)
+
+@require_safe
+def export(request, dataset):
+    """
+    Streams one dataset (ChronosAtlas/export.py).
+    Query parameters: format=ndjson|columns, compression=gzip, since=<ISO 8601 date and time>.
+    """
+    try:
+        since = request.GET.get('since')
+        since = data_export.parse_since(since) if since else None
+        format, compression = request.GET.get('format', 'ndjson'), request.GET.get('compression') or None
+        data_export.check(dataset, format, compression)
+        # Pick the database now: replica routing only lasts for the request, not the streamed body.
+        using = router.db_for_read(apps.get_model(data_export.DATASETS[dataset].model))
+        watermark = data_export.watermark()
+        body = data_export.stream(dataset, format, compression, since, using)
+    except data_export.ExportError as e:
+        return JsonResponse({'detail': str(e)}, status=400)
+    response = StreamingHttpResponse(body, content_type=data_export.CONTENT_TYPES[compression])
+    response['Content-Disposition'] = f'attachment; filename="{data_export.filename(dataset, format, compression)}"'
+    response['X-Export-Watermark'] = watermark.isoformat()
+    return response
+
+_read_executor = None
+
+def read_executor():
+    global _read_executor
+    if _read_executor is None:
+        _read_executor = ThreadPoolExecutor(settings.ASYNC_READ_THREADS, thread_name_prefix='read')
+    return _read_executor
+
+def run_in_read_pool(view):
+    """
+    Wraps a sync view as an async one for the ASGI URLconf (ChronosAtlas/urls_asgi.py).
+    The view, which may block on the database for a long time, runs on a bounded
+    pool of ASYNC_READ_THREADS threads while the event loop keeps accepting
+    requests. Each thread keeps its own connection and honours CONN_MAX_AGE just
+    as a sync worker does around every request.
+    """
+    def call(request, *args, **kwargs):
+        close_old_connections()
+        try:
+            response = instrumentation.profile_call(view, request, *args, **kwargs)
+            if callable(getattr(response, 'render', None)) and not response.is_rendered:
+                response = response.render()
+            return response
+        finally:
+            close_old_connections()
+
+    @functools.wraps(view)
+    async def async_view(request, *args, **kwargs):
+        run = sync_to_async(call, thread_sensitive=False, executor=read_executor())
+        response = await run(request, *args, **kwargs)
+        if getattr(response, 'streaming', False) and not response.is_async:
+            response.streaming_content = iterate_in_thread(response.streaming_content)
+        return response
+
+    return async_view
+
+async def iterate_in_thread(iterator, read_ahead=8):
+    """
+    Runs a blocking iterator (a streamed export reading a database cursor) on a
+    thread of its own and yields its items. Django's ASGI handler would otherwise
+    read a synchronous streaming body whole before sending any of it. At most
+    `read_ahead` items wait in memory; the thread stops when the client goes away.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    slots = threading.Semaphore(read_ahead)
+    stopped = threading.Event()
+
+    def produce():
+        error = None
+        try:
+            for item in iterator:
+                slots.acquire()
+                if stopped.is_set():
+                    return
+                loop.call_soon_threadsafe(queue.put_nowait, (True, item))
+        except Exception as e:
+            error = e
+        finally:
+            connections.close_all()
+        if not stopped.is_set():
+            loop.call_soon_threadsafe(queue.put_nowait, (False, error))
+
+    threading.Thread(target=produce, name='stream', daemon=True).start()
+    try:
+        while True:
+            more, value = await queue.get()
+            if not more:
+                if value is not None:
+                    raise value
+                return
+            slots.release()
+            yield value
+    finally:
+        stopped.set()
+        slots.release()     # wakes the thread if it waits for a slot
+
+def has_no_errors(response):
+    return 'errors' not in json.loads(response.content)
+
+class CachedGraphQLView(GraphQLView):
+    """
+    GraphQLView that serves read queries from the response cache (ChronosAtlas/cache.py).
+    Mutations, GraphiQL and malformed requests always go through to graphene.
+    Every operation is checked against the cost/depth limits (ChronosAtlas/query_cost.py)
+    and runs under the execution budget of ChronosAtlas/graphql_middleware.py.
+    Queries may read from a replica (ChronosAtlas/db_routing.py); mutations use the primary.
+    """
+    # Root query field -> model labels it reads; fields not listed depend on every model.
+    cache_models = {}
+
+    def __init__(self, cache_models=None, **kwargs):
+        super().__init__(**kwargs)
+        if cache_models is not None:
+            self.cache_models = cache_models
+
+    def dispatch(self, request, *args, **kwargs):
+        dispatch = super().dispatch
+        if request.method not in ('GET', 'POST') or self.batch or not is_enabled() or timing_requested(request):
+            return dispatch(request, *args, **kwargs)
+        try:
+            data = self.parse_body(request)
+            if self.graphiql and self.can_display_graphiql(request, data):
+                return dispatch(request, *args, **kwargs)
+            query, variables, operation_name, _ = self.get_graphql_params(request, data)
+            document = parse(query)
+        except (HttpError, GraphQLError, TypeError):
+            return dispatch(request, *args, **kwargs)
+
+        operation = get_operation_ast(document, operation_name)
+        if operation is None or operation.operation != OperationType.QUERY:
+            return dispatch(request, *args, **kwargs)
+        instrumentation.annotate_graphql(operation_name)
+
+        parts = ['graphql', print_ast(document), variables, operation_name, request.GET.get('pretty')]
+        return cached_response(
+            request, parts, self.models_read(operation), lambda: dispatch(request, *args, **kwargs),
+            store=has_no_errors,
+        )
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        instrumentation.annotate_graphql(operation_name)
+        if query:
+            try:
+                document = parse(query)
+            except GraphQLError:
+                document = None     # graphene reports the syntax error
+            if document is not None:
+                errors = check_limits(self.schema.graphql_schema, document, variables, operation_name)
+                if errors:
+                    return ExecutionResult(errors=errors)
+                operation = get_operation_ast(document, operation_name)
+                if operation is not None and operation.operation != OperationType.QUERY:
+                    # A mutation reads what it is about to change from the primary.
+                    use_primary()
+
+        with execution_budget(request) as budget:
+            result = super().execute_graphql_request(
+                request, data, query, variables, operation_name, show_graphiql
+            )
+        if budget.timings is not None:
+            metrics.observe_graphql(operation_name, budget.timings.elapsed(), budget.timings.seconds_per_field())
+            if timing_requested(request):
+                request.graphql_timings = budget.timings.as_dict()
+                log_timings(operation_name, budget.timings)
+        if budget.timed_out:
+            # Drop the partial data and the one error per skipped resolver.
+            return ExecutionResult(errors=[QueryTimeout(f"Query exceeded the {budget.timeout:g}s time limit.")])
+        return result
+
+    def json_encode(self, request, d, pretty=False):
+        timings = getattr(request, 'graphql_timings', None)
+        if timings is not None and not self.batch:
+            d = {**d, 'extensions': {'timing': timings}}
+        with instrumentation.timed('serialize'):
+            return super().json_encode(request, d, pretty)
+
+    def models_read(self, operation):
+        models = set()
+        for selection in operation.selection_set.selections:
+            if not isinstance(selection, FieldNode):
+                # A fragment on the root type; its fields are not worth resolving here.
+                return ALL_MODELS
+            name = selection.name.value
+            if name.startswith('__'):
+                continue
+            if name not in self.cache_models:
+                return ALL_MODELS
+            models.update(self.cache_models[name])
+        return models
@@ -13,4 +13,9 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ChronosAtlas.settings')
 
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+# Build the in-memory autocomplete index in the background as each worker starts.
+from figures.autocomplete import warm  # noqa: E402
+
+warm()
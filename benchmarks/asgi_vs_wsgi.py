@@ -0,0 +1,174 @@
+"""
+Concurrent-request throughput: sync WSGI workers vs. the ASGI read path.
+
+Drives Django's WSGI and ASGI handlers in-process (no network, no server
+needed) against a throwaway, migrated and seeded database:
+
+- wsgi: `--workers` threads, each handling one request at a time like a
+  gunicorn sync worker; requests queue until a worker is free.
+- asgi: one event loop with ChronosAtlas.urls_asgi, whose read routes run on
+  the ASYNC_READ_THREADS pool.
+
+`--clients` concurrent clients loop for `--duration` seconds, sending a slow
+GraphQL query (the whole figure graph) with probability `--slow-ratio` and a
+one-page REST list otherwise. The response cache is disabled so that every
+request does its work. `--db-latency` adds a sleep per SQL statement, to
+stand in for the network round trip to a PostgreSQL server.
+
+Both modes share one process and its GIL, so CPU-bound work does not speed up
+under either; the difference shows up as time spent waiting on the database.
+
+    python -m benchmarks.asgi_vs_wsgi --figures 2000 --clients 32 --db-latency 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ChronosAtlas.settings_dev')
+django.setup()
+
+from django.core.asgi import get_asgi_application  # noqa: E402
+from django.core.wsgi import get_wsgi_application  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+
+from .dataset import seed, throwaway_database  # noqa: E402
+from .harness import add_db_latency, percentile, wsgi_request  # noqa: E402
+
+SLOW_QUERY = json.dumps({'query': '''{ figures { name fields { name }
+    influencesGiven { influenced { name } } influencesReceived { influencer { name } } } }'''}).encode()
+FAST_PATH, FAST_QUERY = '/api/figures/', 'page_size=10'
+
+
+# --- Load generation ---
+
+def pick(rng, slow_ratio):
+    return 'slow' if rng.random() < slow_ratio else 'fast'
+
+
+def run_wsgi(args):
+    handler = get_wsgi_application()
+    workers = ThreadPoolExecutor(args.workers)
+
+    def request(kind):
+        if kind == 'slow':
+            return wsgi_request(handler, 'POST', '/graphql/', body=SLOW_QUERY)[0]
+        return wsgi_request(handler, 'GET', FAST_PATH, FAST_QUERY)[0]
+
+    samples, lock = [], threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    def client(number):
+        rng = random.Random(number)
+        while time.perf_counter() < deadline:
+            kind = pick(rng, args.slow_ratio)
+            start = time.perf_counter()
+            code = workers.submit(request, kind).result()
+            with lock:
+                samples.append((kind, time.perf_counter() - start, code))
+
+    clients = [threading.Thread(target=client, args=(n,)) for n in range(args.clients)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    workers.shutdown()
+    return samples
+
+
+def run_asgi(args):
+    with override_settings(ROOT_URLCONF='ChronosAtlas.urls_asgi'):
+        handler = get_asgi_application()
+        return asyncio.run(_asgi_clients(handler, args))
+
+
+async def _asgi_clients(handler, args):
+    async def request(kind):
+        body = SLOW_QUERY if kind == 'slow' else b''
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'scheme': 'http',
+            'method': 'POST' if kind == 'slow' else 'GET',
+            'path': '/graphql/' if kind == 'slow' else FAST_PATH,
+            'query_string': b'' if kind == 'slow' else FAST_QUERY.encode(),
+            'root_path': '', 'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+            'headers': [(b'host', b'localhost'), (b'content-type', b'application/json'),
+                        (b'content-length', str(len(body)).encode())],
+        }
+        received, status, done = False, [], asyncio.Event()
+
+        async def receive():
+            nonlocal received
+            if not received:
+                received = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            await done.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            elif not message.get('more_body'):
+                done.set()
+
+        await handler(scope, receive, send)
+        return status[0]
+
+    samples = []
+    deadline = time.perf_counter() + args.duration
+
+    async def client(number):
+        rng = random.Random(number)
+        while time.perf_counter() < deadline:
+            kind = pick(rng, args.slow_ratio)
+            start = time.perf_counter()
+            code = await request(kind)
+            samples.append((kind, time.perf_counter() - start, code))
+
+    await asyncio.gather(*(client(n) for n in range(args.clients)))
+    return samples
+
+
+# --- Reporting ---
+
+def report(mode, samples, duration):
+    errors = sum(code != 200 for _, _, code in samples)
+    print(f"{mode:5} {len(samples) / duration:9.1f} req/s  {errors} errors")
+    for kind in ('fast', 'slow'):
+        times = [elapsed * 1000 for k, elapsed, _ in samples if k == kind]
+        print(f"      {kind}: n={len(times):6}  p50={percentile(times, 0.5):8.1f} ms  "
+              f"p99={percentile(times, 0.99):8.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--figures', type=int, default=2000, help="figures to seed")
+    parser.add_argument('--clients', type=int, default=32, help="concurrent clients")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds per mode")
+    parser.add_argument('--workers', type=int, default=4, help="sync WSGI workers to emulate")
+    parser.add_argument('--slow-ratio', type=float, default=0.1, help="share of slow GraphQL requests")
+    parser.add_argument('--db-latency', type=float, default=0.0, help="milliseconds added per SQL statement")
+    parser.add_argument('--modes', default='wsgi,asgi')
+    args = parser.parse_args(argv)
+
+    from django.conf import settings
+    with throwaway_database():
+        seed(figures=args.figures, events=0)
+        if args.db_latency:
+            add_db_latency(args.db_latency / 1000)
+        print(f"{args.figures} figures, {args.clients} clients, {args.duration:g}s per mode, "
+              f"{args.workers} WSGI workers vs {settings.ASYNC_READ_THREADS} ASGI read threads, "
+              f"db latency {args.db_latency:g} ms")
+        with override_settings(RESPONSE_CACHE={'ENABLED': False}):
+            for mode in args.modes.split(','):
+                samples = (run_wsgi if mode == 'wsgi' else run_asgi)(args)
+                report(mode, samples, args.duration)
+
+
+if __name__ == '__main__':
+    main()
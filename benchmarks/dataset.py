@@ -0,0 +1,35 @@
+"""
+Synthetic data and a throwaway database for the benchmarks.
+
+throwaway_database() creates and migrates a fresh test database (in memory on
+SQLite) the same way the test runner does, so benchmarks never touch real data.
+seed() fills it deterministically with timeline/synthetic.py, the generator
+behind the generate_synthetic_data command.
+"""
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+@contextmanager
+def throwaway_database():
+    """Creates, migrates and finally destroys a test copy of the default database."""
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def seed(figures=2000, events=2000, influences_per_figure=3, seed_value=0):
+    """Creates the synthetic dataset in this process; returns a dict of the row counts."""
+    from figures.models import Figure
+    from timeline import synthetic
+    from timeline.models import Influence, TimelineEvent
+
+    synthetic.generate(figures, events, influences_per_figure, seed_value)
+    return {
+        'figures': Figure.objects.count(),
+        'events': TimelineEvent.objects.count(),
+        'influences': Influence.objects.count(),
+    }
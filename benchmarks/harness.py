@@ -0,0 +1,70 @@
+"""
+Helpers shared by the benchmarks: in-process WSGI requests, SQL counting and percentiles.
+"""
+import io
+import sys
+import time
+
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+
+def wsgi_request(handler, method, path, query='', body=b'', headers=None):
+    """Sends one request through a WSGI handler; returns (status code, response body)."""
+    environ = {
+        'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': query,
+        'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)),
+        'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+        'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.input': io.BytesIO(body), 'wsgi.errors': sys.stderr,
+        'wsgi.url_scheme': 'http', 'wsgi.version': (1, 0), 'wsgi.multithread': True,
+        'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+    for name, value in (headers or {}).items():
+        environ['HTTP_' + name.upper().replace('-', '_')] = value
+    status = []
+    response = handler(environ, lambda s, response_headers, exc_info=None: status.append(s))
+    try:
+        content = b''.join(response)
+    finally:
+        response.close()
+    return int(status[0].split()[0]), content
+
+
+class QueryCounter:
+    """Counts the SQL statements this thread's connection runs while installed."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self.count = 0
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+
+
+def add_db_latency(seconds):
+    """Sleeps `seconds` before every SQL statement on connections opened from now on."""
+    def delay(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        connection.execute_wrappers.append(delay)
+
+    connection_created.connect(install, weak=False)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of `values` (NaN when empty)."""
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
@@ -0,0 +1,462 @@
+"""
+Latency, throughput and SQL-per-request baseline for every public endpoint.
+
+Seeds a throwaway database (benchmarks/dataset.py), then drives each scenario
+below through Django's WSGI handler in-process with `--concurrency` threads:
+every REST route of the API router (list, detail, filters, search, the custom
+actions and the write methods) and representative GraphQL operations,
+including the sample in test_data_query.json. Each scenario sends
+`--warmup` untimed requests and then `--requests` timed ones, and reports
+p50/p95/p99 latency, throughput, errors and SQL statements per request.
+
+The response cache is disabled unless `--cache` is given, so the numbers are
+for requests that do their work. On SQLite, write scenarios run one request
+at a time (the in-memory test database cannot take concurrent writers).
+
+    python -m benchmarks.suite --figures 20000 --events 20000 --output baseline.json
+    python -m benchmarks.suite --figures 20000 --events 20000 --compare baseline.json
+
+--compare prints the change of every metric against an earlier --output file
+and exits with status 1 when a scenario regressed by more than --threshold
+percent (p95 latency or throughput) or runs more SQL statements.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ChronosAtlas.settings_dev')
+django.setup()
+
+from django.core.wsgi import get_wsgi_application  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+
+from .dataset import seed, throwaway_database  # noqa: E402
+from .harness import QueryCounter, add_db_latency, percentile, wsgi_request  # noqa: E402
+
+SAMPLE_QUERY_FILE = Path(__file__).resolve().parent.parent / 'test_data_query.json'
+# Routes of the API router that no scenario exercises, and why.
+UNCOVERED = {
+    ('influence-list', 'POST'): "InfluenceSerializer exposes both endpoints read-only",
+}
+
+
+class Scenario:
+    """
+    One kind of request. `build(context, rng)` returns (path, query string, JSON
+    body or None) for the next request; `route` names the router URL and method
+    it exercises (None for GraphQL). Writes that create rows record their ids
+    under `creates`, for the update and delete scenarios that follow.
+    """
+
+    def __init__(self, name, method, build, route=None, write=False, creates=None):
+        self.name = name
+        self.method = method
+        self.build = build
+        self.route = route
+        self.write = write
+        self.creates = creates      # context['created'] list that collects the new ids
+
+
+# --- Scenarios ---
+
+def _unique():
+    return next(_counter)
+
+
+_counter = itertools.count(1)
+
+
+def _figure_payload(context, wikidata_id=None):
+    n = _unique()
+    return {
+        'name': f"Benchmark Figure {n}", 'wikidata_id': wikidata_id or f"QB{n}",
+        'slug': f"benchmark-figure-{n}", 'normalized_birth_year': 1800 + n % 200,
+        'normalized_death_year': 1860 + n % 200, 'instance_of_QIDs': ['Q5'],
+    }
+
+
+def _event_payload(context):
+    n = _unique()
+    return {'title': f"Benchmark event {n}", 'year': 1500 + n % 500, 'category': 'Benchmark'}
+
+
+def _graphql(query, variables=None):
+    def build(context, rng):
+        resolved = variables(context, rng) if callable(variables) else variables
+        return '/graphql/', '', {'query': query, 'variables': resolved or {}}
+    return build
+
+
+def _get(path, query=''):
+    def build(context, rng):
+        return (path(context, rng) if callable(path) else path,
+                query(context, rng) if callable(query) else query, None)
+    return build
+
+
+def _sample_query():
+    with open(SAMPLE_QUERY_FILE) as f:
+        return json.load(f)['query']
+
+
+def scenarios():
+    """All scenarios, in the order they run; writes come after the reads."""
+    figure = lambda c, r: r.choice(c['figure_ids'])    # noqa: E731
+    event = lambda c, r: r.choice(c['event_ids'])      # noqa: E731
+    influence = lambda c, r: r.choice(c['influence_ids'])    # noqa: E731
+
+    return [
+        Scenario('rest.api_root', 'GET', _get('/api/'), ('api-root', 'GET')),
+        # Figures
+        Scenario('rest.figures.list', 'GET', _get('/api/figures/'), ('figure-list', 'GET')),
+        Scenario('rest.figures.list.page_2', 'GET', _get('/api/figures/', lambda c, r: c['figures_page_2'])),
+        Scenario('rest.figures.alive_between', 'GET', _get('/api/figures/', 'alive_between=1800,1850')),
+        Scenario('rest.figures.contemporaries_of', 'GET',
+                 _get('/api/figures/', lambda c, r: f"contemporaries_of={figure(c, r)}")),
+        Scenario('rest.figures.instance_of_all', 'GET', _get('/api/figures/', 'instance_of_all=Q5,Q901')),
+        Scenario('rest.figures.search', 'GET', _get('/api/figures/', lambda c, r: f"q={c['search_term']}")),
+        Scenario('rest.figures.detail', 'GET',
+                 _get(lambda c, r: f"/api/figures/{figure(c, r)}/"), ('figure-detail', 'GET')),
+        Scenario('rest.figures.autocomplete', 'GET',
+                 _get('/api/figures/autocomplete/', lambda c, r: f"q={r.choice(c['prefixes'])}"),
+                 ('figure-autocomplete', 'GET')),
+        # Timeline events
+        Scenario('rest.timeline.list', 'GET', _get('/api/timeline/'), ('timelineevent-list', 'GET')),
+        Scenario('rest.timeline.search', 'GET', _get('/api/timeline/', 'q=battle')),
+        Scenario('rest.timeline.detail', 'GET',
+                 _get(lambda c, r: f"/api/timeline/{event(c, r)}/"), ('timelineevent-detail', 'GET')),
+        Scenario('rest.timeline.density.figures', 'GET',
+                 _get('/api/timeline/density/', 'kind=figures&bucket_size=10&start=-800&end=2000'),
+                 ('timelineevent-density', 'GET')),
+        Scenario('rest.timeline.density.events', 'GET',
+                 _get('/api/timeline/density/', 'kind=events&bucket_size=10&start=1000&end=2000&category=War')),
+        # Influences
+        Scenario('rest.influences.list', 'GET', _get('/api/influences/'), ('influence-list', 'GET')),
+        Scenario('rest.influences.detail', 'GET',
+                 _get(lambda c, r: f"/api/influences/{influence(c, r)}/"), ('influence-detail', 'GET')),
+        Scenario('rest.influences.lineage', 'GET',
+                 _get('/api/influences/lineage/', lambda c, r: f"figure={r.choice(c['hubs'])}&max_depth=3"),
+                 ('influence-lineage', 'GET')),
+        Scenario('rest.influences.path', 'GET',
+                 _get('/api/influences/path/', lambda c, r: "source={}&target={}&k=3".format(*r.choice(c['pairs']))),
+                 ('influence-path', 'GET')),
+        # GraphQL reads
+        Scenario('graphql.test_data_query', 'POST', _graphql(_sample_query())),
+        Scenario('graphql.figures_nested', 'POST', _graphql(
+            'query ($years: [Int]) { figures(aliveBetween: $years) { name fields { name } '
+            'influencesGiven { influenced { name } } influencesReceived { influencer { name } } } }',
+            {'years': [1800, 1810]},
+        )),
+        Scenario('graphql.figures_connection', 'POST', _graphql(
+            '{ figuresConnection(first: 50) { edges { node { id name normalizedBirthYear } } '
+            'pageInfo { hasNextPage endCursor } } }'
+        )),
+        Scenario('graphql.timeline_events_connection', 'POST', _graphql(
+            '{ timelineEventsConnection(first: 50) { edges { node { id title year } } } }'
+        )),
+        Scenario('graphql.search', 'POST', _graphql(
+            'query ($q: String!) { search(query: $q, limit: 20) { kind score snippet '
+            'figure { name } timelineEvent { title } } }',
+            lambda c, r: {'q': c['search_term']},
+        )),
+        Scenario('graphql.figure_autocomplete', 'POST', _graphql(
+            'query ($q: String!) { figureAutocomplete(query: $q) { id name } }',
+            lambda c, r: {'q': r.choice(c['prefixes'])},
+        )),
+        Scenario('graphql.influence_descendants', 'POST', _graphql(
+            'query ($id: ID!) { influenceDescendants(figureId: $id, maxDepth: 3, limit: 100) '
+            '{ depth figure { name } } }',
+            lambda c, r: {'id': r.choice(c['hubs'])},
+        )),
+        Scenario('graphql.influence_paths', 'POST', _graphql(
+            'query ($s: ID!, $t: ID!) { influencePaths(sourceId: $s, targetId: $t, k: 3) '
+            '{ timedOut paths { hops figures { name } } } }',
+            lambda c, r: dict(zip('st', r.choice(c['pairs']))),
+        )),
+        Scenario('graphql.timeline_density', 'POST', _graphql(
+            '{ timelineDensity(kind: FIGURES, startYear: -800, endYear: 2000, bucketSize: 100) '
+            '{ startYear endYear count } }'
+        )),
+        # Writes
+        Scenario('rest.figures.create', 'POST',
+                 lambda c, r: ('/api/figures/', '', _figure_payload(c)), ('figure-list', 'POST'),
+                 write=True, creates='figures'),
+        Scenario('rest.figures.update', 'PUT',
+                 lambda c, r: (f"/api/figures/{c['created']['figures'][-1]}/", '', _figure_payload(c)),
+                 ('figure-detail', 'PUT'), write=True),
+        Scenario('rest.figures.partial_update', 'PATCH',
+                 lambda c, r: (f"/api/figures/{figure(c, r)}/", '', {'summary': f"Edited {_unique()}"}),
+                 ('figure-detail', 'PATCH'), write=True),
+        Scenario('rest.figures.bulk', 'POST',
+                 lambda c, r: ('/api/figures/bulk/', '', [_figure_payload(c) for _ in range(10)]),
+                 ('figure-bulk', 'POST'), write=True),
+        Scenario('rest.figures.upsert', 'POST',
+                 lambda c, r: ('/api/figures/upsert/', '', [
+                     _figure_payload(c, wikidata_id=wikidata_id) for wikidata_id in r.sample(c['wikidata_ids'], 5)
+                 ] + [_figure_payload(c) for _ in range(5)]),
+                 ('figure-upsert', 'POST'), write=True),
+        Scenario('rest.figures.destroy', 'DELETE',
+                 lambda c, r: (f"/api/figures/{c['created']['figures'].pop()}/", '', None),
+                 ('figure-detail', 'DELETE'), write=True),
+        Scenario('rest.timeline.create', 'POST',
+                 lambda c, r: ('/api/timeline/', '', _event_payload(c)), ('timelineevent-list', 'POST'),
+                 write=True, creates='timeline'),
+        Scenario('rest.timeline.update', 'PUT',
+                 lambda c, r: (f"/api/timeline/{c['created']['timeline'][-1]}/", '', _event_payload(c)),
+                 ('timelineevent-detail', 'PUT'), write=True),
+        Scenario('rest.timeline.partial_update', 'PATCH',
+                 lambda c, r: (f"/api/timeline/{event(c, r)}/", '', {'description': f"Edited {_unique()}"}),
+                 ('timelineevent-detail', 'PATCH'), write=True),
+        Scenario('rest.timeline.bulk', 'POST',
+                 lambda c, r: ('/api/timeline/bulk/', '', [_event_payload(c) for _ in range(10)]),
+                 ('timelineevent-bulk', 'POST'), write=True),
+        Scenario('rest.timeline.destroy', 'DELETE',
+                 lambda c, r: (f"/api/timeline/{c['created']['timeline'].pop()}/", '', None),
+                 ('timelineevent-detail', 'DELETE'), write=True),
+        # Both ends of an influence are read-only in the API, so updates only touch updated_at.
+        Scenario('rest.influences.update', 'PUT',
+                 lambda c, r: (f"/api/influences/{influence(c, r)}/", '', {}), ('influence-detail', 'PUT'),
+                 write=True),
+        Scenario('rest.influences.partial_update', 'PATCH',
+                 lambda c, r: (f"/api/influences/{influence(c, r)}/", '', {}), ('influence-detail', 'PATCH'),
+                 write=True),
+        Scenario('rest.influences.destroy', 'DELETE',
+                 _get(lambda c, r: f"/api/influences/{c['influence_ids'].pop()}/"),
+                 ('influence-detail', 'DELETE'), write=True),
+        Scenario('graphql.create_timeline_events', 'POST', _graphql(
+            'mutation ($inputs: [TimelineEventInput!]!) { createTimelineEvents(inputs: $inputs) '
+            '{ timelineEvents { id } errors { index message } } }',
+            lambda c, r: {'inputs': [_event_payload(c) for _ in range(10)]},
+        ), write=True),
+    ]
+
+
+def build_context(seed_value):
+    """Ids and parameters the scenarios draw from, read from the seeded database."""
+    from figures.models import Figure
+    from timeline.graph import get_graph
+    from timeline.models import Influence, TimelineEvent
+
+    rng = random.Random(seed_value)
+    figure_ids = list(Figure.objects.values_list('id', flat=True))
+    graph = get_graph()
+    hubs = sorted(figure_ids, key=lambda pk: -graph.degree(pk))[:100]
+    names = list(Figure.objects.values_list('name', flat=True)[:500])
+    handler = get_wsgi_application()
+    _, first_page = wsgi_request(handler, 'GET', '/api/figures/')
+    next_link = json.loads(first_page).get('next') or ''
+    return {
+        'figure_ids': figure_ids,
+        'wikidata_ids': list(Figure.objects.values_list('wikidata_id', flat=True)[:1000]),
+        'event_ids': list(TimelineEvent.objects.values_list('id', flat=True)),
+        # Leaves plenty of influences for the read scenarios after the deletes.
+        'influence_ids': list(Influence.objects.order_by('-id').values_list('id', flat=True)),
+        'hubs': hubs,
+        'pairs': [(rng.choice(hubs), rng.choice(figure_ids)) for _ in range(50)],
+        'prefixes': sorted({name.split()[0][:3].lower() for name in names}),
+        'search_term': names[0].split()[0] if names else 'battle',
+        'figures_page_2': next_link.partition('?')[2],
+        'created': {'figures': [], 'timeline': []},
+    }
+
+
+# --- Load generation ---
+
+def run_scenario(handler, scenario, context, args):
+    """Sends the scenario's warmup and timed requests; returns its result dict."""
+    concurrency = 1 if scenario.write and connection.vendor == 'sqlite' else args.concurrency
+    lock = threading.Lock()
+
+    def one(number):
+        rng = random.Random(number)
+        with lock:
+            path, query, payload = scenario.build(context, rng)
+        body = json.dumps(payload).encode() if payload is not None else b''
+        with QueryCounter() as queries:
+            start = time.perf_counter()
+            status, content = wsgi_request(handler, scenario.method, path, query, body)
+            elapsed = time.perf_counter() - start
+        if scenario.creates and status == 201:
+            with lock:
+                context['created'][scenario.creates].append(json.loads(content)['id'])
+        if status < 400 and path == '/graphql/' and json.loads(content).get('errors'):
+            status = 400    # GraphQL reports errors with 200 OK
+        return elapsed, queries.count, status
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(one, range(args.warmup)))
+        started = time.perf_counter()
+        samples = list(executor.map(one, range(args.warmup, args.warmup + args.requests)))
+        wall = time.perf_counter() - started
+
+    times = [elapsed * 1000 for elapsed, _, _ in samples]
+    queries = [count for _, count, _ in samples]
+    return {
+        'method': scenario.method,
+        'route': '{} {}'.format(*scenario.route) if scenario.route else None,
+        'concurrency': concurrency,
+        'requests': len(samples),
+        'errors': sum(status >= 400 for _, _, status in samples),
+        'throughput_rps': round(len(samples) / wall, 1),
+        'latency_ms': {
+            'p50': round(percentile(times, 0.5), 2),
+            'p95': round(percentile(times, 0.95), 2),
+            'p99': round(percentile(times, 0.99), 2),
+            'max': round(max(times), 2),
+        },
+        'sql_queries': {'mean': round(sum(queries) / len(queries), 2), 'max': max(queries)},
+    }
+
+
+def router_routes():
+    """(url name, method) for every route of the API router."""
+    from ChronosAtlas.urls import router
+
+    routes = set()
+    for pattern in router.urls:
+        actions = getattr(pattern.callback, 'actions', None) or {'get': None}
+        routes.update((pattern.name, method.upper()) for method in actions)
+    return routes
+
+
+def uncovered_routes(selected):
+    covered = {scenario.route for scenario in selected if scenario.route}
+    return sorted(router_routes() - covered - set(UNCOVERED))
+
+
+# --- Reporting ---
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results):
+    print(f"{'scenario':40} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'sql':>6} {'err':>4}")
+    for name, result in results.items():
+        latency = result['latency_ms']
+        print(f"{name:40} {latency['p50']:9.2f} {latency['p95']:9.2f} {latency['p99']:9.2f} "
+              f"{result['throughput_rps']:8.1f} {result['sql_queries']['mean']:6.1f} {result['errors']:4}")
+
+
+def _change(old, new):
+    return (new - old) / old * 100 if old else 0.0
+
+
+def compare(baseline, current, threshold):
+    """Prints per-metric changes against `baseline`; returns the names of regressed scenarios."""
+    regressed = []
+    print(f"\nAgainst {baseline['meta'].get('git_revision') or 'baseline'} "
+          f"from {baseline['meta'].get('created', '?')}:")
+    print(f"{'scenario':40} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>8} {'sql':>10}")
+    for name, new in current['scenarios'].items():
+        old = baseline['scenarios'].get(name)
+        if old is None:
+            print(f"{name:40} (new)")
+            continue
+        changes = [_change(old['latency_ms'][p], new['latency_ms'][p]) for p in ('p50', 'p95', 'p99')]
+        throughput = _change(old['throughput_rps'], new['throughput_rps'])
+        sql_old, sql_new = old['sql_queries']['mean'], new['sql_queries']['mean']
+        flags = []
+        if changes[1] > threshold:
+            flags.append('p95')
+        if -throughput > threshold:
+            flags.append('req/s')
+        if sql_new > sql_old:
+            flags.append('sql')
+        if new['errors'] > old['errors']:
+            flags.append('errors')
+        if flags:
+            regressed.append(name)
+        print(f"{name:40} " + ' '.join(f"{c:+7.1f}%" for c in changes) + f" {throughput:+7.1f}% "
+              f"{sql_old:4.1f}->{sql_new:<4.1f}" + (f"  REGRESSED: {', '.join(flags)}" if flags else ''))
+    for name in sorted(set(baseline['scenarios']) - set(current['scenarios'])):
+        print(f"{name:40} (not run)")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--figures', type=int, default=5000, help="figures to seed")
+    parser.add_argument('--events', type=int, default=5000, help="timeline events to seed")
+    parser.add_argument('--seed', type=int, default=0, help="random seed of the dataset and the requests")
+    parser.add_argument('--requests', type=int, default=200, help="timed requests per scenario")
+    parser.add_argument('--warmup', type=int, default=10, help="untimed requests per scenario")
+    parser.add_argument('--concurrency', type=int, default=8, help="concurrent clients")
+    parser.add_argument('--only', default='', help="comma-separated scenario name prefixes to run")
+    parser.add_argument('--db-latency', type=float, default=0.0, help="milliseconds added per SQL statement")
+    parser.add_argument('--cache', action='store_true', help="keep the response cache enabled")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="JSON file of an earlier run to diff against")
+    parser.add_argument('--threshold', type=float, default=10.0, help="regression threshold in percent")
+    args = parser.parse_args(argv)
+
+    selected = [
+        scenario for scenario in scenarios()
+        if not args.only or scenario.name.startswith(tuple(args.only.split(',')))
+    ]
+    missing = uncovered_routes(selected)
+    if missing and not args.only:
+        print("Routes without a scenario: " + ', '.join(f"{name} {method}" for name, method in missing),
+              file=sys.stderr)
+
+    with throwaway_database():
+        counts = seed(figures=args.figures, events=args.events, seed_value=args.seed)
+        if args.db_latency:
+            add_db_latency(args.db_latency / 1000)
+        context = build_context(args.seed)
+        handler = get_wsgi_application()
+        results = {}
+        with override_settings(RESPONSE_CACHE={'ENABLED': args.cache}):
+            for scenario in selected:
+                results[scenario.name] = run_scenario(handler, scenario, context, args)
+                print(f"{scenario.name}: done", file=sys.stderr)
+        vendor = connection.vendor
+
+    report = {
+        'meta': {
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': vendor,
+            'dataset': counts,
+            'seed': args.seed,
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'concurrency': args.concurrency,
+            'db_latency_ms': args.db_latency,
+            'response_cache': args.cache,
+        },
+        'scenarios': results,
+    }
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(json.load(f), report, args.threshold)
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
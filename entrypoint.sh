@@ -7,6 +7,10 @@ set -e
 # Use environment variable if set, otherwise fallback to default settings.
 export DJANGO_SETTINGS_MODULE="${DJANGO_SETTINGS_MODULE:-ChronosAtlas.settings_default}"
 
+# Gunicorn workers; settings_base.py reads it as SERVER_PROCESSES, and its system
+# check requires a shared cache (REDIS_URL) when there is more than one.
+export WEB_CONCURRENCY="${WEB_CONCURRENCY:-4}"
+
 # --- 1. Use hardcoded DB credentials for pg_isready ---
 # These MUST match the 'db' service credentials in docker-compose.prod.yml
 DB_HOST="db"
@@ -33,11 +37,33 @@ python manage.py migrate --noinput
 echo "Collecting static files..."
 python manage.py collectstatic --noinput
 
-# --- 4. Execute the Main Command: Start Gunicorn Server ---
+# --- 4. Reset the shared metrics of the previous server run ---
+# Every worker writes its /metrics samples into METRICS_DIR (ChronosAtlas/metrics.py).
+export METRICS_DIR="${METRICS_DIR:-/tmp/chronos-atlas-metrics}"
+rm -rf "$METRICS_DIR"
+mkdir -p "$METRICS_DIR"
+
+# --- 5. Execute the Main Command: Start Gunicorn Server ---
+# SERVER_MODE=asgi runs uvicorn workers (ChronosAtlas/asgi.py): GraphQL and the REST
+# API run as async views on a thread pool per worker (ASYNC_READ_THREADS), so slow
+# queries no longer block a whole worker. The default stays on sync WSGI workers.
+SERVER_MODE="${SERVER_MODE:-wsgi}"
+
+if [ "$SERVER_MODE" = "asgi" ]; then
+    echo "Starting Gunicorn server (ASGI, uvicorn workers)..."
+    exec python -m gunicorn ChronosAtlas.asgi:application \
+        --worker-class uvicorn.workers.UvicornWorker \
+        --bind 0.0.0.0:8000 \
+        --workers "$WEB_CONCURRENCY" \
+        --timeout 120 \
+        --error-logfile - \
+        --log-level debug
+fi
+
 echo "Starting Gunicorn server..."
 exec python -m gunicorn ChronosAtlas.wsgi:application \
     --bind 0.0.0.0:8000 \
-    --workers 4 \
+    --workers "$WEB_CONCURRENCY" \
     --timeout 120 \
     --error-logfile - \
-    --log-level debug
\ No newline at end of file
+    --log-level debug
@@ -1,17 +1,156 @@
+from django.db.models import prefetch_related_objects
+from django.shortcuts import get_object_or_404
 from rest_framework import serializers, viewsets
-from .models import Figure, Field
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from .autocomplete import WATCHED_MODELS as AUTOCOMPLETE_MODELS, autocomplete as suggest_names
+from .ingest import write_figure_batch
+from .models import QID_RE, Figure, Field
+from ChronosAtlas.batch import batch_response
+from ChronosAtlas.cache import CachedResponseMixin, ConditionalGetMixin
+from ChronosAtlas.pagination import KeysetPagination
+from ChronosAtlas.projection import SparseFieldsetMixin
+from timeline.centrality import METRICS
+from timeline.models import InfluenceMetrics
+
+
+def parse_year_range(value):
+    """
+    Parses an "A,B" query parameter into (start, end) years.
+    The end may be omitted ("1900,") for an open-ended interval.
+    """
+    try:
+        start, end = value.split(',')
+        return int(start), (int(end) if end.strip() else None)
+    except ValueError:
+        raise ValidationError({'alive_between': 'Expected "start,end" years, e.g. -500,-300.'})
+
+
+def parse_number(name, value):
+    try:
+        return float(value)
+    except ValueError:
+        raise ValidationError({name: 'Expected a number.'})
+
+
+def parse_qids(name, value):
+    """Parses a comma-separated list of Wikidata QIDs ("Q5,Q937857")."""
+    qids = [qid.strip() for qid in value.split(',') if qid.strip()]
+    if not qids or not all(QID_RE.match(qid) for qid in qids):
+        raise ValidationError({name: 'Expected comma-separated Wikidata QIDs, e.g. Q5,Q937857.'})
+    return qids
+
 
 class FieldSerializer(serializers.ModelSerializer):
     class Meta:
         model = Field
         fields = ['id', 'name']
 
+class InfluenceMetricsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = InfluenceMetrics
+        fields = ['in_degree', 'out_degree', 'pagerank', 'reach', 'computed_at']
+
 class FigureSerializer(serializers.ModelSerializer):
     fields = FieldSerializer(many=True, read_only=True)
+    # null for figures without any influence edge.
+    influence_metrics = InfluenceMetricsSerializer(read_only=True)
     class Meta:
         model = Figure
-        fields = ['id', 'name', 'slug', 'wikidata_id', 'summary', 'birth_date', 'death_date', 'normalized_birth_year', 'normalized_death_year', 'instance_of_QIDs', 'fields']
+        fields = ['id', 'name', 'slug', 'wikidata_id', 'summary', 'birth_date', 'death_date', 'normalized_birth_year', 'normalized_death_year', 'instance_of_QIDs', 'fields', 'influence_metrics']
 
-class FigureViewSet(viewsets.ModelViewSet):
+class FigurePagination(KeysetPagination):
+    ordering = ('normalized_birth_year', 'name', 'id')
+    # ?ordering=-pagerank etc.; only figures with influence metrics are listed.
+    orderings = {
+        f'{sign}{metric}': (f'{sign}influence_metrics__{metric}',) for metric in METRICS for sign in ('-', '')
+    }
+
+class FigureViewSet(SparseFieldsetMixin, ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
+    """
+    Figures API, keyset-paginated in timeline order (?cursor=, ?page_size=).
+    List and detail take ?fields=id,name,... or ?omit=summary,... to return (and read) fewer columns.
+    Supports ?alive_between=A,B, ?contemporaries_of=<figure id> and ?q=<full-text> filters,
+    plus ?instance_of=<QID>, ?instance_of_any=<QIDs> and ?instance_of_all=<QIDs>.
+    Influence metrics: ?min_<metric>= / ?max_<metric>= filters and ?ordering=-<metric>
+    (in_degree, out_degree, pagerank, reach).
+    Batch writes: POST a JSON list to bulk/ (create) or upsert/ (match on wikidata_id).
+    Name suggestions: autocomplete/?q=<prefix>&limit=<n>.
+    """
     queryset = Figure.objects.all()
     serializer_class = FigureSerializer
+    pagination_class = FigurePagination
+    cache_models = ('figures.figure', 'figures.field', 'timeline.influencemetrics')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        params = self.request.query_params
+
+        if 'alive_between' in params:
+            start, end = parse_year_range(params['alive_between'])
+            queryset = queryset.alive_between(start, end)
+
+        if 'contemporaries_of' in params:
+            if not params['contemporaries_of'].isdigit():
+                raise ValidationError({'contemporaries_of': 'Expected a figure id.'})
+            figure = get_object_or_404(Figure, pk=params['contemporaries_of'])
+            queryset = queryset.contemporaries_of(figure)
+
+        if 'instance_of' in params:
+            qids = parse_qids('instance_of', params['instance_of'])
+            if len(qids) > 1:
+                raise ValidationError({'instance_of': 'Expected one QID; use instance_of_any or instance_of_all.'})
+            queryset = queryset.instance_of(qids)
+        if 'instance_of_any' in params:
+            queryset = queryset.instance_of(parse_qids('instance_of_any', params['instance_of_any']), match='any')
+        if 'instance_of_all' in params:
+            queryset = queryset.instance_of(parse_qids('instance_of_all', params['instance_of_all']))
+
+        if params.get('q'):
+            queryset = queryset.search(params['q'])
+
+        for metric in METRICS:
+            for bound, lookup in (('min', 'gte'), ('max', 'lte')):
+                name = f'{bound}_{metric}'
+                if name in params:
+                    queryset = queryset.filter(**{f'influence_metrics__{metric}__{lookup}': parse_number(name, params[name])})
+
+        return queryset
+
+    @action(detail=False, cache_models=AUTOCOMPLETE_MODELS)
+    def autocomplete(self, request):
+        """
+        Typo-tolerant name suggestions ranked by influence degree, served from memory.
+        GET /api/figures/autocomplete/?q=leon&limit=10
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': 'This parameter is required.'})
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            raise ValidationError({'limit': 'Expected an integer.'})
+        return Response({'query': query, 'results': suggest_names(query, limit)})
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Creates many figures with one bulk insert; invalid items are reported per index.
+        POST /api/figures/bulk/  [{"name": ..., "wikidata_id": ...}, ...]
+        """
+        return batch_response(request.data, write_figure_batch, self.batch_serializer)
+
+    @action(detail=False, methods=['post'])
+    def upsert(self, request):
+        """
+        Like bulk/, but figures whose wikidata_id exists are updated (keeping their slug).
+        POST /api/figures/upsert/  [{"name": ..., "wikidata_id": ...}, ...]
+        """
+        return batch_response(
+            request.data, lambda items: write_figure_batch(items, upsert=True), self.batch_serializer
+        )
+
+    def batch_serializer(self, figures, many):
+        prefetch_related_objects(figures, 'fields')
+        return self.get_serializer(figures, many=many)
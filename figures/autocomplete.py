@@ -0,0 +1,341 @@
+"""
+Typo-tolerant name autocomplete for Figures.
+
+Each worker keeps an immutable NameIndex in memory. Names are normalized
+(case-folded, accents stripped) and indexed from every word start, so "vinc"
+finds "Leonardo da Vinci". All keys live in one sorted string table (one str
+plus an offsets array rather than millions of str objects), which makes a
+prefix lookup a binary search. Prefixes that match more than SCAN_LIMIT keys
+get their best results precomputed when the index is built, so no lookup
+ranks more than SCAN_LIMIT entries. Results are ranked by influence degree,
+read from the in-memory influence graph (timeline/graph.py).
+
+Misspellings ("shakspeare") fall back to trigram similarity: a pg_trgm GIN
+index on PostgreSQL (figures/indexes.py), an in-process trigram index over
+the name vocabulary elsewhere.
+
+The index is built on first use (wsgi.py warms it when a worker starts) and
+rebuilt in a background thread when the Figure or Influence version stamps
+(ChronosAtlas/cache.py) move, at most once per REBUILD_INTERVAL however many
+writes arrive; the old index keeps answering meanwhile, and its answers are kept
+out of the response cache. The stamps live in the version store shared by every
+process, so a write served by another worker, or an import command, reaches
+this worker's index too.
+"""
+import heapq
+import logging
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.db import connection, connections
+
+from ChronosAtlas.cache import do_not_store, get_versions, rendering_for_cache
+
+logger = logging.getLogger(__name__)
+
+MAX_RESULTS = 25
+# Prefix ranges longer than this have their top MAX_RESULTS precomputed.
+SCAN_LIMIT = 2000
+# Fuzzy matching: minimum query word length and trigram similarity.
+MIN_FUZZY_LENGTH = 3
+FUZZY_THRESHOLD = 0.3
+FUZZY_CANDIDATE_WORDS = 50
+# Seconds between checks of the version stamps.
+REFRESH_CHECK_INTERVAL = 1.0
+# Minimum seconds between the starts of two rebuilds, so that a stream of writes
+# costs each worker one rebuild per interval rather than one per write.
+REBUILD_INTERVAL = 10.0
+WATCHED_MODELS = ('figures.figure', 'timeline.influence')
+
+_LAST_CHAR = '\U0010ffff'
+_NO_YEAR = -2 ** 63
+
+
+def normalize(text):
+    """Lower-cases, strips accents and collapses everything but word characters to single spaces."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char)).casefold()
+    return ' '.join(re.findall(r'\w+', text))
+
+
+def trigrams(word):
+    """pg_trgm-style trigrams: the word padded with two spaces in front and one behind."""
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class StringTable:
+    """A read-only sequence of strings packed into one str; supports bisect."""
+
+    __slots__ = ('blob', 'offsets')
+
+    def __init__(self, strings):
+        self.offsets = array('q', [0])
+        parts = []
+        for string in strings:
+            parts.append(string)
+            self.offsets.append(self.offsets[-1] + len(string))
+        self.blob = ''.join(parts)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]]
+
+
+class NameIndex:
+    """Prefix and fuzzy lookups over a snapshot of Figure names."""
+
+    def __init__(self, rows, degree, fuzzy=True, versions=None):
+        """
+        `rows` yields (id, name, birth_year, death_year) ordered by id; `degree(id)`
+        gives the ranking weight. `fuzzy` builds the in-process trigram index.
+        """
+        self.versions = versions
+        self.ids, self.popularity = array('q'), array('q')
+        self.births, self.deaths = array('q'), array('q')
+        names, entries = [], []
+        words = defaultdict(list)       # normalized word -> positions of the names using it
+        for position, (pk, name, birth, death) in enumerate(rows):
+            self.ids.append(pk)
+            self.popularity.append(degree(pk))
+            self.births.append(_NO_YEAR if birth is None else birth)
+            self.deaths.append(_NO_YEAR if death is None else death)
+            names.append(name)
+            normalized = normalize(name)
+            for match in re.finditer(r'\S+', normalized):
+                entries.append((normalized[match.start():], position))
+                if fuzzy:
+                    words[match.group()].append(position)
+        self.names = StringTable(names)
+        del names
+
+        entries.sort()
+        self.keys = StringTable(key for key, _ in entries)
+        self.key_positions = array('q', (position for _, position in entries))
+        del entries
+        self.top = self._precompute_top()
+
+        self.word_positions, self.word_trigram_counts, self.word_trigrams = [], array('q'), {}
+        if fuzzy:
+            self._build_trigrams(words)
+
+    def __len__(self):
+        return len(self.ids)
+
+    # --- Build ---
+
+    def _rank(self, position):
+        # Most influential first, then shorter (usually more canonical) names.
+        name = self.names[position]
+        return (-self.popularity[position], len(name), name)
+
+    def _best(self, lo, hi, limit):
+        return heapq.nsmallest(limit, set(self.key_positions[lo:hi]), key=self._rank)
+
+    def _precompute_top(self):
+        """Best results for every prefix matching more than SCAN_LIMIT keys, level by level."""
+        top = {}
+        ranges = [(0, len(self.keys), 0)]
+        while ranges:
+            heavy = []
+            for lo, hi, length in ranges:
+                i = lo
+                while i < hi:
+                    prefix = self.keys[i][:length + 1]
+                    if len(prefix) <= length:    # the key is the parent prefix itself
+                        i += 1
+                        continue
+                    j = bisect_left(self.keys, prefix + _LAST_CHAR, i, hi)
+                    if j - i > SCAN_LIMIT:
+                        top[prefix] = array('q', self._best(i, j, MAX_RESULTS))
+                        heavy.append((i, j, length + 1))
+                    i = j
+            ranges = heavy
+        return top
+
+    def _build_trigrams(self, words):
+        index = defaultdict(list)
+        for word, positions in words.items():
+            word_id = len(self.word_positions)
+            self.word_positions.append(array('q', positions))
+            word_trigrams = trigrams(word)
+            self.word_trigram_counts.append(len(word_trigrams))
+            for trigram in word_trigrams:
+                index[trigram].append(word_id)
+        self.word_trigrams = {trigram: array('q', ids) for trigram, ids in index.items()}
+
+    # --- Lookups ---
+
+    def position_of(self, pk):
+        i = bisect_left(self.ids, pk)
+        return i if i < len(self.ids) and self.ids[i] == pk else None
+
+    def prefix_matches(self, query, limit=10):
+        """Positions of the best names with a word starting with `query`."""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        if prefix in self.top:
+            return list(self.top[prefix][:limit])
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + _LAST_CHAR, lo)
+        return self._best(lo, hi, limit)
+
+    def fuzzy_matches(self, query, limit=10):
+        """Positions of names containing a word similar to the longest word of `query`."""
+        words = normalize(query).split()
+        word = max(words, key=len, default='')
+        if len(word) < MIN_FUZZY_LENGTH or not self.word_trigrams:
+            return []
+        wanted = trigrams(word)
+        shared = Counter()
+        for trigram in wanted:
+            shared.update(self.word_trigrams.get(trigram, ()))
+
+        similar = []
+        for word_id, common in shared.items():
+            similarity = common / (len(wanted) + self.word_trigram_counts[word_id] - common)
+            if similarity >= FUZZY_THRESHOLD:
+                similar.append((similarity, word_id))
+        scores = {}
+        for similarity, word_id in heapq.nlargest(FUZZY_CANDIDATE_WORDS, similar):
+            for position in self.word_positions[word_id]:
+                scores.setdefault(position, similarity)
+        return heapq.nsmallest(
+            limit, scores, key=lambda position: (-scores[position],) + self._rank(position)
+        )
+
+    def result(self, position, match):
+        birth, death = self.births[position], self.deaths[position]
+        return {
+            'id': self.ids[position],
+            'name': self.names[position],
+            'normalized_birth_year': None if birth == _NO_YEAR else birth,
+            'normalized_death_year': None if death == _NO_YEAR else death,
+            'influence_degree': self.popularity[position],
+            'match': match,
+        }
+
+
+def _fuzzy_postgresql(index, query, limit):
+    """Fuzzy candidates from the pg_trgm index (word_similarity via the <% operator)."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT id FROM figures_figure WHERE %s <%% name "
+            "ORDER BY word_similarity(%s, name) DESC, id LIMIT %s",
+            (query, query, limit),
+        )
+        positions = [index.position_of(pk) for (pk,) in cursor.fetchall()]
+    return [position for position in positions if position is not None]
+
+
+def autocomplete(query, limit=10):
+    """
+    Returns up to `limit` result dicts for `query`: prefix matches first, topped
+    up with fuzzy matches when there are fewer than `limit` of them.
+    """
+    limit = max(1, min(limit, MAX_RESULTS))
+    index = get_index()
+    positions = index.prefix_matches(query, limit)
+    results = [index.result(position, 'prefix') for position in positions]
+    if len(results) < limit and len(normalize(query)) >= MIN_FUZZY_LENGTH:
+        if connection.vendor == 'postgresql':
+            fuzzy = _fuzzy_postgresql(index, query, limit)
+        else:
+            fuzzy = index.fuzzy_matches(query, limit)
+        seen = set(positions)
+        for position in fuzzy:
+            if position not in seen and len(results) < limit:
+                seen.add(position)
+                results.append(index.result(position, 'fuzzy'))
+    return results
+
+
+# --- Per-process singleton ---
+
+_index = None
+_last_check = 0.0
+_lock = threading.Lock()
+_refreshing = False
+_last_rebuild = None
+
+
+def build_index(versions=None):
+    from timeline.graph import load_graph
+    from .models import Figure
+
+    # The current graph, not a lagging one: its degrees rank the index.
+    graph = load_graph()
+    rows = Figure.objects.order_by('id').values_list(
+        'id', 'name', 'normalized_birth_year', 'normalized_death_year'
+    )
+    return NameIndex(
+        rows.iterator(chunk_size=20000), graph.degree,
+        fuzzy=connection.vendor != 'postgresql', versions=versions,
+    )
+
+
+def get_index():
+    """Returns this process's index, building it on first use and refreshing it in the background."""
+    global _index, _last_check
+    now = time.monotonic()
+    check = _index is None or now - _last_check >= REFRESH_CHECK_INTERVAL
+    if not check and not rendering_for_cache():
+        return _index
+    versions = get_versions(WATCHED_MODELS)
+    if check:
+        _last_check = now
+        if _index is None:
+            with _lock:
+                if _index is None:
+                    _index = build_index(versions)
+        elif _index.versions != versions:
+            refresh_in_background(versions)
+    if _index.versions != versions:
+        # Suggestions from a lagging index must not be cached under the newer stamps.
+        do_not_store()
+    return _index
+
+
+def _rebuild(versions):
+    global _index, _refreshing
+    try:
+        _index = build_index(versions or get_versions(WATCHED_MODELS))
+    except Exception:
+        logger.exception("Rebuilding the autocomplete index failed")
+    finally:
+        _refreshing = False
+        connections.close_all()    # this thread's connections only
+
+
+def refresh_in_background(versions=None):
+    """
+    Starts rebuilding the index in a daemon thread, unless a rebuild is already
+    running or the last one started less than REBUILD_INTERVAL ago.
+    """
+    global _refreshing, _last_rebuild
+    with _lock:
+        now = time.monotonic()
+        if _refreshing or (_last_rebuild is not None and now - _last_rebuild < REBUILD_INTERVAL):
+            return
+        _refreshing, _last_rebuild = True, now
+    threading.Thread(target=_rebuild, args=(versions,), daemon=True).start()
+
+
+def warm():
+    """Builds the index ahead of the first request (called from wsgi.py)."""
+    refresh_in_background()
+
+
+def reset():
+    """Drops this process's index; the next lookup rebuilds it."""
+    global _index, _last_rebuild
+    _index = None
+    _last_rebuild = None
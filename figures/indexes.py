@@ -0,0 +1,206 @@
+"""
+Vendor-specific indexes for the figures app.
+
+These cannot be expressed in a model's Meta class (GiST/GIN on PostgreSQL, R*Tree
+and FTS5 virtual tables and trigger-maintained side tables on SQLite), so
+migrations call the helpers below instead.
+"""
+from ChronosAtlas.search import FullTextIndex
+
+# Upper bound used for open-ended lifespans (e.g. living figures) where the
+# backend cannot represent an unbounded range. Max value of an rtree_i32 column.
+OPEN_END_YEAR = 2147483647
+
+# --- 1. Lifespan Range Index (alive_between / contemporaries_of) ---
+
+# CRITICAL: Must stay textually identical to the expression used by
+# FigureQuerySet.alive_between, otherwise PostgreSQL will not use the index.
+# A NULL death year gives an unbounded upper end; a death year earlier than the
+# birth year (bad source data) is clamped so int4range() never raises.
+LIFESPAN_RANGE_SQL = (
+    "int4range(normalized_birth_year, "
+    "CASE WHEN normalized_death_year < normalized_birth_year "
+    "THEN normalized_birth_year ELSE normalized_death_year END, '[]')"
+)
+
+POSTGRES_LIFESPAN_INDEX = [
+    "CREATE INDEX IF NOT EXISTS figure_lifespan_gist ON figures_figure "
+    f"USING gist ({LIFESPAN_RANGE_SQL}) WHERE normalized_birth_year IS NOT NULL",
+]
+POSTGRES_LIFESPAN_INDEX_DROP = [
+    "DROP INDEX IF EXISTS figure_lifespan_gist",
+]
+
+# SQLite has no range types, so the equivalent is an R*Tree shadow table kept
+# in sync with figures_figure by triggers.
+SQLITE_LIFESPAN_VALUES = (
+    "NEW.id, NEW.normalized_birth_year, "
+    f"COALESCE(MAX(NEW.normalized_death_year, NEW.normalized_birth_year), {OPEN_END_YEAR})"
+)
+
+SQLITE_LIFESPAN_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS figures_figure_lifespan_ai "
+    "AFTER INSERT ON figures_figure WHEN NEW.normalized_birth_year IS NOT NULL BEGIN "
+    f"INSERT INTO figures_figure_lifespan VALUES ({SQLITE_LIFESPAN_VALUES}); END",
+
+    "CREATE TRIGGER IF NOT EXISTS figures_figure_lifespan_au "
+    "AFTER UPDATE OF id, normalized_birth_year, normalized_death_year ON figures_figure BEGIN "
+    "DELETE FROM figures_figure_lifespan WHERE id = OLD.id; "
+    f"INSERT INTO figures_figure_lifespan SELECT {SQLITE_LIFESPAN_VALUES} "
+    "WHERE NEW.normalized_birth_year IS NOT NULL; END",
+
+    "CREATE TRIGGER IF NOT EXISTS figures_figure_lifespan_ad "
+    "AFTER DELETE ON figures_figure BEGIN "
+    "DELETE FROM figures_figure_lifespan WHERE id = OLD.id; END",
+]
+
+SQLITE_LIFESPAN_INDEX = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS figures_figure_lifespan "
+    "USING rtree_i32(id, birth_year, death_year)",
+    "DELETE FROM figures_figure_lifespan",
+    "INSERT INTO figures_figure_lifespan "
+    "SELECT id, normalized_birth_year, "
+    f"COALESCE(MAX(normalized_death_year, normalized_birth_year), {OPEN_END_YEAR}) "
+    "FROM figures_figure WHERE normalized_birth_year IS NOT NULL",
+] + SQLITE_LIFESPAN_TRIGGERS
+
+SQLITE_LIFESPAN_INDEX_DROP = [
+    "DROP TRIGGER IF EXISTS figures_figure_lifespan_ai",
+    "DROP TRIGGER IF EXISTS figures_figure_lifespan_au",
+    "DROP TRIGGER IF EXISTS figures_figure_lifespan_ad",
+    "DROP TABLE IF EXISTS figures_figure_lifespan",
+]
+
+
+def _execute_all(schema_editor, statements):
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def create_lifespan_index(schema_editor):
+    """Creates the lifespan range index for the current database vendor."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _execute_all(schema_editor, POSTGRES_LIFESPAN_INDEX)
+    elif vendor == 'sqlite':
+        _execute_all(schema_editor, SQLITE_LIFESPAN_INDEX)
+
+
+def drop_lifespan_index(schema_editor):
+    """Reverses create_lifespan_index()."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _execute_all(schema_editor, POSTGRES_LIFESPAN_INDEX_DROP)
+    elif vendor == 'sqlite':
+        _execute_all(schema_editor, SQLITE_LIFESPAN_INDEX_DROP)
+
+
+def install_sqlite_triggers(schema_editor):
+    """
+    Re-creates the SQLite sync triggers (lifespan R*Tree, full-text search and
+    the instance_of side table).
+    Django's SQLite schema editor rebuilds figures_figure for many ALTERs, which
+    silently drops its triggers; any migration that alters Figure must call this.
+    """
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        _execute_all(schema_editor, SQLITE_LIFESPAN_TRIGGERS)
+        FIGURE_SEARCH.install_sqlite_triggers(schema_editor)
+        if INSTANCE_OF_TABLE in connection.introspection.table_names():
+            _execute_all(schema_editor, SQLITE_INSTANCE_OF_TRIGGERS)
+
+
+# --- 2. Full-text search (name ranks above summary) ---
+
+FIGURE_SEARCH = FullTextIndex('figures_figure', ['name', 'summary'])
+
+
+# --- 3. Name trigrams (fuzzy autocomplete, PostgreSQL only) ---
+
+POSTGRES_NAME_TRIGRAM_INDEX = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS figure_name_trgm ON figures_figure USING gin (name gin_trgm_ops)",
+]
+POSTGRES_NAME_TRIGRAM_INDEX_DROP = [
+    "DROP INDEX IF EXISTS figure_name_trgm",
+]
+
+
+def create_name_trigram_index(schema_editor):
+    """Creates the pg_trgm index used by fuzzy autocomplete; other backends match in process."""
+    if schema_editor.connection.vendor == 'postgresql':
+        _execute_all(schema_editor, POSTGRES_NAME_TRIGRAM_INDEX)
+
+
+def drop_name_trigram_index(schema_editor):
+    """Reverses create_name_trigram_index() (the extension is left installed)."""
+    if schema_editor.connection.vendor == 'postgresql':
+        _execute_all(schema_editor, POSTGRES_NAME_TRIGRAM_INDEX_DROP)
+
+
+# --- 4. Taxonomy (instance_of_QIDs contains / any-of / all-of) ---
+
+# PostgreSQL: jsonb_path_ops GIN index, which serves the @> containment operator.
+POSTGRES_INSTANCE_OF_INDEX = [
+    'CREATE INDEX IF NOT EXISTS figure_instance_of_gin ON figures_figure '
+    'USING gin ("instance_of_QIDs" jsonb_path_ops)',
+]
+POSTGRES_INSTANCE_OF_INDEX_DROP = [
+    "DROP INDEX IF EXISTS figure_instance_of_gin",
+]
+
+# SQLite: one (qid, figure_id) row per list element, kept in sync by triggers.
+# The primary key doubles as the QID lookup index.
+INSTANCE_OF_TABLE = 'figures_figure_instance_of'
+
+SQLITE_INSTANCE_OF_INSERT = (
+    f"INSERT OR IGNORE INTO {INSTANCE_OF_TABLE} (qid, figure_id) "
+    "SELECT value, NEW.id FROM json_each(NEW.instance_of_QIDs) WHERE type = 'text';"
+)
+
+SQLITE_INSTANCE_OF_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS figures_figure_instance_of_ai "
+    f"AFTER INSERT ON figures_figure BEGIN {SQLITE_INSTANCE_OF_INSERT} END",
+
+    "CREATE TRIGGER IF NOT EXISTS figures_figure_instance_of_au "
+    "AFTER UPDATE OF id, instance_of_QIDs ON figures_figure BEGIN "
+    f"DELETE FROM {INSTANCE_OF_TABLE} WHERE figure_id = OLD.id; {SQLITE_INSTANCE_OF_INSERT} END",
+
+    "CREATE TRIGGER IF NOT EXISTS figures_figure_instance_of_ad "
+    f"AFTER DELETE ON figures_figure BEGIN DELETE FROM {INSTANCE_OF_TABLE} WHERE figure_id = OLD.id; END",
+]
+
+SQLITE_INSTANCE_OF_INDEX = [
+    f"CREATE TABLE IF NOT EXISTS {INSTANCE_OF_TABLE} ("
+    "qid TEXT NOT NULL, figure_id INTEGER NOT NULL, PRIMARY KEY (qid, figure_id)) WITHOUT ROWID",
+    f"CREATE INDEX IF NOT EXISTS {INSTANCE_OF_TABLE}_figure ON {INSTANCE_OF_TABLE} (figure_id)",
+    f"DELETE FROM {INSTANCE_OF_TABLE}",
+    f"INSERT OR IGNORE INTO {INSTANCE_OF_TABLE} (qid, figure_id) "
+    "SELECT qid.value, figure.id FROM figures_figure figure, json_each(figure.instance_of_QIDs) qid "
+    "WHERE qid.type = 'text'",
+] + SQLITE_INSTANCE_OF_TRIGGERS
+
+SQLITE_INSTANCE_OF_INDEX_DROP = [
+    "DROP TRIGGER IF EXISTS figures_figure_instance_of_ai",
+    "DROP TRIGGER IF EXISTS figures_figure_instance_of_au",
+    "DROP TRIGGER IF EXISTS figures_figure_instance_of_ad",
+    f"DROP TABLE IF EXISTS {INSTANCE_OF_TABLE}",
+]
+
+
+def create_instance_of_index(schema_editor):
+    """Creates the instance_of_QIDs index for the current database vendor."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _execute_all(schema_editor, POSTGRES_INSTANCE_OF_INDEX)
+    elif vendor == 'sqlite':
+        _execute_all(schema_editor, SQLITE_INSTANCE_OF_INDEX)
+
+
+def drop_instance_of_index(schema_editor):
+    """Reverses create_instance_of_index()."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _execute_all(schema_editor, POSTGRES_INSTANCE_OF_INDEX_DROP)
+    elif vendor == 'sqlite':
+        _execute_all(schema_editor, SQLITE_INSTANCE_OF_INDEX_DROP)
@@ -0,0 +1,335 @@
+"""
+Batch ingestion helpers for Figure data (used by the load_figures command and
+the batch create/upsert APIs).
+
+Rows are upserted on `wikidata_id` one bounded batch at a time: PostgreSQL
+streams each batch through COPY into a temp staging table and merges it with
+INSERT ... ON CONFLICT, every other backend (or psycopg without copy_expert)
+uses bulk_create(update_conflicts=True). If a batch violates another constraint
+(e.g. a duplicate slug), it is retried row by row so only the offending rows
+are rejected.
+"""
+import csv
+import io
+import json
+import os
+from collections import Counter, defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.text import slugify
+
+from ChronosAtlas.batch import BatchResult, build, check_batch_size, clean, write_or_isolate
+from ChronosAtlas.cache import bump_on_commit
+from .models import Figure
+
+# Columns written by the upsert, in COPY order. `slug` is only set on insert so
+# existing URLs stay stable when a figure is re-imported.
+UPSERT_COLUMNS = [
+    'name', 'slug', 'wikidata_id', 'summary', 'birth_date', 'death_date',
+    'normalized_birth_year', 'normalized_death_year', 'instance_of_QIDs', 'wikidata_revision', 'updated_at',
+]
+UPDATE_COLUMNS = [c for c in UPSERT_COLUMNS if c not in ('slug', 'wikidata_id')]
+# Columns a batch API item may set.
+INPUT_COLUMNS = [c for c in UPSERT_COLUMNS if c not in ('wikidata_revision', 'updated_at')]
+
+POSTGRES_STAGE_TABLE = """
+    CREATE TEMP TABLE IF NOT EXISTS figures_figure_stage (
+        name varchar(255), slug varchar(255), wikidata_id varchar(50), summary text,
+        birth_date date, death_date date, normalized_birth_year integer,
+        normalized_death_year integer, "instance_of_QIDs" jsonb, wikidata_revision bigint,
+        updated_at timestamp with time zone
+    ) ON COMMIT DELETE ROWS
+"""
+
+
+class RowError(ValueError):
+    """Raised when a source row cannot be turned into a Figure."""
+
+
+def _optional_int(row, *columns):
+    for column in columns:
+        value = (row.get(column) or '').strip()
+        if value:
+            try:
+                return int(value)
+            except ValueError:
+                raise RowError(f"{column} is not an integer: {value!r}")
+    return None
+
+
+def _optional_date(row, column):
+    value = (row.get(column) or '').strip()
+    if not value:
+        return None
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise RowError(f"{column} is not an ISO date: {value!r}")
+    return parsed
+
+
+def _qids(value):
+    value = (value or '').strip()
+    if not value:
+        return []
+    if value.startswith('['):
+        try:
+            qids = json.loads(value)
+        except ValueError:
+            raise RowError(f"instance_of_QIDs is not valid JSON: {value!r}")
+        if not isinstance(qids, list):
+            raise RowError("instance_of_QIDs must be a list")
+        return [str(q) for q in qids]
+    return [q.strip() for q in value.split(';') if q.strip()]
+
+
+def default_slug(name, wikidata_id):
+    return slugify(f"{name}-{wikidata_id}")[:255]
+
+
+def figure_from_row(row):
+    """
+    Converts a CSV row (dict) into an unsaved Figure, raising RowError if invalid.
+    `birth_year`/`death_year` are accepted as aliases for the normalized years.
+    """
+    name = (row.get('name') or '').strip()
+    wikidata_id = (row.get('wikidata_id') or '').strip()
+    if not name:
+        raise RowError("name is required")
+    if not wikidata_id:
+        raise RowError("wikidata_id is required")
+    if len(name) > 255 or len(wikidata_id) > 50:
+        raise RowError("name or wikidata_id is too long")
+
+    slug = (row.get('slug') or '').strip() or default_slug(name, wikidata_id)
+    return Figure(
+        name=name,
+        slug=slug,
+        wikidata_id=wikidata_id,
+        summary=(row.get('summary') or '').strip() or None,
+        birth_date=_optional_date(row, 'birth_date'),
+        death_date=_optional_date(row, 'death_date'),
+        normalized_birth_year=_optional_int(row, 'normalized_birth_year', 'birth_year'),
+        normalized_death_year=_optional_int(row, 'normalized_death_year', 'death_year'),
+        instance_of_QIDs=_qids(row.get('instance_of_QIDs')),
+    )
+
+
+class FigureUpserter:
+    """Upserts batches of unsaved Figure objects on wikidata_id."""
+
+    def __init__(self, use_copy=True):
+        self.use_copy = use_copy and connection.vendor == 'postgresql'
+
+    def upsert(self, figures):
+        """
+        Writes one batch and returns a list of (figure, error) for rejected rows.
+        Duplicate wikidata_ids inside the batch collapse to the last occurrence.
+        """
+        figures = list({figure.wikidata_id: figure for figure in figures}.values())
+        with transaction.atomic():
+            refused = write_or_isolate(list(enumerate(figures)), self.write)
+            # Bulk writes skip model signals; retire cached responses explicitly.
+            bump_on_commit(Figure)
+        return [(figures[index], message) for index, message in refused]
+
+    def write(self, figures):
+        """Upserts figures in one statement (or one COPY), with no error isolation."""
+        now = timezone.now()
+        for figure in figures:
+            figure.updated_at = now
+        with connection.cursor() as cursor:
+            if self.use_copy and hasattr(cursor, 'copy_expert'):
+                self._copy(cursor, figures)
+                return
+        Figure.objects.bulk_create(
+            figures,
+            update_conflicts=True,
+            unique_fields=['wikidata_id'],
+            update_fields=UPDATE_COLUMNS,
+        )
+
+    def _copy(self, cursor, figures):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for figure in figures:
+            writer.writerow([
+                r'\N' if value is None else value for value in (
+                    figure.name, figure.slug, figure.wikidata_id, figure.summary,
+                    figure.birth_date, figure.death_date, figure.normalized_birth_year,
+                    figure.normalized_death_year, json.dumps(figure.instance_of_QIDs), figure.wikidata_revision,
+                    figure.updated_at,
+                )
+            ])
+        buffer.seek(0)
+
+        columns = ', '.join(f'"{c}"' for c in UPSERT_COLUMNS)
+        updates = ', '.join(f'"{c}" = EXCLUDED."{c}"' for c in UPDATE_COLUMNS)
+        cursor.execute(POSTGRES_STAGE_TABLE)
+        cursor.copy_expert(
+            f"COPY figures_figure_stage ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            buffer,
+        )
+        cursor.execute(
+            f"INSERT INTO figures_figure ({columns}) SELECT {columns} FROM figures_figure_stage "
+            f"ON CONFLICT (wikidata_id) DO UPDATE SET {updates}"
+        )
+        cursor.execute("TRUNCATE figures_figure_stage")
+
+
+def write_figure_batch(items, upsert=False):
+    """
+    Validates and writes a batch of figure payloads (dicts keyed like INPUT_COLUMNS)
+    and returns a BatchResult. Without `upsert`, items whose wikidata_id or slug
+    already exists are rejected; with it, figures matching on wikidata_id are
+    updated (keeping their slug) and the rest inserted.
+    Raises BatchTooLarge if there are more than MAX_BATCH_SIZE items.
+    """
+    from timeline import density, viewport
+
+    check_batch_size(items)
+    result = BatchResult(len(items))
+
+    figures = {}
+    for index, data in enumerate(items):
+        try:
+            figure = build(Figure, INPUT_COLUMNS, data)
+        except ValidationError as e:
+            result.reject_invalid(index, e)
+            continue
+        if not figure.slug and figure.name and figure.wikidata_id:
+            figure.slug = default_slug(figure.name, figure.wikidata_id)
+        if clean(result, index, figure):
+            figures[index] = figure
+
+    # Uniqueness, checked for the whole batch with one query instead of one per item.
+    first_seen = {}
+    for index, figure in list(figures.items()):
+        for column in ('wikidata_id', 'slug'):
+            other = first_seen.setdefault((column, getattr(figure, column)), index)
+            if other != index:
+                result.reject(index, f"Duplicates item {other} of this batch.", column)
+                del figures[index]
+                break
+
+    existing, taken_slugs = {}, set()
+    wikidata_ids = [figure.wikidata_id for figure in figures.values()]
+    slugs = [figure.slug for figure in figures.values()]
+    rows = Figure.objects.filter(wikidata_id__in=wikidata_ids) | Figure.objects.filter(slug__in=slugs)
+    for row in rows.order_by().values('id', 'wikidata_id', 'slug', 'normalized_birth_year', 'normalized_death_year'):
+        existing[row['wikidata_id']] = row
+        taken_slugs.add(row['slug'])
+
+    for index, figure in list(figures.items()):
+        if figure.wikidata_id in existing and upsert:
+            continue
+        if figure.wikidata_id in existing:
+            result.reject(index, "A figure with this wikidata_id already exists.", 'wikidata_id')
+        elif figure.slug in taken_slugs:
+            result.reject(index, "A figure with this slug already exists.", 'slug')
+        else:
+            continue
+        del figures[index]
+
+    if not figures:
+        return result.finish()
+
+    if upsert:
+        write = FigureUpserter().write
+    else:
+        def write(batch):
+            Figure.objects.bulk_create(batch)
+
+    with transaction.atomic():
+        for index, message in write_or_isolate(sorted(figures.items()), write):
+            result.reject(index, message)
+            del figures[index]
+
+        saved = Figure.objects.in_bulk([figure.wikidata_id for figure in figures.values()],
+                                       field_name='wikidata_id')
+        # Batch writes skip model signals, so keep the density buckets and viewport tiles current here.
+        fields = defaultdict(list)
+        updated_ids = [existing[f.wikidata_id]['id'] for f in figures.values() if f.wikidata_id in existing]
+        if updated_ids:
+            links = Figure.fields.through.objects.filter(figure_id__in=updated_ids)
+            for figure_id, field_id in links.values_list('figure_id', 'field_id'):
+                fields[figure_id].append(field_id)
+
+        counts, moves = Counter(), []
+        for index, figure in figures.items():
+            figure = result.objects[index] = saved[figure.wikidata_id]
+            dimensions = [density.ALL, *fields.get(figure.pk, ())]
+            before = existing.get(figure.wikidata_id)
+            if before is not None:
+                density.count_figure(counts, before['normalized_birth_year'],
+                                     before['normalized_death_year'], dimensions, -1)
+            density.count_figure(counts, figure.normalized_birth_year, figure.normalized_death_year, dimensions)
+            birth_before = before['normalized_birth_year'] if before is not None else None
+            if before is None or birth_before != figure.normalized_birth_year:
+                moves.append((figure.pk, birth_before, figure.normalized_birth_year))
+        density.apply_counts(counts)
+        viewport.figures_moved(moves)
+        bump_on_commit(Figure)
+
+    return result.finish()
+
+
+class Checkpoint:
+    """
+    Remembers how far through a source file the last committed batch got, so an
+    interrupted load resumes from there. Written atomically after every batch.
+    """
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = os.path.abspath(source)
+        self.offset = 0
+        self.rows = 0
+        self.fieldnames = None
+
+    def load(self):
+        """Restores state if a checkpoint for the same source exists; returns True if so."""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('source') != self.source:
+            return False
+        self.offset, self.rows, self.fieldnames = data['offset'], data['rows'], data['fieldnames']
+        return True
+
+    def save(self, offset, rows, fieldnames):
+        self.offset, self.rows, self.fieldnames = offset, rows, fieldnames
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'source': self.source, 'offset': offset, 'rows': rows, 'fieldnames': fieldnames,
+            }, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def iter_csv_rows(f, fieldnames=None):
+    """
+    Yields (row, offset) from an open CSV file, where `offset` is the file
+    position just after the row: seeking there resumes at the next row.
+    Reads with readline() so tell() stays usable and quoted newlines still work.
+    """
+    def lines():
+        while True:
+            line = f.readline()
+            if not line:
+                return
+            yield line
+
+    reader = csv.DictReader(lines(), fieldnames=fieldnames)
+    for row in reader:
+        yield row, f.tell()
@@ -2,50 +2,112 @@
 
 import csv
 import os
-from django.core.management.base import BaseCommand
-from figures.models import Figure # Import your Figure model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from figures.ingest import Checkpoint, FigureUpserter, RowError, figure_from_row, iter_csv_rows
 
 # Define the expected path to your CSV file
 # Adjust this path based on where you placed your data file in the Docker build context
-CSV_FILE_PATH = os.path.join(os.getcwd(), 'data', 'historical_figures_normalized.csv') 
+CSV_FILE_PATH = os.path.join(os.getcwd(), 'data', 'historical_figures_normalized.csv')
 
 class Command(BaseCommand):
-    help = 'Loads figure data from the normalized CSV file.'
+    help = (
+        'Streams figure data from a normalized CSV file and upserts it on wikidata_id in batches. '
+        'Invalid rows go to a reject file; progress is checkpointed so an interrupted load resumes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', nargs='?', default=CSV_FILE_PATH,
+                            help='CSV file to load (default: data/historical_figures_normalized.csv).')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows per committed batch (bounds memory use).')
+        parser.add_argument('--reject-file',
+                            help='Where to write rejected rows (default: <csv>.rejects.csv).')
+        parser.add_argument('--checkpoint',
+                            help='Checkpoint file used to resume (default: <csv>.checkpoint.json).')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore any existing checkpoint and load from the first row.')
+        parser.add_argument('--no-copy', action='store_true',
+                            help='Disable the PostgreSQL COPY fast path and use bulk_create.')
 
     def handle(self, *args, **options):
-        self.stdout.write(self.style.NOTICE('Starting figure data loading...'))
-        
+        csv_path = options['csv_path']
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1.')
+
         # Ensure the file exists before proceeding
-        if not os.path.exists(CSV_FILE_PATH):
-            self.stderr.write(self.style.ERROR(f'CSV file not found at: {CSV_FILE_PATH}'))
+        if not os.path.exists(csv_path):
+            self.stderr.write(self.style.ERROR(f'CSV file not found at: {csv_path}'))
             return
 
-        with open(CSV_FILE_PATH, mode='r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            figures_to_create = []
-            
-            for row in reader:
+        checkpoint = Checkpoint(options['checkpoint'] or f'{csv_path}.checkpoint.json', csv_path)
+        if options['restart']:
+            checkpoint.clear()
+        resuming = checkpoint.load()
+        reject_path = options['reject_file'] or f'{csv_path}.rejects.csv'
+        upserter = FigureUpserter(use_copy=not options['no_copy'])
+
+        if resuming:
+            self.stdout.write(self.style.NOTICE(f'Resuming figure load after row {checkpoint.rows}...'))
+        else:
+            self.stdout.write(self.style.NOTICE('Starting figure data loading...'))
+
+        self.loaded = self.rejected = 0
+        rows_done = checkpoint.rows
+        with open(csv_path, mode='r', encoding='utf-8', newline='') as f, \
+                open(reject_path, mode='a' if resuming else 'w', encoding='utf-8', newline='') as reject_file:
+            self.rejects = csv.writer(reject_file)
+            if resuming:
+                f.seek(checkpoint.offset)
+                fieldnames = checkpoint.fieldnames
+            else:
+                fieldnames = next(csv.reader([f.readline()]), None)
+                if not fieldnames:
+                    raise CommandError(f'CSV file is empty: {csv_path}')
+                self.rejects.writerow(['row', 'error'] + fieldnames)
+            self.fieldnames = fieldnames
+
+            # Only the current batch is ever held in memory.
+            batch = {}
+            for row, offset in iter_csv_rows(f, fieldnames=fieldnames):
+                rows_done += 1
                 try:
-                    # Construct the Figure object, converting year strings to integers
-                    figure = Figure(
-                        name=row['name'],
-                        birth_year=int(row['birth_year']),
-                        death_year=int(row['death_year']),
-                        normalized_birth_year=int(row['normalized_birth_year']),
-                        normalized_death_year=int(row['normalized_death_year']),
-                        # Add other model fields here
-                    )
-                    figures_to_create.append(figure)
-                except KeyError as e:
-                    self.stderr.write(self.style.ERROR(f"Missing column in CSV: {e}"))
-                    return
-                except ValueError as e:
-                    self.stderr.write(self.style.ERROR(f"Data type error in row: {row}. Error: {e}"))
-                    return
-
-            # Use bulk_create for massive performance gains
-            Figure.objects.bulk_create(figures_to_create, ignore_conflicts=True)
-            
-            self.stdout.write(self.style.SUCCESS(
-                f'Successfully loaded and created {len(figures_to_create)} figure records.'
-            ))
\ No newline at end of file
+                    figure = figure_from_row(row)
+                except RowError as e:
+                    self.reject(rows_done, row, e)
+                    continue
+                # Later rows for the same wikidata_id win within a batch.
+                batch.pop(figure.wikidata_id, None)
+                batch[figure.wikidata_id] = (figure, rows_done, row)
+
+                if len(batch) >= batch_size:
+                    self.flush(upserter, batch)
+                    reject_file.flush()
+                    checkpoint.save(offset, rows_done, fieldnames)
+                    self.stdout.write(f'  Committed through row {rows_done}')
+                    batch = {}
+
+            self.flush(upserter, batch)
+
+        checkpoint.clear()
+        # bulk writes skip model signals, so refresh the derived timeline aggregates.
+        call_command('rebuild_density', stdout=self.stdout)
+        call_command('rebuild_viewport_tiles', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully loaded {self.loaded} figure records ({self.rejected} rejected, see {reject_path}).'
+        ))
+
+    def reject(self, row_number, row, error):
+        self.rejects.writerow([row_number, str(error)] + [row.get(name) for name in self.fieldnames])
+        self.rejected += 1
+
+    def flush(self, upserter, batch):
+        """Upserts one batch and records any rows the database refused."""
+        if not batch:
+            return
+        failures = upserter.upsert([figure for figure, _, _ in batch.values()])
+        for figure, error in failures:
+            _, row_number, row = batch[figure.wikidata_id]
+            self.reject(row_number, row, error)
+        self.loaded += len(batch) - len(failures)
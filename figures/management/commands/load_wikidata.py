@@ -0,0 +1,162 @@
+import csv
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from ChronosAtlas.cache import bump_versions
+from figures import wikidata
+from figures.ingest import FigureUpserter
+from timeline.graph import invalidate_graph
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = (
+        'Streams a Wikidata JSON dump (.json, .gz, .bz2 or .xz) and upserts every item that is an '
+        'instance of a class (humans by default) as a Figure, with its influences and fields of work. '
+        'Parsing runs in a process pool; items unchanged since the last import are skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('dump_path', help='Wikidata entity dump, e.g. latest-all.json.gz.')
+        parser.add_argument('--instance-of', action='append', metavar='QID',
+                            help=f'Class whose instances are imported; repeatable (default: {wikidata.HUMAN}).')
+        parser.add_argument('--language', default='en',
+                            help="Language of names and summaries, falling back to 'mul', then 'en'.")
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Figures per committed batch (bounds memory use).')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Parsing processes; 1 parses in this process.')
+        parser.add_argument('--reject-file',
+                            help='Where to write rejected items (default: <dump>.rejects.csv).')
+        parser.add_argument('--skip-field-labels', action='store_true',
+                            help='Do not scan the dump again for the labels of new fields; '
+                                 'only fields imported before are linked.')
+        parser.add_argument('--no-copy', action='store_true',
+                            help='Disable the PostgreSQL COPY fast path and use bulk_create.')
+
+    def handle(self, *args, **options):
+        dump_path = options['dump_path']
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        if not os.path.exists(dump_path):
+            raise CommandError(f'Dump not found at: {dump_path}')
+        self.language = options['language']
+        classes = frozenset(options['instance_of'] or [wikidata.HUMAN])
+        workers = max(options['workers'], 1)
+        reject_path = options['reject_file'] or f'{dump_path}.rejects.csv'
+        upserter = FigureUpserter(use_copy=not options['no_copy'])
+
+        self.stdout.write(self.style.NOTICE(
+            f"Importing instances of {', '.join(sorted(classes))} from {dump_path} "
+            f"({workers} worker{'s' if workers > 1 else ''})..."
+        ))
+        started = time.monotonic()
+        self.loaded = self.skipped = self.rejected = 0
+        self.field_qids = set()
+        self.pool = None
+        with tempfile.TemporaryDirectory() as spill_dir, \
+                open(reject_path, 'w', encoding='utf-8', newline='') as reject_file:
+            self.rejects = csv.writer(reject_file)
+            self.rejects.writerow(['wikidata_id', 'error'])
+            self.influences = wikidata.Spill(os.path.join(spill_dir, 'influences.csv'))
+            self.fields = wikidata.Spill(os.path.join(spill_dir, 'fields.csv'))
+            self.revisions = wikidata.Spill(os.path.join(spill_dir, 'revisions.csv'))
+            if workers > 1:
+                # Forked workers must not share this process's connections.
+                connections.close_all()
+                self.pool = multiprocessing.Pool(workers, initializer=_init_worker)
+                self.depth = workers * wikidata.PIPELINE_DEPTH
+            try:
+                # Only the current batch (and the chunks queued for the workers) is held in memory.
+                batch = []
+                for figures, rejects in self.parse(dump_path, wikidata.parse_chunk, classes):
+                    for qid, error in rejects:
+                        self.reject(qid, error)
+                    batch.extend(figures)
+                    if len(batch) >= options['batch_size']:
+                        self.flush(upserter, batch)
+                        reject_file.flush()
+                        batch = []
+                self.flush(upserter, batch)
+
+                self.stdout.write(self.style.NOTICE('Linking influences and fields...'))
+                influences = wikidata.link_influences(self.influences.chunks())
+                field_ids = self.resolve_fields(dump_path, options['skip_field_labels'])
+                links = wikidata.link_fields(self.fields.chunks(), field_ids)
+            finally:
+                if self.pool is not None:
+                    self.pool.terminate()
+            # Only now is every figure complete: a run interrupted before this re-imports them.
+            wikidata.mark_imported(self.revisions.chunks())
+
+        # Batch writes skip model signals, so refresh the derived data and caches here.
+        invalidate_graph()
+        bump_versions('figures.figure', 'figures.field')
+        call_command('refresh_influence_metrics', no_copy=options['no_copy'], stdout=self.stdout)
+        call_command('rebuild_density', stdout=self.stdout)
+        call_command('rebuild_viewport_tiles', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {self.loaded} figures ({self.skipped} unchanged, {self.rejected} rejected, '
+            f'see {reject_path}), {influences} influences and {links} field links '
+            f'in {time.monotonic() - started:.1f}s.'
+        ))
+
+    def parse(self, dump_path, func, argument):
+        """Yields func((chunk, argument, language)) for every chunk of the dump, in order."""
+        with wikidata.open_dump(dump_path) as f:
+            tasks = ((chunk, argument, self.language) for chunk in wikidata.chunks(wikidata.entity_lines(f)))
+            if self.pool is None:
+                yield from map(func, tasks)
+            else:
+                yield from wikidata.pipelined(self.pool, func, tasks, self.depth)
+
+    def reject(self, qid, error):
+        self.rejects.writerow([qid, str(error)])
+        self.rejected += 1
+
+    def flush(self, upserter, batch):
+        """Upserts one batch, skipping unchanged items, and spills the links of the rest."""
+        # Later items for the same wikidata_id win within a batch.
+        batch = list({parsed.qid: parsed for parsed in batch}.values())
+        unchanged = wikidata.unchanged(batch) if batch else set()
+        batch = [parsed for parsed in batch if parsed.qid not in unchanged]
+        self.skipped += len(unchanged)
+        if not batch:
+            return
+        failures = upserter.upsert([wikidata.to_figure(parsed) for parsed in batch])
+        for figure, error in failures:
+            self.reject(figure.wikidata_id, error)
+        failed = {figure.wikidata_id for figure, _ in failures}
+        # Links are rewritten from the dump, dropping claims removed since the last import.
+        wikidata.unlink(parsed.qid for parsed in batch if parsed.qid not in failed)
+        for parsed in batch:
+            if parsed.qid in failed:
+                continue
+            self.influences.add((source, parsed.qid) for source in parsed.influenced_by)
+            self.fields.add((parsed.qid, field) for field in parsed.fields)
+            self.field_qids.update(parsed.fields)
+            self.revisions.add([(parsed.qid, parsed.revision)])
+        self.loaded += len(batch) - len(failures)
+        self.stdout.write(f'  Committed {self.loaded} figures ({self.skipped} unchanged)')
+
+    def resolve_fields(self, dump_path, skip_labels):
+        """{field qid: Field id} for the fields seen, creating Fields for new ones unless skip_labels."""
+        field_ids = wikidata.known_fields(self.field_qids)
+        missing = frozenset(self.field_qids - field_ids.keys())
+        if missing and not skip_labels:
+            self.stdout.write(self.style.NOTICE(f'Scanning the dump for the labels of {len(missing)} fields...'))
+            labels = {}
+            for found in self.parse(dump_path, wikidata.parse_labels, missing):
+                labels.update(found)
+            field_ids.update(wikidata.create_fields(labels))
+        return field_ids
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+from figures.indexes import create_lifespan_index, drop_lifespan_index
+
+
+def forwards(apps, schema_editor):
+    create_lifespan_index(schema_editor)
+
+
+def backwards(apps, schema_editor):
+    drop_lifespan_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+    """
+    Adds the lifespan range index used by the alive_between/contemporaries_of
+    filters: a GiST index over int4range(birth, death) on PostgreSQL and an
+    R*Tree shadow table on SQLite.
+    """
+
+    dependencies = [
+        ('figures', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0 on 2026-10-18 15:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('figures', '0002_figure_lifespan_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='figure',
+            index=models.Index(fields=['normalized_birth_year', 'name', 'id'], name='figure_timeline_order_idx'),
+        ),
+    ]
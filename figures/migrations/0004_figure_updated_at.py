@@ -0,0 +1,28 @@
+# Generated by Django 5.0 on 2026-10-18 17:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+from figures.indexes import install_sqlite_triggers
+
+
+def reinstall_triggers(apps, schema_editor):
+    # Adding a NOT NULL column makes SQLite rebuild figures_figure, dropping its triggers.
+    install_sqlite_triggers(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('figures', '0003_figure_timeline_order_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='figure',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(reinstall_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+from figures.indexes import FIGURE_SEARCH
+
+
+def forwards(apps, schema_editor):
+    FIGURE_SEARCH.create(schema_editor)
+
+
+def backwards(apps, schema_editor):
+    FIGURE_SEARCH.drop(schema_editor)
+
+
+class Migration(migrations.Migration):
+    """
+    Adds full-text search over name and summary: a stored tsvector column with a
+    GIN index on PostgreSQL and an FTS5 shadow table on SQLite.
+    """
+
+    dependencies = [
+        ('figures', '0004_figure_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+from figures.indexes import create_name_trigram_index, drop_name_trigram_index
+
+
+def forwards(apps, schema_editor):
+    create_name_trigram_index(schema_editor)
+
+
+def backwards(apps, schema_editor):
+    drop_name_trigram_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+    """
+    Adds a pg_trgm GIN index on Figure.name for fuzzy autocomplete (PostgreSQL
+    only; a no-op elsewhere).
+    """
+
+    dependencies = [
+        ('figures', '0005_figure_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+from figures.indexes import create_instance_of_index, drop_instance_of_index
+
+
+def forwards(apps, schema_editor):
+    create_instance_of_index(schema_editor)
+
+
+def backwards(apps, schema_editor):
+    drop_instance_of_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+    """
+    Indexes instance_of_QIDs for the taxonomy filters: a jsonb_path_ops GIN index
+    on PostgreSQL and a trigger-maintained (qid, figure_id) side table on SQLite.
+    """
+
+    dependencies = [
+        ('figures', '0006_figure_name_trigram'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
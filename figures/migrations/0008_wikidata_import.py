@@ -0,0 +1,31 @@
+# Generated by Django 5.0 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+from figures.indexes import install_sqlite_triggers
+
+
+def reinstall_triggers(apps, schema_editor):
+    # SQLite may rebuild figures_figure to add the column, dropping its triggers.
+    install_sqlite_triggers(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('figures', '0007_figure_instance_of_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='field',
+            name='wikidata_id',
+            field=models.CharField(blank=True, max_length=50, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='figure',
+            name='wikidata_revision',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(reinstall_triggers, migrations.RunPython.noop),
+    ]
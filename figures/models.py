@@ -1,7 +1,92 @@
-from django.db import models
-from django.contrib.postgres.fields import ArrayField
-# NOTE: GistIndex is imported here but we will add it via migration 0003, 
-# not in the model's Meta class.
+import re
+
+from django.db import connections, models
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.contrib.postgres.fields import ArrayField, IntegerRangeField
+from django.db.backends.postgresql.psycopg_any import NumericRange
+# NOTE: The lifespan GiST index (and its SQLite R*Tree equivalent) is added via
+# migration 0002 using figures/indexes.py, not in the model's Meta class.
+from .indexes import FIGURE_SEARCH, INSTANCE_OF_TABLE, LIFESPAN_RANGE_SQL
+
+# Wikidata item ids as stored in Figure.instance_of_QIDs, e.g. "Q5" (human).
+QID_RE = re.compile(r'^Q[1-9][0-9]*$')
+
+
+class FigureQuerySet(models.QuerySet):
+    """Timeline-specific lookups for Figure, routed to the vendor's range index."""
+
+    def alive_between(self, start, end=None):
+        """
+        Figures whose lifespan overlaps the closed year interval [start, end].
+        A NULL normalized_death_year is treated as still alive (open-ended), and
+        end=None means "from start onwards". Figures without a birth year are excluded.
+        """
+        if end is not None and end < start:
+            start, end = end, start
+        queryset = self.filter(normalized_birth_year__isnull=False)
+        vendor = connections[self.db].vendor
+
+        if vendor == 'postgresql':
+            # Matches the partial GiST index expression in figures/indexes.py.
+            return queryset.alias(
+                lifespan=RawSQL(LIFESPAN_RANGE_SQL, (), output_field=IntegerRangeField())
+            ).filter(lifespan__overlap=NumericRange(start, end, '[]'))
+
+        if vendor == 'sqlite':
+            # R*Tree lookup; open-ended lifespans are stored with OPEN_END_YEAR.
+            if end is None:
+                return queryset.filter(pk__in=RawSQL(
+                    "SELECT id FROM figures_figure_lifespan WHERE death_year >= %s", (start,)
+                ))
+            return queryset.filter(pk__in=RawSQL(
+                "SELECT id FROM figures_figure_lifespan WHERE birth_year <= %s AND death_year >= %s",
+                (end, start),
+            ))
+
+        if end is not None:
+            queryset = queryset.filter(normalized_birth_year__lte=end)
+        return queryset.filter(
+            Q(normalized_death_year__gte=start) | Q(normalized_death_year__isnull=True)
+        )
+
+    def search(self, text):
+        """Figures whose name or summary match `text` (full-text; see ChronosAtlas/search.py)."""
+        return FIGURE_SEARCH.filter(self, text)
+
+    def instance_of(self, qids, match='all'):
+        """
+        Figures whose instance_of_QIDs include all (match='all') or any (match='any')
+        of the given Wikidata class QIDs. Routed to the GIN index on PostgreSQL and
+        to the side table on SQLite (see figures/indexes.py).
+        """
+        qids = list(dict.fromkeys(qids))
+        if not qids:
+            return self if match == 'all' else self.none()
+        vendor = connections[self.db].vendor
+
+        if vendor == 'sqlite':
+            placeholders = ', '.join(['%s'] * len(qids))
+            sql = f"SELECT figure_id FROM {INSTANCE_OF_TABLE} WHERE qid IN ({placeholders})"
+            if match == 'all':
+                sql += f" GROUP BY figure_id HAVING COUNT(*) = {len(qids)}"
+            return self.filter(pk__in=RawSQL(sql, qids))
+
+        # jsonb @> containment on PostgreSQL; any-of ORs one containment per QID.
+        if match == 'all':
+            return self.filter(instance_of_QIDs__contains=qids)
+        condition = Q()
+        for qid in qids:
+            condition |= Q(instance_of_QIDs__contains=[qid])
+        return self.filter(condition)
+
+    def contemporaries_of(self, figure):
+        """Figures (other than `figure`) whose lifespan overlaps the given figure's."""
+        if figure.normalized_birth_year is None:
+            return self.none()
+        return self.alive_between(
+            figure.normalized_birth_year, figure.normalized_death_year
+        ).exclude(pk=figure.pk)
 
 class Figure(models.Model):
     """
@@ -28,22 +113,37 @@ class Figure(models.Model):
     
     # Taxonomy and Filtering Fields
     instance_of_QIDs = models.JSONField(default=list, blank=True)
+
+    # Wikidata revision (lastrevid) of the last completed dump import; NULL after any other write
+    # through the importers, so the next `load_wikidata` run re-imports the figure.
+    wikidata_revision = models.BigIntegerField(null=True, blank=True)
     
     # CRITICAL ADDITION: ManyToMany field needed by load_mvp_data.py
     fields = models.ManyToManyField('Field', related_name='figures')
 
+    # Last write to the row or its `fields` links; drives Last-Modified/ETag on the API.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = FigureQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Historical Figure"
         verbose_name_plural = "Historical Figures"
         ordering = ['normalized_birth_year', 'name']
-        # The GiST indexes are applied via the 0003 migration file.
+        indexes = [
+            # Serves the default ordering and keyset pagination (see ChronosAtlas/pagination.py).
+            models.Index(fields=['normalized_birth_year', 'name', 'id'], name='figure_timeline_order_idx'),
+        ]
+        # The lifespan range index is applied via the 0002 migration file.
 
     def __str__(self):
         return self.name
 
-# Placeholder models for relationships (created in migration 0002)
+# Placeholder models for relationships (created in migration 0001)
 class Field(models.Model):
     name = models.CharField(max_length=100, unique=True)
+    # Wikidata item of the field ("field of work", P101), set by `load_wikidata`.
+    wikidata_id = models.CharField(max_length=50, unique=True, null=True, blank=True)
 
     def __str__(self):
         return self.name
@@ -1,31 +1,233 @@
 import graphene
+from collections import defaultdict
 from graphene_django.types import DjangoObjectType
-from .models import Figure
-from django.db import IntegrityError
+from .models import QID_RE, Figure, Field
+from graphql import GraphQLError
+from .autocomplete import autocomplete
+from .ingest import write_figure_batch
+from ChronosAtlas.batch import BatchTooLarge
+from ChronosAtlas.dataloaders import BatchLoader, expect, get_loader
+from ChronosAtlas.pagination import Keyset, resolve_keyset_connection
+from ChronosAtlas.projection import project
+from timeline.centrality import METRICS
+
+# --- 0. DataLoaders (one query per relation per request) ---
+class FigureLoader(BatchLoader):
+    """Loads Figure objects by primary key, with the columns the operation selects."""
+    key_space = 'figure'
+
+    def batch_load(self, keys):
+        figures = project(Figure.objects.order_by(), self.registry.info, FigureType).in_bulk(keys)
+        return [figures.get(key) for key in keys]
+
+class FieldsByFigureLoader(BatchLoader):
+    """Loads the `fields` M2M for many figures via a single join on the through table."""
+    key_space = 'figure'
+
+    def batch_load(self, keys):
+        fields_by_figure = defaultdict(list)
+        links = Figure.fields.through.objects.filter(figure_id__in=keys).select_related('field')
+        for link in links.order_by('field__name'):
+            fields_by_figure[link.figure_id].append(link.field)
+        return [fields_by_figure[key] for key in keys]
+
+def expect_figures(info, figures):
+    """Announces figures returned by a resolver so their relations load in one batch."""
+    expect(info, 'figure', [figure.pk for figure in figures])
+    loader = get_loader(info, FigureLoader)
+    for figure in figures:
+        loader.prime(figure.pk, figure)
+    return figures
 
 # --- 1. Graphene Type Definition ---
+class FieldType(DjangoObjectType):
+    """Defines the structure of a Field (area of contribution) in GraphQL."""
+    class Meta:
+        model = Field
+        fields = ("id", "name")
+
 class FigureType(DjangoObjectType):
     """Defines the structure of the Figure in GraphQL."""
     class Meta:
         model = Figure
-        fields = ("id", "name", "birthYear", "deathYear", "description")
+        fields = (
+            "id", "name", "slug", "wikidata_id", "summary", "birth_date", "death_date",
+            "normalized_birth_year", "normalized_death_year", "fields",
+            "influences_given", "influences_received", "influence_metrics",
+        )
+
+    def resolve_fields(self, info):
+        return get_loader(info, FieldsByFigureLoader).load(self.pk)
+
+    # Influence lives in the timeline app, which depends on figures; import lazily.
+    def resolve_influences_given(self, info):
+        from timeline.schema import InfluencesGivenLoader
+        return get_loader(info, InfluencesGivenLoader).load(self.pk)
+
+    def resolve_influences_received(self, info):
+        from timeline.schema import InfluencesReceivedLoader
+        return get_loader(info, InfluencesReceivedLoader).load(self.pk)
+
+    def resolve_influence_metrics(self, info):
+        from timeline.schema import InfluenceMetricsLoader
+        return get_loader(info, InfluenceMetricsLoader).load(self.pk)
+
+class FigureConnection(graphene.relay.Connection):
+    """Relay connection over figures, paginated by keyset in timeline order."""
+    class Meta:
+        node = FigureType
+
+FIGURE_KEYSET = Keyset(Figure, 'normalized_birth_year', 'name', 'id')
+
+class FigureOrder(graphene.Enum):
+    """TIMELINE is by birth year; the others list figures with influence metrics, highest first."""
+    TIMELINE = 'timeline'
+    PAGERANK = 'pagerank'
+    REACH = 'reach'
+    IN_DEGREE = 'in_degree'
+    OUT_DEGREE = 'out_degree'
+
+FIGURE_KEYSETS = {
+    'timeline': FIGURE_KEYSET,
+    **{metric: Keyset(Figure, f'-influence_metrics__{metric}') for metric in METRICS},
+}
+
+class InfluenceMetricsFilter(graphene.InputObjectType):
+    """Inclusive bounds on a figure's influence metrics."""
+    min_in_degree = graphene.Int()
+    max_in_degree = graphene.Int()
+    min_out_degree = graphene.Int()
+    max_out_degree = graphene.Int()
+    min_pagerank = graphene.Float()
+    max_pagerank = graphene.Float()
+    min_reach = graphene.Int()
+    max_reach = graphene.Int()
+
+# Everything reachable from a FigureType (its fields, influences both ways, and metrics).
+FIGURE_GRAPH_MODELS = ('figures.figure', 'figures.field', 'timeline.influence', 'timeline.influencemetrics')
+
+# Models each root query field reads, for the response cache (ChronosAtlas/cache.py).
+CACHE_MODELS = {
+    'figures': FIGURE_GRAPH_MODELS,
+    'figuresConnection': FIGURE_GRAPH_MODELS,
+    'figureAutocomplete': FIGURE_GRAPH_MODELS,
+}
+
+# Taxonomy filters on instance_of_QIDs: one class, any of several, all of several.
+TAXONOMY_FILTERS = {
+    'instance_of': graphene.String(),
+    'instance_of_any': graphene.List(graphene.NonNull(graphene.String)),
+    'instance_of_all': graphene.List(graphene.NonNull(graphene.String)),
+}
+
+def filter_figures(queryset, alive_between=None, contemporaries_of=None,
+                   instance_of=None, instance_of_any=None, instance_of_all=None, metrics=None):
+    """Applies the lifespan, taxonomy and metrics filters shared by `figures` and `figuresConnection`."""
+    if alive_between is not None:
+        if not alive_between or alive_between[0] is None or len(alive_between) > 2:
+            raise GraphQLError("aliveBetween expects [start, end] years.")
+        end = alive_between[1] if len(alive_between) == 2 else None
+        queryset = queryset.alive_between(alive_between[0], end)
+
+    if contemporaries_of is not None:
+        try:
+            figure = Figure.objects.get(pk=contemporaries_of)
+        except (Figure.DoesNotExist, ValueError):
+            raise GraphQLError(f"Figure {contemporaries_of} does not exist.")
+        queryset = queryset.contemporaries_of(figure)
+
+    if instance_of is not None:
+        queryset = queryset.instance_of(check_qids([instance_of]))
+    if instance_of_any is not None:
+        queryset = queryset.instance_of(check_qids(instance_of_any), match='any')
+    if instance_of_all is not None:
+        queryset = queryset.instance_of(check_qids(instance_of_all))
+
+    for metric in METRICS:
+        for bound, lookup in (('min', 'gte'), ('max', 'lte')):
+            value = (metrics or {}).get(f'{bound}_{metric}')
+            if value is not None:
+                queryset = queryset.filter(**{f'influence_metrics__{metric}__{lookup}': value})
+
+    return queryset
+
+def check_qids(qids):
+    invalid = [qid for qid in qids if not QID_RE.match(qid)]
+    if invalid:
+        raise GraphQLError(f"Not a Wikidata QID: {', '.join(invalid)}.")
+    return qids
 
 # --- 2. Query Definition ---
 class FigureQuery(graphene.ObjectType):
     """Handles fetching Figure data."""
-    figures = graphene.List(FigureType)
+    # [start, end] years; omit end (or pass null) for an open-ended interval.
+    figures = graphene.List(
+        FigureType,
+        alive_between=graphene.List(graphene.Int),
+        contemporaries_of=graphene.ID(),
+        metrics=InfluenceMetricsFilter(),
+        order_by=FigureOrder(default_value=FigureOrder.TIMELINE.value),
+        **TAXONOMY_FILTERS,
+    )
+    # Paginated variant (first/after, last/before); prefer this for large result sets.
+    figures_connection = graphene.relay.ConnectionField(
+        FigureConnection,
+        alive_between=graphene.List(graphene.Int),
+        contemporaries_of=graphene.ID(),
+        metrics=InfluenceMetricsFilter(),
+        order_by=FigureOrder(default_value=FigureOrder.TIMELINE.value),
+        **TAXONOMY_FILTERS,
+    )
+    # Typo-tolerant name suggestions, most influential first (see figures/autocomplete.py).
+    figure_autocomplete = graphene.List(
+        FigureType,
+        query=graphene.String(required=True),
+        limit=graphene.Int(default_value=10),
+    )
     
-    def resolve_figures(root, info):
-        """Resolver to fetch all Figure objects, ordered by birthYear."""
-        return Figure.objects.all()
+    def resolve_figures(root, info, order_by='timeline', **filters):
+        """Resolver to fetch Figure objects, by normalized birth year or by an influence metric."""
+        keyset = FIGURE_KEYSETS[getattr(order_by, 'value', order_by)]
+        queryset = project(filter_figures(Figure.objects.all(), **filters), info, FigureType, keyset.columns)
+        return expect_figures(info, list(keyset.prepare(queryset).order_by(*keyset.order_by())))
+
+    def resolve_figures_connection(root, info, first=None, after=None, last=None, before=None,
+                                   order_by='timeline', **filters):
+        """Resolver for one keyset page of figures."""
+        keyset = FIGURE_KEYSETS[getattr(order_by, 'value', order_by)]
+        queryset = project(filter_figures(Figure.objects.all(), **filters), info, FigureType, keyset.columns)
+        connection = resolve_keyset_connection(
+            FigureConnection, keyset, queryset, first=first, after=after, last=last, before=before
+        )
+        expect_figures(info, [edge.node for edge in connection.edges])
+        return connection
+
+    def resolve_figure_autocomplete(root, info, query, limit=10):
+        """Resolver for name suggestions; the figures themselves load in one batch."""
+        ids = [result['id'] for result in autocomplete(query, limit)]
+        expect(info, 'figure', ids)
+        # The index may briefly lag a delete; skip ids that no longer exist.
+        return [figure for figure in get_loader(info, FigureLoader).load_many(ids) if figure is not None]
 
 # --- 3. Mutation Input Definition ---
 class FigureInput(graphene.InputObjectType):
     """Defines the structure of the input object for Figure mutations."""
     name = graphene.String(required=True)
-    birthYear = graphene.Int(required=True)
-    deathYear = graphene.Int(required=True)
-    description = graphene.String(required=False)
+    wikidata_id = graphene.String(required=True)
+    # Derived from name and wikidata_id when omitted.
+    slug = graphene.String(required=False)
+    summary = graphene.String(required=False)
+    birth_date = graphene.Date(required=False)
+    death_date = graphene.Date(required=False)
+    normalized_birth_year = graphene.Int(required=False)
+    normalized_death_year = graphene.Int(required=False)
+    instance_of_QIDs = graphene.List(graphene.String, required=False)
+
+class BatchItemErrorType(graphene.ObjectType):
+    """Why one item of a batch mutation was rejected; `index` is its position in `inputs`."""
+    index = graphene.Int()
+    field = graphene.String()
+    message = graphene.String()
 
 # --- 4. Mutation Definition (Create Operation) ---
 class CreateFigure(graphene.Mutation):
@@ -39,22 +241,47 @@ class CreateFigure(graphene.Mutation):
 
     @staticmethod
     def mutate(root, info, input=None):
-        """The core logic for creating the figure."""
+        """The core logic for creating the figure (a batch of one)."""
+        result = write_figure_batch([input])
+        if result.errors:
+            raise GraphQLError("; ".join(
+                f"{error['field']}: {error['message']}" if error['field'] else error['message']
+                for error in result.errors
+            ))
+        return CreateFigure(figure=result.objects[0])
+
+class CreateFigures(graphene.Mutation):
+    """
+    Creates many figures with one bulk insert. Invalid items (or ones whose
+    wikidataId/slug already exists) are reported in `errors`; the rest are saved.
+    """
+    upsert = False
+
+    class Arguments:
+        inputs = graphene.List(graphene.NonNull(FigureInput), required=True)
+
+    figures = graphene.List(FigureType, description="One entry per input; null where the item was rejected.")
+    errors = graphene.List(graphene.NonNull(BatchItemErrorType))
+
+    @classmethod
+    def mutate(cls, root, info, inputs):
         try:
-            figure = Figure.objects.create(
-                name=input.name,
-                birthYear=input.birthYear,
-                deathYear=input.deathYear,
-                description=input.description if input.description else ""
-            )
-            return CreateFigure(figure=figure)
-        except IntegrityError as e:
-            raise Exception(f"Database error while creating Figure: {e}")
-        except Exception as e:
-            # General catch-all for unexpected issues
-            raise Exception(f"An unexpected error occurred: {e}")
+            result = write_figure_batch(inputs, upsert=cls.upsert)
+        except BatchTooLarge as e:
+            raise GraphQLError(str(e))
+        expect_figures(info, [figure for figure in result.objects if figure is not None])
+        return cls(figures=result.objects, errors=result.errors)
+
+class UpsertFigures(CreateFigures):
+    """
+    Like createFigures, but figures whose wikidataId already exists are updated
+    in place (their slug is kept) instead of being rejected.
+    """
+    upsert = True
 
 # --- 5. Mutation Container ---
 class FigureMutation(graphene.ObjectType):
     """Root container for all Figure-related mutations."""
-    createFigure = CreateFigure.Field()
\ No newline at end of file
+    createFigure = CreateFigure.Field()
+    createFigures = CreateFigures.Field()
+    upsertFigures = UpsertFigures.Field()
@@ -1,4 +1,12 @@
-from django.test import TestCase
+import csv
+import io
+import os
+from unittest import mock
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.test import Client, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from ChronosAtlas import db_routing
 from .models import Figure, Field
 
 class FigureModelTest(TestCase):
@@ -25,3 +33,768 @@ class FigureModelTest(TestCase):
         self.assertEqual(self.figure.normalized_death_year, 1955)
         self.assertEqual(list(self.figure.instance_of_QIDs), ["Q5"])
         self.assertEqual(self.figure.fields.first().name, "Science")
+
+class FigureLifespanQueryTest(TestCase):
+    def setUp(self):
+        def make(name, birth, death):
+            return Figure.objects.create(
+                name=name, slug=name.lower().replace(' ', '-'), wikidata_id=f"Q-{name}",
+                normalized_birth_year=birth, normalized_death_year=death,
+            )
+        self.plato = make("Plato", -428, -348)
+        self.aristotle = make("Aristotle", -384, -322)
+        self.einstein = make("Albert Einstein", 1879, 1955)
+        self.chomsky = make("Noam Chomsky", 1928, None)
+        self.unknown = make("Unknown Scribe", None, None)
+
+    def names(self, queryset):
+        return sorted(queryset.values_list('name', flat=True))
+
+    def test_alive_between(self):
+        self.assertEqual(self.names(Figure.objects.alive_between(-350, -340)), ["Aristotle", "Plato"])
+        self.assertEqual(self.names(Figure.objects.alive_between(-340, -350)), ["Aristotle", "Plato"])
+        self.assertEqual(self.names(Figure.objects.alive_between(2000, 2020)), ["Noam Chomsky"])
+        self.assertEqual(self.names(Figure.objects.alive_between(1950, None)), ["Albert Einstein", "Noam Chomsky"])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.chomsky.normalized_death_year = 1999
+        self.chomsky.save()
+        self.assertEqual(self.names(Figure.objects.alive_between(2000, 2020)), [])
+        self.plato.delete()
+        self.assertEqual(self.names(Figure.objects.alive_between(-350, -340)), ["Aristotle"])
+
+    def test_contemporaries_of(self):
+        self.assertEqual(self.names(Figure.objects.contemporaries_of(self.chomsky)), ["Albert Einstein"])
+        self.assertEqual(self.names(Figure.objects.contemporaries_of(self.plato)), ["Aristotle"])
+        self.assertEqual(self.names(Figure.objects.contemporaries_of(self.unknown)), [])
+
+    def test_rest_and_graphql_filters(self):
+        response = self.client.get('/api/figures/', {'alive_between': '1900,1950'})
+        self.assertEqual([f['name'] for f in response.json()['results']], ["Albert Einstein", "Noam Chomsky"])
+        response = self.client.get('/api/figures/', {'contemporaries_of': self.aristotle.pk})
+        self.assertEqual([f['name'] for f in response.json()['results']], ["Plato"])
+        self.assertEqual(self.client.get('/api/figures/', {'alive_between': 'x'}).status_code, 400)
+
+        response = self.client.post('/graphql/', {
+            'query': '{ figures(aliveBetween: [2000]) { name normalizedDeathYear } }'
+        }, content_type='application/json')
+        self.assertEqual(response.json()['data']['figures'], [{'name': "Noam Chomsky", 'normalizedDeathYear': None}])
+
+class FigureTaxonomyFilterTest(TestCase):
+    def setUp(self):
+        def make(name, qids):
+            return Figure.objects.create(name=name, slug=name.lower(), wikidata_id=f"Q-{name}",
+                                         instance_of_QIDs=qids)
+        self.plato = make("Plato", ["Q5", "Q4964182"])
+        self.caesar = make("Caesar", ["Q5", "Q116"])
+        self.bucephalus = make("Bucephalus", ["Q726"])
+
+    def names(self, queryset):
+        return sorted(queryset.values_list('name', flat=True))
+
+    def test_contains_any_and_all(self):
+        self.assertEqual(self.names(Figure.objects.instance_of(["Q5"])), ["Caesar", "Plato"])
+        self.assertEqual(self.names(Figure.objects.instance_of(["Q5", "Q116"])), ["Caesar"])
+        self.assertEqual(self.names(Figure.objects.instance_of(["Q116", "Q726"], match='any')),
+                         ["Bucephalus", "Caesar"])
+        self.assertEqual(self.names(Figure.objects.instance_of(["Q5", "Q5"])), ["Caesar", "Plato"])
+
+    def test_index_follows_writes(self):
+        self.plato.instance_of_QIDs = ["Q5"]
+        self.plato.save()
+        self.assertEqual(self.names(Figure.objects.instance_of(["Q4964182"])), [])
+        self.caesar.delete()
+        self.assertEqual(self.names(Figure.objects.instance_of(["Q5"])), ["Plato"])
+        self.client.post('/api/figures/upsert/', [
+            {'name': "Plato", 'wikidata_id': "Q-Plato", 'instance_of_QIDs': ["Q5", "Q4964182"]},
+        ], content_type='application/json')
+        self.assertEqual(self.names(Figure.objects.instance_of(["Q4964182"])), ["Plato"])
+
+    def test_rest_and_graphql_filters(self):
+        def rest(**params):
+            response = self.client.get('/api/figures/', params)
+            return sorted(f['name'] for f in response.json()['results'])
+        self.assertEqual(rest(instance_of="Q5"), ["Caesar", "Plato"])
+        self.assertEqual(rest(instance_of_any="Q4964182,Q726"), ["Bucephalus", "Plato"])
+        self.assertEqual(rest(instance_of_all="Q5,Q116"), ["Caesar"])
+        self.assertEqual(self.client.get('/api/figures/', {'instance_of': "human"}).status_code, 400)
+        self.assertEqual(self.client.get('/api/figures/', {'instance_of': "Q5,Q116"}).status_code, 400)
+
+        response = self.client.post('/graphql/', {
+            'query': '{ figures(instanceOfAny: ["Q116", "Q726"], instanceOf: "Q5") { name } }'
+        }, content_type='application/json')
+        self.assertEqual(response.json()['data']['figures'], [{'name': "Caesar"}])
+        response = self.client.post('/graphql/', {'query': '{ figures(instanceOfAll: ["x"]) { name } }'},
+                                    content_type='application/json')
+        self.assertIn("Not a Wikidata QID: x", response.json()['errors'][0]['message'])
+
+class FigureGraphQLBatchingTest(TestCase):
+    QUERY = '''{ figures { name fields { name }
+        influencesGiven { influenced { name fields { name } } }
+        influencesReceived { influencer { name } } } }'''
+
+    def seed(self, count):
+        from timeline.models import Influence
+        science, art = Field.objects.get_or_create(name="Science")[0], Field.objects.get_or_create(name="Art")[0]
+        start = Figure.objects.count()
+        figures = [
+            Figure.objects.create(name=f"Figure {start + i}", slug=f"figure-{start + i}",
+                                  wikidata_id=f"Q{start + i}", normalized_birth_year=1800 + i)
+            for i in range(count)
+        ]
+        for previous, figure in zip(figures, figures[1:]):
+            figure.fields.add(science, art)
+            Influence.objects.create(influencer=previous, influenced=figure)
+
+    def run_query(self):
+        response = self.client.post('/graphql/', {'query': self.QUERY}, content_type='application/json')
+        self.assertNotIn('errors', response.json())
+        return response.json()['data']['figures']
+
+    def test_query_count_is_constant(self):
+        self.seed(3)
+        with self.assertNumQueries(4):
+            small = self.run_query()
+        self.seed(25)
+        with self.assertNumQueries(4):
+            large = self.run_query()
+        self.assertEqual(len(small), 3)
+        self.assertEqual(len(large), 28)
+
+    def test_batched_results_match_relations(self):
+        self.seed(3)
+        figures = {f['name']: f for f in self.run_query()}
+        self.assertEqual(figures["Figure 0"]['fields'], [])
+        self.assertEqual(figures["Figure 1"]['fields'], [{'name': "Art"}, {'name': "Science"}])
+        self.assertEqual(figures["Figure 0"]['influencesGiven'],
+                         [{'influenced': {'name': "Figure 1", 'fields': [{'name': "Art"}, {'name': "Science"}]}}])
+        self.assertEqual(figures["Figure 2"]['influencesReceived'], [{'influencer': {'name': "Figure 1"}}])
+
+class SparseFieldsetTest(TestCase):
+    def setUp(self):
+        self.figure = Figure.objects.create(
+            name="Hypatia", slug="hypatia", wikidata_id="Q11567", summary="Mathematician and astronomer.",
+            normalized_birth_year=360, normalized_death_year=415, instance_of_QIDs=["Q5"],
+        )
+        self.figure.fields.add(Field.objects.create(name="Mathematics"))
+
+    def selects(self, queries, column):
+        return any(f'"{column}"' in query['sql'] for query in queries if query['sql'].startswith('SELECT'))
+
+    def test_rest_fields_and_omit(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/figures/?fields=id,name,normalized_birth_year')
+        self.assertEqual(response.json()['results'], [{'id': self.figure.pk, 'name': "Hypatia",
+                                                       'normalized_birth_year': 360}])
+        self.assertFalse(self.selects(queries, 'summary'))
+        self.assertFalse(any('figures_field' in query['sql'] for query in queries))
+
+        detail = self.client.get(f'/api/figures/{self.figure.pk}/?omit=summary,instance_of_QIDs').json()
+        self.assertNotIn('summary', detail)
+        self.assertEqual(detail['fields'], [{'id': self.figure.fields.get().pk, 'name': "Mathematics"}])
+        self.assertEqual(self.client.get('/api/figures/?fields=name,nope').status_code, 400)
+
+    def test_full_list_prefetches_fields(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/figures/')
+        self.assertEqual(response.json()['results'][0]['summary'], "Mathematician and astronomer.")
+
+    def test_graphql_reads_selected_columns(self):
+        def run(query):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post('/graphql/', {'query': query}, content_type='application/json')
+            self.assertNotIn('errors', response.json())
+            return response.json()['data'], queries
+
+        data, queries = run('{ figures { id name } }')
+        self.assertEqual(data['figures'], [{'id': str(self.figure.pk), 'name': "Hypatia"}])
+        self.assertFalse(self.selects(queries, 'summary'))
+        # A fragment elsewhere in the operation widens what the shared figure objects load.
+        data, queries = run('{ figures { name } figuresConnection(first: 5) { edges { node { ...Bio } } } } '
+                            'fragment Bio on FigureType { summary }')
+        self.assertEqual(data['figuresConnection']['edges'], [{'node': {'summary': "Mathematician and astronomer."}}])
+        self.assertTrue(self.selects(queries, 'summary'))
+
+class ReadReplicaRoutingTest(TestCase):
+    """'replica' is a second, separate database, so each response shows which one served it."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        connections.settings['replica'] = {**connections.settings['default'], 'NAME': ':memory:'}
+        call_command('migrate', database='replica', verbosity=0)
+        Figure.objects.using('replica').create(name="Replica Copy", slug="replica-copy", wikidata_id="Q2")
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        super().tearDownClass()
+
+    def setUp(self):
+        db_routing.health.clear()
+        Figure.objects.create(name="Primary Copy", slug="primary-copy", wikidata_id="Q1")
+        self.routing = self.settings(DATABASE_ROUTING={'REPLICAS': ['replica']})
+        self.routing.enable()
+        self.addCleanup(self.routing.disable)
+
+    def names(self, response):
+        return sorted(figure['name'] for figure in response.json()['results'])
+
+    def graphql(self, query, client=None):
+        return (client or self.client).post('/graphql/', {'query': query}, content_type='application/json').json()
+
+    def test_reads_use_replica_until_a_write(self):
+        self.assertEqual(self.names(self.client.get('/api/figures/')), ["Replica Copy"])
+        self.assertEqual(self.graphql('{ figures { name } }')['data']['figures'], [{'name': "Replica Copy"}])
+
+        response = self.client.post('/api/figures/', {'name': "New", 'slug': "new", 'wikidata_id': "Q3"}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(db_routing.setting('COOKIE_NAME'), response.cookies)
+        self.assertTrue(Figure.objects.filter(slug="new").exists())
+        # Read-your-writes: the cookie keeps this client on the primary.
+        self.assertEqual(self.names(self.client.get('/api/figures/')), ["New", "Primary Copy"])
+        self.assertEqual(self.names(Client().get('/api/figures/')), ["Replica Copy"])
+
+    def test_graphql_timing_counts_replica_queries(self):
+        response = self.client.post('/graphql/', {'query': '{ figures { name } }'},
+                                    content_type='application/json', HTTP_X_GRAPHQL_TIMING='1').json()
+        self.assertEqual(response['data']['figures'], [{'name': "Replica Copy"}])
+        resolvers = {r['field']: r for r in response['extensions']['timing']['resolvers']}
+        self.assertGreater(resolvers['Query.figures']['sqlQueries'], 0)
+
+    def test_mutation_runs_on_primary(self):
+        data = self.graphql('mutation { createFigure(input: {name: "Made", slug: "made", wikidataId: "Q4"}) { figure { name } } }')
+        self.assertEqual(data['data']['createFigure']['figure'], {'name': "Made"})
+        self.assertTrue(Figure.objects.filter(slug="made").exists())
+        self.assertFalse(Figure.objects.using('replica').filter(slug="made").exists())
+
+    def test_failover_to_primary(self):
+        with mock.patch('ChronosAtlas.db_routing.check_replica', return_value=False):
+            self.assertEqual(self.names(self.client.get('/api/figures/')), ["Primary Copy"])
+
+        db_routing.health.clear()
+        replica = connections['replica']
+
+        def unreachable(execute, sql, params, many, context):
+            raise OperationalError('server closed the connection unexpectedly')
+
+        replica.execute_wrappers += [db_routing._watch_errors('replica'), unreachable]
+        self.addCleanup(replica.execute_wrappers.clear)
+        # The failed read is retried on the primary, and the replica leaves rotation.
+        response = Client(raise_request_exception=False).get('/api/figures/')
+        self.assertEqual(self.names(response), ["Primary Copy"])
+        self.assertFalse(db_routing.health.is_healthy('replica'))
+
+
+class FigureKeysetPaginationTest(TestCase):
+    def setUp(self):
+        # Duplicate and NULL birth years exercise every tie-break column.
+        years = [1900, 1900, None, -400, 1900, None, 1500]
+        for i, year in enumerate(years):
+            Figure.objects.create(name=f"Figure {i % 3}", slug=f"figure-{i}", wikidata_id=f"Q{i}",
+                                  normalized_birth_year=year)
+        dated = Figure.objects.exclude(normalized_birth_year=None).order_by('normalized_birth_year', 'name', 'id')
+        undated = Figure.objects.filter(normalized_birth_year=None).order_by('name', 'id')
+        self.expected = [f.pk for f in dated] + [f.pk for f in undated]
+
+    def test_rest_pages_forward_and_back_without_offset(self):
+        pages, url = [], '/api/figures/?page_size=2'
+        with CaptureQueriesContext(connection) as queries:
+            while url:
+                page = self.client.get(url).json()
+                pages.append([f['id'] for f in page['results']])
+                previous, url = page['previous'], page['next']
+        self.assertEqual(sum(pages, []), self.expected)
+        self.assertFalse(any('OFFSET' in q['sql'] for q in queries.captured_queries))
+
+        # Walk back from the last page using the "previous" links.
+        back = []
+        while previous:
+            page = self.client.get(previous).json()
+            back.insert(0, [f['id'] for f in page['results']])
+            previous = page['previous']
+        self.assertEqual(back, pages[:-1])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/figures/', {'cursor': 'garbage'}).status_code, 404)
+
+    def test_filter_matches_the_ordering(self):
+        from ChronosAtlas.pagination import Keyset
+        for fields in [('normalized_birth_year', 'name', 'id'), ('-normalized_birth_year', 'name'),
+                       ('name', '-id'), ('-name', 'slug')]:
+            keyset = Keyset(Figure, *fields)
+            ordered = list(Figure.objects.order_by(*keyset.order_by()))
+            for i, row in enumerate(ordered):
+                position = keyset.position(row)
+                after = keyset.filter_after(Figure.objects.all(), position).order_by(*keyset.order_by())
+                before = keyset.filter_after(Figure.objects.all(), position, reverse=True)
+                self.assertEqual(list(after), ordered[i + 1:], (fields, position))
+                self.assertEqual(list(before.order_by(*keyset.order_by(reverse=True))), ordered[:i][::-1],
+                                 (fields, position))
+
+    def test_filter_is_index_friendly(self):
+        from ChronosAtlas.pagination import Keyset
+        keyset = Keyset(Figure, 'normalized_birth_year', 'name', 'id')
+        sql = str(keyset.filter_after(Figure.objects.all(), [1900, "Figure 0", 1]).query)
+        # A bound on the leading column, the NULL tail as its own branch, the rest as one row value.
+        self.assertIn('"normalized_birth_year" >= 1900', sql)
+        self.assertIn('"normalized_birth_year" IS NULL', sql)
+        self.assertRegex(sql, r'\("figures_figure"\."name", "figures_figure"\."id"\) > \(Figure 0, 1\)')
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = keyset.filter_after(Figure.objects.all(), [1900, "Figure 0", 1]).order_by(
+                *keyset.order_by())[:2].explain()
+            self.assertIn('figure_timeline_order_idx', plan)
+
+    def test_graphql_connection(self):
+        query = """query($after: String) { figuresConnection(first: 3, after: $after) {
+            edges { node { id } } pageInfo { hasNextPage endCursor } } }"""
+        seen, after = [], None
+        while True:
+            response = self.client.post('/graphql/', {'query': query, 'variables': {'after': after}},
+                                        content_type='application/json')
+            data = response.json()['data']['figuresConnection']
+            seen += [int(edge['node']['id']) for edge in data['edges']]
+            if not data['pageInfo']['hasNextPage']:
+                break
+            after = data['pageInfo']['endCursor']
+        self.assertEqual(seen, self.expected)
+
+class LoadFiguresCommandTest(TestCase):
+    HEADER = "name,wikidata_id,slug,normalized_birth_year,normalized_death_year,instance_of_QIDs\n"
+
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.csv_path = os.path.join(self.tmpdir.name, 'figures.csv')
+
+    def write_csv(self, rows):
+        with open(self.csv_path, 'w', encoding='utf-8') as f:
+            f.write(self.HEADER + ''.join(rows))
+
+    def load(self, *args):
+        call_command('load_figures', self.csv_path, '--batch-size', '2', *args, stdout=io.StringIO())
+
+    def read_rejects(self):
+        with open(f'{self.csv_path}.rejects.csv', encoding='utf-8') as f:
+            return list(csv.DictReader(f))
+
+    def test_upserts_and_rejects_bad_rows(self):
+        Figure.objects.create(name="Plato (old)", slug="plato", wikidata_id="Q859")
+        self.write_csv([
+            "Plato,Q859,,-428,-348,Q5;Q4964182\n",
+            "Aristotle,Q868,,-384,-322,\"[\"\"Q5\"\"]\"\n",
+            "Broken,Q1,,not-a-year,,\n",
+            "No Id,,,1900,,\n",
+            "Slug Clash,Q2,plato,1900,,\n",
+            "Noam Chomsky,Q9049,,1928,,Q5\n",
+        ])
+        self.load()
+
+        plato = Figure.objects.get(wikidata_id="Q859")
+        self.assertEqual((plato.name, plato.slug, plato.normalized_birth_year), ("Plato", "plato", -428))
+        self.assertEqual(plato.instance_of_QIDs, ["Q5", "Q4964182"])
+        self.assertEqual(Figure.objects.get(wikidata_id="Q868").slug, "aristotle-q868")
+        self.assertIsNone(Figure.objects.get(wikidata_id="Q9049").normalized_death_year)
+        self.assertEqual(Figure.objects.count(), 3)
+        self.assertEqual([r['name'] for r in self.read_rejects()], ["Broken", "No Id", "Slug Clash"])
+
+    def test_resumes_from_checkpoint_after_crash(self):
+        from figures.ingest import FigureUpserter
+        self.write_csv([f"Figure {i},Q{i},,{1900 + i},,\n" for i in range(5)])
+
+        original = FigureUpserter.upsert
+        calls = []
+        def crash_on_second_batch(upserter, figures):
+            calls.append(len(figures))
+            if len(calls) == 2:
+                raise RuntimeError("simulated crash")
+            return original(upserter, figures)
+
+        with mock.patch.object(FigureUpserter, 'upsert', crash_on_second_batch):
+            with self.assertRaises(RuntimeError):
+                self.load()
+        self.assertEqual(Figure.objects.count(), 2)
+        self.assertTrue(os.path.exists(f'{self.csv_path}.checkpoint.json'))
+
+        self.load()
+        self.assertEqual(sorted(Figure.objects.values_list('wikidata_id', flat=True)),
+                         ["Q0", "Q1", "Q2", "Q3", "Q4"])
+        self.assertFalse(os.path.exists(f'{self.csv_path}.checkpoint.json'))
+
+class LoadWikidataCommandTest(TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.dump_path = os.path.join(self.tmpdir.name, 'latest-all.json.gz')
+
+    @staticmethod
+    def claim(value, rank='normal'):
+        return {'mainsnak': {'snaktype': 'value', 'datavalue': {'value': value}}, 'rank': rank}
+
+    def item(self, qid, label, revision=1, classes=('Q5',), born=None, died=None, fields=(), influenced_by=()):
+        claims = {'P31': [self.claim({'id': c}) for c in classes]}
+        for prop, time in (('P569', born), ('P570', died)):
+            if time:
+                claims[prop] = [self.claim(time)]
+        if fields:
+            claims['P101'] = [self.claim({'id': f}) for f in fields]
+        if influenced_by:
+            claims['P737'] = [self.claim({'id': q}) for q in influenced_by]
+        labels = {'en': {'language': 'en', 'value': label}} if label else {}
+        return {'type': 'item', 'id': qid, 'lastrevid': revision, 'labels': labels,
+                'descriptions': {'en': {'language': 'en', 'value': f'About {label}'}}, 'claims': claims}
+
+    def write_dump(self, items):
+        import gzip
+        import json
+        with gzip.open(self.dump_path, 'wt', encoding='utf-8') as f:
+            f.write('[\n' + ',\n'.join(json.dumps(i, separators=(',', ':')) for i in items) + '\n]\n')
+
+    def load(self, *args):
+        call_command('load_wikidata', self.dump_path, '--batch-size', '2', *args, stdout=io.StringIO())
+
+    def items(self, newton_revision=1):
+        julian = 'http://www.wikidata.org/entity/Q1985786'
+        return [
+            self.item('Q913', 'Socrates', born={'time': '-0470-00-00T00:00:00Z', 'precision': 9},
+                      died={'time': '-0500-00-00T00:00:00Z', 'precision': 7}),
+            self.item('Q935', 'Isaac Newton', revision=newton_revision, fields=('Q395', 'Q413'),
+                      born={'time': '+1642-12-25T00:00:00Z', 'precision': 11, 'calendarmodel': julian},
+                      influenced_by=('Q913', 'Q8011')),
+            self.item('Q8011', 'Galileo Galilei', born={'time': '+1600-00-00T00:00:00Z', 'precision': 7}),
+            self.item('Q395', 'mathematics', classes=('Q11862829',)),
+            self.item('Q413', 'physics', classes=('Q11862829',)),
+            self.item('Q1', None),
+        ]
+
+    def test_imports_figures_links_and_skips_unchanged(self):
+        Field.objects.create(name='Physics')
+        self.write_dump(self.items())
+        self.load('--workers', '1')
+
+        self.assertEqual(sorted(Figure.objects.values_list('wikidata_id', flat=True)), ['Q8011', 'Q913', 'Q935'])
+        socrates = Figure.objects.get(wikidata_id='Q913')
+        self.assertEqual((socrates.normalized_birth_year, socrates.normalized_death_year), (-470, -500))
+        self.assertEqual(socrates.summary, 'About Socrates')
+        newton = Figure.objects.get(wikidata_id='Q935')
+        self.assertEqual(str(newton.birth_date), '1643-01-04')
+        self.assertEqual(newton.normalized_birth_year, 1643)
+        self.assertEqual(Figure.objects.get(wikidata_id='Q8011').normalized_birth_year, 1501)
+        self.assertEqual(sorted(newton.influences_received.values_list('influencer__wikidata_id', flat=True)),
+                         ['Q8011', 'Q913'])
+        self.assertEqual(sorted(newton.fields.values_list('name', 'wikidata_id')),
+                         [('Mathematics', 'Q395'), ('Physics', 'Q413')])
+        self.assertEqual(newton.wikidata_revision, 1)
+        with open(f'{self.dump_path}.rejects.csv', encoding='utf-8') as f:
+            self.assertEqual([r['wikidata_id'] for r in csv.DictReader(f)], ['Q1'])
+
+        items = self.items(newton_revision=2)
+        items[1]['labels']['en']['value'] = 'Sir Isaac Newton'
+        items[0]['labels']['en']['value'] = 'Changed, but at the same revision'
+        self.write_dump(items)
+        socrates_updated = socrates.updated_at
+        self.load('--workers', '1', '--skip-field-labels')
+        self.assertEqual(Figure.objects.get(wikidata_id='Q935').name, 'Sir Isaac Newton')
+        self.assertEqual(Figure.objects.get(wikidata_id='Q935').wikidata_revision, 2)
+        self.assertEqual(Figure.objects.get(wikidata_id='Q913').name, 'Socrates')
+        self.assertEqual(Figure.objects.get(wikidata_id='Q913').updated_at, socrates_updated)
+        self.assertEqual(Field.objects.count(), 2)
+
+    def test_reimport_drops_removed_claims(self):
+        from timeline import graph as graph_module
+        self.write_dump(self.items())
+        self.load('--workers', '1')
+        newton = Figure.objects.get(wikidata_id='Q935')
+        socrates = Figure.objects.get(wikidata_id='Q913')
+        self.assertIn(newton.pk, graph_module.load_graph().descendants(socrates.pk, max_depth=1))
+
+        items = self.items(newton_revision=2)
+        items[1] = self.item('Q935', 'Isaac Newton', revision=2, fields=('Q413',), influenced_by=('Q8011',))
+        self.write_dump(items)
+        self.load('--workers', '1', '--skip-field-labels')
+        self.assertEqual(list(newton.influences_received.values_list('influencer__wikidata_id', flat=True)),
+                         ['Q8011'])
+        self.assertEqual(list(newton.fields.values_list('wikidata_id', flat=True)), ['Q413'])
+        self.assertNotIn(newton.pk, graph_module.load_graph().descendants(socrates.pk, max_depth=1))
+
+    def test_parallel_parse_matches_serial(self):
+        self.write_dump(self.items())
+        self.load('--workers', '2')
+        self.assertEqual(Figure.objects.count(), 3)
+        newton = Figure.objects.get(wikidata_id='Q935')
+        self.assertEqual(newton.influences_received.count(), 2)
+        self.assertEqual(newton.fields.count(), 2)
+
+    def test_normalize_time(self):
+        from datetime import date
+        from figures.wikidata import normalize_time
+        self.assertEqual(normalize_time({'time': '+1850-00-00T00:00:00Z', 'precision': 8}), (1850, None))
+        self.assertEqual(normalize_time({'time': '+1900-00-00T00:00:00Z', 'precision': 7}), (1801, None))
+        self.assertEqual(normalize_time({'time': '-2000-00-00T00:00:00Z', 'precision': 6}), (-2000, None))
+        self.assertEqual(normalize_time({'time': '+1000000-00-00T00:00:00Z', 'precision': 3}), (None, None))
+        self.assertEqual(normalize_time({'time': '-0044-03-15T00:00:00Z', 'precision': 11}), (-44, None))
+        self.assertEqual(normalize_time({'time': '+1969-07-20T00:00:00Z', 'precision': 11,
+                                         'calendarmodel': 'http://www.wikidata.org/entity/Q1985727'}),
+                         (1969, date(1969, 7, 20)))
+
+class FigureBatchWriteTest(TestCase):
+    def setUp(self):
+        self.philosophy = Field.objects.create(name="Philosophy")
+        self.plato = Figure.objects.create(name="Plato", slug="plato", wikidata_id="Q859",
+                                           normalized_birth_year=-428, normalized_death_year=-348)
+        self.plato.fields.add(self.philosophy)
+
+    def snapshot_density(self):
+        from timeline.models import DensityBucket
+        return set(DensityBucket.objects.exclude(count=0).values_list(
+            'kind', 'resolution', 'dimension', 'start_year', 'count'))
+
+    def test_create_figures_mutation_reports_per_item_errors(self):
+        query = """
+            mutation($inputs: [FigureInput!]!) {
+                createFigures(inputs: $inputs) { figures { name slug } errors { index field message } }
+            }
+        """
+        inputs = [
+            {"name": "Aristotle", "wikidataId": "Q868", "normalizedBirthYear": -384, "normalizedDeathYear": -322},
+            {"name": "Plato again", "wikidataId": "Q859"},
+            {"name": "Socrates", "wikidataId": "Q913", "normalizedBirthYear": -470, "slug": "not a slug"},
+            {"name": "Zeno", "wikidataId": "Q868"},
+        ]
+        # One uniqueness lookup, one INSERT, one re-read, then the density and viewport tile upkeep;
+        # savepoints aside.
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/graphql/', {'query': query, 'variables': {'inputs': inputs}},
+                                        content_type='application/json')
+        statements = [q['sql'] for q in queries.captured_queries if 'SAVEPOINT' not in q['sql']]
+        self.assertEqual(len(statements), 8)
+        data = response.json()['data']['createFigures']
+        self.assertEqual(data['figures'], [{'name': 'Aristotle', 'slug': 'aristotle-q868'}, None, None, None])
+        self.assertEqual([(e['index'], e['field']) for e in data['errors']],
+                         [(1, 'wikidata_id'), (2, 'slug'), (3, 'wikidata_id')])
+        self.assertEqual(Figure.objects.count(), 2)
+
+    def test_upsert_updates_existing_and_keeps_density_current(self):
+        from timeline.density import rebuild
+        response = self.client.post('/api/figures/upsert/', [
+            {"name": "Plato", "wikidata_id": "Q859", "slug": "ignored",
+             "normalized_birth_year": -427, "normalized_death_year": -347},
+            {"name": "Aristotle", "wikidata_id": "Q868", "birth_date": "not a date"},
+            {"name": "Aristotle", "wikidata_id": "Q868", "normalized_birth_year": -384},
+        ], content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['results'][0]['slug'], 'plato')
+        self.assertEqual(body['results'][0]['fields'], [{'id': self.philosophy.pk, 'name': 'Philosophy'}])
+        self.assertIsNone(body['results'][1])
+        self.assertEqual([(e['index'], e['field']) for e in body['errors']], [(1, 'birth_date')])
+        self.assertEqual(Figure.objects.get(wikidata_id="Q859").normalized_birth_year, -427)
+
+        incremental = self.snapshot_density()
+        rebuild()
+        self.assertEqual(incremental, self.snapshot_density())
+
+    def test_create_figure_and_bulk_validation(self):
+        query = 'mutation { createFigure(input: {name: "Aristotle", wikidataId: "Q868"}) { figure { slug } } }'
+        response = self.client.post('/graphql/', {'query': query}, content_type='application/json')
+        self.assertEqual(response.json()['data']['createFigure']['figure'], {'slug': 'aristotle-q868'})
+        response = self.client.post('/graphql/', {'query': query}, content_type='application/json')
+        self.assertIn('already exists', response.json()['errors'][0]['message'])
+
+        self.assertEqual(self.client.post('/api/figures/bulk/', {"name": "x"},
+                                          content_type='application/json').status_code, 400)
+        response = self.client.post('/api/figures/bulk/', [{"name": "Zeno", "colour": "red"}],
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual({e['field'] for e in response.json()['errors']}, {'colour'})
+
+class ConditionalGetTest(TransactionTestCase):
+    """Version stamps move when writes commit, hence TransactionTestCase."""
+
+    def setUp(self):
+        self.plato = Figure.objects.create(name="Plato", slug="plato", wikidata_id="Q859",
+                                           normalized_birth_year=-428, normalized_death_year=-348)
+
+    def test_list_etag_changes_only_with_relevant_writes(self):
+        etag = self.client.get('/api/figures/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/figures/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # The body's absolute URLs depend on the host.
+        self.assertEqual(self.client.get('/api/figures/', HTTP_HOST='localhost', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        from timeline.models import TimelineEvent
+        TimelineEvent.objects.create(title="Academy founded", year=-387, category="Education")
+        self.assertEqual(self.client.get('/api/figures/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.plato.fields.add(Field.objects.create(name="Philosophy"))
+        response = self.client.get('/api/figures/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_etag_follows_writes_from_other_processes(self):
+        import tempfile
+        from django.core.cache.backends.filebased import FileBasedCache
+        from ChronosAtlas.cache import _version_key
+        with tempfile.TemporaryDirectory() as tmpdir, self.settings(
+            CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'versions': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tmpdir},
+            },
+            RESPONSE_CACHE={'VERSION_CACHE': 'versions'},
+        ):
+            etag = self.client.get('/api/figures/')['ETag']
+            self.assertEqual(self.client.get('/api/figures/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            # A write served by another worker bumps the stamp through its own cache instance.
+            FileBasedCache(tmpdir, {}).incr(_version_key('figures.figure'))
+            self.assertEqual(self.client.get('/api/figures/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detail_etag_uses_one_lookup(self):
+        url = f'/api/figures/{self.plato.pk}/'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # A write to another figure leaves this one's ETag alone.
+        Figure.objects.create(name="Aristotle", slug="aristotle", wikidata_id="Q868")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.plato.summary = "Philosopher"
+        self.plato.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get('/api/figures/999/').status_code, 404)
+
+    def test_event_detail_last_modified(self):
+        from timeline.models import TimelineEvent
+        event = TimelineEvent.objects.create(title="Academy founded", year=-387, category="Education")
+        response = self.client.get(f'/api/timeline/{event.pk}/')
+        self.assertIn('Last-Modified', response)
+        response = self.client.get(f'/api/timeline/{event.pk}/',
+                                   HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+class FigureAutocompleteTest(TestCase):
+    def setUp(self):
+        from timeline.models import Influence
+        from . import autocomplete
+        autocomplete.reset()
+        self.addCleanup(autocomplete.reset)
+        names = ["Socrates", "Plato", "Aristotle", "Plotinus", "Émilie du Châtelet", "William Shakespeare"]
+        figures = {name: Figure.objects.create(name=name, slug=f"figure-{i}", wikidata_id=f"Q{i}")
+                   for i, name in enumerate(names)}
+        for influencer, influenced in [("Socrates", "Plato"), ("Plato", "Aristotle"), ("Plato", "Plotinus")]:
+            Influence.objects.create(influencer=figures[influencer], influenced=figures[influenced])
+
+    def suggest(self, query, **params):
+        response = self.client.get('/api/figures/autocomplete/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(r['name'], r['match']) for r in response.json()['results']]
+
+    def test_prefix_fuzzy_and_ranking(self):
+        # Ranked by influence degree; any word start matches, accents are ignored.
+        self.assertEqual(self.suggest("pl"), [("Plato", 'prefix'), ("Plotinus", 'prefix')])
+        self.assertEqual(self.suggest("CHATEL"), [("Émilie du Châtelet", 'prefix')])
+        self.assertEqual(self.suggest("shakspeare"), [("William Shakespeare", 'fuzzy')])
+        self.assertEqual(self.suggest("pl", limit=1), [("Plato", 'prefix')])
+        self.assertEqual(self.client.get('/api/figures/autocomplete/').status_code, 400)
+
+        response = self.client.post('/graphql/', {'query': '{ figureAutocomplete(query: "aristo") { name } }'},
+                                    content_type='application/json')
+        self.assertEqual(response.json()['data']['figureAutocomplete'], [{'name': "Aristotle"}])
+
+    def test_refreshes_after_a_write_made_by_another_process(self):
+        import tempfile
+        from django.core.cache.backends.filebased import FileBasedCache
+        from ChronosAtlas.cache import _version_key
+        from . import autocomplete
+        with tempfile.TemporaryDirectory() as tmpdir, self.settings(
+            CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'versions': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tmpdir},
+            },
+            RESPONSE_CACHE={'VERSION_CACHE': 'versions'},
+        ), mock.patch.object(autocomplete, 'REFRESH_CHECK_INTERVAL', 0), \
+                mock.patch.object(autocomplete, 'refresh_in_background', autocomplete._rebuild):
+            self.assertEqual(self.suggest("sapph"), [])
+            # An import in another process: no signals here, only its bump of the shared stamps.
+            Figure.objects.bulk_create([Figure(name="Sappho", slug="sappho", wikidata_id="Q17892")])
+            FileBasedCache(tmpdir, {}).incr(_version_key('figures.figure'))
+            self.suggest("sapph")   # notices the new stamp and rebuilds
+            self.assertEqual(self.suggest("sapph"), [("Sappho", 'prefix')])
+
+    def test_precomputed_prefixes_match_a_full_scan(self):
+        from . import autocomplete
+        rows = [(i, name, None, None) for i, name in
+                enumerate(["Ada", "Adam", "Adams", "Adele", "Bach", "Ada Bach", "Adler", "Abe"])]
+        with mock.patch.object(autocomplete, 'SCAN_LIMIT', 1):
+            index = autocomplete.NameIndex(rows, degree=lambda pk: pk % 3, fuzzy=False)
+        self.assertIn('ad', index.top)
+        for prefix in ['a', 'ad', 'ada', 'adam', 'b', 'bach', 'x']:
+            expected = sorted(
+                (pk for pk, name, _, _ in rows if any(w.lower().startswith(prefix) for w in name.split())),
+                key=lambda pk: (-(pk % 3), len(rows[pk][1]), rows[pk][1]),
+            )
+            self.assertEqual(index.prefix_matches(prefix, limit=3), expected[:3], prefix)
+
+class FigureAutocompleteCacheTest(TransactionTestCase):
+    """The response cache only stores outside transactions, hence TransactionTestCase."""
+
+    def setUp(self):
+        from . import autocomplete
+        autocomplete.reset()
+        self.addCleanup(autocomplete.reset)
+        Figure.objects.create(name="Plato", slug="plato", wikidata_id="Q859")
+
+    def suggest(self, query):
+        response = self.client.get('/api/figures/autocomplete/', {'q': query})
+        return [r['name'] for r in response.json()['results']], response['X-Cache']
+
+    def test_answers_from_a_lagging_index_are_not_cached(self):
+        import tempfile
+        from django.core.cache.backends.filebased import FileBasedCache
+        from ChronosAtlas.cache import _version_key, get_response_cache
+        from . import autocomplete
+        with tempfile.TemporaryDirectory() as tmpdir, self.settings(
+            CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'versions': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tmpdir},
+            },
+            RESPONSE_CACHE={'VERSION_CACHE': 'versions'},
+        ), mock.patch.object(autocomplete, 'REFRESH_CHECK_INTERVAL', 3600), \
+                mock.patch.object(autocomplete, 'refresh_in_background') as refresh:
+            get_response_cache().clear()
+            self.assertEqual(self.suggest("sapph"), ([], 'MISS'))
+            self.assertEqual(self.suggest("sapph"), ([], 'HIT'))
+            Figure.objects.bulk_create([Figure(name="Sappho", slug="sappho", wikidata_id="Q17892")])
+            FileBasedCache(tmpdir, {}).incr(_version_key('figures.figure'))
+            # Within the check interval the index lags the new stamps, so its answer is not stored.
+            self.assertEqual(self.suggest("sapph"), ([], 'MISS'))
+            self.assertEqual(self.suggest("sapph"), ([], 'MISS'))
+            refresh.assert_not_called()
+
+            with mock.patch.object(autocomplete, 'REFRESH_CHECK_INTERVAL', 0):
+                self.suggest("sapph")   # the periodic check starts the rebuild
+            refresh.assert_called_once()
+            autocomplete._rebuild(*refresh.call_args.args)
+            self.assertEqual(self.suggest("sapph"), (["Sappho"], 'MISS'))
+            self.assertEqual(self.suggest("sapph"), (["Sappho"], 'HIT'))
+
+    def test_rebuilds_are_rate_limited(self):
+        from . import autocomplete
+        autocomplete.get_index()
+        with mock.patch.object(autocomplete.threading, 'Thread') as thread:
+            autocomplete.refresh_in_background()
+            autocomplete._refreshing = False   # as if that rebuild had finished
+            autocomplete.refresh_in_background()
+            thread.assert_called_once()
+            autocomplete._refreshing = False
+            with mock.patch.object(autocomplete, 'REBUILD_INTERVAL', 0):
+                autocomplete.refresh_in_background()
+            self.assertEqual(thread.call_count, 2)
+        autocomplete._refreshing = False
@@ -0,0 +1,391 @@
+"""
+Streaming import of a Wikidata JSON dump (used by the load_wikidata command).
+
+A dump (https://dumps.wikimedia.org/wikidatawiki/entities/, latest-all.json.gz
+or .bz2) is a JSON array with one entity per line. The command reads it
+sequentially and hands chunks of lines to a process pool; workers drop lines
+that cannot match before decoding them and turn matching items into
+WikidataFigure tuples. While the workers parse, the command upserts the
+previous batch through FigureUpserter (figures/ingest.py), so parsing and
+writing overlap, and at most PIPELINE_DEPTH chunks per worker are in flight.
+
+Influences ("influenced by", P737) and Fields ("field of work", P101) may
+point at items later in the dump, so they are spilled to temporary files and
+linked once every figure exists, a chunk at a time. Fields are named after the
+label of their item, found by a second, id-only scan of the dump for items not
+seen in an earlier import (Field.wikidata_id).
+
+Re-runs are incremental: every figure remembers the `lastrevid` it was
+imported at (Figure.wikidata_revision), and entities at that revision are
+skipped. A changed figure's influences and field links are deleted with its
+batch and written again from the dump, so claims removed on Wikidata go away.
+Revisions are only recorded after the links are written, so an interrupted run
+re-imports what it had not finished.
+"""
+import bz2
+import csv
+import gzip
+import json
+import lzma
+import os
+import re
+from collections import deque, namedtuple
+from datetime import date
+from itertools import islice
+
+from django.db.models import Case, Value, When
+
+from timeline.models import Influence
+from .ingest import RowError, default_slug
+from .models import Field, Figure
+
+HUMAN = 'Q5'
+INSTANCE_OF = 'P31'
+OCCUPATION = 'P106'
+DATE_OF_BIRTH = 'P569'
+DATE_OF_DEATH = 'P570'
+FIELD_OF_WORK = 'P101'
+INFLUENCED_BY = 'P737'
+
+JULIAN = 'http://www.wikidata.org/entity/Q1985786'
+# Wikidata time precisions: 6 millennium, 7 century, 8 decade, 9 year, 10 month, 11 day.
+PRECISION_DAY = 11
+PRECISION_YEAR = 9
+COARSEST_PRECISION = 6
+
+# Lines handed to a worker at a time, and chunks queued per worker.
+CHUNK_LINES = 1000
+PIPELINE_DEPTH = 4
+# Rows per query when linking spilled pairs.
+LINK_CHUNK = 5000
+
+TIME_RE = re.compile(r'^([+-])(\d+)-(\d\d)-(\d\d)T')
+ENTITY_ID_RE = re.compile(rb'"id":"(Q\d+)"')
+
+WikidataFigure = namedtuple(
+    'WikidataFigure', 'qid revision name summary birth death instance_of fields influenced_by'
+)
+
+
+# --- 1. Reading the dump ---
+
+def open_dump(path):
+    """Opens a dump for binary reading, decompressing .gz, .bz2 and .xz files."""
+    opener = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}.get(os.path.splitext(path)[1], open)
+    return opener(path, 'rb')
+
+
+def entity_lines(f):
+    """The entity lines of an open dump, without the array brackets and trailing commas."""
+    for line in f:
+        line = line.strip()
+        if line.endswith(b','):
+            line = line[:-1]
+        if line and line not in (b'[', b']'):
+            yield line
+
+
+def chunks(lines, size=CHUNK_LINES):
+    lines = iter(lines)
+    while chunk := list(islice(lines, size)):
+        yield chunk
+
+
+def pipelined(pool, func, tasks, depth):
+    """
+    pool.imap(func, tasks), keeping at most `depth` tasks queued so that a fast
+    reader cannot buffer the whole dump ahead of the workers.
+    """
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.apply_async(func, (task,)))
+        if len(pending) >= depth:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+# --- 2. Parsing entities (runs in the workers) ---
+
+def julian_to_gregorian(year, month, day):
+    """Converts a Julian calendar date (astronomical year numbering) to the proleptic Gregorian calendar."""
+    a = (14 - month) // 12
+    y, m = year + 4800 - a, month + 12 * a - 3
+    jdn = day + (153 * m + 2) // 5 + 365 * y + y // 4 - 32083
+    a = jdn + 32044
+    b = (4 * a + 3) // 146097
+    c = a - 146097 * b // 4
+    d = (4 * c + 3) // 1461
+    e = c - 1461 * d // 4
+    m = (5 * e + 2) // 153
+    return 100 * b + d - 4800 + m // 10, m + 3 - 12 * (m // 10), e - (153 * m + 2) // 5 + 1
+
+
+def normalize_time(value):
+    """
+    Turns a Wikidata time value into (normalized_year, date or None). Years
+    are negative BCE, as in Wikidata. Decades normalize to their first year and
+    centuries and millennia to theirs (the 5th century BCE to -500, the 19th
+    century to 1801); a date is only returned at day precision, in the
+    Gregorian calendar, for years 1 to 9999. Returns (None, None) for values
+    coarser than a millennium.
+    """
+    match = TIME_RE.match(value.get('time', ''))
+    precision = value.get('precision', 0)
+    if match is None or precision < COARSEST_PRECISION:
+        return None, None
+    sign, year, month, day = match.groups()
+    year, month, day = int(year) * (-1 if sign == '-' else 1), int(month), int(day)
+
+    if precision < PRECISION_YEAR:
+        unit = 10 ** (PRECISION_YEAR - precision)
+        if precision == 8:
+            return year // unit * unit, None
+        # Ordinal centuries/millennia: the 19th century is 1801-1900, the 5th century BCE -500 to -401.
+        ordinal = -(-abs(year) // unit)
+        return ((ordinal - 1) * unit + 1 if year > 0 else -ordinal * unit), None
+
+    if precision < PRECISION_DAY or not (month and day):
+        return year, None
+    if value.get('calendarmodel') == JULIAN:
+        # Wikidata numbers years historically (no year 0); the conversion works on astronomical years.
+        astronomical = year + 1 if year < 0 else year
+        astronomical, month, day = julian_to_gregorian(astronomical, month, day)
+        year = astronomical - 1 if astronomical <= 0 else astronomical
+    if not 1 <= year <= 9999:
+        return year, None
+    try:
+        return year, date(year, month, day)
+    except ValueError:
+        return year, None
+
+
+def statement_values(claims, prop):
+    """Values of the best-ranked statements of `prop` (preferred over normal; deprecated never)."""
+    statements = [s for s in claims.get(prop, ()) if s.get('rank') != 'deprecated']
+    if any(s.get('rank') == 'preferred' for s in statements):
+        statements = [s for s in statements if s.get('rank') == 'preferred']
+    for statement in statements:
+        snak = statement.get('mainsnak', {})
+        if snak.get('snaktype') == 'value':
+            yield snak['datavalue']['value']
+
+
+def item_ids(claims, prop):
+    return list(dict.fromkeys(
+        value['id'] for value in statement_values(claims, prop) if isinstance(value, dict) and 'id' in value
+    ))
+
+
+def first_time(claims, prop):
+    for value in statement_values(claims, prop):
+        year, day = normalize_time(value)
+        if year is not None:
+            return year, day
+    return None, None
+
+
+def text(entity, key, language):
+    values = entity.get(key, {})
+    for code in (language, 'mul', 'en'):
+        if code in values:
+            return values[code]['value']
+    return None
+
+
+def parse_entity(entity, classes, language):
+    """A WikidataFigure for an item that is an instance of one of `classes`, else None."""
+    if entity.get('type') != 'item':
+        return None
+    claims = entity.get('claims', {})
+    instance_of = item_ids(claims, INSTANCE_OF)
+    if classes.isdisjoint(instance_of):
+        return None
+    qid = entity['id']
+    name = text(entity, 'labels', language)
+    if not name:
+        raise RowError(f"No label in {language!r}, 'mul' or 'en'")
+    if len(name) > 255:
+        raise RowError("Label is longer than 255 characters")
+    birth, death = first_time(claims, DATE_OF_BIRTH), first_time(claims, DATE_OF_DEATH)
+    return WikidataFigure(
+        qid=qid,
+        revision=entity.get('lastrevid'),
+        name=name,
+        summary=text(entity, 'descriptions', language),
+        birth=birth,
+        death=death,
+        instance_of=list(dict.fromkeys(instance_of + item_ids(claims, OCCUPATION))),
+        fields=item_ids(claims, FIELD_OF_WORK),
+        influenced_by=item_ids(claims, INFLUENCED_BY),
+    )
+
+
+def parse_chunk(task):
+    """
+    Parses one chunk of lines; returns (figures, rejects) with rejects as (qid, error).
+    Lines that mention none of the classes are dropped before decoding.
+    """
+    lines, classes, language = task
+    markers = [f'"id":"{qid}"'.encode() for qid in classes]
+    figures, rejects = [], []
+    for line in lines:
+        if not any(marker in line for marker in markers):
+            continue
+        try:
+            entity = json.loads(line)
+            figure = parse_entity(entity, classes, language)
+        except RowError as e:
+            rejects.append((entity['id'], str(e)))
+            continue
+        except (ValueError, KeyError, TypeError) as e:
+            match = ENTITY_ID_RE.search(line)
+            rejects.append((match.group(1).decode() if match else '', f"Malformed entity: {e}"))
+            continue
+        if figure is not None:
+            figures.append(figure)
+    return figures, rejects
+
+
+def parse_labels(task):
+    """{qid: label} for the lines of items in `wanted`; used by the field label scan."""
+    lines, wanted, language = task
+    labels = {}
+    for line in lines:
+        match = ENTITY_ID_RE.search(line, 0, 100)
+        if match is None or match.group(1).decode() not in wanted:
+            continue
+        label = text(json.loads(line), 'labels', language)
+        if label:
+            labels[match.group(1).decode()] = label
+    return labels
+
+
+# --- 3. Writing (runs in the command's process) ---
+
+def to_figure(parsed):
+    """The unsaved Figure for a WikidataFigure; its revision is recorded by mark_imported()."""
+    return Figure(
+        name=parsed.name,
+        slug=default_slug(parsed.name, parsed.qid),
+        wikidata_id=parsed.qid,
+        summary=parsed.summary,
+        birth_date=parsed.birth[1],
+        death_date=parsed.death[1],
+        normalized_birth_year=parsed.birth[0],
+        normalized_death_year=parsed.death[0],
+        instance_of_QIDs=parsed.instance_of,
+    )
+
+
+def unchanged(parsed):
+    """The qids of `parsed` already imported at the same revision (one query)."""
+    revisions = dict(
+        Figure.objects.filter(wikidata_id__in=[p.qid for p in parsed]).exclude(wikidata_revision=None)
+        .order_by().values_list('wikidata_id', 'wikidata_revision')
+    )
+    return {p.qid for p in parsed if p.revision is not None and revisions.get(p.qid) == p.revision}
+
+
+class Spill:
+    """Pairs of qids appended to a CSV file, read back in chunks once the pass is over."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'w', encoding='utf-8', newline='')
+        self.writer = csv.writer(self.file)
+        self.count = 0
+
+    def add(self, rows):
+        for row in rows:
+            self.writer.writerow(row)
+            self.count += 1
+
+    def chunks(self, size=LINK_CHUNK):
+        self.file.close()
+        with open(self.path, encoding='utf-8', newline='') as f:
+            yield from chunks(csv.reader(f), size)
+
+
+def figure_ids(qids):
+    return dict(Figure.objects.filter(wikidata_id__in=set(qids)).order_by().values_list('wikidata_id', 'id'))
+
+
+def unlink(qids):
+    """
+    Deletes the influences received by, and the field links of, the figures with
+    these qids, before their links are written again from the dump. Skips the
+    Influence signals: call invalidate_graph() afterwards.
+    """
+    ids = list(figure_ids(qids).values())
+    for queryset in (Influence.objects.filter(influenced_id__in=ids),
+                     Figure.fields.through.objects.filter(figure_id__in=ids)):
+        queryset._raw_delete(queryset.db)
+
+
+def link_influences(pairs):
+    """
+    Creates Influences for (influencer qid, influenced qid) pairs whose figures
+    both exist; returns the number of pairs written. Skips the Influence
+    signals: call invalidate_graph() afterwards.
+    """
+    created = 0
+    for chunk in pairs:
+        ids = figure_ids(qid for pair in chunk for qid in pair)
+        influences = [
+            Influence(influencer_id=ids[source], influenced_id=ids[target])
+            for source, target in chunk if source in ids and target in ids and source != target
+        ]
+        Influence.objects.bulk_create(influences, ignore_conflicts=True)
+        created += len(influences)
+    return created
+
+
+def known_fields(qids):
+    return dict(Field.objects.filter(wikidata_id__in=qids).values_list('wikidata_id', 'id'))
+
+
+def create_fields(labels):
+    """
+    Creates a Field for each {qid: label}, adopting a Field of the same name that
+    has no wikidata_id yet; returns {qid: field id}.
+    """
+    ids = {}
+    for qid, label in labels.items():
+        name = (label[:1].upper() + label[1:])[:100]
+        field = Field.objects.filter(name__iexact=name, wikidata_id=None).first()
+        if field is not None:
+            field.wikidata_id = qid
+            field.save(update_fields=['wikidata_id'])
+        else:
+            if Field.objects.filter(name__iexact=name).exists():
+                name = f"{name[:100 - len(qid) - 3]} ({qid})"
+            field = Field.objects.create(name=name, wikidata_id=qid)
+        ids[qid] = field.pk
+    return ids
+
+
+def link_fields(pairs, field_ids):
+    """Links (figure qid, field qid) pairs whose figure and Field exist; returns the count."""
+    through = Figure.fields.through
+    created = 0
+    for chunk in pairs:
+        ids = figure_ids(figure for figure, _ in chunk)
+        links = [
+            through(figure_id=ids[figure], field_id=field_ids[field])
+            for figure, field in chunk if figure in ids and field in field_ids
+        ]
+        through.objects.bulk_create(links, ignore_conflicts=True)
+        created += len(links)
+    return created
+
+
+def mark_imported(revisions):
+    """Records the revision each (qid, revision) pair was imported at."""
+    for chunk in revisions:
+        chunk = [(qid, int(revision)) for qid, revision in chunk if revision]
+        if not chunk:
+            continue
+        Figure.objects.filter(wikidata_id__in=[qid for qid, _ in chunk]).update(
+            wikidata_revision=Case(*(When(wikidata_id=qid, then=Value(revision)) for qid, revision in chunk))
+        )
@@ -1,15 +1,127 @@
 from rest_framework import serializers, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+from . import density, viewport
+from .ingest import create_event_batch
+from .graph import MAX_PATH_HOPS, get_graph
 from .models import TimelineEvent, Influence
 from figures.models import Figure
+from ChronosAtlas.batch import batch_response
+from ChronosAtlas.cache import CachedResponseMixin, ConditionalGetMixin
+from ChronosAtlas.pagination import KeysetPagination
+from ChronosAtlas.projection import SparseFieldsetMixin
+
+class TimelineEventPagination(KeysetPagination):
+    ordering = ('year', 'id')
+
+class InfluencePagination(KeysetPagination):
+    ordering = ('id',)
+
+def int_param(params, name, default=None, minimum=None):
+    """Reads an optional integer query parameter, raising a 400 if it is malformed."""
+    value = params.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValidationError({name: 'Expected an integer.'})
+    if minimum is not None and value < minimum:
+        raise ValidationError({name: f'Must be at least {minimum}.'})
+    return value
 
 class TimelineEventSerializer(serializers.ModelSerializer):
     class Meta:
         model = TimelineEvent
-        fields = ['id', 'title', 'year', 'category', 'description']
+        fields = ['id', 'title', 'year', 'category', 'description', 'importance']
 
-class TimelineEventViewSet(viewsets.ModelViewSet):
+class TimelineEventViewSet(SparseFieldsetMixin, ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
     queryset = TimelineEvent.objects.all()
     serializer_class = TimelineEventSerializer
+    pagination_class = TimelineEventPagination
+    cache_models = ('timeline.timelineevent',)
+
+    def get_queryset(self):
+        """Supports ?q=<full-text> over title and description."""
+        queryset = super().get_queryset()
+        if self.request.query_params.get('q'):
+            queryset = queryset.search(self.request.query_params['q'])
+        return queryset
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Creates many events with one bulk insert; invalid items are reported per index.
+        POST /api/timeline/bulk/  [{"title": ..., "year": ..., "category": ...}, ...]
+        """
+        return batch_response(request.data, create_event_batch, self.get_serializer)
+
+    @action(detail=False, methods=['get'],
+            cache_models=('figures.figure', 'figures.field', 'timeline.timelineevent'))
+    def density(self, request):
+        """
+        Density histogram from the precomputed aggregate table.
+        GET /api/timeline/density/?kind=figures|events&bucket_size=100&start=-500&end=2000
+            [&field=<field id> (figures) | &category=<name> (events)]
+        """
+        params = request.query_params
+        kind = params.get('kind', 'events')
+        bucket_size = int_param(params, 'bucket_size', default=100, minimum=1)
+        start = int_param(params, 'start')
+        end = int_param(params, 'end')
+        if start is None or end is None:
+            raise ValidationError({'start': 'Both start and end years are required.'})
+        dimension = params.get('field', '') if kind == 'figures' else params.get('category', '')
+
+        try:
+            buckets = density.histogram(kind, bucket_size, start, end, dimension)
+        except ValueError as e:
+            raise ValidationError({'detail': str(e)})
+        return Response({'kind': kind, 'bucket_size': bucket_size, 'buckets': buckets})
+
+    @action(detail=False, methods=['get'],
+            cache_models=('figures.figure', 'timeline.timelineevent', 'timeline.influencemetrics'))
+    def viewport(self, request):
+        """
+        Level-of-detail view of the timeline from the precomputed tiles: the most
+        important figures and events of each bucket, and how many more it holds.
+        GET /api/timeline/viewport/?start=-500&end=2000&width=1200[&kinds=figures,events&per_bucket=5]
+        """
+        params = request.query_params
+        start = int_param(params, 'start')
+        end = int_param(params, 'end')
+        if start is None or end is None:
+            raise ValidationError({'start': 'Both start and end years are required.'})
+        width = int_param(params, 'width', minimum=1)
+        if width is None:
+            raise ValidationError({'width': 'The viewport width in pixels is required.'})
+        per_bucket = int_param(params, 'per_bucket', default=viewport.DEFAULT_PER_BUCKET, minimum=1)
+        kinds = [kind for kind in params.get('kinds', ','.join(viewport.KINDS)).split(',') if kind]
+
+        try:
+            bucket_size, buckets = viewport.viewport(start, end, width, kinds, per_bucket)
+        except ValueError as e:
+            raise ValidationError({'detail': str(e)})
+
+        def ids(kind):
+            return [pk for bucket in buckets for _, pk in bucket[kind]['top']]
+
+        serializers_by_kind = {
+            viewport.FIGURES: (LineageFigureSerializer, Figure.objects.only(*LineageFigureSerializer.Meta.fields)),
+            viewport.EVENTS: (TimelineEventSerializer, TimelineEvent.objects.all()),
+        }
+        for kind in kinds:
+            serializer, queryset = serializers_by_kind[kind]
+            rows = queryset.order_by().in_bulk(ids(kind))
+            for bucket in buckets:
+                entries = bucket[kind].pop('top')
+                bucket[kind]['items'] = [
+                    {**serializer(rows[pk]).data, 'importance': importance}
+                    for importance, pk in entries if pk in rows
+                ]
+                bucket[kind]['clustered'] = bucket[kind]['count'] - len(bucket[kind]['items'])
+        return Response({'start': start, 'end': end, 'width': width, 'bucket_size': bucket_size, 'buckets': buckets})
 
 class InfluenceSerializer(serializers.ModelSerializer):
     influencer = serializers.StringRelatedField()
@@ -18,6 +130,79 @@ class InfluenceSerializer(serializers.ModelSerializer):
         model = Influence
         fields = ['id', 'influencer', 'influenced']
 
-class InfluenceViewSet(viewsets.ModelViewSet):
-    queryset = Influence.objects.all()
+class LineageFigureSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Figure
+        fields = ['id', 'name', 'normalized_birth_year', 'normalized_death_year']
+
+class InfluenceViewSet(SparseFieldsetMixin, ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
+    queryset = Influence.objects.select_related('influencer', 'influenced')
     serializer_class = InfluenceSerializer
+    pagination_class = InfluencePagination
+    cache_models = ('timeline.influence', 'figures.figure')
+
+    @action(detail=False, methods=['get'])
+    def lineage(self, request):
+        """
+        Transitive influence lineage from the in-memory influence graph.
+        GET /api/influences/lineage/?figure=<id>&direction=descendants|ancestors&max_depth=N&limit=N
+        """
+        params = request.query_params
+        figure_id = int_param(params, 'figure', minimum=1)
+        if figure_id is None:
+            raise ValidationError({'figure': 'This parameter is required.'})
+        direction = params.get('direction', 'descendants')
+        if direction not in ('descendants', 'ancestors'):
+            raise ValidationError({'direction': 'Expected "descendants" or "ancestors".'})
+        max_depth = int_param(params, 'max_depth', minimum=1)
+        limit = int_param(params, 'limit', default=1000, minimum=1)
+
+        entries = get_graph().lineage(figure_id, direction, max_depth)
+        page = entries[:limit]
+        figures = Figure.objects.order_by().in_bulk([figure_id] + [pk for pk, _ in page])
+        if figure_id not in figures:
+            raise NotFound(f'Figure {figure_id} does not exist.')
+
+        return Response({
+            'figure': figure_id,
+            'direction': direction,
+            'count': len(entries),
+            'results': [
+                {'depth': depth, 'figure': LineageFigureSerializer(figures[pk]).data}
+                for pk, depth in page if pk in figures
+            ],
+        })
+
+    @action(detail=False, methods=['get'])
+    def path(self, request):
+        """
+        Shortest influence chains between two figures (first result is the shortest).
+        GET /api/influences/path/?source=<id>&target=<id>&k=3&max_hops=6&directed=true
+        """
+        params = request.query_params
+        source = int_param(params, 'source', minimum=1)
+        target = int_param(params, 'target', minimum=1)
+        if source is None or target is None:
+            raise ValidationError({'source': 'Both source and target are required.'})
+        k = int_param(params, 'k', default=1, minimum=1)
+        max_hops = int_param(params, 'max_hops', default=MAX_PATH_HOPS, minimum=1)
+        directed = params.get('directed', 'true').lower() not in ('false', '0', 'no')
+
+        paths, timed_out = get_graph().shortest_paths(source, target, k, max_hops, directed=directed)
+        figures = Figure.objects.order_by().in_bulk({source, target}.union(*paths))
+        for pk in (source, target):
+            if pk not in figures:
+                raise NotFound(f'Figure {pk} does not exist.')
+
+        return Response({
+            'source': source,
+            'target': target,
+            'timed_out': timed_out,
+            'paths': [
+                {
+                    'hops': len(path) - 1,
+                    'figures': [LineageFigureSerializer(figures[pk]).data for pk in path if pk in figures],
+                }
+                for path in paths
+            ],
+        })
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class TimelineConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'timeline'
+
+    def ready(self):
+        # Connects the Influence signals that keep the in-memory graph current.
+        from . import signals  # noqa: F401
@@ -0,0 +1,220 @@
+"""
+Influence centrality metrics, precomputed into the InfluenceMetrics side table.
+
+For every figure with at least one Influence edge:
+
+    in_degree / out_degree  number of influencers / of figures influenced
+    pagerank                PageRank over influencer -> influenced edges (sums
+                            to 1 over the figures in the graph)
+    reach                   figures influenced within REACH_HOPS hops
+
+Everything is computed from the CSR arrays of the influence graph
+(timeline/graph.py), as repeated sparse matrix-vector products over whole
+arrays rather than per-figure graph walks. PageRank is a power iteration over
+the reverse adjacency. Reach propagates a reachability sketch per figure
+REACH_HOPS times along the edges: exact bitsets up to EXACT_REACH_LIMIT
+figures, HyperLogLog counters (about 13% standard error) beyond that.
+
+Degrees are kept current by the Influence signals (timeline/signals.py).
+PageRank and reach depend on the whole graph, so they are recomputed by
+`refresh_influence_metrics` (from cron, or in a loop with --every), which
+skips the work with --if-stale when the graph has not changed since its
+last run: the Influence row count and latest `updated_at` it computed from
+are stored in InfluenceMetricsState and compared with the table's.
+"""
+import math
+from array import array
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Max
+from django.utils import timezone
+
+from ChronosAtlas.cache import bump_on_commit, bump_versions
+from . import viewport
+from .graph import InfluenceGraph
+from .models import Influence, InfluenceMetrics, InfluenceMetricsState
+
+DAMPING = 0.85
+# Power iteration stops once the L1 change of the PageRank vector falls below this.
+TOLERANCE = 1e-10
+MAX_ITERATIONS = 100
+REACH_HOPS = 3
+# Figures in the graph up to which reach is counted exactly.
+EXACT_REACH_LIMIT = 20000
+
+METRICS = ('in_degree', 'out_degree', 'pagerank', 'reach')
+COLUMNS = ['figure_id', 'in_degree', 'out_degree', 'pagerank', 'reach', 'computed_at']
+
+
+# --- 1. Sparse iteration over the CSR arrays ---
+
+def degrees(csr):
+    """Row lengths of a CSR structure: the out-degree of every id."""
+    offsets = csr.offsets
+    return array('q', map(int.__sub__, offsets[1:], offsets[:-1]))
+
+
+def pagerank(graph, nodes, out_degree):
+    """PageRank of every id in `nodes` (a list of ids), as an id-indexed array."""
+    size = len(out_degree)
+    count = len(nodes)
+    rank = array('d', bytes(8 * size))
+    if not count:
+        return rank
+    for node in nodes:
+        rank[node] = 1 / count
+    dangling = [node for node in nodes if not out_degree[node]]
+    offsets, sources = graph.reverse.offsets, graph.reverse.targets
+
+    for _ in range(MAX_ITERATIONS):
+        share = array('d', map(lambda r, d: r / d if d else 0.0, rank, out_degree))
+        # Rank of figures without outgoing edges is spread over every figure.
+        base = (1 - DAMPING) / count + DAMPING * math.fsum(rank[node] for node in dangling) / count
+        updated = array('d', bytes(8 * size))
+        change = 0.0
+        for node in nodes:
+            incoming = sum(map(share.__getitem__, sources[offsets[node]:offsets[node + 1]]))
+            value = base + DAMPING * incoming
+            change += abs(value - rank[node])
+            updated[node] = value
+        rank = updated
+        if change < TOLERANCE:
+            break
+    return rank
+
+
+class ExactSketch:
+    """Reachable sets as bitsets over each figure's position in `nodes`."""
+
+    def __init__(self, nodes):
+        self.unit = {node: 1 << position for position, node in enumerate(nodes)}
+
+    merge = staticmethod(int.__or__)
+
+    def count(self, node, value):
+        return (value & ~self.unit[node]).bit_count()
+
+
+class HyperLogLogSketch:
+    """
+    HyperLogLog counters of LANES one-byte registers packed into one int, so
+    that the register-wise max of two counters is a few big-int operations.
+    """
+    LANES = 64
+    HIGH = int.from_bytes(b'\x80' * LANES, 'little')
+    ALPHA = 0.709   # bias correction for 64 registers
+
+    def __init__(self, nodes):
+        self.unit = {node: self.single(node) for node in nodes}
+
+    @classmethod
+    def single(cls, node):
+        # splitmix64, so that consecutive ids spread over the registers.
+        h = (node + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        h = ((h ^ (h >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+        h = ((h ^ (h >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+        h ^= h >> 31
+        lane, rest = h & (cls.LANES - 1), h >> 6
+        return (59 - rest.bit_length()) << (8 * lane)
+
+    @classmethod
+    def merge(cls, a, b):
+        # A lane of `at_least` is 0xFF where a's register >= b's (registers stay below 0x80).
+        at_least = ((((a | cls.HIGH) - b) & cls.HIGH) >> 7) * 0xFF
+        return (a & at_least) | (b & ~at_least)
+
+    def count(self, node, value):
+        registers = Counter(value.to_bytes(self.LANES, 'little'))
+        harmonic = sum(n * 2.0 ** -register for register, n in registers.items())
+        estimate = self.ALPHA * self.LANES ** 2 / harmonic
+        zeros = registers.get(0, 0)
+        if estimate <= 2.5 * self.LANES and zeros:
+            estimate = self.LANES * math.log(self.LANES / zeros)
+        return round(estimate)
+
+
+def reach(graph, nodes, hops=REACH_HOPS):
+    """{id: figures reachable in 1..hops hops} for every id in `nodes`."""
+    sketch = (ExactSketch if len(nodes) <= EXACT_REACH_LIMIT else HyperLogLogSketch)(nodes)
+    unit, merge = sketch.unit, sketch.merge
+    offsets, targets = graph.forward.offsets, graph.forward.targets
+    # Reachable within k hops = union over successors of (successor + its k-1 hops).
+    step = {node: unit[node] for node in nodes}
+    reached = dict.fromkeys(nodes, 0)
+    for _ in range(hops):
+        following = {}
+        for node in nodes:
+            value = reached[node]
+            for target in targets[offsets[node]:offsets[node + 1]]:
+                value = merge(value, step[target])
+            following[node] = value
+        reached = following
+        step = {node: merge(unit[node], reached[node]) for node in nodes}
+    return {node: sketch.count(node, value) for node, value in reached.items()}
+
+
+def compute(graph, hops=REACH_HOPS):
+    """Yields (figure_id, in_degree, out_degree, pagerank, reach) for every figure in the graph."""
+    out_degree, in_degree = degrees(graph.forward), degrees(graph.reverse)
+    nodes = [node for node in range(len(out_degree)) if out_degree[node] or in_degree[node]]
+    ranks = pagerank(graph, nodes, out_degree)
+    reached = reach(graph, nodes, hops)
+    for node in nodes:
+        yield node, in_degree[node], out_degree[node], ranks[node], reached[node]
+
+
+# --- 2. Storing and refreshing ---
+
+def watermark():
+    """(row count, latest updated_at) of Influence: it changes with every insert, update and delete."""
+    found = Influence.objects.aggregate(rows=Count('pk'), updated_at=Max('updated_at'))
+    return found['rows'], found['updated_at']
+
+
+def is_stale():
+    """True when Influence changed since the stored metrics were computed."""
+    state = InfluenceMetricsState.objects.filter(pk=1).values_list('influences', 'influences_updated_at').first()
+    return state != watermark()
+
+
+def refresh(hops=REACH_HOPS, use_copy=True):
+    """Recomputes every figure's metrics from the database; returns the number of rows written."""
+    from .synthetic import write_rows
+
+    # Taken before reading the graph, so writes made meanwhile leave the metrics stale.
+    influences, influences_updated_at = watermark()
+    graph = InfluenceGraph.from_database()
+    now = timezone.now()
+    rows = [row + (now,) for row in compute(graph, hops)]
+    with transaction.atomic():
+        stored = dict(InfluenceMetrics.objects.values_list('figure_id', F('in_degree') + F('out_degree')))
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'TRUNCATE {InfluenceMetrics._meta.db_table}')
+        else:
+            InfluenceMetrics.objects.all().delete()
+        write_rows(InfluenceMetrics, COLUMNS, rows, use_copy)
+        # Degrees only drift from the stored ones after writes that skipped the
+        # signals (bulk loads); the viewport tiles rank figures by them.
+        if len(stored) != len(rows) or any(stored.get(row[0]) != row[1] + row[2] for row in rows):
+            viewport.rebuild([viewport.FIGURES])
+        InfluenceMetricsState.objects.update_or_create(pk=1, defaults={
+            'influences': influences, 'influences_updated_at': influences_updated_at, 'computed_at': now,
+        })
+    bump_versions('timeline.influencemetrics')
+    return len(rows)
+
+
+def apply_edge(source, target, delta):
+    """Adds `delta` to the out-degree of `source` and the in-degree of `target` (inside the write)."""
+    with transaction.atomic():
+        if delta > 0:
+            # Insert missing rows at 0 first so that concurrent writers only run relative updates.
+            # (Removals never insert: their figure may be about to be deleted.)
+            InfluenceMetrics.objects.bulk_create(
+                [InfluenceMetrics(figure_id=source), InfluenceMetrics(figure_id=target)], ignore_conflicts=True
+            )
+        InfluenceMetrics.objects.filter(figure_id=source).update(out_degree=F('out_degree') + delta)
+        InfluenceMetrics.objects.filter(figure_id=target).update(in_degree=F('in_degree') + delta)
+    bump_on_commit('timeline.influencemetrics')
@@ -0,0 +1,207 @@
+"""
+Timeline density histograms served from the DensityBucket aggregate table.
+
+Every figure adds 1 to each bucket its lifespan overlaps and every event adds 1
+to the bucket containing its year, once per stored resolution and once per
+dimension (all rows, plus each of the figure's Fields / the event's category).
+"Alive" counts are not additive across buckets, so a histogram is always read
+at exactly one stored resolution.
+"""
+from collections import Counter, defaultdict
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import DensityBucket
+
+# Bucket sizes (in years) that histograms can be requested at.
+RESOLUTIONS = (10, 100, 1000)
+# Largest number of buckets a single histogram may return.
+MAX_BUCKETS = 2000
+# Living figures (no death year) are stored as alive up to this fixed year, so the
+# buckets a figure adds never depend on when it was written; histogram() clips
+# figure counts to the current year.
+OPEN_END_YEAR = 2200
+
+ALL = ''
+
+
+def bucket_starts(first_year, last_year, resolution):
+    """Start years of every bucket overlapping [first_year, last_year]."""
+    return range(first_year // resolution * resolution, last_year // resolution * resolution + 1, resolution)
+
+
+def lifespan(birth, death):
+    """
+    The years a figure is stored as alive, or None without a birth year.
+    Living figures (no death year) are alive up to OPEN_END_YEAR.
+    """
+    if birth is None:
+        return None
+    if death is None:
+        death = OPEN_END_YEAR
+    return birth, max(birth, death)
+
+
+def _apply(kind, first_year, last_year, dimensions, delta):
+    """Adds `delta` to every (dimension, bucket) overlapping the years, at every resolution."""
+    if not delta:
+        return
+    dimensions = [str(d) for d in dimensions]
+    with transaction.atomic():
+        for resolution in RESOLUTIONS:
+            starts = bucket_starts(first_year, last_year, resolution)
+            # Insert missing rows at 0 first, so concurrent writers only ever run the
+            # relative UPDATE below and no increment can be lost.
+            DensityBucket.objects.bulk_create(
+                [
+                    DensityBucket(kind=kind, resolution=resolution, dimension=dimension, start_year=start)
+                    for dimension in dimensions for start in starts
+                ],
+                ignore_conflicts=True,
+            )
+            DensityBucket.objects.filter(
+                kind=kind, resolution=resolution, dimension__in=dimensions,
+                start_year__gte=starts[0], start_year__lte=starts[-1],
+            ).update(count=F('count') + delta)
+
+
+def apply_figure(birth, death, field_ids, delta, include_all=True):
+    """
+    Adds (delta=1) or removes (delta=-1) one figure's lifespan under each of its
+    Fields, and under the all-figures dimension unless include_all is False.
+    """
+    years = lifespan(birth, death)
+    dimensions = [ALL, *field_ids] if include_all else list(field_ids)
+    if years is not None and dimensions:
+        _apply(DensityBucket.FIGURES, years[0], years[1], dimensions, delta)
+
+
+def apply_event(year, category, delta):
+    """Adds (delta=1) or removes (delta=-1) one timeline event."""
+    dimensions = [ALL, category] if category else [ALL]
+    _apply(DensityBucket.EVENTS, year, year, dimensions, delta)
+
+
+def count_figure(counts, birth, death, dimensions, delta=1):
+    """Adds one figure's lifespan to a {(kind, resolution, dimension, start): delta} Counter."""
+    years = lifespan(birth, death)
+    if years is None:
+        return
+    for resolution in RESOLUTIONS:
+        for start in bucket_starts(years[0], years[1], resolution):
+            for dimension in dimensions:
+                counts[DensityBucket.FIGURES, resolution, str(dimension), start] += delta
+
+
+def count_event(counts, year, category, delta=1):
+    """Adds one timeline event to a {(kind, resolution, dimension, start): delta} Counter."""
+    for resolution in RESOLUTIONS:
+        start = year // resolution * resolution
+        counts[DensityBucket.EVENTS, resolution, ALL, start] += delta
+        if category:
+            counts[DensityBucket.EVENTS, resolution, category, start] += delta
+
+
+def apply_counts(counts, chunk_size=200):
+    """
+    Adds a Counter built by count_figure/count_event to the stored buckets.
+    Used by batch writes, which skip model signals: issues one UPDATE per distinct
+    delta (and chunk of buckets) rather than one per row written.
+    """
+    keys_by_delta = defaultdict(list)
+    for key, delta in counts.items():
+        if delta:
+            keys_by_delta[delta].append(key)
+    if not keys_by_delta:
+        return
+    with transaction.atomic():
+        DensityBucket.objects.bulk_create(
+            [
+                DensityBucket(kind=kind, resolution=resolution, dimension=dimension, start_year=start)
+                for keys in keys_by_delta.values() for kind, resolution, dimension, start in keys
+            ],
+            ignore_conflicts=True,
+            batch_size=5000,
+        )
+        for delta, keys in keys_by_delta.items():
+            for i in range(0, len(keys), chunk_size):
+                match = reduce(or_, (
+                    Q(kind=kind, resolution=resolution, dimension=dimension, start_year=start)
+                    for kind, resolution, dimension, start in keys[i:i + chunk_size]
+                ))
+                DensityBucket.objects.filter(match).update(count=F('count') + delta)
+
+
+@transaction.atomic
+def rebuild():
+    """
+    Recomputes the whole table from Figure, Field and TimelineEvent.
+    Used after bulk loads that bypass model signals; streams rows, so memory is
+    bounded by the number of buckets rather than the number of rows.
+    """
+    from figures.models import Figure
+    from .models import TimelineEvent
+
+    counts = Counter()
+    figure_fields = Figure.fields.through.objects.order_by('figure_id').values_list('figure_id', 'field_id')
+    fields_iter = iter(figure_fields.iterator(chunk_size=20000))
+    pending = next(fields_iter, None)
+
+    figures = Figure.objects.exclude(normalized_birth_year=None).order_by('id')
+    for pk, birth, death in figures.values_list('id', 'normalized_birth_year', 'normalized_death_year') \
+            .iterator(chunk_size=20000):
+        # Merge-join the through table (also ordered by figure_id) to get this figure's fields.
+        dimensions = [ALL]
+        while pending is not None and pending[0] <= pk:
+            if pending[0] == pk:
+                dimensions.append(str(pending[1]))
+            pending = next(fields_iter, None)
+        count_figure(counts, birth, death, dimensions)
+
+    for year, category in TimelineEvent.objects.values_list('year', 'category').iterator(chunk_size=20000):
+        count_event(counts, year, category)
+
+    DensityBucket.objects.all().delete()
+    DensityBucket.objects.bulk_create(
+        (
+            DensityBucket(kind=kind, resolution=resolution, dimension=dimension, start_year=start, count=count)
+            for (kind, resolution, dimension, start), count in counts.items()
+        ),
+        batch_size=5000,
+    )
+
+
+def histogram(kind, bucket_size, start_year, end_year, dimension=ALL):
+    """
+    Returns [{'start_year', 'end_year', 'count'}, ...] for every bucket overlapping
+    [start_year, end_year], including empty ones. Figure buckets starting after the
+    current year count 0. Raises ValueError on bad input.
+    """
+    if kind not in (DensityBucket.FIGURES, DensityBucket.EVENTS):
+        raise ValueError(f"kind must be '{DensityBucket.FIGURES}' or '{DensityBucket.EVENTS}'.")
+    if bucket_size not in RESOLUTIONS:
+        raise ValueError(f"bucket_size must be one of {', '.join(map(str, RESOLUTIONS))}.")
+    if end_year < start_year:
+        raise ValueError("end_year must not be before start_year.")
+    starts = bucket_starts(start_year, end_year, bucket_size)
+    if len(starts) > MAX_BUCKETS:
+        raise ValueError(f"Range spans more than {MAX_BUCKETS} buckets; use a larger bucket_size.")
+
+    stored = dict(
+        DensityBucket.objects.filter(
+            kind=kind, resolution=bucket_size, dimension=str(dimension),
+            start_year__gte=starts[0], start_year__lte=starts[-1],
+        ).values_list('start_year', 'count')
+    )
+    if kind == DensityBucket.FIGURES:
+        # Only living figures reach past today (up to OPEN_END_YEAR).
+        current_year = timezone.now().year
+        stored = {start: count for start, count in stored.items() if start <= current_year}
+    return [
+        {'start_year': start, 'end_year': start + bucket_size - 1, 'count': stored.get(start, 0)}
+        for start in starts
+    ]
@@ -0,0 +1,405 @@
+"""
+In-memory influence graph for transitive lineage queries.
+
+Each worker process holds the Influence table as two CSR (compressed sparse row)
+adjacency structures keyed directly by Figure id: `offsets[id]:offsets[id + 1]`
+slices `targets` to give that figure's neighbours. One structure follows edges
+forwards (influencer -> influenced), the other backwards, so descendant and
+ancestor traversals are plain array walks with no SQL.
+
+Writes are applied incrementally: Influence post_save/post_delete signals record
+added/removed edges in a small overlay on top of the CSR arrays, and the overlay
+is folded back into fresh arrays (from memory, not the database) once it grows
+past COMPACT_THRESHOLD. Other worker processes notice changes through a version
+counter kept next to the response cache versions (ChronosAtlas.cache.version_store(),
+shared by every worker and management command) and reload from the database in
+a background thread; their current graph keeps answering until the new one is
+ready, and only the first load of a process happens on a request.
+"""
+import heapq
+import logging
+import threading
+import time
+from array import array
+from collections import defaultdict, deque
+from itertools import chain
+
+from django.db import connections
+
+from ChronosAtlas.cache import bump_versions, do_not_store, rendering_for_cache, version_store
+
+logger = logging.getLogger(__name__)
+
+VERSION_CACHE_KEY = 'timeline:influence_graph:version'
+# Seconds between checks of the shared version counter.
+VERSION_CHECK_INTERVAL = 1.0
+# Overlay edges tolerated before the CSR arrays are rebuilt in memory.
+COMPACT_THRESHOLD = 10000
+# Upper bounds for path searches, so their cost never scales with the whole graph.
+MAX_PATH_HOPS = 12
+MAX_PATHS = 10
+PATH_TIME_BUDGET = 0.25  # seconds
+
+
+class SearchTimeout(Exception):
+    """Raised when a path search exceeds its time budget."""
+
+
+class CSR:
+    """Compressed sparse rows over Figure ids: neighbours(i) = targets[offsets[i]:offsets[i + 1]]."""
+
+    __slots__ = ('offsets', 'targets')
+
+    def __init__(self, offsets, targets):
+        self.offsets = offsets
+        self.targets = targets
+
+    @classmethod
+    def from_edges(cls, sources, targets, size):
+        """Builds CSR arrays from parallel edge arrays with a counting sort (O(V + E))."""
+        offsets = array('q', bytes(8 * (size + 1)))
+        for source in sources:
+            offsets[source + 1] += 1
+        for i in range(size):
+            offsets[i + 1] += offsets[i]
+
+        cursor = array('q', offsets)
+        ordered = array('q', bytes(8 * len(targets)))
+        for source, target in zip(sources, targets):
+            ordered[cursor[source]] = target
+            cursor[source] += 1
+        return cls(offsets, ordered)
+
+    def neighbours(self, node):
+        if node + 1 >= len(self.offsets):
+            return ()
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    def edges(self):
+        offsets, targets = self.offsets, self.targets
+        for node in range(len(offsets) - 1):
+            for i in range(offsets[node], offsets[node + 1]):
+                yield node, targets[i]
+
+
+class InfluenceGraph:
+    """Forward and reverse adjacency over all Influence edges, plus a pending-write overlay."""
+
+    def __init__(self, sources, targets, version=None):
+        self.version = version
+        self.lock = threading.RLock()
+        self._build(sources, targets)
+
+    def _build(self, sources, targets):
+        size = max(max(sources, default=0), max(targets, default=0)) + 1
+        self.forward = CSR.from_edges(sources, targets, size)
+        self.reverse = CSR.from_edges(targets, sources, size)
+        self.edge_count = len(sources)
+        self.added = defaultdict(set)       # source -> targets added since the last compaction
+        self.added_reverse = defaultdict(set)
+        self.removed = set()                # (source, target) removed since the last compaction
+        self.overlay_size = 0
+
+    @classmethod
+    def from_database(cls, version=None):
+        from .models import Influence
+
+        sources, targets = array('q'), array('q')
+        rows = Influence.objects.values_list('influencer_id', 'influenced_id').order_by()
+        for source, target in rows.iterator(chunk_size=20000):
+            sources.append(source)
+            targets.append(target)
+        return cls(sources, targets, version=version)
+
+    # --- Incremental updates ---
+
+    def add_edge(self, source, target):
+        with self.lock:
+            if (source, target) in self.removed:
+                self.removed.discard((source, target))
+            elif target not in self.forward.neighbours(source):
+                self.added[source].add(target)
+                self.added_reverse[target].add(source)
+            else:
+                return
+            self._touch(1)
+
+    def remove_edge(self, source, target):
+        with self.lock:
+            if target in self.added.get(source, ()):
+                self.added[source].discard(target)
+                self.added_reverse[target].discard(source)
+            elif target in self.forward.neighbours(source):
+                self.removed.add((source, target))
+            else:
+                return
+            self._touch(-1)
+
+    def _touch(self, delta):
+        self.edge_count += delta
+        self.overlay_size += 1
+        if self.overlay_size >= COMPACT_THRESHOLD:
+            self.compact()
+
+    def compact(self):
+        """Folds the overlay into new CSR arrays without touching the database."""
+        with self.lock:
+            sources, targets = array('q'), array('q')
+            for source, target in self.forward.edges():
+                if (source, target) not in self.removed:
+                    sources.append(source)
+                    targets.append(target)
+            for source, added in self.added.items():
+                for target in added:
+                    sources.append(source)
+                    targets.append(target)
+            self._build(sources, targets)
+
+    # --- Traversals ---
+
+    def _neighbours(self, node, reverse):
+        csr, added = (self.reverse, self.added_reverse) if reverse else (self.forward, self.added)
+        removed = self.removed
+        for other in csr.neighbours(node):
+            edge = (other, node) if reverse else (node, other)
+            if not removed or edge not in removed:
+                yield other
+        yield from added.get(node, ())
+
+    def traverse(self, start, max_depth=None, reverse=False):
+        """
+        Breadth-first walk from `start`, returning {figure_id: depth} for every
+        figure reachable in 1..max_depth hops (excluding `start` itself).
+        """
+        depths = {start: 0}
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            depth = depths[node] + 1
+            if max_depth is not None and depth > max_depth:
+                continue
+            for other in self._neighbours(node, reverse):
+                if other not in depths:
+                    depths[other] = depth
+                    queue.append(other)
+        del depths[start]
+        return depths
+
+    def descendants(self, figure_id, max_depth=None):
+        """Everyone influenced (transitively) by the figure."""
+        return self.traverse(figure_id, max_depth)
+
+    def ancestors(self, figure_id, max_depth=None):
+        """Everyone who (transitively) influenced the figure."""
+        return self.traverse(figure_id, max_depth, reverse=True)
+
+    def degree(self, figure_id):
+        """Number of influence edges touching the figure, in either direction."""
+        with self.lock:
+            return sum(1 for _ in self._neighbours(figure_id, False)) + \
+                sum(1 for _ in self._neighbours(figure_id, True))
+
+    def lineage(self, figure_id, direction='descendants', max_depth=None):
+        """Returns [(figure_id, depth), ...] ordered by depth, then id."""
+        depths = self.traverse(figure_id, max_depth, reverse=(direction == 'ancestors'))
+        return sorted(depths.items(), key=lambda item: (item[1], item[0]))
+
+
+    # --- Path finding ---
+
+    def _adjacent(self, node, reverse, directed):
+        if directed:
+            return self._neighbours(node, reverse)
+        return chain(self._neighbours(node, False), self._neighbours(node, True))
+
+    def shortest_path(self, source, target, max_hops=MAX_PATH_HOPS, deadline=None, directed=True,
+                      banned_nodes=frozenset(), banned_edges=frozenset()):
+        """
+        Bidirectional BFS for the shortest chain source -> ... -> target.
+
+        Each round expands the smaller frontier by one full level, so a search of
+        h hops touches roughly two balls of radius h/2 instead of one of radius h.
+        Returns a list of figure ids, or None if no chain of <= max_hops exists.
+        Raises SearchTimeout once time.monotonic() passes `deadline`.
+        """
+        if source == target:
+            return [source]
+        parents = ({source: None}, {target: None})   # forward tree, backward tree
+        frontiers = ([source], [target])
+        hops = 0
+        while frontiers[0] and frontiers[1] and hops < max_hops:
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            mine, theirs = parents[side], parents[1 - side]
+            next_frontier = []
+            for node in frontiers[side]:
+                if deadline is not None and time.monotonic() > deadline:
+                    raise SearchTimeout()
+                # The forward tree walks edges forwards, the backward tree walks them in reverse.
+                for other in self._adjacent(node, side == 1, directed):
+                    edge = (node, other) if side == 0 else (other, node)
+                    if other in mine or other in banned_nodes or edge in banned_edges:
+                        continue
+                    mine[other] = node
+                    if other in theirs:
+                        return self._join(parents, other)
+                    next_frontier.append(other)
+            frontiers = (next_frontier, frontiers[1]) if side == 0 else (frontiers[0], next_frontier)
+            hops += 1
+        return None
+
+    @staticmethod
+    def _join(parents, meeting):
+        forward, backward = parents
+        path, node = [], meeting
+        while node is not None:
+            path.append(node)
+            node = forward[node]
+        path.reverse()
+        node = backward[meeting]
+        while node is not None:
+            path.append(node)
+            node = backward[node]
+        return path
+
+    def shortest_paths(self, source, target, k=1, max_hops=MAX_PATH_HOPS,
+                       time_budget=PATH_TIME_BUDGET, directed=True):
+        """
+        The k shortest loop-free chains from source to target (Yen's algorithm,
+        with the bidirectional BFS above for every spur search).
+        Returns (paths, timed_out); on timeout, the paths found so far are kept.
+        """
+        k = max(1, min(k, MAX_PATHS))
+        max_hops = max(1, min(max_hops, MAX_PATH_HOPS))
+        deadline = time.monotonic() + time_budget
+        paths, candidates, seen = [], [], set()
+        try:
+            first = self.shortest_path(source, target, max_hops, deadline, directed)
+            if first is None:
+                return [], False
+            paths.append(first)
+            seen.add(tuple(first))
+            while len(paths) < k:
+                previous = paths[-1]
+                for i in range(len(previous) - 1):
+                    root = previous[:i + 1]
+                    banned_edges = {
+                        (path[i], path[i + 1]) for path in paths
+                        if len(path) > i + 1 and path[:i + 1] == root
+                    }
+                    spur = self.shortest_path(
+                        root[-1], target, max_hops - i, deadline, directed,
+                        banned_nodes=frozenset(root[:-1]), banned_edges=banned_edges,
+                    )
+                    if spur is not None:
+                        candidate = tuple(root[:-1] + spur)
+                        if candidate not in seen:
+                            seen.add(candidate)
+                            heapq.heappush(candidates, (len(candidate), candidate))
+                if not candidates:
+                    break
+                paths.append(list(heapq.heappop(candidates)[1]))
+        except SearchTimeout:
+            return paths, True
+        return paths, False
+
+
+# --- Per-process singleton ---
+
+_graph = None
+_last_check = 0.0
+_lock = threading.Lock()
+_reloading = False
+_reloading_lock = threading.Lock()
+
+
+def _shared_version():
+    return version_store().get(VERSION_CACHE_KEY, 0)
+
+
+def get_graph():
+    """
+    Returns this process's graph, loading it on first use. When another process
+    changed Influence, the current graph keeps answering while a fresh one loads
+    in the background.
+    """
+    global _last_check
+    graph = _graph
+    if graph is None:
+        return load_graph()
+    now = time.monotonic()
+    check = now - _last_check >= VERSION_CHECK_INTERVAL
+    if check or rendering_for_cache():
+        behind = graph.version != _shared_version()
+        if check:
+            _last_check = now
+            if behind:
+                reload_in_background()
+        if behind:
+            # Answers computed from a lagging graph must not be cached under the newer versions.
+            do_not_store()
+    return graph
+
+
+def load_graph():
+    """Loads the graph of the current shared version in the calling thread, unless it is already loaded."""
+    global _graph
+    with _lock:
+        version = _shared_version()
+        if _graph is None or _graph.version != version:
+            _graph = InfluenceGraph.from_database(version=version)
+        return _graph
+
+
+def _reload():
+    global _reloading
+    try:
+        load_graph()
+    except Exception:
+        logger.exception("Reloading the influence graph failed")
+    finally:
+        _reloading = False
+        connections.close_all()    # this thread's connections only
+
+
+def reload_in_background():
+    """Starts reloading the graph in a daemon thread, unless a reload is already running."""
+    global _reloading
+    with _reloading_lock:
+        if _reloading:
+            return
+        _reloading = True
+    threading.Thread(target=_reload, daemon=True).start()
+
+
+def _bump_version():
+    """Advances the shared version; returns the new value."""
+    store = version_store()
+    try:
+        return store.incr(VERSION_CACHE_KEY)
+    except ValueError:
+        store.add(VERSION_CACHE_KEY, 0, timeout=None)
+        return store.incr(VERSION_CACHE_KEY)
+
+
+def apply_edge_change(source, target, added):
+    """Applies one committed edge change locally and announces it to other processes."""
+    version = _bump_version()
+    graph = _graph
+    if graph is None:
+        return
+    with graph.lock:
+        # Only track the change incrementally if no other process wrote in between.
+        if graph.version == version - 1:
+            (graph.add_edge if added else graph.remove_edge)(source, target)
+            graph.version = version
+
+
+def invalidate_graph():
+    """
+    Forces every process to reload, e.g. after bulk writes that bypass signals;
+    this one loads again on its next use.
+    """
+    global _graph
+    _bump_version()
+    bump_versions('timeline.influence')
+    _graph = None
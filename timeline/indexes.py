@@ -0,0 +1,15 @@
+"""
+Vendor-specific indexes for the timeline app (see figures/indexes.py).
+"""
+from ChronosAtlas.search import FullTextIndex
+
+# Full-text search (title ranks above description).
+EVENT_SEARCH = FullTextIndex('timeline_timelineevent', ['title', 'description'])
+
+
+def install_sqlite_triggers(schema_editor):
+    """
+    Re-creates the SQLite sync triggers, which Django's SQLite schema editor drops
+    when it rebuilds timeline_timelineevent; migrations that alter it must call this.
+    """
+    EVENT_SEARCH.install_sqlite_triggers(schema_editor)
@@ -0,0 +1,53 @@
+"""
+Batch ingestion helpers for TimelineEvent data (used by the batch create APIs).
+"""
+from collections import Counter
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from ChronosAtlas.batch import BatchResult, build, check_batch_size, clean, write_or_isolate
+from ChronosAtlas.cache import bump_on_commit
+from . import density, viewport
+from .models import TimelineEvent
+
+EVENT_COLUMNS = ['title', 'year', 'category', 'description', 'importance']
+
+
+def create_event_batch(items):
+    """
+    Validates a batch of event payloads (dicts keyed like EVENT_COLUMNS), inserts
+    the valid ones with one bulk_create and returns a BatchResult.
+    Raises BatchTooLarge if there are more than MAX_BATCH_SIZE items.
+    """
+    check_batch_size(items)
+    result = BatchResult(len(items))
+
+    events = {}
+    for index, data in enumerate(items):
+        try:
+            event = build(TimelineEvent, EVENT_COLUMNS, data)
+        except ValidationError as e:
+            result.reject_invalid(index, e)
+            continue
+        if clean(result, index, event):
+            events[index] = event
+
+    if not events:
+        return result.finish()
+
+    with transaction.atomic():
+        for index, message in write_or_isolate(sorted(events.items()), TimelineEvent.objects.bulk_create):
+            result.reject(index, message)
+            del events[index]
+
+        # Batch writes skip model signals, so keep the density buckets and viewport tiles current here.
+        counts = Counter()
+        for index, event in events.items():
+            result.objects[index] = event
+            density.count_event(counts, event.year, event.category)
+        density.apply_counts(counts)
+        viewport.apply(viewport.EVENTS, [(e.pk, None, e.year, e.importance) for e in events.values()])
+        bump_on_commit(TimelineEvent)
+
+    return result.finish()
@@ -0,0 +1,65 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ChronosAtlas import export
+
+
+class Command(BaseCommand):
+    help = (
+        'Streams figures, fields, figure_fields, events and influences to one file each '
+        '(NDJSON or column blocks, optionally gzip-compressed) with constant memory. '
+        'With --state, each run only exports rows changed since the previous one.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir', default='.', help='Directory the files are written to.')
+        parser.add_argument('--dataset', action='append', choices=list(export.DATASETS),
+                            help='Dataset to export; repeatable (default: all).')
+        parser.add_argument('--format', default='ndjson', choices=export.FORMATS,
+                            help='ndjson: one object per row; columns: one list per column per block of rows.')
+        parser.add_argument('--compression', choices=export.COMPRESSIONS, help='Compress the files on the fly.')
+        parser.add_argument('--since', help='Only export rows changed at or after this ISO 8601 time.')
+        parser.add_argument('--state',
+                            help='JSON file holding the watermark of the last run: it is used as --since, '
+                                 'and replaced once every file is written.')
+
+    def handle(self, *args, **options):
+        datasets = options['dataset'] or list(export.DATASETS)
+        since = options['since']
+        if since and options['state']:
+            raise CommandError('--since and --state are mutually exclusive.')
+        if options['state'] and os.path.exists(options['state']):
+            with open(options['state'], encoding='utf-8') as f:
+                since = json.load(f)['watermark']
+        try:
+            since = export.parse_since(since) if since else None
+        except export.ExportError as e:
+            raise CommandError(str(e))
+        os.makedirs(options['output_dir'], exist_ok=True)
+
+        watermark = export.watermark()
+        self.stdout.write(self.style.NOTICE(
+            f"Exporting {', '.join(datasets)}" + (f' changed since {since.isoformat()}' if since else '') + '...'
+        ))
+        for dataset in datasets:
+            started = time.monotonic()
+            path = os.path.join(options['output_dir'],
+                                export.filename(dataset, options['format'], options['compression']))
+            size = 0
+            # Readers never see a partial file.
+            with open(f'{path}.tmp', 'wb') as f:
+                for chunk in export.stream(dataset, options['format'], options['compression'], since):
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(f'{path}.tmp', path)
+            self.stdout.write(f'  {path}: {size} bytes in {time.monotonic() - started:.1f}s')
+
+        if options['state']:
+            tmp_path = f"{options['state']}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'watermark': watermark.isoformat()}, f)
+            os.replace(tmp_path, options['state'])
+        self.stdout.write(self.style.SUCCESS(f'Export complete; next watermark {watermark.isoformat()}.'))
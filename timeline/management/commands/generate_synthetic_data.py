@@ -0,0 +1,91 @@
+import multiprocessing
+import os
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from timeline import synthetic
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def _run(task):
+    write, plan, chunk, use_copy = task
+    try:
+        return write(plan, chunk, use_copy)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates a deterministic synthetic dataset (figures with Fields and QIDs, a power-law "
+        "influence graph, timeline events) at production scale, written in parallel with COPY on "
+        "PostgreSQL. Appends to the existing data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--figures', type=int, default=100000, help='Figures to create.')
+        parser.add_argument('--events', type=int, default=100000, help='Timeline events to create.')
+        parser.add_argument('--influences-per-figure', type=float, default=3.0,
+                            help='Mean number of influencers per figure.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Random seed; the same seed and chunk size give the same data.')
+        parser.add_argument('--chunk-size', type=int, default=50000,
+                            help='Rows generated and committed per task.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes (PostgreSQL only; other backends use one).')
+        parser.add_argument('--no-copy', action='store_true',
+                            help='Disable the PostgreSQL COPY fast path and use bulk_create.')
+
+    def handle(self, *args, **options):
+        if min(options['figures'], options['events']) < 0 or options['chunk_size'] < 1:
+            raise CommandError('--figures and --events must not be negative, --chunk-size must be positive.')
+        workers = max(options['workers'], 1)
+        if workers > 1 and connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING(
+                f'{connection.vendor} does not take concurrent writers; using one process.'
+            ))
+            workers = 1
+        use_copy = not options['no_copy']
+
+        plan = synthetic.make_plan(options['figures'], options['events'], options['influences_per_figure'],
+                                   options['seed'], options['chunk_size'])
+        self.stdout.write(self.style.NOTICE(
+            f"Generating {plan.figures} figures and {plan.events} events "
+            f"(seed {plan.seed}, {workers} worker{'s' if workers > 1 else ''})..."
+        ))
+        started = time.monotonic()
+        # Influences reference figures from other chunks, so they are written once every figure exists.
+        phases = [
+            [(synthetic.write_figures, plan, chunk, use_copy) for chunk in plan.chunks(plan.figures)]
+            + [(synthetic.write_events, plan, chunk, use_copy) for chunk in plan.chunks(plan.events)],
+            [(synthetic.write_influences, plan, chunk, use_copy) for chunk in plan.chunks(plan.figures)],
+        ]
+        counts, rows = Counter(), 0
+        if workers == 1:
+            results = (task[0](*task[1:]) for phase in phases for task in phase)
+            for written, deltas in results:
+                rows += written
+                counts.update(deltas)
+        else:
+            # Forked workers must not share this process's connections.
+            connections.close_all()
+            with multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+                for phase in phases:
+                    for written, deltas in pool.imap_unordered(_run, phase):
+                        rows += written
+                        counts.update(deltas)
+                        self.stdout.write(f'  {rows} rows written ({time.monotonic() - started:.0f}s)')
+
+        self.stdout.write(self.style.NOTICE('Updating density buckets, viewport tiles and caches...'))
+        synthetic.finish(counts)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Synthetic data generated: {rows} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):.0f} rows/s).'
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from ChronosAtlas.cache import bump_versions
+from timeline.density import rebuild
+from timeline.models import DensityBucket
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the timeline density aggregate table from scratch. "
+        "Run after bulk loads that bypass model signals (e.g. load_figures)."
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.NOTICE('Rebuilding timeline density buckets...'))
+        rebuild()
+        # Density responses are cached under these models' versions.
+        bump_versions('figures.figure', 'timeline.timelineevent')
+        self.stdout.write(self.style.SUCCESS(
+            f'Timeline density rebuilt: {DensityBucket.objects.count()} buckets.'
+        ))
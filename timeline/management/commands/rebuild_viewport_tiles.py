@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from ChronosAtlas.cache import bump_versions
+from timeline.models import ViewportTile
+from timeline.viewport import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the timeline viewport tiles from scratch. "
+        "Run after bulk loads that bypass model signals (e.g. load_figures)."
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.NOTICE('Rebuilding timeline viewport tiles...'))
+        rebuild()
+        # Viewport responses are cached under these models' versions.
+        bump_versions('figures.figure', 'timeline.timelineevent')
+        self.stdout.write(self.style.SUCCESS(
+            f'Timeline viewport tiles rebuilt: {ViewportTile.objects.count()} tiles.'
+        ))
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from timeline import centrality
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes influence centrality (degrees, PageRank, reach) for every figure into the "
+        "InfluenceMetrics table. Run it from cron, or keep it running with --every."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--if-stale', action='store_true',
+                            help='Skip the run when Influence has not changed since the last one.')
+        parser.add_argument('--every', type=float, default=None, metavar='SECONDS',
+                            help='Keep running, checking for changes every SECONDS (implies --if-stale).')
+        parser.add_argument('--reach-hops', type=int, default=centrality.REACH_HOPS,
+                            help='Hops counted by the reach metric.')
+        parser.add_argument('--no-copy', action='store_true',
+                            help='Disable the PostgreSQL COPY fast path and use bulk_create.')
+
+    def handle(self, *args, **options):
+        if options['reach_hops'] < 1:
+            raise CommandError('--reach-hops must be positive.')
+        if options['every'] is None:
+            self.run(options, options['if_stale'])
+            return
+        while True:
+            self.run(options, if_stale=True)
+            time.sleep(options['every'])
+
+    def run(self, options, if_stale):
+        if if_stale and not centrality.is_stale():
+            return
+        self.stdout.write(self.style.NOTICE('Computing influence metrics...'))
+        started = time.monotonic()
+        rows = centrality.refresh(options['reach_hops'], use_copy=not options['no_copy'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Influence metrics refreshed: {rows} figures in {time.monotonic() - started:.1f}s.'
+        ))
@@ -0,0 +1,17 @@
+# Generated by Django 5.0 on 2026-10-18 15:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timeline', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='timelineevent',
+            index=models.Index(fields=['year', 'id'], name='event_year_order_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0 on 2026-10-18 15:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timeline', '0002_event_year_order_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DensityBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('figures', 'Figures alive'), ('events', 'Timeline events')], max_length=10)),
+                ('resolution', models.PositiveIntegerField()),
+                ('dimension', models.CharField(blank=True, default='', max_length=100)),
+                ('start_year', models.IntegerField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Timeline Density Bucket',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='densitybucket',
+            constraint=models.UniqueConstraint(fields=('kind', 'resolution', 'dimension', 'start_year'), name='density_bucket_key'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+from timeline.indexes import EVENT_SEARCH
+
+
+def forwards(apps, schema_editor):
+    EVENT_SEARCH.create(schema_editor)
+
+
+def backwards(apps, schema_editor):
+    EVENT_SEARCH.drop(schema_editor)
+
+
+class Migration(migrations.Migration):
+    """
+    Adds full-text search over title and description: a stored tsvector column
+    with a GIN index on PostgreSQL and an FTS5 shadow table on SQLite.
+    """
+
+    dependencies = [
+        ('timeline', '0004_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
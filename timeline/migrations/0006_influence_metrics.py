@@ -0,0 +1,31 @@
+# Generated by Django 5.0 on 2026-10-18 16:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('figures', '0007_figure_instance_of_index'),
+        ('timeline', '0005_event_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InfluenceMetrics',
+            fields=[
+                ('figure', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='influence_metrics', serialize=False, to='figures.figure')),
+                ('in_degree', models.IntegerField(default=0)),
+                ('out_degree', models.IntegerField(default=0)),
+                ('pagerank', models.FloatField(default=0)),
+                ('reach', models.IntegerField(default=0)),
+                ('computed_at', models.DateTimeField(null=True)),
+            ],
+            options={
+                'verbose_name': 'Influence Metrics',
+                'verbose_name_plural': 'Influence Metrics',
+                'indexes': [models.Index(fields=['-pagerank', 'figure'], name='metrics_pagerank_idx'), models.Index(fields=['-reach', 'figure'], name='metrics_reach_idx'), models.Index(fields=['-in_degree', 'figure'], name='metrics_in_degree_idx'), models.Index(fields=['-out_degree', 'figure'], name='metrics_out_degree_idx')],
+            },
+        ),
+    ]
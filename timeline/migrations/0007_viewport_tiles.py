@@ -0,0 +1,48 @@
+# Generated by Django 5.0 on 2026-10-18 16:34
+
+from django.db import migrations, models
+
+from timeline.indexes import install_sqlite_triggers
+
+
+def reinstall_triggers(apps, schema_editor):
+    # Adding a NOT NULL column makes SQLite rebuild timeline_timelineevent, dropping its triggers.
+    install_sqlite_triggers(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timeline', '0006_influence_metrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ViewportTile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('figures', 'Figures born'), ('events', 'Timeline events')], max_length=10)),
+                ('resolution', models.PositiveIntegerField()),
+                ('start_year', models.IntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('top', models.JSONField(default=list)),
+            ],
+            options={
+                'verbose_name': 'Timeline Viewport Tile',
+            },
+        ),
+        migrations.AddField(
+            model_name='timelineevent',
+            name='importance',
+            field=models.IntegerField(db_default=models.Value(0), default=0),
+        ),
+        migrations.RunPython(reinstall_triggers, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='timelineevent',
+            index=models.Index(fields=['-importance', 'id'], name='event_importance_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='viewporttile',
+            constraint=models.UniqueConstraint(fields=('kind', 'resolution', 'start_year'), name='viewport_tile_key'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0 on 2026-10-18 17:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timeline', '0007_viewport_tiles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InfluenceMetricsState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('influences', models.IntegerField()),
+                ('influences_updated_at', models.DateTimeField(null=True)),
+                ('computed_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Influence Metrics State',
+            },
+        ),
+    ]
@@ -1,5 +1,11 @@
 from django.db import models
 from figures.models import Figure # REQUIRED for the Influence model
+from .indexes import EVENT_SEARCH
+
+class TimelineEventQuerySet(models.QuerySet):
+    def search(self, text):
+        """Events whose title or description match `text` (full-text; see ChronosAtlas/search.py)."""
+        return EVENT_SEARCH.filter(self, text)
 
 class TimelineEvent(models.Model):
     """
@@ -9,12 +15,24 @@ class TimelineEvent(models.Model):
     year = models.IntegerField()
     category = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
+    # Ranks the event within its stretch of the zoomed-out timeline (higher shows first).
+    importance = models.IntegerField(default=0, db_default=0)
+    # Drives Last-Modified/ETag on the API.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = TimelineEventQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.year}: {self.title}"
 
     class Meta:
         ordering = ['year']
+        indexes = [
+            # Serves the default ordering and keyset pagination (see ChronosAtlas/pagination.py).
+            models.Index(fields=['year', 'id'], name='event_year_order_idx'),
+            # Refills viewport tiles with their most important events (see timeline/viewport.py).
+            models.Index(fields=['-importance', 'id'], name='event_importance_idx'),
+        ]
 
 # CRITICAL: MISSING MODEL ADDED FOR data loading (load_mvp_data.py)
 class Influence(models.Model):
@@ -32,6 +50,7 @@ class Influence(models.Model):
         related_name='influences_received'
     )
     # Optional fields could be added here (e.g., degree of influence, source)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         unique_together = ['influencer', 'influenced']
@@ -39,4 +58,108 @@ class Influence(models.Model):
         verbose_name_plural = "Influence Relationships"
 
     def __str__(self):
-        return f"{self.influencer.name} influenced {self.influenced.name}"
\ No newline at end of file
+        return f"{self.influencer.name} influenced {self.influenced.name}"
+
+class DensityBucket(models.Model):
+    """
+    Precomputed timeline density: how many figures are alive, or how many events
+    happen, in one bucket of `resolution` years starting at `start_year`.
+    Maintained incrementally by timeline/signals.py (see timeline/density.py), so
+    histograms cost O(buckets) instead of O(rows).
+    """
+    FIGURES = 'figures'
+    EVENTS = 'events'
+    KIND_CHOICES = [(FIGURES, 'Figures alive'), (EVENTS, 'Timeline events')]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    resolution = models.PositiveIntegerField()
+    # '' for all rows; a Field id for figures, or an event category for events.
+    dimension = models.CharField(max_length=100, blank=True, default='')
+    start_year = models.IntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['kind', 'resolution', 'dimension', 'start_year'], name='density_bucket_key'
+            ),
+        ]
+        verbose_name = "Timeline Density Bucket"
+
+    def __str__(self):
+        return f"{self.kind}@{self.resolution}[{self.dimension or '*'}] {self.start_year}: {self.count}"
+
+class InfluenceMetrics(models.Model):
+    """
+    Precomputed influence centrality of one figure (see timeline/centrality.py).
+    Degrees follow every Influence write; pagerank and reach are recomputed by
+    `refresh_influence_metrics` and stay 0 on rows it has not seen yet.
+    Figures without any influence edge have no row.
+    """
+    figure = models.OneToOneField(
+        Figure, on_delete=models.CASCADE, primary_key=True, related_name='influence_metrics'
+    )
+    in_degree = models.IntegerField(default=0)
+    out_degree = models.IntegerField(default=0)
+    pagerank = models.FloatField(default=0)
+    # Figures influenced within centrality.REACH_HOPS hops.
+    reach = models.IntegerField(default=0)
+    # When pagerank and reach were last computed (NULL: not yet).
+    computed_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            # Serve the "most influential first" orderings and their keyset pagination.
+            models.Index(fields=['-pagerank', 'figure'], name='metrics_pagerank_idx'),
+            models.Index(fields=['-reach', 'figure'], name='metrics_reach_idx'),
+            models.Index(fields=['-in_degree', 'figure'], name='metrics_in_degree_idx'),
+            models.Index(fields=['-out_degree', 'figure'], name='metrics_out_degree_idx'),
+        ]
+        verbose_name = "Influence Metrics"
+        verbose_name_plural = "Influence Metrics"
+
+    def __str__(self):
+        return f"{self.figure_id}: in {self.in_degree}, out {self.out_degree}, pagerank {self.pagerank}"
+
+class InfluenceMetricsState(models.Model):
+    """
+    The single row recording which Influence table the stored PageRank and reach
+    were computed from: its row count and latest `updated_at` at the time
+    (see centrality.is_stale()).
+    """
+    influences = models.IntegerField()
+    influences_updated_at = models.DateTimeField(null=True)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Influence Metrics State"
+
+    def __str__(self):
+        return f"{self.influences} influences up to {self.influences_updated_at}, computed {self.computed_at}"
+
+class ViewportTile(models.Model):
+    """
+    One precomputed level-of-detail tile of the zoomable timeline: how many figures
+    (placed at their birth year) or events fall in `resolution` years from
+    `start_year`, and the most important of them (see timeline/viewport.py).
+    Maintained incrementally on writes, like DensityBucket.
+    """
+    FIGURES = DensityBucket.FIGURES
+    EVENTS = DensityBucket.EVENTS
+    KIND_CHOICES = [(FIGURES, 'Figures born'), (EVENTS, 'Timeline events')]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    resolution = models.PositiveIntegerField()
+    start_year = models.IntegerField()
+    count = models.IntegerField(default=0)
+    # [[importance, id], ...] best first; everything in the tile but not listed ranks below these.
+    top = models.JSONField(default=list)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'resolution', 'start_year'], name='viewport_tile_key'),
+        ]
+        verbose_name = "Timeline Viewport Tile"
+
+    def __str__(self):
+        return f"{self.kind}@{self.resolution} {self.start_year}: {self.count}"
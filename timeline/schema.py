@@ -1,6 +1,63 @@
 import graphene
+from collections import defaultdict
+from graphql import GraphQLError
 from graphene_django.types import DjangoObjectType
-from .models import TimelineEvent
+from .models import TimelineEvent, Influence, InfluenceMetrics
+from figures.indexes import FIGURE_SEARCH
+from figures.models import Figure
+from figures.schema import FIGURE_GRAPH_MODELS, BatchItemErrorType, FigureLoader, FigureType
+from . import density, viewport
+from .indexes import EVENT_SEARCH
+from .ingest import create_event_batch
+from .graph import MAX_PATH_HOPS, get_graph
+from ChronosAtlas.batch import BatchTooLarge
+from ChronosAtlas.dataloaders import BatchLoader, expect, get_loader
+from ChronosAtlas.pagination import Keyset, resolve_keyset_connection
+from ChronosAtlas.projection import project
+
+# --- 0. DataLoaders (one query per relation per request) ---
+
+# Both foreign keys are read to announce the figures on each end.
+INFLUENCE_ENDPOINTS = ('influencer', 'influenced')
+
+def influence_figure_ids(influences):
+    return [i.influencer_id for i in influences] + [i.influenced_id for i in influences]
+
+def expect_influences(info, influences):
+    """Announces both endpoints of the given influences so their figures load in one batch."""
+    expect(info, 'figure', influence_figure_ids(influences))
+    return influences
+
+class InfluenceLoaderBase(BatchLoader):
+    """Loads Influence rows grouped by one of their figure foreign keys."""
+    key_space = 'figure'
+    group_by = None
+
+    def batch_load(self, keys):
+        influences = Influence.objects.filter(**{f"{self.group_by}__in": keys}).order_by('id')
+        influences = list(project(influences, self.registry.info, InfluenceType, INFLUENCE_ENDPOINTS))
+        self.registry.expect('figure', influence_figure_ids(influences))
+
+        influences_by_figure = defaultdict(list)
+        for influence in influences:
+            influences_by_figure[getattr(influence, self.group_by)].append(influence)
+        return [influences_by_figure[key] for key in keys]
+
+class InfluencesGivenLoader(InfluenceLoaderBase):
+    """Influences where the keyed figure is the influencer."""
+    group_by = 'influencer_id'
+
+class InfluencesReceivedLoader(InfluenceLoaderBase):
+    """Influences where the keyed figure is the one influenced."""
+    group_by = 'influenced_id'
+
+class InfluenceMetricsLoader(BatchLoader):
+    """Loads each figure's precomputed influence metrics (None without a row)."""
+    key_space = 'figure'
+
+    def batch_load(self, keys):
+        metrics = InfluenceMetrics.objects.in_bulk(keys)
+        return [metrics.get(key) for key in keys]
 
 # --- 1. Graphene Type Definition (Read Schema) ---
 
@@ -10,11 +67,156 @@ class TimelineEventType(DjangoObjectType):
     """
     class Meta:
         model = TimelineEvent
-        fields = ('id', 'title', 'year', 'category', 'description')
+        fields = ('id', 'title', 'year', 'category', 'description', 'importance')
         # Setting interfaces is good practice, especially if using Relay, 
         # but not strictly required for basic Graphene setup.
         # interfaces = (graphene.Node,)
 
+class InfluenceMetricsType(DjangoObjectType):
+    """Precomputed influence centrality of a figure (see timeline/centrality.py)."""
+    class Meta:
+        model = InfluenceMetrics
+        fields = ('in_degree', 'out_degree', 'pagerank', 'reach', 'computed_at')
+
+class InfluenceType(DjangoObjectType):
+    """
+    Defines the GraphQL object representation for an Influence relationship.
+    Both endpoints resolve through the per-request FigureLoader.
+    """
+    class Meta:
+        model = Influence
+        fields = ('id', 'influencer', 'influenced')
+
+    def resolve_influencer(self, info):
+        return get_loader(info, FigureLoader).load(self.influencer_id)
+
+    def resolve_influenced(self, info):
+        return get_loader(info, FigureLoader).load(self.influenced_id)
+
+class TimelineEventConnection(graphene.relay.Connection):
+    """Relay connection over timeline events, paginated by keyset on year."""
+    class Meta:
+        node = TimelineEventType
+
+class InfluenceConnection(graphene.relay.Connection):
+    """Relay connection over influence relationships, paginated by keyset on id."""
+    class Meta:
+        node = InfluenceType
+
+class LineageEntryType(graphene.ObjectType):
+    """A figure reached by a lineage traversal and its distance in influence hops."""
+    figure = graphene.Field(FigureType)
+    depth = graphene.Int()
+
+    def resolve_figure(root, info):
+        return get_loader(info, FigureLoader).load(root['figure_id'])
+
+def resolve_lineage(info, figure_id, direction, max_depth=None, limit=1000):
+    """Runs a traversal on the in-memory influence graph and batches the figure lookups."""
+    try:
+        figure_id = int(figure_id)
+    except ValueError:
+        raise GraphQLError(f"Invalid figure id: {figure_id!r}")
+    entries = get_graph().lineage(figure_id, direction, max_depth)[:max(limit, 0)]
+    expect(info, 'figure', [pk for pk, _ in entries])
+    return [{'figure_id': pk, 'depth': depth} for pk, depth in entries]
+
+class InfluencePathType(graphene.ObjectType):
+    """One chain of Influence edges, listed from source to target."""
+    hops = graphene.Int()
+    figures = graphene.List(FigureType)
+
+    def resolve_hops(root, info):
+        return len(root) - 1
+
+    def resolve_figures(root, info):
+        return get_loader(info, FigureLoader).load_many(root)
+
+class InfluencePathsType(graphene.ObjectType):
+    """Shortest chains between two figures; `paths[0]` is the shortest."""
+    paths = graphene.List(InfluencePathType)
+    timed_out = graphene.Boolean(description="True if the time budget cut the search short.")
+
+class DensityBucketType(graphene.ObjectType):
+    """Number of figures alive (or events) between start_year and end_year inclusive."""
+    start_year = graphene.Int()
+    end_year = graphene.Int()
+    count = graphene.Int()
+
+class SearchKind(graphene.Enum):
+    FIGURE = 'figure'
+    TIMELINE_EVENT = 'timeline_event'
+
+class SearchHitType(graphene.ObjectType):
+    """One full-text match; exactly one of figure / timelineEvent is set."""
+    kind = SearchKind()
+    score = graphene.Float(description="Relevance; only comparable within one search.")
+    snippet = graphene.String(description="HTML-escaped excerpt with the matches wrapped in <mark>.")
+    figure = graphene.Field(FigureType)
+    timeline_event = graphene.Field(TimelineEventType)
+
+    def resolve_figure(root, info):
+        return get_loader(info, FigureLoader).load(root['id']) if root['kind'] == 'figure' else None
+
+    def resolve_timeline_event(root, info):
+        return root.get('event')
+
+class DensityKind(graphene.Enum):
+    FIGURES = 'figures'
+    EVENTS = 'events'
+
+class ViewportFiguresType(graphene.ObjectType):
+    """The figures born in one viewport bucket: the most important ones and how many there are."""
+    count = graphene.Int()
+    clustered = graphene.Int(description="Figures of the bucket not listed in `items`.")
+    items = graphene.List(FigureType, description="Most influential first.")
+
+    def resolve_clustered(root, info):
+        return root['count'] - len(root['top'])
+
+    def resolve_items(root, info):
+        return get_loader(info, FigureLoader).load_many([pk for _, pk in root['top']])
+
+class ViewportEventsType(graphene.ObjectType):
+    """The events of one viewport bucket: the most important ones and how many there are."""
+    count = graphene.Int()
+    clustered = graphene.Int(description="Events of the bucket not listed in `items`.")
+    items = graphene.List(TimelineEventType, description="Highest importance first.")
+
+    def resolve_clustered(root, info):
+        return root['count'] - len(root['top'])
+
+class ViewportBucketType(graphene.ObjectType):
+    """One bucket of a timeline viewport, from start_year to end_year inclusive."""
+    start_year = graphene.Int()
+    end_year = graphene.Int()
+    figures = graphene.Field(ViewportFiguresType)
+    events = graphene.Field(ViewportEventsType)
+
+class TimelineViewportType(graphene.ObjectType):
+    """Level-of-detail view of a year range; see timeline/viewport.py."""
+    bucket_size = graphene.Int()
+    buckets = graphene.List(ViewportBucketType)
+
+TIMELINE_EVENT_KEYSET = Keyset(TimelineEvent, 'year', 'id')
+INFLUENCE_KEYSET = Keyset(Influence, 'id')
+
+# Models each root query field reads, for the response cache (ChronosAtlas/cache.py).
+CACHE_MODELS = {
+    'allTimelineEvents': ('timeline.timelineevent',),
+    'timelineEvent': ('timeline.timelineevent',),
+    'timelineEventsConnection': ('timeline.timelineevent',),
+    'allInfluences': FIGURE_GRAPH_MODELS,
+    'influencesConnection': FIGURE_GRAPH_MODELS,
+    'influenceDescendants': FIGURE_GRAPH_MODELS,
+    'influenceAncestors': FIGURE_GRAPH_MODELS,
+    'influencePaths': FIGURE_GRAPH_MODELS,
+    # Density buckets are derived from figures, their fields and events.
+    'timelineDensity': ('figures.figure', 'figures.field', 'timeline.timelineevent'),
+    # Viewport tiles rank figures by their influence metrics.
+    'timelineViewport': ('figures.figure', 'timeline.timelineevent', 'timeline.influencemetrics'),
+}
+
 # --- 2. Query Definition (Read Operations) ---
 
 class TimelineQuery(graphene.ObjectType):
@@ -30,14 +232,156 @@ class TimelineQuery(graphene.ObjectType):
         id=graphene.Int() # Using Int for the primary key lookup
     )
 
+    # Paginated variant of all_timeline_events (first/after, last/before)
+    timeline_events_connection = graphene.relay.ConnectionField(TimelineEventConnection)
+
+    # Query to fetch a list of all influence relationships
+    all_influences = graphene.List(InfluenceType)
+    influences_connection = graphene.relay.ConnectionField(InfluenceConnection)
+
+    # Transitive lineage from the in-memory influence graph (no SQL per hop)
+    influence_descendants = graphene.List(
+        LineageEntryType, figure_id=graphene.ID(required=True), max_depth=graphene.Int(), limit=graphene.Int()
+    )
+    influence_ancestors = graphene.List(
+        LineageEntryType, figure_id=graphene.ID(required=True), max_depth=graphene.Int(), limit=graphene.Int()
+    )
+
+    influence_paths = graphene.Field(
+        InfluencePathsType,
+        source_id=graphene.ID(required=True),
+        target_id=graphene.ID(required=True),
+        k=graphene.Int(default_value=1),
+        max_hops=graphene.Int(default_value=MAX_PATH_HOPS),
+        directed=graphene.Boolean(default_value=True),
+    )
+
+    # Ranked full-text search over figure names/summaries and event titles/descriptions
+    search = graphene.List(
+        SearchHitType,
+        query=graphene.String(required=True),
+        kinds=graphene.List(SearchKind),
+        limit=graphene.Int(default_value=20),
+    )
+
+    # Density strip for the timeline UI, served from precomputed buckets
+    timeline_density = graphene.List(
+        DensityBucketType,
+        kind=DensityKind(required=True),
+        start_year=graphene.Int(required=True),
+        end_year=graphene.Int(required=True),
+        bucket_size=graphene.Int(default_value=100),
+        field_id=graphene.ID(description="Only figures in this Field (kind FIGURES)."),
+        category=graphene.String(description="Only events in this category (kind EVENTS)."),
+    )
+
+    # Zoom-aware timeline: top items and cluster counts per bucket, from precomputed tiles
+    timeline_viewport = graphene.Field(
+        TimelineViewportType,
+        start_year=graphene.Int(required=True),
+        end_year=graphene.Int(required=True),
+        width=graphene.Int(required=True, description="Width of the viewport in pixels."),
+        kinds=graphene.List(DensityKind),
+        per_bucket=graphene.Int(default_value=viewport.DEFAULT_PER_BUCKET),
+    )
+
+    def resolve_search(root, info, query, kinds=None, limit=20):
+        """Best matches across figures and events, highest score first."""
+        kinds = {getattr(kind, 'value', kind) for kind in kinds or ('figure', 'timeline_event')}
+        hits = []
+        if 'figure' in kinds:
+            hits += [
+                {'kind': 'figure', 'id': pk, 'score': score, 'snippet': snippet}
+                for pk, score, snippet in FIGURE_SEARCH.ranked(Figure.objects.all(), query, limit)
+            ]
+        if 'timeline_event' in kinds:
+            hits += [
+                {'kind': 'timeline_event', 'id': pk, 'score': score, 'snippet': snippet}
+                for pk, score, snippet in EVENT_SEARCH.ranked(TimelineEvent.objects.all(), query, limit)
+            ]
+        hits = sorted(hits, key=lambda hit: -hit['score'])[:max(limit, 0)]
+
+        expect(info, 'figure', [hit['id'] for hit in hits if hit['kind'] == 'figure'])
+        events = project(TimelineEvent.objects.all(), info, TimelineEventType).in_bulk(
+            [hit['id'] for hit in hits if hit['kind'] == 'timeline_event']
+        )
+        for hit in hits:
+            if hit['kind'] == 'timeline_event':
+                hit['event'] = events.get(hit['id'])
+        return hits
+
+    def resolve_timeline_density(root, info, kind, start_year, end_year, bucket_size=100,
+                                 field_id=None, category=None):
+        """Histogram of figures alive / events per bucket, O(buckets)."""
+        kind = getattr(kind, 'value', kind)
+        dimension = (field_id if kind == 'figures' else category) or ''
+        try:
+            return density.histogram(kind, bucket_size, start_year, end_year, dimension)
+        except ValueError as e:
+            raise GraphQLError(str(e))
+
+    def resolve_timeline_viewport(root, info, start_year, end_year, width, kinds=None,
+                                  per_bucket=viewport.DEFAULT_PER_BUCKET):
+        """The tiles of the zoom level matching the range and width; O(buckets) whatever the data size."""
+        kinds = [getattr(kind, 'value', kind) for kind in kinds or viewport.KINDS]
+        try:
+            bucket_size, buckets = viewport.viewport(start_year, end_year, width, kinds, per_bucket)
+        except ValueError as e:
+            raise GraphQLError(str(e))
+
+        if viewport.FIGURES in kinds:
+            expect(info, 'figure', [pk for bucket in buckets for _, pk in bucket['figures']['top']])
+        if viewport.EVENTS in kinds:
+            events = TimelineEvent.objects.order_by().in_bulk(
+                [pk for bucket in buckets for _, pk in bucket['events']['top']]
+            )
+            for bucket in buckets:
+                bucket['events']['items'] = [events[pk] for _, pk in bucket['events']['top'] if pk in events]
+        return {'bucket_size': bucket_size, 'buckets': buckets}
+
+    def resolve_influence_paths(root, info, source_id, target_id, k=1, max_hops=MAX_PATH_HOPS, directed=True):
+        """The k shortest influence chains from source to target (bidirectional BFS)."""
+        try:
+            source, target = int(source_id), int(target_id)
+        except ValueError:
+            raise GraphQLError("sourceId and targetId must be figure ids.")
+        paths, timed_out = get_graph().shortest_paths(source, target, k, max_hops, directed=directed)
+        expect(info, 'figure', [pk for path in paths for pk in path])
+        return InfluencePathsType(paths=paths, timed_out=timed_out)
+
+    def resolve_influence_descendants(root, info, figure_id, max_depth=None, limit=1000):
+        """Everyone influenced by the figure, up to max_depth hops."""
+        return resolve_lineage(info, figure_id, 'descendants', max_depth, limit)
+
+    def resolve_influence_ancestors(root, info, figure_id, max_depth=None, limit=1000):
+        """Everyone who influenced the figure, up to max_depth hops."""
+        return resolve_lineage(info, figure_id, 'ancestors', max_depth, limit)
+
+    def resolve_all_influences(root, info):
+        """Returns all Influence objects; figures on both ends are batch-loaded."""
+        influences = project(Influence.objects.order_by('id'), info, InfluenceType, INFLUENCE_ENDPOINTS)
+        return expect_influences(info, list(influences))
+
+    def resolve_influences_connection(root, info, **page):
+        """Returns one keyset page of Influence objects."""
+        queryset = project(Influence.objects.all(), info, InfluenceType, INFLUENCE_ENDPOINTS)
+        connection = resolve_keyset_connection(InfluenceConnection, INFLUENCE_KEYSET, queryset, **page)
+        expect_influences(info, [edge.node for edge in connection.edges])
+        return connection
+
+    def resolve_timeline_events_connection(root, info, **page):
+        """Returns one keyset page of TimelineEvent objects, ordered by year."""
+        queryset = project(TimelineEvent.objects.all(), info, TimelineEventType, TIMELINE_EVENT_KEYSET.fields)
+        return resolve_keyset_connection(TimelineEventConnection, TIMELINE_EVENT_KEYSET, queryset, **page)
+
     def resolve_all_timeline_events(root, info):
         """Returns all TimelineEvent objects, ordered by year (as defined in models.py)."""
-        return TimelineEvent.objects.all()
+        return project(TimelineEvent.objects.all(), info, TimelineEventType)
 
     def resolve_timeline_event(root, info, id):
         """Returns a single TimelineEvent object based on the provided ID."""
         try:
-            return TimelineEvent.objects.get(pk=id)
+            return project(TimelineEvent.objects.all(), info, TimelineEventType).get(pk=id)
         except TimelineEvent.DoesNotExist:
             return None
 
@@ -52,6 +396,7 @@ class TimelineEventInput(graphene.InputObjectType):
     year = graphene.Int(required=True)
     category = graphene.String(required=True)
     description = graphene.String(required=False)
+    importance = graphene.Int(required=False)
 
 class CreateTimelineEvent(graphene.Mutation):
     """
@@ -73,15 +418,38 @@ class CreateTimelineEvent(graphene.Mutation):
             title=input.title,
             year=input.year,
             category=input.category,
-            description=input.description if hasattr(input, 'description') else None
+            description=input.description if hasattr(input, 'description') else None,
+            importance=input.importance or 0,
         )
         
         # Return the mutation payload
         return CreateTimelineEvent(timeline_event=timeline_event)
 
+class CreateTimelineEvents(graphene.Mutation):
+    """
+    Creates many events with one bulk insert. Invalid items are reported in
+    `errors` (by their index in `inputs`); the rest are saved.
+    """
+    class Arguments:
+        inputs = graphene.List(graphene.NonNull(TimelineEventInput), required=True)
+
+    timeline_events = graphene.List(
+        TimelineEventType, description="One entry per input; null where the item was rejected."
+    )
+    errors = graphene.List(graphene.NonNull(BatchItemErrorType))
+
+    @staticmethod
+    def mutate(root, info, inputs):
+        try:
+            result = create_event_batch(inputs)
+        except BatchTooLarge as e:
+            raise GraphQLError(str(e))
+        return CreateTimelineEvents(timeline_events=result.objects, errors=result.errors)
+
 class TimelineMutation(graphene.ObjectType):
     """
     Combines all write operations for the timeline app.
     """
     create_timeline_event = CreateTimelineEvent.Field()
+    create_timeline_events = CreateTimelineEvents.Field()
     # Add update_timeline_event and delete_timeline_event fields later
\ No newline at end of file
@@ -0,0 +1,232 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from ChronosAtlas.cache import bump_on_commit
+from figures.models import Field, Figure
+from . import centrality, density, viewport
+from .graph import apply_edge_change
+from .models import Influence, TimelineEvent
+
+
+# --- 1. Influence graph ---
+
+@receiver(post_save, sender=Influence)
+def influence_saved(sender, instance, **kwargs):
+    """Moves the edge in the influence graph once the write commits."""
+    # influence_pre_save (section 3) recorded the stored endpoints.
+    previous = getattr(instance, '_metrics_previous', None)
+    current = (instance.influencer_id, instance.influenced_id)
+    if previous == current:
+        return
+    if previous is not None:
+        transaction.on_commit(lambda: apply_edge_change(*previous, added=False))
+    transaction.on_commit(lambda: apply_edge_change(*current, added=True))
+
+
+@receiver(post_delete, sender=Influence)
+def influence_deleted(sender, instance, **kwargs):
+    """Removes the edge from the influence graph once the delete commits."""
+    source, target = instance.influencer_id, instance.influenced_id
+    transaction.on_commit(lambda: apply_edge_change(source, target, added=False))
+
+
+# --- 2. Timeline density aggregates (run inside the writing transaction) ---
+
+@receiver(pre_save, sender=TimelineEvent)
+def event_pre_save(sender, instance, **kwargs):
+    # One read for both the density and the viewport receivers (section 4).
+    previous = (
+        TimelineEvent.objects.filter(pk=instance.pk).values_list('year', 'category', 'importance').first()
+        if instance.pk else None
+    )
+    instance._density_previous = previous[:2] if previous else None
+    instance._viewport_previous = (previous[0], previous[2]) if previous else None
+
+
+@receiver(post_save, sender=TimelineEvent)
+def event_saved(sender, instance, **kwargs):
+    previous = getattr(instance, '_density_previous', None)
+    if previous == (instance.year, instance.category):
+        return
+    if previous is not None:
+        density.apply_event(*previous, delta=-1)
+    density.apply_event(instance.year, instance.category, delta=1)
+
+
+@receiver(post_delete, sender=TimelineEvent)
+def event_deleted(sender, instance, **kwargs):
+    density.apply_event(instance.year, instance.category, delta=-1)
+
+
+def _field_ids(figure):
+    return list(Figure.fields.through.objects.filter(figure_id=figure.pk).values_list('field_id', flat=True))
+
+
+@receiver(pre_save, sender=Figure)
+def figure_pre_save(sender, instance, **kwargs):
+    instance._density_previous = (
+        Figure.objects.filter(pk=instance.pk)
+        .values_list('normalized_birth_year', 'normalized_death_year').first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Figure)
+def figure_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_density_previous', None)
+    current = (instance.normalized_birth_year, instance.normalized_death_year)
+    if previous == current:
+        return
+    # A new figure has no Fields yet; they are counted by figure_fields_changed.
+    field_ids = [] if created else _field_ids(instance)
+    if previous is not None:
+        density.apply_figure(*previous, field_ids, delta=-1)
+    density.apply_figure(*current, field_ids, delta=1)
+
+
+@receiver(pre_delete, sender=Figure)
+def figure_pre_delete(sender, instance, **kwargs):
+    # The M2M rows are removed by the cascade without an m2m_changed signal.
+    instance._density_field_ids = _field_ids(instance)
+
+
+@receiver(post_delete, sender=Figure)
+def figure_deleted(sender, instance, **kwargs):
+    density.apply_figure(
+        instance.normalized_birth_year, instance.normalized_death_year,
+        getattr(instance, '_density_field_ids', []), delta=-1,
+    )
+
+
+@receiver(m2m_changed, sender=Figure.fields.through)
+def figure_fields_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keeps the per-Field dimension in step with figure.fields (from either side)."""
+    if action == 'pre_clear':
+        # pk_set is not provided for clear(); remember what is about to go.
+        if reverse:
+            instance._density_cleared = list(instance.figures.values_list('pk', flat=True))
+        else:
+            instance._density_cleared = _field_ids(instance)
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    delta = 1 if action == 'post_add' else -1
+    pks = instance.__dict__.pop('_density_cleared', []) if action == 'post_clear' else pk_set
+    if not pks:
+        return
+
+    if reverse:
+        # field.figures.add(...): instance is the Field, pks are figures.
+        years = Figure.objects.filter(pk__in=pks).values_list('normalized_birth_year', 'normalized_death_year')
+        for birth, death in years:
+            density.apply_figure(birth, death, [instance.pk], delta, include_all=False)
+    else:
+        density.apply_figure(
+            instance.normalized_birth_year, instance.normalized_death_year, pks, delta, include_all=False
+        )
+
+
+# --- 3. Influence metric degrees (run inside the writing transaction) ---
+
+@receiver(pre_save, sender=Influence)
+def influence_pre_save(sender, instance, **kwargs):
+    instance._metrics_previous = (
+        Influence.objects.filter(pk=instance.pk).values_list('influencer_id', 'influenced_id').first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Influence)
+def influence_metrics_saved(sender, instance, **kwargs):
+    previous = getattr(instance, '_metrics_previous', None)
+    current = (instance.influencer_id, instance.influenced_id)
+    if previous == current:
+        return
+    if previous is not None:
+        centrality.apply_edge(*previous, delta=-1)
+    centrality.apply_edge(*current, delta=1)
+
+
+@receiver(post_delete, sender=Influence)
+def influence_metrics_deleted(sender, instance, **kwargs):
+    centrality.apply_edge(instance.influencer_id, instance.influenced_id, delta=-1)
+
+
+# --- 4. Viewport tiles (run inside the writing transaction) ---
+
+@receiver(post_save, sender=TimelineEvent)
+def event_viewport_saved(sender, instance, **kwargs):
+    # event_pre_save above recorded the stored (year, importance).
+    previous = getattr(instance, '_viewport_previous', None)
+    if previous == (instance.year, instance.importance):
+        return
+    year_before = previous[0] if previous is not None else None
+    viewport.apply(viewport.EVENTS, [(instance.pk, year_before, instance.year, instance.importance)])
+
+
+@receiver(post_delete, sender=TimelineEvent)
+def event_viewport_deleted(sender, instance, **kwargs):
+    viewport.apply(viewport.EVENTS, [(instance.pk, instance.year, None, instance.importance)])
+
+
+@receiver(post_save, sender=Figure)
+def figure_viewport_saved(sender, instance, created, **kwargs):
+    # figure_pre_save above recorded the stored (birth, death) years.
+    previous = getattr(instance, '_density_previous', None)
+    birth_before = previous[0] if previous is not None else None
+    if not created and birth_before == instance.normalized_birth_year:
+        return
+    viewport.figures_moved([(instance.pk, birth_before, instance.normalized_birth_year)])
+
+
+@receiver(post_delete, sender=Figure)
+def figure_viewport_deleted(sender, instance, **kwargs):
+    viewport.apply(viewport.FIGURES, [(instance.pk, instance.normalized_birth_year, None, 0)])
+
+
+@receiver(post_save, sender=Influence)
+def influence_viewport_saved(sender, instance, **kwargs):
+    # Runs after influence_metrics_saved, so the degrees are already updated.
+    previous = getattr(instance, '_metrics_previous', None)
+    current = (instance.influencer_id, instance.influenced_id)
+    if previous != current:
+        viewport.influence_changed({*(previous or ()), *current})
+
+
+@receiver(post_delete, sender=Influence)
+def influence_viewport_deleted(sender, instance, **kwargs):
+    viewport.influence_changed([instance.influencer_id, instance.influenced_id])
+
+
+# --- 5. Response cache versions ---
+
+@receiver(post_save, sender=Figure)
+@receiver(post_delete, sender=Figure)
+@receiver(post_save, sender=Field)
+@receiver(post_delete, sender=Field)
+@receiver(post_save, sender=TimelineEvent)
+@receiver(post_delete, sender=TimelineEvent)
+@receiver(post_save, sender=Influence)
+@receiver(post_delete, sender=Influence)
+def model_changed(sender, **kwargs):
+    """Retires cached responses that read this model once the write commits."""
+    bump_on_commit(sender)
+
+
+@receiver(m2m_changed, sender=Figure.fields.through)
+def figure_fields_linked(sender, instance, action, reverse, pk_set, **kwargs):
+    """Link changes count as writes to the figures: touch updated_at and bump the version."""
+    if action == 'pre_clear' and reverse:
+        instance._cleared_figures = list(instance.figures.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        pks = [instance.pk]
+    elif action == 'post_clear':
+        pks = instance.__dict__.pop('_cleared_figures', [])
+    else:
+        pks = pk_set
+    Figure.objects.filter(pk__in=pks).update(updated_at=timezone.now())
+    bump_on_commit(Figure)
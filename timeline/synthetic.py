@@ -0,0 +1,314 @@
+"""
+Deterministic synthetic data at production scale (generate_synthetic_data command).
+
+Every row is a pure function of (seed, chunk), so chunks can be generated and
+written by independent worker processes and the output does not depend on the
+number of workers:
+
+- Figures are generated in birth order: the figure of rank r (0 = oldest) is
+  born in year_at((r + 0.5) / N) of the BIRTH_YEAR_CDF distribution, which
+  includes BCE. Ranks map to primary keys through a bijective permutation, so
+  ids carry no chronological order.
+- Each figure gets 1-3 Fields (Zipf-distributed popularity), Q5 ("human") plus
+  the Wikidata occupation classes of its Fields as instance_of_QIDs, and a
+  lifespan from an era-dependent age at death (recent figures may be alive).
+- Influences point from an earlier rank to a later one, so the influencer is
+  never born after the influenced. The target year lies a log-normal gap before
+  the influenced figure's birth; the target rank is then rounded down to a
+  multiple of 2**L, with P(L >= l) = 2**(-HUB_EXPONENT * l). Ranks with many
+  trailing zero bits collect edges from far around them, which gives a
+  power-law out-degree distribution without any shared state.
+- Timeline events draw their years from the same distribution.
+
+Chunks are written with COPY on PostgreSQL and bulk_create elsewhere. Each
+worker also returns the density deltas (timeline/density.py) of the rows it
+wrote, which are applied once at the end; the viewport tiles
+(timeline/viewport.py) are then rebuilt from the tables.
+"""
+import csv
+import io
+import json
+import math
+import random
+from bisect import bisect_right
+from collections import Counter
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from figures.models import Field, Figure
+from . import density, viewport
+from .models import Influence, TimelineEvent
+
+PRESENT_YEAR = 2025
+# (year, share of figures born before it), piecewise linear in between.
+BIRTH_YEAR_CDF = [
+    (-3000, 0.0), (-1000, 0.005), (-500, 0.02), (0, 0.045), (500, 0.07), (1000, 0.1),
+    (1500, 0.18), (1700, 0.28), (1800, 0.4), (1900, 0.66), (1950, 0.87), (2005, 1.0),
+]
+_CDF_YEARS = [year for year, _ in BIRTH_YEAR_CDF]
+_CDF_SHARES = [share for _, share in BIRTH_YEAR_CDF]
+
+# Field name, Wikidata occupation class (philosopher, mathematician, ...), Zipf order.
+FIELDS = [
+    ("Politics", "Q82955"), ("Literature", "Q36180"), ("Art", "Q1028181"), ("Music", "Q36834"),
+    ("Science", "Q901"), ("Philosophy", "Q4964182"), ("Religion", "Q1234713"), ("Warfare", "Q47064"),
+    ("Medicine", "Q39631"), ("Mathematics", "Q170790"), ("Physics", "Q169470"), ("Law", "Q40348"),
+    ("History", "Q201788"), ("Architecture", "Q42973"), ("Economics", "Q188094"),
+    ("Chemistry", "Q593644"), ("Astronomy", "Q11063"), ("Biology", "Q864503"),
+    ("Theatre", "Q33999"), ("Exploration", "Q11900058"), ("Engineering", "Q81096"),
+]
+FIELD_WEIGHTS = [1 / (rank + 1) for rank in range(len(FIELDS))]
+HUMAN_QID = "Q5"
+MONARCH_QID = "Q116"
+# First QID of the synthetic wikidata_id range, far above real Wikidata items.
+WIKIDATA_ID_BASE = 900_000_000
+
+EVENT_CATEGORIES = [
+    ("War", "Battle of {}"), ("Treaty", "Treaty of {}"), ("Founding", "Founding of {}"),
+    ("Discovery", "Discovery of the {} passage"), ("Invention", "{} engine"),
+    ("Publication", "Publication of the {} codex"), ("Election", "{} election"),
+]
+EVENT_WEIGHTS = [1 / (rank + 1) for rank in range(len(EVENT_CATEGORIES))]
+
+SYLLABLES = [
+    "al", "an", "ar", "ba", "bel", "ca", "da", "del", "do", "el", "en", "fa", "gar", "ha", "is",
+    "ja", "ka", "la", "len", "li", "lo", "ma", "mar", "mi", "na", "nes", "ni", "no", "o", "pa",
+    "ra", "ri", "ro", "sa", "se", "so", "ta", "te", "ti", "to", "u", "va", "vi", "za",
+]
+
+# Influence generation.
+HUB_EXPONENT = 0.5
+INFLUENCE_GAP_MEDIAN = 40       # years between the influencer's and the influenced's births
+INFLUENCE_GAP_SIGMA = 0.9
+
+
+def year_at(share):
+    """The birth year below which `share` (0..1) of all figures are born."""
+    i = min(max(bisect_right(_CDF_SHARES, share), 1), len(BIRTH_YEAR_CDF) - 1)
+    (y0, s0), (y1, s1) = BIRTH_YEAR_CDF[i - 1], BIRTH_YEAR_CDF[i]
+    return math.floor(y0 + (y1 - y0) * (share - s0) / (s1 - s0))
+
+
+def share_before(year):
+    """Inverse of year_at: the share of figures born before `year`."""
+    i = min(max(bisect_right(_CDF_YEARS, year), 1), len(BIRTH_YEAR_CDF) - 1)
+    (y0, s0), (y1, s1) = BIRTH_YEAR_CDF[i - 1], BIRTH_YEAR_CDF[i]
+    return min(max(s0 + (s1 - s0) * (year - y0) / (y1 - y0), 0.0), 1.0)
+
+
+class Plan:
+    """The sizes, seed and id ranges of one generation run, shared by all workers."""
+
+    def __init__(self, figures, events, influences_per_figure=3.0, seed=0, chunk_size=50000,
+                 first_figure_id=1, field_ids=None):
+        self.figures = figures
+        self.events = events
+        self.influences_per_figure = influences_per_figure
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.first_figure_id = first_figure_id
+        self.field_ids = field_ids or {}
+        self.max_level = max(figures - 1, 1).bit_length()
+        # A multiplier coprime with N makes rank -> id a bijection.
+        self.multiplier = 2654435761 % max(figures, 1) or 1
+        while math.gcd(self.multiplier, figures) != 1:
+            self.multiplier += 1
+
+    def rng(self, kind, chunk):
+        return random.Random(f"{self.seed}:{kind}:{chunk}")
+
+    def chunks(self, total):
+        return range((total + self.chunk_size - 1) // self.chunk_size)
+
+    def figure_id(self, rank):
+        return self.first_figure_id + rank * self.multiplier % self.figures
+
+    def birth_year(self, rank):
+        return year_at((rank + 0.5) / self.figures)
+
+    def rank_born_by(self, year):
+        return math.floor(share_before(year) * self.figures)
+
+
+def _name(rng):
+    def word():
+        return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).title()
+    return ' '.join(word() for _ in range(rng.choice((1, 2, 2, 2, 3))))
+
+
+def _death_year(rng, birth):
+    mean_age = 55 if birth < 1800 else 62 if birth < 1900 else 75
+    death = birth + min(max(round(rng.gauss(mean_age, 15)), 18), 105)
+    return None if death >= PRESENT_YEAR else death
+
+
+def figure_rows(plan, chunk):
+    """(figure tuples, [(figure_id, field_id)]) for the ranks of one chunk."""
+    rng = plan.rng('figures', chunk)
+    start = chunk * plan.chunk_size
+    figures, links = [], []
+    for rank in range(start, min(start + plan.chunk_size, plan.figures)):
+        pk = plan.figure_id(rank)
+        birth = plan.birth_year(rank)
+        name = _name(rng)
+        chosen = list(dict.fromkeys(rng.choices(range(len(FIELDS)), FIELD_WEIGHTS, k=rng.randint(1, 3))))
+        qids = [HUMAN_QID] + [FIELDS[i][1] for i in chosen]
+        if rng.random() < 0.01:
+            qids.append(MONARCH_QID)
+        era = f"{-birth} BCE" if birth < 0 else str(birth)
+        figures.append((
+            pk, name, f"{name.lower().replace(' ', '-')}-{pk}", f"Q{WIKIDATA_ID_BASE + pk}",
+            f"{FIELDS[chosen[0]][0]} figure born in {era}.", birth, _death_year(rng, birth), qids,
+        ))
+        if plan.field_ids:
+            links.extend((pk, plan.field_ids[FIELDS[i][0]]) for i in chosen)
+    return figures, links
+
+
+def influence_rows(plan, chunk):
+    """[(influencer_id, influenced_id)] for the influenced ranks of one chunk."""
+    rng = plan.rng('influences', chunk)
+    hub_rate = HUB_EXPONENT * math.log(2)
+    start = chunk * plan.chunk_size
+    edges = []
+    for rank in range(max(start, 1), min(start + plan.chunk_size, plan.figures)):
+        birth = plan.birth_year(rank)
+        sources = set()
+        for _ in range(int(rng.expovariate(1 / plan.influences_per_figure) + 0.5)):
+            gap = rng.lognormvariate(math.log(INFLUENCE_GAP_MEDIAN), INFLUENCE_GAP_SIGMA)
+            target = min(plan.rank_born_by(birth - gap), rank - 1)
+            level = min(int(rng.expovariate(hub_rate)), plan.max_level)
+            sources.add(target - target % (1 << level))
+        influenced = plan.figure_id(rank)
+        edges.extend((plan.figure_id(source), influenced) for source in sorted(sources))
+    return edges
+
+
+def event_rows(plan, chunk):
+    """[(title, year, category, description)] for one chunk of events."""
+    rng = plan.rng('events', chunk)
+    start = chunk * plan.chunk_size
+    events = []
+    for i in range(start, min(start + plan.chunk_size, plan.events)):
+        year = min(year_at(rng.random()), PRESENT_YEAR)
+        category, template = rng.choices(EVENT_CATEGORIES, EVENT_WEIGHTS)[0]
+        events.append((template.format(_name(rng)), year, category, f"Synthetic event {i}."))
+    return events
+
+
+# --- Writing ---
+
+def _copy(cursor, model, columns, rows):
+    """Streams rows into the model's table with COPY ... FROM STDIN (PostgreSQL)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([
+            r'\N' if value is None else json.dumps(value) if isinstance(value, list) else value
+            for value in row
+        ])
+    buffer.seek(0)
+    names = ', '.join(f'"{model._meta.get_field(column).column}"' for column in columns)
+    cursor.copy_expert(
+        f"COPY {model._meta.db_table} ({names}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer
+    )
+
+
+def write_rows(model, columns, rows, use_copy=True):
+    """Inserts tuples of `columns` values, with COPY when the backend supports it."""
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        if use_copy and connection.vendor == 'postgresql' and hasattr(cursor, 'copy_expert'):
+            _copy(cursor, model, columns, rows)
+            return
+    model.objects.bulk_create((model(**dict(zip(columns, row))) for row in rows), batch_size=5000)
+
+
+FIGURE_COLUMNS = ['id', 'name', 'slug', 'wikidata_id', 'summary',
+                  'normalized_birth_year', 'normalized_death_year', 'instance_of_QIDs', 'updated_at']
+EVENT_COLUMNS = ['title', 'year', 'category', 'description', 'updated_at']
+
+
+def write_figures(plan, chunk, use_copy=True):
+    """Generates and inserts one chunk of figures and their Field links; returns (rows, density deltas)."""
+    figures, links = figure_rows(plan, chunk)
+    now = timezone.now()
+    counts = Counter()
+    fields_by_figure = {}
+    for figure_id, field_id in links:
+        fields_by_figure.setdefault(figure_id, []).append(field_id)
+    for pk, _, _, _, _, birth, death, _ in figures:
+        density.count_figure(counts, birth, death, [density.ALL, *fields_by_figure.get(pk, ())])
+    with transaction.atomic():
+        write_rows(Figure, FIGURE_COLUMNS, [row + (now,) for row in figures], use_copy)
+        write_rows(Figure.fields.through, ['figure_id', 'field_id'], links, use_copy)
+    return len(figures) + len(links), counts
+
+
+def write_influences(plan, chunk, use_copy=True):
+    now = timezone.now()
+    edges = influence_rows(plan, chunk)
+    with transaction.atomic():
+        write_rows(Influence, ['influencer_id', 'influenced_id', 'updated_at'],
+                   [edge + (now,) for edge in edges], use_copy)
+    return len(edges), Counter()
+
+
+def write_events(plan, chunk, use_copy=True):
+    now = timezone.now()
+    events = event_rows(plan, chunk)
+    counts = Counter()
+    for _, year, category, _ in events:
+        density.count_event(counts, year, category)
+    with transaction.atomic():
+        write_rows(TimelineEvent, EVENT_COLUMNS, [row + (now,) for row in events], use_copy)
+    return len(events), counts
+
+
+def make_plan(figures, events, influences_per_figure=3.0, seed=0, chunk_size=50000):
+    """A Plan that appends after the existing figures, creating the Fields it needs."""
+    field_ids = {}
+    for name, _ in FIELDS:
+        field_ids[name] = Field.objects.get_or_create(name=name)[0].pk
+    last_id = Figure.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    return Plan(figures, events, influences_per_figure, seed, chunk_size,
+                first_figure_id=last_id + 1, field_ids=field_ids)
+
+
+def reset_sequences():
+    """Moves the figure id sequence past the explicitly inserted ids (PostgreSQL)."""
+    from django.core.management.color import no_style
+
+    statements = connection.ops.sequence_reset_sql(no_style(), [Figure])
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def finish(counts):
+    """Applies the density deltas, rebuilds the viewport tiles and retires every cache of the written models."""
+    from ChronosAtlas.cache import bump_versions
+    from .graph import invalidate_graph
+
+    reset_sequences()
+    density.apply_counts(counts)
+    viewport.rebuild()
+    bump_versions('figures.figure', 'figures.field', 'timeline.timelineevent')
+    invalidate_graph()
+
+
+def generate(figures, events, influences_per_figure=3.0, seed=0, chunk_size=50000, use_copy=True):
+    """Writes a whole dataset from this process; returns the number of rows written."""
+    plan = make_plan(figures, events, influences_per_figure, seed, chunk_size)
+    counts, rows = Counter(), 0
+    tasks = [(write_figures, chunk) for chunk in plan.chunks(plan.figures)]
+    tasks += [(write_events, chunk) for chunk in plan.chunks(plan.events)]
+    tasks += [(write_influences, chunk) for chunk in plan.chunks(plan.figures)]
+    for write, chunk in tasks:
+        written, deltas = write(plan, chunk, use_copy)
+        rows += written
+        counts.update(deltas)
+    finish(counts)
+    return rows
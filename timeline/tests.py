@@ -1,4 +1,6 @@
-from django.test import TestCase
+import threading
+from unittest import mock
+from django.test import TestCase, TransactionTestCase, override_settings
 from .models import TimelineEvent, Influence
 from figures.models import Figure
 
@@ -42,3 +44,1021 @@ class InfluenceModelTest(TestCase):
     def test_influence_creation(self):
         self.assertEqual(self.influence.influencer.name, "Isaac Newton")
         self.assertEqual(self.influence.influenced.name, "Albert Einstein")
+
+class InfluenceGraphQLTest(TestCase):
+    def test_all_influences_batches_figures(self):
+        figures = [
+            Figure.objects.create(name=f"Figure {i}", slug=f"figure-{i}", wikidata_id=f"Q{i}")
+            for i in range(10)
+        ]
+        for influencer, influenced in zip(figures, figures[1:]):
+            Influence.objects.create(influencer=influencer, influenced=influenced)
+
+        with self.assertNumQueries(2):
+            response = self.client.post('/graphql/', {
+                'query': '{ allInfluences { influencer { name } influenced { name } } }'
+            }, content_type='application/json')
+        data = response.json()['data']['allInfluences']
+        self.assertEqual(len(data), 9)
+        self.assertEqual(data[0], {'influencer': {'name': "Figure 0"}, 'influenced': {'name': "Figure 1"}})
+
+class TimelineEventConnectionTest(TestCase):
+    def test_backward_pagination(self):
+        for year in [1969, 1066, 1492, 1066, 1789]:
+            TimelineEvent.objects.create(title=f"Event {year}", year=year, category="History")
+        query = """query($before: String) { timelineEventsConnection(last: 2, before: $before) {
+            edges { node { year } } pageInfo { hasPreviousPage startCursor } } }"""
+        years, before = [], None
+        while True:
+            response = self.client.post('/graphql/', {'query': query, 'variables': {'before': before}},
+                                        content_type='application/json')
+            data = response.json()['data']['timelineEventsConnection']
+            years = [edge['node']['year'] for edge in data['edges']] + years
+            if not data['pageInfo']['hasPreviousPage']:
+                break
+            before = data['pageInfo']['startCursor']
+        self.assertEqual(years, [1066, 1066, 1492, 1789, 1969])
+
+class InfluenceGraphTest(TestCase):
+    def setUp(self):
+        from .graph import invalidate_graph
+        invalidate_graph()
+        names = ["Plato", "Aristotle", "Leonardo", "Curie", "Einstein", "Chomsky"]
+        self.f = {
+            name: Figure.objects.create(name=name, slug=name.lower(), wikidata_id=f"Q-{name}")
+            for name in names
+        }
+        for influencer, influenced in [("Plato", "Aristotle"), ("Aristotle", "Leonardo"),
+                                       ("Leonardo", "Curie"), ("Curie", "Einstein"), ("Plato", "Einstein")]:
+            Influence.objects.create(influencer=self.f[influencer], influenced=self.f[influenced])
+
+    def names(self, depths):
+        by_id = {figure.pk: name for name, figure in self.f.items()}
+        return {by_id[pk]: depth for pk, depth in depths.items()}
+
+    def test_traversals(self):
+        from .graph import get_graph
+        graph = get_graph()
+        self.assertEqual(self.names(graph.descendants(self.f["Plato"].pk)),
+                         {"Aristotle": 1, "Einstein": 1, "Leonardo": 2, "Curie": 3})
+        self.assertEqual(self.names(graph.descendants(self.f["Plato"].pk, max_depth=1)),
+                         {"Aristotle": 1, "Einstein": 1})
+        self.assertEqual(self.names(graph.ancestors(self.f["Curie"].pk)),
+                         {"Leonardo": 1, "Aristotle": 2, "Plato": 3})
+        self.assertEqual(graph.descendants(self.f["Chomsky"].pk), {})
+
+    def test_incremental_updates_and_compaction(self):
+        from . import graph as graph_module
+        graph = graph_module.get_graph()
+        with self.captureOnCommitCallbacks(execute=True):
+            Influence.objects.create(influencer=self.f["Einstein"], influenced=self.f["Chomsky"])
+            Influence.objects.get(influencer=self.f["Plato"], influenced=self.f["Aristotle"]).delete()
+        self.assertIs(graph_module.get_graph(), graph)
+        self.assertEqual(self.names(graph.descendants(self.f["Plato"].pk)), {"Einstein": 1, "Chomsky": 2})
+        self.assertEqual(graph.edge_count, 5)
+
+        graph.compact()
+        self.assertEqual((graph.overlay_size, graph.removed), (0, set()))
+        self.assertEqual(self.names(graph.ancestors(self.f["Chomsky"].pk)),
+                         {"Einstein": 1, "Curie": 2, "Plato": 2, "Leonardo": 3, "Aristotle": 4})
+
+        # Updates move the edge in place; a save that changes nothing leaves the graph alone.
+        influence = Influence.objects.get(influencer=self.f["Curie"], influenced=self.f["Einstein"])
+        version = graph.version
+        with self.captureOnCommitCallbacks(execute=True):
+            influence.save()
+        self.assertEqual(graph.version, version)
+        influence.influenced = self.f["Chomsky"]
+        with self.captureOnCommitCallbacks(execute=True):
+            influence.save()
+        self.assertIs(graph_module.get_graph(), graph)
+        self.assertEqual(self.names(graph.descendants(self.f["Curie"].pk)), {"Chomsky": 1})
+        self.assertEqual(graph.edge_count, 5)
+
+    def test_reloads_after_a_change_made_by_another_process(self):
+        import tempfile
+        from django.core.cache.backends.filebased import FileBasedCache
+        from . import graph as graph_module
+        with tempfile.TemporaryDirectory() as tmpdir, override_settings(
+            CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'versions': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tmpdir},
+            },
+            RESPONSE_CACHE={'VERSION_CACHE': 'versions'},
+        ), mock.patch.object(graph_module, 'VERSION_CHECK_INTERVAL', 0), \
+                mock.patch.object(graph_module, 'reload_in_background', graph_module._reload):
+            graph = graph_module.get_graph()
+            self.assertEqual(graph.descendants(self.f["Einstein"].pk), {})
+            # A bulk load in another process: no signals here, only its bump of the shared version.
+            Influence.objects.bulk_create([Influence(influencer=self.f["Einstein"], influenced=self.f["Chomsky"])])
+            other_process = FileBasedCache(tmpdir, {})
+            other_process.add(graph_module.VERSION_CACHE_KEY, 0, timeout=None)
+            other_process.incr(graph_module.VERSION_CACHE_KEY)
+            # The old graph answers while the new one loads (here: synchronously, in place of the thread).
+            self.assertIs(graph_module.get_graph(), graph)
+            self.assertEqual(self.names(graph_module.get_graph().descendants(self.f["Einstein"].pk)), {"Chomsky": 1})
+
+    def test_lineage_endpoints(self):
+        from .graph import get_graph
+        get_graph()  # warm the per-process graph; lineage itself needs only the figure lookup
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/influences/lineage/', {
+                'figure': self.f["Einstein"].pk, 'direction': 'ancestors', 'max_depth': 2,
+            })
+        data = response.json()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual([(r['depth'], r['figure']['name']) for r in data['results']],
+                         [(1, "Plato"), (1, "Curie"), (2, "Leonardo")])
+        self.assertEqual(self.client.get('/api/influences/lineage/', {'figure': 'x'}).status_code, 400)
+
+        response = self.client.post('/graphql/', {'query': '{ influenceDescendants(figureId: %d, maxDepth: 2) '
+                                                           '{ depth figure { name } } }' % self.f["Plato"].pk},
+                                    content_type='application/json')
+        self.assertEqual(response.json()['data']['influenceDescendants'], [
+            {'depth': 1, 'figure': {'name': "Aristotle"}},
+            {'depth': 1, 'figure': {'name': "Einstein"}},
+            {'depth': 2, 'figure': {'name': "Leonardo"}},
+        ])
+
+class InfluencePathTest(TestCase):
+    def setUp(self):
+        from .graph import invalidate_graph
+        invalidate_graph()
+        names = ["Plato", "Aristotle", "Leonardo", "Curie", "Einstein", "Lovelace", "Chomsky"]
+        self.f = {
+            name: Figure.objects.create(name=name, slug=name.lower(), wikidata_id=f"Q-{name}")
+            for name in names
+        }
+        for influencer, influenced in [("Plato", "Aristotle"), ("Aristotle", "Leonardo"),
+                                       ("Leonardo", "Curie"), ("Curie", "Einstein"),
+                                       ("Aristotle", "Lovelace"), ("Lovelace", "Einstein"),
+                                       ("Plato", "Chomsky")]:
+            Influence.objects.create(influencer=self.f[influencer], influenced=self.f[influenced])
+        self.by_id = {figure.pk: name for name, figure in self.f.items()}
+
+    def chains(self, paths):
+        return [[self.by_id[pk] for pk in path] for path in paths]
+
+    def test_shortest_and_alternative_paths(self):
+        from .graph import get_graph
+        graph = get_graph()
+        paths, timed_out = graph.shortest_paths(self.f["Aristotle"].pk, self.f["Einstein"].pk, k=3)
+        self.assertFalse(timed_out)
+        self.assertEqual(self.chains(paths), [
+            ["Aristotle", "Lovelace", "Einstein"],
+            ["Aristotle", "Leonardo", "Curie", "Einstein"],
+        ])
+        self.assertEqual(graph.shortest_paths(self.f["Einstein"].pk, self.f["Plato"].pk), ([], False))
+        self.assertEqual(graph.shortest_paths(self.f["Aristotle"].pk, self.f["Einstein"].pk, max_hops=1), ([], False))
+
+        undirected, _ = graph.shortest_paths(self.f["Chomsky"].pk, self.f["Lovelace"].pk, directed=False)
+        self.assertEqual(self.chains(undirected), [["Chomsky", "Plato", "Aristotle", "Lovelace"]])
+
+    def test_time_budget(self):
+        from .graph import get_graph
+        paths, timed_out = get_graph().shortest_paths(self.f["Plato"].pk, self.f["Einstein"].pk, time_budget=-1)
+        self.assertEqual((paths, timed_out), ([], True))
+
+    def test_path_endpoints(self):
+        response = self.client.get('/api/influences/path/', {
+            'source': self.f["Plato"].pk, 'target': self.f["Einstein"].pk, 'k': 2,
+        })
+        data = response.json()
+        self.assertEqual([p['hops'] for p in data['paths']], [3, 4])
+        self.assertEqual([f['name'] for f in data['paths'][0]['figures']], ["Plato", "Aristotle", "Lovelace", "Einstein"])
+        self.assertEqual(self.client.get('/api/influences/path/', {'source': 1}).status_code, 400)
+
+        query = '{ influencePaths(sourceId: %d, targetId: %d) { timedOut paths { hops figures { name } } } }' % (
+            self.f["Plato"].pk, self.f["Curie"].pk)
+        response = self.client.post('/graphql/', {'query': query}, content_type='application/json')
+        self.assertEqual(response.json()['data']['influencePaths'], {
+            'timedOut': False,
+            'paths': [{'hops': 3, 'figures': [{'name': n} for n in ["Plato", "Aristotle", "Leonardo", "Curie"]]}],
+        })
+
+class TimelineDensityTest(TestCase):
+    def setUp(self):
+        from figures.models import Field
+        self.philosophy = Field.objects.create(name="Philosophy")
+        self.plato = Figure.objects.create(name="Plato", slug="plato", wikidata_id="Q859",
+                                           normalized_birth_year=-428, normalized_death_year=-348)
+        self.plato.fields.add(self.philosophy)
+        self.aristotle = Figure.objects.create(name="Aristotle", slug="aristotle", wikidata_id="Q868",
+                                               normalized_birth_year=-384, normalized_death_year=-322)
+        TimelineEvent.objects.create(title="Academy founded", year=-387, category="Education")
+        TimelineEvent.objects.create(title="Battle of Chaeronea", year=-338, category="War")
+
+    def counts(self, kind, bucket_size, start, end, dimension=''):
+        from .density import histogram
+        return [(b['start_year'], b['count']) for b in histogram(kind, bucket_size, start, end, dimension)]
+
+    def test_incremental_maintenance_matches_rebuild(self):
+        self.assertEqual(self.counts('figures', 100, -500, -201), [(-500, 1), (-400, 2), (-300, 0)])
+        self.assertEqual(self.counts('figures', 10, -360, -321, self.philosophy.pk),
+                         [(-360, 1), (-350, 1), (-340, 0), (-330, 0)])
+        self.assertEqual(self.counts('events', 100, -400, -301), [(-400, 2)])
+        self.assertEqual(self.counts('events', 100, -400, -301, 'War'), [(-400, 1)])
+
+        self.aristotle.fields.add(self.philosophy)
+        self.plato.normalized_death_year = -400
+        self.plato.save()
+        TimelineEvent.objects.filter(category="War").get().delete()
+        self.assertEqual(self.counts('figures', 100, -500, -301, self.philosophy.pk), [(-500, 1), (-400, 2)])
+        self.assertEqual(self.counts('figures', 10, -360, -351), [(-360, 1)])
+        self.assertEqual(self.counts('events', 1000, -1000, -1), [(-1000, 1)])
+
+        from .density import rebuild
+        from .models import DensityBucket
+        before = set(DensityBucket.objects.exclude(count=0).values_list('kind', 'resolution', 'dimension', 'start_year', 'count'))
+        rebuild()
+        after = set(DensityBucket.objects.values_list('kind', 'resolution', 'dimension', 'start_year', 'count'))
+        self.assertEqual(before, after)
+
+    def test_living_figures_do_not_drift_with_the_clock(self):
+        from datetime import datetime, timezone as dt_timezone
+        from .density import rebuild
+        from .models import DensityBucket
+
+        def at_year(year):
+            return mock.patch('django.utils.timezone.now', return_value=datetime(year, 6, 1, tzinfo=dt_timezone.utc))
+
+        with at_year(2020):
+            chomsky = Figure.objects.create(name="Noam Chomsky", slug="chomsky", wikidata_id="Q9049",
+                                            normalized_birth_year=1928)
+            self.assertEqual(self.counts('figures', 10, 2010, 2049), [(2010, 1), (2020, 1), (2030, 0), (2040, 0)])
+        with at_year(2035):
+            self.assertEqual(self.counts('figures', 10, 2010, 2049), [(2010, 1), (2020, 1), (2030, 1), (2040, 0)])
+            before = set(DensityBucket.objects.exclude(count=0).values_list(
+                'kind', 'resolution', 'dimension', 'start_year', 'count'))
+            rebuild()
+            self.assertEqual(before, set(DensityBucket.objects.values_list(
+                'kind', 'resolution', 'dimension', 'start_year', 'count')))
+            chomsky.delete()
+        self.assertFalse(DensityBucket.objects.filter(start_year__gte=1000).exclude(count=0).exists())
+        self.assertFalse(DensityBucket.objects.filter(count__lt=0).exists())
+
+    def test_density_endpoints(self):
+        response = self.client.get('/api/timeline/density/', {
+            'kind': 'figures', 'bucket_size': 100, 'start': -450, 'end': -350,
+        })
+        self.assertEqual(response.json()['buckets'], [
+            {'start_year': -500, 'end_year': -401, 'count': 1},
+            {'start_year': -400, 'end_year': -301, 'count': 2},
+        ])
+        self.assertEqual(self.client.get('/api/timeline/density/', {
+            'bucket_size': 7, 'start': 0, 'end': 10}).status_code, 400)
+
+        query = '{ timelineDensity(kind: EVENTS, startYear: -400, endYear: -301, category: "Education") { startYear count } }'
+        response = self.client.post('/graphql/', {'query': query}, content_type='application/json')
+        self.assertEqual(response.json()['data']['timelineDensity'], [{'startYear': -400, 'count': 1}])
+
+class TimelineViewportTest(TestCase):
+    """The coarse tiles are updated on commit, hence captureOnCommitCallbacks(execute=True)."""
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.figures = [
+                Figure.objects.create(name=name, slug=name.lower(), wikidata_id=f"Q{i}", normalized_birth_year=year)
+                for i, (name, year) in enumerate([("Socrates", -470), ("Plato", -428), ("Aristotle", -384)], 1)
+            ]
+            Influence.objects.create(influencer=self.figures[0], influenced=self.figures[1])
+            Influence.objects.create(influencer=self.figures[1], influenced=self.figures[2])
+            for i in range(12):
+                TimelineEvent.objects.create(title=f"Event {i}", year=-400 + i, category="Misc", importance=i % 5)
+
+    def tiles(self):
+        from .models import ViewportTile
+        return {
+            (t.kind, t.resolution, t.start_year): (t.count, t.top)
+            for t in ViewportTile.objects.exclude(count=0)
+        }
+
+    @mock.patch('timeline.viewport.MAX_PER_BUCKET', 2)
+    @mock.patch('timeline.viewport.CAPACITY', 3)
+    def test_incremental_maintenance_matches_rebuild(self):
+        import random
+        from .viewport import rebuild
+
+        rng = random.Random(7)
+        events = list(TimelineEvent.objects.all())
+        with self.captureOnCommitCallbacks(execute=True):
+            for event in events[:6]:
+                event.importance = rng.randrange(10)
+                event.year = rng.randrange(-420, -380)
+                event.save()
+            for event in events[6:9]:
+                event.delete()
+            TimelineEvent.objects.create(title="Late", year=-381, category="Misc", importance=9)
+            Influence.objects.create(influencer=self.figures[2], influenced=self.figures[0])
+            Influence.objects.get(influencer=self.figures[0], influenced=self.figures[1]).delete()
+            self.figures[1].normalized_birth_year = -399
+            self.figures[1].save()
+        self.assert_matches_rebuild()
+
+    def assert_matches_rebuild(self):
+        from .viewport import rebuild
+        incremental = self.tiles()
+        rebuild()
+        rebuilt = self.tiles()
+        self.assertEqual(incremental.keys(), rebuilt.keys())
+        for key, (count, top) in incremental.items():
+            # Each tile lists a prefix of the true ranking, long enough to serve a response.
+            self.assertEqual(count, rebuilt[key][0], key)
+            self.assertEqual(top, rebuilt[key][1][:len(top)], key)
+            self.assertGreaterEqual(len(top), min(2, count), key)
+
+    def test_event_update_reads_the_stored_row_once(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        event = TimelineEvent.objects.get(title="Event 0")
+        event.year, event.importance = -390, 4
+        with CaptureQueriesContext(connection) as queries:
+            event.save()
+        reads = [q['sql'] for q in queries.captured_queries
+                 if q['sql'].startswith('SELECT') and f'"timeline_timelineevent"."id" = {event.pk}' in q['sql']]
+        self.assertEqual(len(reads), 1)
+
+    def test_coarse_tiles_follow_writers_committing_out_of_order(self):
+        from .models import ViewportTile
+
+        def coarse_count():
+            return ViewportTile.objects.get(kind='events', resolution=500, start_year=-500).count
+
+        event = TimelineEvent.objects.get(title="Event 0")
+        # Writer A raises the event's importance; inside its transaction only the fine tiles change.
+        with self.captureOnCommitCallbacks() as first:
+            event.importance = 9
+            event.save()
+            TimelineEvent.objects.create(title="Early", year=-450, category="Misc", importance=7)
+        self.assertEqual(coarse_count(), 12)
+        self.assertEqual(self.tiles()['events', 100, -500][0], 1)
+        # Writer B commits and applies its coarse update before A's: it moves the event on.
+        with self.captureOnCommitCallbacks(execute=True):
+            event.year = -2000
+            event.importance = 1
+            event.save()
+        for callback in first:
+            callback()
+        self.assertEqual(coarse_count(), 12)
+        self.assertNotIn(event.pk, [pk for _, pk in self.tiles()['events', 500, -500][1]])
+        self.assert_matches_rebuild()
+
+    def test_viewport_endpoints(self):
+        response = self.client.get('/api/timeline/viewport/', {'start': -500, 'end': -301, 'width': 400})
+        data = response.json()
+        self.assertEqual(data['bucket_size'], 50)
+        self.assertEqual([b['start_year'] for b in data['buckets']], [-500, -450, -400, -350])
+        self.assertEqual([f['name'] for f in data['buckets'][0]['figures']['items']], ["Socrates"])
+        self.assertEqual(data['buckets'][1]['figures']['items'][0]['importance'], 2)
+        bucket = data['buckets'][2]
+        self.assertEqual([f['name'] for f in bucket['figures']['items']], ["Aristotle"])
+        self.assertEqual(bucket['events']['count'], 12)
+        self.assertEqual(len(bucket['events']['items']), 5)
+        self.assertEqual(bucket['events']['clustered'], 7)
+        self.assertEqual([e['importance'] for e in bucket['events']['items']], [4, 4, 3, 3, 2])
+        self.assertEqual(self.client.get('/api/timeline/viewport/', {
+            'start': -500, 'end': 2000, 'width': 0}).status_code, 400)
+        self.assertEqual(self.client.get('/api/timeline/viewport/', {
+            'start': -500000, 'end': 2000, 'width': 100}).status_code, 400)
+
+        query = '''{ timelineViewport(startYear: -400, endYear: -391, width: 400, kinds: [FIGURES], perBucket: 1) {
+            bucketSize buckets { startYear figures { count clustered items { name } } events { count } } } }'''
+        response = self.client.post('/graphql/', {'query': query}, content_type='application/json')
+        data = response.json()['data']['timelineViewport']
+        self.assertEqual(data['bucketSize'], 1)
+        self.assertEqual(len(data['buckets']), 10)
+        self.assertEqual(data['buckets'][0]['figures'], {'count': 0, 'clustered': 0, 'items': []})
+        self.assertIsNone(data['buckets'][0]['events'])
+
+class TimelineEventBatchTest(TestCase):
+    def test_create_timeline_events_batch(self):
+        query = """
+            mutation($inputs: [TimelineEventInput!]!) {
+                createTimelineEvents(inputs: $inputs) { timelineEvents { id title } errors { index field } }
+            }
+        """
+        inputs = [
+            {"title": "Academy founded", "year": -387, "category": "Education"},
+            {"title": "", "year": -338, "category": "War"},
+            {"title": "Lyceum founded", "year": -335, "category": "Education"},
+        ]
+        response = self.client.post('/graphql/', {'query': query, 'variables': {'inputs': inputs}},
+                                    content_type='application/json')
+        data = response.json()['data']['createTimelineEvents']
+        self.assertEqual([e and e['title'] for e in data['timelineEvents']],
+                         ['Academy founded', None, 'Lyceum founded'])
+        self.assertEqual(data['errors'], [{'index': 1, 'field': 'title'}])
+
+        from .density import histogram
+        self.assertEqual([b['count'] for b in histogram('events', 100, -400, -301, 'Education')], [2])
+
+    def test_bulk_endpoint(self):
+        response = self.client.post('/api/timeline/bulk/', [
+            {"title": "Moon Landing", "year": 1969, "category": "Space"},
+            {"title": "Sputnik", "year": 1957, "category": "Space"},
+        ], content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([r['title'] for r in response.json()['results']], ['Moon Landing', 'Sputnik'])
+        self.assertEqual(response.json()['errors'], [])
+
+class ResponseCacheTest(TransactionTestCase):
+    """Writes must commit for the version bumps to run, hence TransactionTestCase."""
+
+    def setUp(self):
+        from ChronosAtlas.cache import get_response_cache
+        get_response_cache().clear()
+        TimelineEvent.objects.create(title="Moon Landing", year=1969, category="Space")
+
+    def graphql(self, query):
+        return self.client.post('/graphql/', {'query': query}, content_type='application/json')
+
+    def test_rest_reads_are_served_from_cache_until_a_relevant_write(self):
+        self.assertEqual(self.client.get('/api/timeline/')['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/timeline/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(len(response.json()['results']), 1)
+
+        # Figures are not part of the event list, so its entry survives.
+        Figure.objects.create(name="Yuri Gagarin", slug="gagarin", wikidata_id="Q7327")
+        self.assertEqual(self.client.get('/api/timeline/')['X-Cache'], 'HIT')
+
+        TimelineEvent.objects.create(title="Sputnik", year=1957, category="Space")
+        response = self.client.get('/api/timeline/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual([e['title'] for e in response.json()['results']], ['Sputnik', 'Moon Landing'])
+        self.assertNotEqual(self.client.get('/api/timeline/?page_size=1')['X-Cache'], 'HIT')
+
+    def test_graphql_queries_are_keyed_on_normalized_text(self):
+        self.assertEqual(self.graphql('{ allTimelineEvents { title } }')['X-Cache'], 'MISS')
+        response = self.graphql('query {\n  allTimelineEvents {\n    title\n  }\n}')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.json(), {'data': {'allTimelineEvents': [{'title': 'Moon Landing'}]}})
+
+        self.graphql('{ figures { name fields { name } } }')
+        figure = Figure.objects.create(name="Yuri Gagarin", slug="gagarin", wikidata_id="Q7327")
+        self.assertEqual(self.graphql('{ allTimelineEvents { title } }')['X-Cache'], 'HIT')
+        self.assertEqual(self.graphql('{ figures { name fields { name } } }')['X-Cache'], 'MISS')
+
+        from figures.models import Field
+        figure.fields.add(Field.objects.create(name="Spaceflight"))
+        response = self.graphql('{ figures { name fields { name } } }')
+        self.assertEqual(response.json()['data']['figures'][0]['fields'], [{'name': 'Spaceflight'}])
+
+    def test_rest_entries_are_keyed_on_host_and_scheme(self):
+        TimelineEvent.objects.create(title="Sputnik", year=1957, category="Space")
+        url = '/api/timeline/?page_size=1'
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        response = self.client.get(url, HTTP_HOST='localhost')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertTrue(response.json()['next'].startswith('http://localhost/'))
+        response = self.client.get(url, HTTP_HOST='localhost', secure=True)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertTrue(response.json()['next'].startswith('https://localhost/'))
+        self.assertEqual(self.client.get(url, HTTP_HOST='localhost')['X-Cache'], 'HIT')
+
+    def test_versions_bumped_by_another_process_invalidate_entries(self):
+        import tempfile
+        from django.core.cache.backends.filebased import FileBasedCache
+        from ChronosAtlas.cache import _version_key
+        with tempfile.TemporaryDirectory() as tmpdir, override_settings(
+            CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'versions': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tmpdir},
+            },
+            RESPONSE_CACHE={'VERSION_CACHE': 'versions'},
+        ):
+            self.assertEqual(self.client.get('/api/timeline/')['X-Cache'], 'MISS')
+            self.assertEqual(self.client.get('/api/timeline/')['X-Cache'], 'HIT')
+            # Another worker, or a management command, bumping through its own instance.
+            FileBasedCache(tmpdir, {}).incr(_version_key('timeline.timelineevent'))
+            self.assertEqual(self.client.get('/api/timeline/')['X-Cache'], 'MISS')
+
+    def test_graph_answers_lagging_a_foreign_write_are_not_cached(self):
+        import tempfile
+        from django.core.cache.backends.filebased import FileBasedCache
+        from ChronosAtlas.cache import _version_key
+        from . import graph as graph_module
+        plato = Figure.objects.create(name="Plato", slug="plato", wikidata_id="Q859")
+        aristotle = Figure.objects.create(name="Aristotle", slug="aristotle", wikidata_id="Q868")
+        url = f'/api/influences/lineage/?figure={plato.pk}'
+        with tempfile.TemporaryDirectory() as tmpdir, override_settings(
+            CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'versions': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tmpdir},
+            },
+            RESPONSE_CACHE={'VERSION_CACHE': 'versions'},
+        ), mock.patch.object(graph_module, 'VERSION_CHECK_INTERVAL', 3600):
+            graph_module.invalidate_graph()
+            self.assertEqual(self.client.get(url).json()['count'], 0)
+            # Another process writes an edge and bumps the graph and response versions.
+            Influence.objects.bulk_create([Influence(influencer=plato, influenced=aristotle)])
+            other_process = FileBasedCache(tmpdir, {})
+            other_process.incr(graph_module.VERSION_CACHE_KEY)
+            other_process.incr(_version_key('timeline.influence'))
+            # Within the check interval the old graph answers, but that answer is not stored.
+            response = self.client.get(url)
+            self.assertEqual((response['X-Cache'], response.json()['count']), ('MISS', 0))
+            with mock.patch.object(graph_module, 'VERSION_CHECK_INTERVAL', 0), \
+                    mock.patch.object(graph_module, 'reload_in_background', graph_module._reload):
+                self.assertEqual(self.client.get(url).json()['count'], 0)  # starts the reload
+                response = self.client.get(url)
+                self.assertEqual((response['X-Cache'], response.json()['count']), ('MISS', 1))
+                self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+    def test_per_process_version_cache_is_refused_with_several_processes(self):
+        from ChronosAtlas.cache import check_version_store
+        self.assertEqual(check_version_store(None), [])
+        with override_settings(SERVER_PROCESSES=4):
+            [error] = check_version_store(None)
+            self.assertEqual(error.id, 'ChronosAtlas.E001')
+            with override_settings(RESPONSE_CACHE={'ENABLED': False}):
+                self.assertEqual(check_version_store(None), [])
+
+    def test_mutations_and_errors_are_not_cached(self):
+        mutation = 'mutation { createTimelineEvent(input: {title: "Sputnik", year: 1957, category: "Space"}) { timelineEvent { id } } }'
+        self.assertNotIn('X-Cache', self.graphql(mutation))
+        self.assertNotIn('X-Cache', self.graphql(mutation))
+        self.assertEqual(TimelineEvent.objects.count(), 3)
+
+        failing = '{ timelineDensity(kind: EVENTS, startYear: 0, endYear: 10, bucketSize: 7) { count } }'
+        self.graphql(failing)
+        response = self.graphql(failing)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn('errors', response.json())
+
+class FullTextSearchTest(TestCase):
+    def setUp(self):
+        self.plato = Figure.objects.create(name="Plato", slug="plato", wikidata_id="Q859",
+                                           summary="Athenian philosopher who founded the Academy.")
+        Figure.objects.create(name="Aristotle", slug="aristotle", wikidata_id="Q868",
+                              summary="Philosopher & polymath, student of <Plato>.")
+        self.academy = TimelineEvent.objects.create(title="Academy founded", year=-387, category="Education",
+                                                    description="Plato opens his school in Athens.")
+        TimelineEvent.objects.create(title="Moon Landing", year=1969, category="Space")
+
+    def test_search_query_ranks_and_highlights(self):
+        query = '{ search(query: "plato") { kind snippet figure { name } timelineEvent { title } } }'
+        response = self.client.post('/graphql/', {'query': query}, content_type='application/json')
+        hits = response.json()['data']['search']
+        # A match in the name outranks matches in longer text.
+        self.assertEqual(hits[0]['kind'], 'FIGURE')
+        self.assertEqual(hits[0]['figure'], {'name': 'Plato'})
+        self.assertEqual(len(hits), 3)
+        aristotle = next(hit for hit in hits if hit['figure'] == {'name': 'Aristotle'})
+        self.assertIn('&lt;<mark>Plato</mark>&gt;', aristotle['snippet'])
+        event = next(hit for hit in hits if hit['kind'] == 'TIMELINE_EVENT')
+        self.assertEqual(event['timelineEvent'], {'title': 'Academy founded'})
+
+        query = '{ search(query: "philosophers", kinds: [FIGURE]) { figure { name } } }'
+        response = self.client.post('/graphql/', {'query': query}, content_type='application/json')
+        self.assertEqual(len(response.json()['data']['search']), 2)
+
+    def test_search_index_follows_writes(self):
+        self.plato.summary = "Author of the Republic."
+        self.plato.save()
+        self.assertEqual(list(Figure.objects.search('academy')), [])
+        self.assertEqual(list(Figure.objects.search('republic')), [self.plato])
+        self.academy.delete()
+        self.assertEqual(list(TimelineEvent.objects.search('athens')), [])
+        self.assertEqual(list(Figure.objects.search('"OR" )')), [])
+
+    def test_q_filter_on_viewsets(self):
+        response = self.client.get('/api/figures/', {'q': 'polymath'})
+        self.assertEqual([f['name'] for f in response.json()['results']], ['Aristotle'])
+        response = self.client.get('/api/timeline/', {'q': 'moon'})
+        self.assertEqual([e['title'] for e in response.json()['results']], ['Moon Landing'])
+
+@override_settings(ROOT_URLCONF='ChronosAtlas.urls_asgi')
+class AsyncReadPathTest(TransactionTestCase):
+    """The ASGI URLconf; the read pool's connections only see committed rows."""
+
+    async def test_reads_run_on_the_read_pool(self):
+        await TimelineEvent.objects.acreate(title="Academy founded", year=-387, category="Education")
+
+        response = await self.async_client.get('/api/timeline/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([e['title'] for e in response.json()['results']], ["Academy founded"])
+        # Queries on the read pool's threads count towards the request.
+        self.assertNotIn('desc="0 queries"', response['Server-Timing'])
+
+        response = await self.async_client.post(
+            '/graphql/', {'query': '{ allTimelineEvents { title } }'}, content_type='application/json'
+        )
+        self.assertEqual(response.json()['data']['allTimelineEvents'], [{'title': "Academy founded"}])
+        self.assertTrue(any(t.name.startswith('read') for t in threading.enumerate()))
+
+        # Writes go through the same wrapped routes.
+        response = await self.async_client.post(
+            '/api/timeline/', {'title': "Lyceum founded", 'year': -335, 'category': "Education"},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(await TimelineEvent.objects.acount(), 2)
+
+        # Exports stream from a thread of their own instead of being read whole first.
+        response = await self.async_client.get('/api/export/events/')
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(body.count(b'\n'), 2)
+
+class GraphQLLimitsTest(TestCase):
+    def setUp(self):
+        plato = Figure.objects.create(name="Plato", slug="plato", wikidata_id="Q859")
+        aristotle = Figure.objects.create(name="Aristotle", slug="aristotle", wikidata_id="Q868")
+        Influence.objects.create(influencer=plato, influenced=aristotle)
+
+    def query(self, query, variables=None, **extra):
+        return self.client.post('/graphql/', {'query': query, 'variables': variables or {}},
+                                content_type='application/json', **extra)
+
+    def test_depth_and_cost_limits(self):
+        deep = '{ figures { influencesGiven { influenced { influencesGiven { influenced { name } } } } } }'
+        connection = 'query ($n: Int) { figuresConnection(first: $n) { edges { node { name fields { name } } } } }'
+        with self.settings(GRAPHQL_LIMITS={'MAX_DEPTH': 5, 'MAX_COST': 200}):
+            self.assertEqual(self.query(deep.replace('influencesGiven { influenced { name } }', 'name')).status_code, 200)
+            response = self.query(deep)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['errors'][0]['extensions']['code'], 'QUERY_TOO_DEEP')
+
+            # connection + edges + node x n + fields x n
+            self.assertEqual(self.query(connection, {'n': 5}).status_code, 200)
+            error = self.query(connection, {'n': 100}).json()['errors'][0]
+            self.assertEqual(error['extensions'], {'code': 'QUERY_TOO_COSTLY', 'cost': 202, 'maxCost': 200})
+
+        from graphql import get_introspection_query
+        self.assertNotIn('errors', self.query(get_introspection_query()).json())
+
+    def test_repeated_fragment_spreads_are_analysed_once(self):
+        from graphql import parse
+        from ChronosAtlas.query_cost import CostAnalysis, check_limits
+        from ChronosAtlas.schema import schema
+        # Each level spreads the next twice: 2**22 copies of `fields` once expanded.
+        levels = 22
+        query = '{ figures { ...F0 } } ' + ' '.join(
+            f'fragment F{i} on FigureType {{ ...F{i + 1} ...F{i + 1} }}' for i in range(levels)
+        ) + f' fragment F{levels} on FigureType {{ fields {{ name }} }}'
+        field = CostAnalysis.field
+        with self.settings(GRAPHQL_LIMITS={'LIST_SIZES': {'Query.figures': 1}}), \
+                mock.patch.object(CostAnalysis, 'field', autospec=True, side_effect=field) as analysed:
+            [error] = check_limits(schema.graphql_schema, parse(query))
+        self.assertEqual(error.extensions['cost'], 1 + 2 ** levels)
+        self.assertLess(analysed.call_count, 10)
+
+    def test_timeout_and_resolver_timing(self):
+        query = '{ figures { name influencesGiven { influenced { name } } } }'
+        with self.assertLogs('ChronosAtlas.graphql_middleware', 'INFO') as logs:
+            response = self.query(query, HTTP_X_GRAPHQL_TIMING='1')
+        timing = response.json()['extensions']['timing']
+        resolvers = {r['field']: r for r in timing['resolvers']}
+        self.assertEqual(resolvers['Query.figures']['calls'], 1)
+        self.assertEqual(resolvers['FigureType.influencesGiven']['calls'], 2)
+        self.assertGreaterEqual(timing['sqlQueries'], 2)
+        self.assertIn('Query.figures=', logs.output[0])
+        self.assertNotIn('extensions', self.query(query).json())
+
+        with self.settings(GRAPHQL_LIMITS={'TIMEOUT': 1e-9}):
+            response = self.query(query)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'errors': [{'message': "Query exceeded the 1e-09s time limit."}]})
+
+
+class SyntheticDataCommandTest(TestCase):
+    def test_generates_time_consistent_data(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from django.db.models import F
+        from .density import histogram
+
+        call_command('generate_synthetic_data', figures=300, events=200, chunk_size=100, workers=1,
+                     stdout=StringIO())
+        self.assertEqual(Figure.objects.count(), 300)
+        self.assertEqual(TimelineEvent.objects.count(), 200)
+        self.assertGreater(Influence.objects.count(), 300)
+        self.assertFalse(Influence.objects.filter(
+            influencer__normalized_birth_year__gt=F('influenced__normalized_birth_year')
+        ).exists())
+        self.assertLess(Figure.objects.order_by('normalized_birth_year').first().normalized_birth_year, 0)
+        self.assertEqual(Figure.objects.instance_of(['Q5']).count(), 300)
+        self.assertEqual(Figure.objects.filter(fields=None).count(), 0)
+        # Density deltas collected by the workers match the generated lifespans.
+        alive = Figure.objects.alive_between(1000, 1999).count()
+        self.assertGreater(alive, 0)
+        self.assertEqual(histogram('figures', 1000, 1000, 1999)[0]['count'], alive)
+
+    def test_rows_depend_only_on_seed_and_chunk(self):
+        from .synthetic import Plan, figure_rows, influence_rows
+
+        plan, other = Plan(1000, 0, seed=7, chunk_size=100), Plan(1000, 0, seed=7, chunk_size=100)
+        self.assertEqual(figure_rows(plan, 3), figure_rows(other, 3))
+        self.assertEqual(influence_rows(plan, 3), influence_rows(other, 3))
+        self.assertNotEqual(figure_rows(plan, 3), figure_rows(Plan(1000, 0, seed=8, chunk_size=100), 3))
+        ids = {plan.figure_id(rank) for rank in range(1000)}
+        self.assertEqual(ids, set(range(1, 1001)))
+
+
+class InfluenceMetricsTest(TestCase):
+    def setUp(self):
+        from .graph import invalidate_graph
+        invalidate_graph()
+        self.figures = {
+            name: Figure.objects.create(name=name, slug=name.lower(), wikidata_id=f"Q{i}", normalized_birth_year=i)
+            for i, name in enumerate(["Thales", "Anaximander", "Anaximenes", "Heraclitus", "Parmenides"], 1)
+        }
+        # Thales -> Anaximander -> Anaximenes -> Heraclitus, plus Thales -> Anaximenes.
+        for source, target in [("Thales", "Anaximander"), ("Anaximander", "Anaximenes"),
+                               ("Anaximenes", "Heraclitus"), ("Thales", "Anaximenes")]:
+            self.link(source, target)
+
+    def link(self, source, target):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Influence.objects.create(influencer=self.figures[source], influenced=self.figures[target])
+
+    def metrics(self, name):
+        from .models import InfluenceMetrics
+        return InfluenceMetrics.objects.get(figure=self.figures[name])
+
+    def refresh(self, *args):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('refresh_influence_metrics', *args, stdout=out)
+        return out.getvalue()
+
+    def test_degrees_follow_writes_and_refresh_computes_the_rest(self):
+        from . import centrality
+
+        anaximenes = self.metrics("Anaximenes")
+        self.assertEqual((anaximenes.in_degree, anaximenes.out_degree, anaximenes.pagerank), (2, 1, 0))
+        self.assertTrue(centrality.is_stale())
+        self.assertIn('4 figures', self.refresh())
+        self.assertFalse(centrality.is_stale())
+        self.assertEqual(self.refresh('--if-stale'), '')
+
+        self.assertEqual(self.metrics("Thales").reach, 3)
+        self.assertEqual(self.metrics("Anaximenes").reach, 1)
+        ranks = {name: self.metrics(name).pagerank for name in ["Thales", "Anaximander", "Anaximenes", "Heraclitus"]}
+        self.assertAlmostEqual(sum(ranks.values()), 1)
+        self.assertEqual(max(ranks, key=ranks.get), "Heraclitus")
+        self.assertFalse(Figure.objects.filter(name="Parmenides", influence_metrics__isnull=False).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Influence.objects.get(influencer=self.figures["Thales"], influenced=self.figures["Anaximenes"]).delete()
+        self.assertEqual(self.metrics("Anaximenes").in_degree, 1)
+        self.assertEqual(self.metrics("Thales").out_degree, 1)
+        self.assertTrue(centrality.is_stale())
+
+    def test_staleness_is_shared_through_the_database(self):
+        from django.core.cache import cache
+        from . import centrality
+        self.refresh()
+        cache.clear()   # another process's cache knows nothing about this run
+        self.assertFalse(centrality.is_stale())
+        # A write made by another process, without this one's signals.
+        Influence.objects.bulk_create([Influence(influencer=self.figures["Heraclitus"],
+                                                 influenced=self.figures["Parmenides"])])
+        self.assertTrue(centrality.is_stale())
+        self.assertIn('5 figures', self.refresh('--if-stale'))
+        self.assertFalse(centrality.is_stale())
+
+    def test_reach_sketches_agree(self):
+        from array import array
+        from .centrality import HyperLogLogSketch, reach
+        from .graph import InfluenceGraph
+
+        # A binary tree: figure n influences 2n and 2n + 1.
+        sources = array('q', [n // 2 for n in range(2, 4096)])
+        graph = InfluenceGraph(sources, array('q', range(2, 4096)))
+        nodes = list(range(1, 4096))
+        exact = reach(graph, nodes, hops=6)
+        self.assertEqual(exact[1], 2 + 4 + 8 + 16 + 32 + 64)
+        with mock.patch('timeline.centrality.EXACT_REACH_LIMIT', 0):
+            approximate = reach(graph, nodes, hops=6)
+        self.assertLess(abs(approximate[1] - exact[1]) / exact[1], 0.4)
+        self.assertEqual(approximate[4095], 0)
+        self.assertIsInstance(HyperLogLogSketch(nodes).unit[1], int)
+
+    def test_rest_and_graphql_sort_and_filter(self):
+        self.refresh()
+        response = self.client.get('/api/figures/?ordering=-reach&fields=name,influence_metrics')
+        results = response.json()['results']
+        self.assertEqual([r['name'] for r in results], ["Thales", "Anaximander", "Anaximenes", "Heraclitus"])
+        self.assertEqual(results[0]['influence_metrics']['reach'], 3)
+        page = self.client.get('/api/figures/?ordering=-pagerank&page_size=2').json()
+        self.assertEqual(page['results'][0]['name'], "Heraclitus")
+        rest = self.client.get(page['next']).json()['results']
+        self.assertEqual(len(page['results']) + len(rest), 4)
+        self.assertEqual(
+            [r['name'] for r in self.client.get('/api/figures/?min_in_degree=2').json()['results']], ["Anaximenes"]
+        )
+        self.assertEqual(self.client.get('/api/figures/?ordering=fame').status_code, 400)
+        self.assertEqual(self.client.get('/api/figures/?min_reach=many').status_code, 400)
+
+        query = '''{
+          figures(orderBy: OUT_DEGREE, metrics: {minOutDegree: 1}) { name influenceMetrics { outDegree } }
+          figuresConnection(orderBy: REACH, first: 1) { edges { node { name } } pageInfo { endCursor } }
+          plain: figures { name influenceMetrics { reach } }
+        }'''
+        response = self.client.post('/graphql/', {'query': query}, content_type='application/json')
+        data = response.json()['data']
+        self.assertEqual([f['name'] for f in data['figures']], ["Thales", "Anaximander", "Anaximenes"])
+        self.assertEqual(data['figures'][0]['influenceMetrics'], {'outDegree': 2})
+        self.assertEqual(data['figuresConnection']['edges'], [{'node': {'name': "Thales"}}])
+        # The default ordering still lists figures without metrics.
+        plain = {f['name']: f['influenceMetrics'] for f in data['plain']}
+        self.assertEqual(len(plain), 5)
+        self.assertEqual(plain["Thales"], {'reach': 3})
+        self.assertIsNone(plain["Parmenides"])
+
+class DataExportTest(TestCase):
+    def setUp(self):
+        from figures.models import Field
+        science = Field.objects.create(name="Science")
+        self.thales = Figure.objects.create(name="Thales", slug="thales", wikidata_id="Q35497",
+                                            normalized_birth_year=-624, instance_of_QIDs=["Q5"])
+        self.anaximander = Figure.objects.create(name="Anaximander", slug="anaximander", wikidata_id="Q173314",
+                                                 normalized_birth_year=-610)
+        self.thales.fields.add(science)
+        Influence.objects.create(influencer=self.thales, influenced=self.anaximander)
+        TimelineEvent.objects.create(title="Eclipse of Thales", year=-585, category="Science")
+
+    def lines(self, response):
+        import json
+        return [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+    def test_streams_ndjson_columns_and_gzip(self):
+        import gzip
+        import json
+        from ChronosAtlas import export
+        with mock.patch.object(export, 'BLOCK_ROWS', 1):
+            response = self.client.get('/api/export/figures/')
+            self.assertTrue(response.streaming)
+            chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), 2)
+        rows = [json.loads(chunk) for chunk in chunks]
+        self.assertEqual([(r['name'], r['instance_of_QIDs']) for r in rows], [("Thales", ["Q5"]), ("Anaximander", [])])
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertIn('X-Export-Watermark', response)
+
+        header, block = self.lines(self.client.get('/api/export/influences/', {'format': 'columns'}))
+        self.assertEqual(header['columns'], ['id', 'influencer_id', 'influenced_id', 'updated_at'])
+        self.assertEqual(block[1:3], [[self.thales.pk], [self.anaximander.pk]])
+
+        response = self.client.get('/api/export/events/', {'compression': 'gzip'})
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="events.ndjson.gz"')
+        event = json.loads(gzip.decompress(b''.join(response.streaming_content)))
+        self.assertEqual((event['title'], event['year']), ("Eclipse of Thales", -585))
+
+        self.assertEqual(self.client.get('/api/export/occupations/').status_code, 400)
+        self.assertEqual(self.client.get('/api/export/figures/', {'format': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/export/figures/', {'since': 'yesterday'}).status_code, 400)
+
+    def test_changed_since_and_command_state(self):
+        import io
+        import os
+        import tempfile
+        from datetime import timedelta
+        from django.core.management import call_command
+        from django.utils import timezone
+        Figure.objects.update(updated_at=timezone.now() - timedelta(days=2))
+        self.anaximander.save()
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        response = self.client.get('/api/export/figures/', {'since': since})
+        self.assertEqual([r['name'] for r in self.lines(response)], ["Anaximander"])
+        response = self.client.get('/api/export/figure_fields/', {'since': since})
+        self.assertEqual(self.lines(response), [])
+        response = self.client.get('/api/export/fields/', {'since': since})
+        self.assertEqual([r['name'] for r in self.lines(response)], ["Science"])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            state = os.path.join(tmpdir, 'state.json')
+            def export(*args):
+                call_command('export_data', '--output-dir', tmpdir, '--state', state, *args, stdout=io.StringIO())
+                with open(os.path.join(tmpdir, 'figures.ndjson'), encoding='utf-8') as f:
+                    return [line for line in f.read().splitlines()]
+            self.assertEqual(len(export()), 2)
+            self.assertEqual(sorted(os.listdir(tmpdir)), [
+                'events.ndjson', 'fields.ndjson', 'figure_fields.ndjson', 'figures.ndjson',
+                'influences.ndjson', 'state.json',
+            ])
+            # The watermark trails the run, so rows written just before it are exported again.
+            self.assertEqual(len(export('--dataset', 'figures')), 1)
+            with open(state, encoding='utf-8') as f:
+                watermark = f.read()
+            Figure.objects.update(updated_at=timezone.now() - timedelta(days=2))
+            self.assertEqual(export('--dataset', 'figures'), [])
+            with open(state, encoding='utf-8') as f:
+                self.assertNotEqual(f.read(), watermark)
+
+class InstrumentationTest(TestCase):
+    def setUp(self):
+        for year in (-624, -610, -585):
+            Figure.objects.create(name=f"Figure {year}", slug=f"figure{year}", wikidata_id=f"Q{-year}",
+                                  normalized_birth_year=year)
+
+    def timings(self, response):
+        return {entry.split(';')[0]: entry for entry in response['Server-Timing'].split(', ')}
+
+    def test_server_timing_and_duplicate_detection(self):
+        from ChronosAtlas import instrumentation
+        timings = self.timings(self.client.get('/api/figures/'))
+        self.assertRegex(timings['total'], r'^total;dur=[\d.]+$')
+        self.assertRegex(timings['sql'], r'^sql;dur=[\d.]+;desc="\d+ queries"$')
+        self.assertIn('serialize', timings)
+        self.assertNotIn('nplus1', timings)
+
+        response = self.client.post('/graphql/', {'query': 'query Names { figures { name } }', 'operationName': 'Names'},
+                                    content_type='application/json')
+        timings = self.timings(response)
+        self.assertEqual(timings['graphql'], 'graphql;desc="Names"')
+        self.assertIn('serialize', timings)
+
+        with instrumentation.recording() as metrics:
+            for figure in Figure.objects.all():
+                Figure.objects.get(pk=figure.pk)
+        self.assertEqual(metrics.queries, 4)
+        [(runs, sql)] = metrics.duplicates()
+        self.assertEqual(runs, 3)
+        self.assertIn('WHERE', sql)
+        self.assertIn('nplus1;desc="1 statements repeated (3 runs)"', instrumentation.server_timing(metrics))
+
+    def test_slow_log_and_profile(self):
+        import os
+        import pstats
+        import tempfile
+        with override_settings(INSTRUMENTATION={'SLOW_REQUEST_MS': 0}):
+            with self.assertLogs('ChronosAtlas.instrumentation', 'WARNING') as logs:
+                self.client.get('/api/figures/')
+        self.assertIn('Slow request GET /api/figures/ -> 200', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+        with override_settings(INSTRUMENTATION={'SLOW_REQUEST_MS': 0, 'SLOW_LOG_SAMPLE_RATE': 0}):
+            with self.assertNoLogs('ChronosAtlas.instrumentation', 'WARNING'):
+                self.client.get('/api/figures/')
+
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                override_settings(INSTRUMENTATION={'PROFILE_DIR': tmpdir, 'PROFILE_TOKEN': 'secret'}):
+            response = self.client.get('/api/figures/', headers={'X-Profile': 'guess'})
+            self.assertNotIn('profile', self.timings(response))
+            self.assertEqual(os.listdir(tmpdir), [])
+            response = self.client.get('/api/figures/', headers={'X-Profile': 'secret'})
+            [name] = os.listdir(tmpdir)
+            self.assertEqual(self.timings(response)['profile'], f'profile;desc="{name}"')
+            self.assertTrue(pstats.Stats(os.path.join(tmpdir, name)).total_calls)
+
+
+class MetricsEndpointTest(TransactionTestCase):
+    """TransactionTestCase so that the response cache, counted too, is in use."""
+
+    def setUp(self):
+        import tempfile
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(METRICS={'DIRECTORY': self.directory})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        Figure.objects.create(name="Thales", slug="thales", wikidata_id="Q169243", normalized_birth_year=-624)
+        from ChronosAtlas.cache import get_response_cache
+        get_response_cache().clear()
+
+    def scrape(self, **extra):
+        return self.client.get('/metrics', **extra)
+
+    def test_exposition(self):
+        self.client.get('/api/figures/')
+        self.client.get('/api/figures/')
+        self.client.post('/graphql/', {'query': 'query Names { figures { name } }', 'operationName': 'Names'},
+                         content_type='application/json')
+        self.client.get('/api/timeline/')
+        self.client.get('/api/timeline/')
+        response = self.scrape()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('# TYPE chronos_http_requests_total counter', text)
+        self.assertIn('chronos_http_requests_total{method="GET",route="figure-list",status="200"} 2', text)
+        self.assertIn('# TYPE chronos_http_request_duration_seconds histogram', text)
+        buckets = [line for line in text.splitlines()
+                   if line.startswith('chronos_http_request_duration_seconds_bucket{method="GET",route="figure-list"')]
+        self.assertEqual(len(buckets), 12)
+        self.assertTrue(buckets[-1].endswith('le="+Inf"} 2'))
+        self.assertIn('chronos_http_request_duration_seconds_count{method="GET",route="figure-list"} 2', text)
+        self.assertIn('chronos_graphql_operation_duration_seconds_count{operation="Names"} 1', text)
+        self.assertIn('chronos_graphql_resolver_duration_seconds_count{field="Query.figures"} 1', text)
+        self.assertRegex(text, r'chronos_db_queries_total\{alias="default"\} \d+')
+        # Second reads of the figure and event lists hit; GraphQL and first reads miss.
+        self.assertIn('chronos_response_cache_requests_total{result="hit"} 2', text)
+        self.assertIn('chronos_response_cache_requests_total{result="miss"} 3', text)
+
+    def test_sums_other_workers_and_restricts_clients(self):
+        from ChronosAtlas import metrics
+        self.client.get('/api/figures/')
+        with mock.patch('os.getpid', return_value=999999):
+            other_worker = metrics.Samples(self.directory)
+        other_worker.add([metrics._counter('chronos_http_requests_total', 3, method='GET',
+                                           route='figure-list', status='200')])
+        self.assertIn('chronos_http_requests_total{method="GET",route="figure-list",status="200"} 4',
+                      self.scrape().content.decode())
+        self.assertEqual(self.scrape(REMOTE_ADDR='10.0.0.5').status_code, 403)
+        with override_settings(METRICS={'ENABLED': False}):
+            self.assertEqual(self.scrape().status_code, 404)
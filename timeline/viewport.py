@@ -0,0 +1,343 @@
+"""
+Level-of-detail tiles for the zoomable timeline, stored in ViewportTile.
+
+Every figure (at its birth year) and every event falls in one tile per stored
+resolution. A tile holds the number of rows in it and its CAPACITY most
+important rows, best first, with the invariant that every row of the tile
+left out of that list ranks below every row in it. A viewport request reads
+one resolution, the finest whose tiles are at least MIN_BUCKET_PIXELS wide at
+the requested pixel width, so it touches at most width / MIN_BUCKET_PIXELS
+tiles and returns at most MAX_PER_BUCKET rows from each, however many rows the
+range holds; the rest are reported as cluster counts.
+
+Importance is a figure's influence degree (InfluenceMetrics in + out) and an
+event's `importance` column, ties going to the lower id. Tiles are updated by
+timeline/signals.py for single rows and by the batch ingest helpers for
+batches, each tile locked while its list is recomputed. Tiles up to 100 years
+wide are updated inside the writing transaction. The COARSE_RESOLUTIONS tiles
+cover so many rows that nearly every write lands in the same few of them, so
+they are updated once the write commits, in a short transaction of their own:
+concurrent writers then wait on each other only for that update, not for each
+other's whole transaction. A crash between the commit and that update leaves
+the coarse tiles behind until rebuild_viewport_tiles runs. Keeping twice as
+many rows as a response shows absorbs most removals; a tile left with fewer
+than MAX_PER_BUCKET rows while holding more is refilled from the table.
+"""
+import heapq
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
+
+from .density import bucket_starts
+from .models import TimelineEvent, ViewportTile
+
+FIGURES = ViewportTile.FIGURES
+EVENTS = ViewportTile.EVENTS
+KINDS = (FIGURES, EVENTS)
+
+# Tile sizes (in years), finest first.
+RESOLUTIONS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+# Resolutions updated after the write commits (see the module docstring).
+COARSE_RESOLUTIONS = (500, 1000, 5000)
+# Narrowest a bucket may be drawn; bounds the buckets of one response to width / this.
+MIN_BUCKET_PIXELS = 40
+MAX_WIDTH = 10000
+DEFAULT_PER_BUCKET = 5
+MAX_PER_BUCKET = 10
+# Rows kept per tile.
+CAPACITY = 2 * MAX_PER_BUCKET
+
+
+def figure_importance():
+    """Importance of a Figure row, for annotate()."""
+    return Coalesce(F('influence_metrics__in_degree') + F('influence_metrics__out_degree'), Value(0))
+
+
+def _candidates(kind, first_year, last_year):
+    """(importance, id) of the rows placed in [first_year, last_year], best first."""
+    from figures.models import Figure
+
+    if kind == FIGURES:
+        rows = Figure.objects.filter(normalized_birth_year__gte=first_year, normalized_birth_year__lte=last_year) \
+            .annotate(importance=figure_importance())
+    else:
+        rows = TimelineEvent.objects.filter(year__gte=first_year, year__lte=last_year)
+    return rows.order_by('-importance', 'id').values_list('importance', 'id')
+
+
+def _rank(entry):
+    return -entry[0], entry[1]
+
+
+# --- 1. Incremental maintenance ---
+
+class _Tile:
+    """Applies row changes to one locked ViewportTile in memory."""
+
+    def __init__(self, row):
+        self.row = row
+        self.top = [tuple(entry) for entry in row.top]
+        self.positions = {pk: i for i, (_, pk) in enumerate(self.top)}
+        self.stale = False      # refill from the table before saving
+
+    def _set(self, top):
+        self.top = top
+        self.positions = {pk: i for i, (_, pk) in enumerate(top)}
+
+    def _below_all(self, entry):
+        """True if `entry` cannot be listed without checking the unlisted rows."""
+        if len(self.top) == self.row.count:
+            return False
+        return not self.top or _rank(entry) > _rank(self.top[-1])
+
+    def add(self, pk, importance):
+        entry = (importance, pk)
+        if self._below_all(entry):
+            if not self.top:
+                self.stale = True
+        else:
+            self._set(sorted([*self.top, entry], key=_rank)[:CAPACITY])
+        self.row.count += 1
+
+    def remove(self, pk):
+        self.row.count -= 1
+        self.unlist(pk)
+
+    def unlist(self, pk):
+        if pk in self.positions:
+            self._set([entry for entry in self.top if entry[1] != pk])
+        self._check_size()
+
+    def reweigh(self, pk, importance):
+        entry = (importance, pk)
+        if pk not in self.positions:
+            # Every other row of the tile listed: nothing unlisted can outrank it.
+            if len(self.top) == self.row.count - 1 or not self._below_all(entry):
+                self._set(sorted([*self.top, entry], key=_rank)[:CAPACITY])
+            elif not self.top and self.row.count:
+                self.stale = True
+            return
+        previous = self.top[self.positions[pk]]
+        top = sorted([e for e in self.top if e[1] != pk] + [entry], key=_rank)
+        # A row that dropped to the end may now rank below unlisted ones: unlist it.
+        if top[-1] == entry and _rank(entry) > _rank(previous) and len(top) < self.row.count:
+            top.pop()
+        self._set(top)
+        self._check_size()
+
+    def _check_size(self):
+        if len(self.top) < min(MAX_PER_BUCKET, self.row.count):
+            self.stale = True
+
+    def save_top(self):
+        self.row.top = [list(entry) for entry in self.top]
+
+
+def apply(kind, changes):
+    """
+    Applies row changes to the tiles of `kind`. `changes` yields
+    (pk, year_before, year_after, importance): year_before is None for a new row,
+    year_after None for a deleted one, and importance is the row's current value.
+    Run after the write, inside its transaction: refills read the table.
+    """
+    changes = [change for change in changes if change[1] is not None or change[2] is not None]
+    if not changes:
+        return
+    _apply(kind, changes, [resolution for resolution in RESOLUTIONS if resolution not in COARSE_RESOLUTIONS])
+    transaction.on_commit(lambda: _apply(kind, changes, COARSE_RESOLUTIONS, committed=True))
+
+
+def _current(kind, pks):
+    """{pk: (year, importance)} of the rows that still exist."""
+    from figures.models import Figure
+
+    if kind == FIGURES:
+        rows = Figure.objects.filter(pk__in=pks).annotate(importance=figure_importance()) \
+            .values_list('id', 'normalized_birth_year', 'importance')
+    else:
+        rows = TimelineEvent.objects.filter(pk__in=pks).values_list('id', 'year', 'importance')
+    return {pk: (year, importance) for pk, year, importance in rows.order_by()}
+
+
+def _apply(kind, changes, resolutions, committed=False):
+    """
+    Applies the changes to the tiles of `resolutions`, locked for the rest of the
+    transaction. Once `committed`, writers that committed later may already have
+    updated the tiles, so rows are listed by their current year and importance.
+    """
+    keys = defaultdict(set)
+    for _, before, after, _ in changes:
+        for resolution in resolutions:
+            for year in (before, after):
+                if year is not None:
+                    keys[resolution].add(year // resolution * resolution)
+
+    with transaction.atomic():
+        # Insert missing tiles first so that every writer locks existing rows, always in the same order.
+        ViewportTile.objects.bulk_create(
+            [
+                ViewportTile(kind=kind, resolution=resolution, start_year=start)
+                for resolution, starts in keys.items() for start in starts
+            ],
+            ignore_conflicts=True,
+        )
+        match = reduce(or_, (Q(resolution=resolution, start_year__in=starts) for resolution, starts in keys.items()))
+        locked = ViewportTile.objects.select_for_update().filter(match, kind=kind).order_by('resolution', 'start_year')
+        tiles = {(tile.resolution, tile.start_year): _Tile(tile) for tile in locked}
+        current = _current(kind, [change[0] for change in changes]) if committed else None
+
+        for pk, before, after, importance in changes:
+            if committed:
+                year, importance = current.get(pk, (None, importance))
+            for resolution in resolutions:
+                old = None if before is None else tiles[resolution, before // resolution * resolution]
+                new = None if after is None else tiles[resolution, after // resolution * resolution]
+                if committed:
+                    # Count the change, but list the row only in the tile it is in now.
+                    if old is not new:
+                        for tile, delta in ((old, -1), (new, 1)):
+                            if tile is not None:
+                                tile.row.count += delta
+                    for tile in {old, new} - {None}:
+                        if year is not None and year // resolution * resolution == tile.row.start_year:
+                            tile.reweigh(pk, importance)
+                        else:
+                            tile.unlist(pk)
+                    continue
+                if old is new:
+                    old.reweigh(pk, importance)
+                    continue
+                if old is not None:
+                    old.remove(pk)
+                if new is not None:
+                    new.add(pk, importance)
+
+        for (resolution, start), tile in tiles.items():
+            if tile.stale:
+                tile._set(list(_candidates(kind, start, start + resolution - 1)[:CAPACITY]))
+            tile.save_top()
+        ViewportTile.objects.bulk_update([tile.row for tile in tiles.values()], ['count', 'top'])
+
+
+def figures_moved(moves):
+    """
+    Applies figure changes given as (pk, birth_year_before, birth_year_after);
+    their importance is read from the table. A figure whose influence degree
+    changed is passed with the same year twice.
+    """
+    from figures.models import Figure
+
+    moves = [move for move in moves if move[1] is not None or move[2] is not None]
+    if not moves:
+        return
+    # New figures have no influences yet.
+    existing = [pk for pk, before, _ in moves if before is not None]
+    importance = dict(
+        Figure.objects.filter(pk__in=existing).order_by()
+        .annotate(importance=figure_importance()).values_list('id', 'importance')
+    ) if existing else {}
+    apply(FIGURES, [(pk, before, after, importance.get(pk, 0)) for pk, before, after in moves])
+
+
+def influence_changed(figure_ids):
+    """Re-ranks figures whose influence degree changed."""
+    from figures.models import Figure
+
+    births = Figure.objects.filter(pk__in=figure_ids).exclude(normalized_birth_year=None) \
+        .order_by().values_list('id', 'normalized_birth_year')
+    figures_moved([(pk, birth, birth) for pk, birth in births])
+
+
+# --- 2. Rebuilding ---
+
+def _rows(kind):
+    from figures.models import Figure
+
+    if kind == FIGURES:
+        rows = Figure.objects.exclude(normalized_birth_year=None).annotate(importance=figure_importance()) \
+            .values_list('importance', 'id', 'normalized_birth_year')
+    else:
+        rows = TimelineEvent.objects.values_list('importance', 'id', 'year')
+    return rows.order_by().iterator(chunk_size=20000)
+
+
+@transaction.atomic
+def rebuild(kinds=KINDS):
+    """
+    Recomputes the tiles of `kinds` from the tables. Used after bulk loads that
+    bypass model signals; streams rows, so memory is bounded by the number of
+    tiles rather than the number of rows.
+    """
+    for kind in kinds:
+        counts = defaultdict(int)
+        # Min-heaps of the best CAPACITY rows per tile, worst on top.
+        heaps = defaultdict(list)
+        for importance, pk, year in _rows(kind):
+            item = (importance, -pk)
+            for resolution in RESOLUTIONS:
+                key = (resolution, year // resolution * resolution)
+                counts[key] += 1
+                heap = heaps[key]
+                if len(heap) < CAPACITY:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+
+        ViewportTile.objects.filter(kind=kind).delete()
+        ViewportTile.objects.bulk_create(
+            (
+                ViewportTile(
+                    kind=kind, resolution=resolution, start_year=start, count=count,
+                    top=[[importance, -negated] for importance, negated in sorted(heaps[resolution, start], reverse=True)],
+                )
+                for (resolution, start), count in counts.items()
+            ),
+            batch_size=5000,
+        )
+
+
+# --- 3. Reading a viewport ---
+
+def viewport(start_year, end_year, width, kinds=KINDS, per_bucket=DEFAULT_PER_BUCKET):
+    """
+    Buckets covering [start_year, end_year] drawn `width` pixels wide, as
+    (bucket_size, [{'start_year', 'end_year', <kind>: {'count', 'top'}}, ...]) where
+    'top' holds up to `per_bucket` (importance, id) pairs, best first. The first
+    and last bucket may extend past the range. Raises ValueError on bad input.
+    """
+    if end_year < start_year:
+        raise ValueError("end_year must not be before start_year.")
+    if not 1 <= width <= MAX_WIDTH:
+        raise ValueError(f"width must be between 1 and {MAX_WIDTH} pixels.")
+    if not 1 <= per_bucket <= MAX_PER_BUCKET:
+        raise ValueError(f"per_bucket must be between 1 and {MAX_PER_BUCKET}.")
+    unknown = set(kinds) - set(KINDS)
+    if unknown or not kinds:
+        raise ValueError(f"kinds must be among '{FIGURES}' and '{EVENTS}'.")
+
+    years_per_bucket = (end_year - start_year + 1) * MIN_BUCKET_PIXELS / width
+    bucket_size = next((r for r in RESOLUTIONS if r >= years_per_bucket), None)
+    if bucket_size is None:
+        raise ValueError(
+            f"At {width} pixels, a range can span at most {RESOLUTIONS[-1] * width // MIN_BUCKET_PIXELS} years."
+        )
+    starts = bucket_starts(start_year, end_year, bucket_size)
+
+    stored = {
+        (kind, start): (count, top[:per_bucket])
+        for kind, start, count, top in ViewportTile.objects.filter(
+            kind__in=kinds, resolution=bucket_size, start_year__gte=starts[0], start_year__lte=starts[-1],
+        ).values_list('kind', 'start_year', 'count', 'top')
+    }
+    buckets = []
+    for start in starts:
+        bucket = {'start_year': start, 'end_year': start + bucket_size - 1}
+        for kind in kinds:
+            count, top = stored.get((kind, start), (0, []))
+            bucket[kind] = {'count': count, 'top': [tuple(entry) for entry in top]}
+        buckets.append(bucket)
+    return bucket_size, buckets